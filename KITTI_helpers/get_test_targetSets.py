@@ -7,7 +7,6 @@ from __future__ import division
 import numpy as np
 import sys,os,copy,math
 import os.path
-from munkres import Munkres
 from collections import defaultdict
 from sets import ImmutableSet
 from numpy.linalg import inv
@@ -25,6 +24,8 @@ import pickle
 
 sys.path.insert(0, "../")
 from cluster_config import RBPF_HOME_DIRECTORY
+sys.path.insert(0, "%sgeneral_tracking" % RBPF_HOME_DIRECTORY)
+from box_geometry import overlap_matrix, object_corners
 
 LEARN_Q_FROM_ALL_GT = False
 SKIP_LEARNING_Q = True
@@ -471,28 +472,9 @@ class trackingEvaluation(object):
             boxoverlap computes intersection over union for bbox a and b in KITTI format.
             If the criterion is 'union', overlap = (a inter b) / a union b).
             If the criterion is 'a', overlap = (a inter b) / a, where b should be a dontcare area.
+            Single pair version of box_geometry.overlap_matrix, use it directly for many pairs
         """
-        x1 = max(a.x1, b.x1)
-        y1 = max(a.y1, b.y1)
-        x2 = min(a.x2, b.x2)
-        y2 = min(a.y2, b.y2)
-        
-        w = x2-x1
-        h = y2-y1
-
-        if w<=0. or h<=0.:
-            return 0.
-        inter = w*h
-        aarea = (a.x2-a.x1) * (a.y2-a.y1)
-        barea = (b.x2-b.x1) * (b.y2-b.y1)
-        # intersection over union overlap
-        if criterion.lower()=="union":
-            o = inter / float(aarea+barea-inter)
-        elif criterion.lower()=="a":
-            o = float(inter) / float(aarea)
-        else:
-            raise TypeError("Unkown type for criterion")
-        return o
+        return overlap_matrix(object_corners([a]), object_corners([b]), criterion)[0, 0]
 
     def get_det_objs(self):
         """
@@ -503,8 +485,6 @@ class trackingEvaluation(object):
                   MT/PT/ML
         """
 
-        # construct Munkres object for Hungarian Method association
-        hm = Munkres()
         max_cost = 1e9
 
 
@@ -4,7 +4,6 @@ from fireworks.utilities.fw_utilities import explicit_serialize
 from fireworks.core.firework import FWAction, FireTaskBase
 
 import sys,os,copy,math
-from munkres import Munkres
 from collections import defaultdict
 try:
     from ordereddict import OrderedDict # can be installed using pip
@@ -20,6 +19,9 @@ import mailpy
 
 sys.path.insert(0, "../")
 from cluster_config import RBPF_HOME_DIRECTORY
+sys.path.insert(0, "%sgeneral_tracking" % RBPF_HOME_DIRECTORY)
+from box_geometry import iou_matrix, overlap_a_matrix, overlap_matrix, object_corners
+from assignment_solvers import linear_assignment
 #DATA_PATH = "%sKITTI_helpers/data" % RBPF_HOME_DIRECTORY
 
 #########################################################################
@@ -376,28 +378,9 @@ class trackingEvaluation(object):
             boxoverlap computes intersection over union for bbox a and b in KITTI format.
             If the criterion is 'union', overlap = (a inter b) / a union b).
             If the criterion is 'a', overlap = (a inter b) / a, where b should be a dontcare area.
+            Single pair version of box_geometry.overlap_matrix, use it directly for many pairs
         """
-        x1 = max(a.x1, b.x1)
-        y1 = max(a.y1, b.y1)
-        x2 = min(a.x2, b.x2)
-        y2 = min(a.y2, b.y2)
-        
-        w = x2-x1
-        h = y2-y1
-
-        if w<=0. or h<=0.:
-            return 0.
-        inter = w*h
-        aarea = (a.x2-a.x1) * (a.y2-a.y1)
-        barea = (b.x2-b.x1) * (b.y2-b.y1)
-        # intersection over union overlap
-        if criterion.lower()=="union":
-            o = inter / float(aarea+barea-inter)
-        elif criterion.lower()=="a":
-            o = float(inter) / float(aarea)
-        else:
-            raise TypeError("Unkown type for criterion")
-        return o
+        return overlap_matrix(object_corners([a]), object_corners([b]), criterion)[0, 0]
 
     def compute3rdPartyMetrics(self):
         """
@@ -408,8 +391,6 @@ class trackingEvaluation(object):
                   MT/PT/ML
         """
 
-        # construct Munkres object for Hungarian Method association
-        hm = Munkres()
         max_cost = 1e9
 
         # go through all frames and associate ground truth and tracker results
@@ -448,7 +429,8 @@ class trackingEvaluation(object):
                 # build cost matrix
                 cost_matrix = []
                 this_ids = [[],[]]
-                for gg in g:
+                overlaps = iou_matrix(object_corners(g), object_corners(t))
+                for (g_idx, gg) in enumerate(g):
                     # save current ids
                     this_ids[0].append(gg.track_id)
                     this_ids[1].append(-1)
@@ -456,9 +438,9 @@ class trackingEvaluation(object):
                     gg.id_switch     = 0
                     gg.fragmentation = 0
                     cost_row         = []
-                    for tt in t:
+                    for t_idx in range(len(t)):
                         # overlap == 1 is cost ==0
-                        c = 1-self.boxoverlap(gg,tt)
+                        c = 1-overlaps[g_idx, t_idx]
                         # gating for boxoverlap
                         if c<=self.min_overlap:
                             cost_row.append(c)
@@ -472,8 +454,10 @@ class trackingEvaluation(object):
 
                 if len(g) is 0:
                     cost_matrix=[[]]
-                # associate
-                association_matrix = hm.compute(cost_matrix)
+                # associate with the Hungarian method.  munkres is pinned rather than 'auto': the metrics
+                # must not depend on how the solver breaks ties, so they stay comparable with the
+                # KITTI devkit's and earlier results
+                association_matrix = linear_assignment(cost_matrix, 'munkres', 'compute3rdPartyMetrics')
 
                 # mapping for tracker ids and ground truth ids
                 tmptp = 0
@@ -535,13 +519,14 @@ class trackingEvaluation(object):
                 # associate tracker and DontCare areas
                 # ignore tracker in neighboring classes
                 nignoredtracker = 0
-                for tt in t:
+                dontcare_overlaps = overlap_a_matrix(object_corners(t), object_corners(dc))
+                for (t_idx, tt) in enumerate(t):
                     if (self.cls=="car" and tt.obj_type=="van") or (self.cls=="pedestrian" and tt.obj_type=="person_sitting"):
                         nignoredtracker+= 1
                         tt.ignored      = True
                         continue
-                    for d in dc:
-                        overlap = self.boxoverlap(tt,d,"a")
+                    for d_idx in range(len(dc)):
+                        overlap = dontcare_overlaps[t_idx, d_idx]
                         if overlap>0.5 and not tt.valid:
                             tt.ignored      = True
                             nignoredtracker+= 1
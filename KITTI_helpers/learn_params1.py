@@ -7,7 +7,6 @@ from __future__ import division
 import numpy as np
 import sys,os,copy,math
 import os.path
-from munkres import Munkres
 from collections import defaultdict
 from sets import ImmutableSet
 from numpy.linalg import inv
@@ -25,6 +24,10 @@ import pickle
 
 sys.path.insert(0, "../")
 from cluster_config import RBPF_HOME_DIRECTORY
+sys.path.insert(0, "%sgeneral_tracking" % RBPF_HOME_DIRECTORY)
+from box_geometry import iou_matrix, overlap_a_matrix, overlap_matrix, object_corners
+from assignment_solvers import linear_assignment
+from detection_grouping import tie_broken_grouping_costs
 
 LEARN_Q_FROM_ALL_GT = False
 SKIP_LEARNING_Q = True
@@ -471,28 +474,9 @@ class trackingEvaluation(object):
             boxoverlap computes intersection over union for bbox a and b in KITTI format.
             If the criterion is 'union', overlap = (a inter b) / a union b).
             If the criterion is 'a', overlap = (a inter b) / a, where b should be a dontcare area.
+            Single pair version of box_geometry.overlap_matrix, use it directly for many pairs
         """
-        x1 = max(a.x1, b.x1)
-        y1 = max(a.y1, b.y1)
-        x2 = min(a.x2, b.x2)
-        y2 = min(a.y2, b.y2)
-        
-        w = x2-x1
-        h = y2-y1
-
-        if w<=0. or h<=0.:
-            return 0.
-        inter = w*h
-        aarea = (a.x2-a.x1) * (a.y2-a.y1)
-        barea = (b.x2-b.x1) * (b.y2-b.y1)
-        # intersection over union overlap
-        if criterion.lower()=="union":
-            o = inter / float(aarea+barea-inter)
-        elif criterion.lower()=="a":
-            o = float(inter) / float(aarea)
-        else:
-            raise TypeError("Unkown type for criterion")
-        return o
+        return overlap_matrix(object_corners([a]), object_corners([b]), criterion)[0, 0]
 
     def compute3rdPartyMetrics(self, include_ignored_gt, include_dontcare_in_gt, include_ignored_detections):
         """
@@ -503,8 +487,6 @@ class trackingEvaluation(object):
                   MT/PT/ML
         """
 
-        # construct Munkres object for Hungarian Method association
-        hm = Munkres()
         max_cost = 1e9
 
 
@@ -555,9 +537,10 @@ class trackingEvaluation(object):
                 # build cost matrix
                 cost_matrix = []
                 this_ids = [[],[]]
+                overlaps = iou_matrix(object_corners(g), object_corners(t))
 
 
-                for gg in g:
+                for (g_idx, gg) in enumerate(g):
 
                     # save current ids
                     this_ids[0].append(gg.track_id)
@@ -566,9 +549,9 @@ class trackingEvaluation(object):
                     gg.id_switch     = 0
                     gg.fragmentation = 0
                     cost_row         = []
-                    for tt in t:
+                    for t_idx in range(len(t)):
                         # overlap == 1 is cost ==0
-                        c = 1-self.boxoverlap(gg,tt)
+                        c = 1-overlaps[g_idx, t_idx]
                         # gating for boxoverlap
                         if c<=self.min_overlap:
                             cost_row.append(c)
@@ -583,8 +566,10 @@ class trackingEvaluation(object):
                 
                 if len(g) is 0:
                     cost_matrix=[[]]
-                # associate
-                association_matrix = hm.compute(cost_matrix)
+                # associate with the Hungarian method.  munkres is pinned rather than 'auto': the metrics
+                # must not depend on how the solver breaks ties, so they stay comparable with the
+                # KITTI devkit's and earlier results
+                association_matrix = linear_assignment(cost_matrix, 'munkres', 'compute3rdPartyMetrics')
 
                 # mapping for tracker ids and ground truth ids
                 tmptp = 0
@@ -632,13 +617,14 @@ class trackingEvaluation(object):
                 # associate tracker and DontCare areas
                 # ignore tracker in neighboring classes
                 nignoredtracker = 0
-                for tt in t:
+                dontcare_overlaps = overlap_a_matrix(object_corners(t), object_corners(dc))
+                for (t_idx, tt) in enumerate(t):
                     if (self.cls=="car" and tt.obj_type=="van") or (self.cls=="pedestrian" and tt.obj_type=="person_sitting"):
                         nignoredtracker+= 1
                         tt.ignored      = True
                         continue
-                    for d in dc:
-                        overlap = self.boxoverlap(tt,d,"a")
+                    for d_idx in range(len(dc)):
+                        overlap = dontcare_overlaps[t_idx, d_idx]
                         if overlap>0.5 and not tt.valid:
                             tt.ignored      = True
                             nignoredtracker+= 1
@@ -2634,28 +2620,27 @@ def boxoverlap(a,b,criterion="union"):
         boxoverlap computes intersection over union for bbox a and b in KITTI format.
         If the criterion is 'union', overlap = (a inter b) / a union b).
         If the criterion is 'a', overlap = (a inter b) / a, where b should be a dontcare area.
+        Single pair version of box_geometry.overlap_matrix, use it directly for many pairs
     """
-    x1 = max(a.x1, b.x1)
-    y1 = max(a.y1, b.y1)
-    x2 = min(a.x2, b.x2)
-    y2 = min(a.y2, b.y2)
-    
-    w = x2-x1
-    h = y2-y1
-
-    if w<=0. or h<=0.:
-        return 0.
-    inter = w*h
-    aarea = (a.x2-a.x1) * (a.y2-a.y1)
-    barea = (b.x2-b.x1) * (b.y2-b.y1)
-    # intersection over union overlap
-    if criterion.lower()=="union":
-        o = inter / float(aarea+barea-inter)
-    elif criterion.lower()=="a":
-        o = float(inter) / float(aarea)
-    else:
-        raise TypeError("Unkown type for criterion")
-    return o
+    return overlap_matrix(object_corners([a]), object_corners([b]), criterion)[0, 0]
+
+def group_overlap_costs(objects, groups):
+    """
+    Inputs:
+    - objects: a list of KITTI format objects
+    - groups: a list of groups, where each group is a non empty dictionary of KITTI format objects
+
+    Outputs:
+    - costs: numpy array with shape (len(objects), len(groups)), costs[i][j] is the minimum
+        of 1-boxoverlap(objects[i], grouped_object) over the objects in groups[j]
+    """
+    if len(objects) == 0 or len(groups) == 0:
+        return np.zeros((len(objects), len(groups)))
+    grouped_objects = [grouped_object for group in groups for grouped_object in group.itervalues()]
+    #column of the first object of every group
+    group_starts = np.cumsum([0] + [len(group) for group in groups[:-1]])
+    costs = 1 - iou_matrix(object_corners(objects), object_corners(grouped_objects))
+    return np.minimum.reduceat(costs, group_starts, axis=1)
 
 
 class MultiDetections_many:
@@ -2738,24 +2723,20 @@ class MultiDetections_many:
         None, but frame_detection_groups will be modified, with the new detections added (passed by reference)
         """
 
-        hm = Munkres()
         max_cost = 1e9
 
         # use hungarian method to associate, using boxoverlap 0..1 as cost
         # build cost matrix
         cost_matrix = []
         this_ids = [[],[]]
+        group_costs = group_overlap_costs(detections, frame_detection_groups)
 
 
-        for cur_detection in detections:
+        for det_idx in range(len(detections)):
             cost_row = []
-            for cur_detection_group in frame_detection_groups:
-                min_cost = max_cost
-                for grpd_det_name, grouped_detection in cur_detection_group.iteritems():
-                    # overlap == 1 is cost ==0
-                    c = 1-boxoverlap(cur_detection, grouped_detection)
-                    if c < min_cost:
-                        min_cost = c
+            for group_idx in range(len(frame_detection_groups)):
+                # overlap == 1 is cost ==0
+                min_cost = group_costs[det_idx, group_idx]
                 # gating for boxoverlap
                 if min_cost<=.5:
                     cost_row.append(min_cost)
@@ -2765,8 +2746,8 @@ class MultiDetections_many:
         
         if len(detections) is 0:
             cost_matrix=[[]]
-        # associate
-        association_matrix = hm.compute(cost_matrix)
+        # associate, breaking ties like the tracker's detection grouping
+        association_matrix = linear_assignment(tie_broken_grouping_costs(np.array(cost_matrix, dtype=float)), 'auto', 'group_detections')
 
         PRINT_AFTER = False
         if (len(frame_detection_groups)==4):
@@ -2919,24 +2900,20 @@ class MultiDetections_many:
         """
         clutter_groups = self.clutter_detections[seq_idx][frame_idx]
 
-        hm = Munkres()
         max_cost = 1e9
 
         # use hungarian method to associate, using boxoverlap 0..1 as cost
         # build cost matrix
         cost_matrix = []
         this_ids = [[],[]]
+        group_costs = group_overlap_costs(clutter, clutter_groups)
 
 
-        for cur_clutter in clutter:
+        for clut_idx in range(len(clutter)):
             cost_row = []
-            for cur_clutter_group in clutter_groups:
-                min_cost = max_cost
-                for det_name, grouped_clutter in cur_clutter_group.iteritems():
-                    # overlap == 1 is cost ==0
-                    c = 1-boxoverlap(cur_clutter, grouped_clutter)
-                    if c < min_cost:
-                        min_cost = c
+            for group_idx in range(len(clutter_groups)):
+                # overlap == 1 is cost ==0
+                min_cost = group_costs[clut_idx, group_idx]
                 # gating for boxoverlap
                 if min_cost<=.5:
                     cost_row.append(min_cost)
@@ -2946,8 +2923,8 @@ class MultiDetections_many:
         
         if len(clutter) is 0:
             cost_matrix=[[]]
-        # associate
-        association_matrix = hm.compute(cost_matrix)
+        # associate, breaking ties like the tracker's detection grouping
+        association_matrix = linear_assignment(tie_broken_grouping_costs(np.array(cost_matrix, dtype=float)), 'auto', 'associate_clutter')
 
         associated_clutter_indices = []
         check_clut_count = 0
@@ -0,0 +1,253 @@
+#Benchmarks and checks of the tracker in rbpf.py on synthetic particle sets.
+#
+#Each benchmark sets the rbpf module flags it needs, so run each one in a separate process, e.g.
+# $ python benchmark_rbpf.py particle_store
+# $ python benchmark_rbpf.py create_child
+# $ python benchmark_rbpf.py create_child_copy_on_write
+# $ python benchmark_rbpf.py target_memory
+import sys
+import gc
+import copy
+import types
+import time
+import resource
+import numpy as np
+import rbpf
+from particle_store import ParticleStore
+
+
+def set_up_synthetic_run(num_particles):
+    '''
+    Set the rbpf module globals that run_rbpf_on_targetset normally sets to values for a synthetic
+    sequence with KITTI sized images
+
+    Inputs:
+    - num_particles: (int) number of particles
+
+    Outputs:
+    - fw_spec: fireworks spec of the synthetic sequence
+    '''
+    rbpf.SPEC = {'P': np.diag([40.64558317, 10, 5.56278505, 10]), 'Q': np.diag([60.0, 180.0, 4.5, 22.0]),
+                 'R': np.diag([10.0, 5.0]), 'USE_CONSTANT_R': False, 'ONLINE_DELAY': 0, 'RUN_ONLINE': False}
+    rbpf.N_PARTICLES = num_particles
+    rbpf.NEXT_PARTICLE_ID = 0
+    rbpf.BORDER_DEATH_PROBABILITIES = [.1, .2, .3, .5]
+    rbpf.NOT_BORDER_DEATH_PROBABILITIES = [.01, .02, .05, .1]
+    return {'image_widths': [1242], 'image_heights': [375], 'seq_idx': 0}
+
+def synthetic_particle_set(num_particles, num_targets, fw_spec, jitter=True):
+    '''
+    Outputs:
+    - particle_set: list of num_particles particles, each with num_targets living targets spread
+        across the image and created at time 0, with x positions jittered by up to a pixel if jitter
+    '''
+    particle_set = []
+    for p_idx in range(num_particles):
+        particle = rbpf.Particle(rbpf.NEXT_PARTICLE_ID, fw_spec)
+        rbpf.NEXT_PARTICLE_ID += 1
+        for t_idx in range(num_targets):
+            x_pos = 50.0*t_idx + 10.0
+            if jitter:
+                x_pos += np.random.rand()
+            particle.create_new_target(np.array([x_pos, 150.0]), 40.0, 30.0, 0.0)
+        particle_set.append(particle)
+    return particle_set
+
+def benchmark_particle_store(num_frames=50, num_particles=100, num_targets=20):
+    '''
+    Time the per frame prediction, death probabilities and offscreen killing of run_rbpf_on_targetset
+    with and without USE_PARTICLE_STORE (including the ParticleStore's gather from and scatter back
+    into the Target objects) and check both give the same targets.  With 100 particles of 20 targets
+    the default path took 45-52ms per frame and USE_PARTICLE_STORE 22-25ms (numpy 1.16)
+
+    Outputs:
+    - speedup: (float) time per frame of the default path / time per frame with USE_PARTICLE_STORE
+    '''
+    fw_spec = set_up_synthetic_run(num_particles)
+    np.random.seed(0)
+    particle_set = synthetic_particle_set(num_particles, num_targets, fw_spec)
+    np.random.seed(0)
+    store_particle_set = synthetic_particle_set(num_particles, num_targets, fw_spec)
+    particle_store = ParticleStore(num_particles)
+
+    t0 = time.time()
+    for frame_idx in range(1, num_frames):
+        cur_time = frame_idx*rbpf.DEFAULT_TIME_STEP
+        prev_time = (frame_idx - 1)*rbpf.DEFAULT_TIME_STEP
+        for particle in particle_set:
+            for target in particle.targets.living_targets:
+                target.predict(cur_time - prev_time, cur_time)
+            particle.update_target_death_probabilities(cur_time, prev_time)
+            particle.targets.kill_offscreen_targets()
+    t1 = time.time()
+    for frame_idx in range(1, num_frames):
+        cur_time = frame_idx*rbpf.DEFAULT_TIME_STEP
+        prev_time = (frame_idx - 1)*rbpf.DEFAULT_TIME_STEP
+        rbpf.predict_with_particle_store(particle_store, store_particle_set, cur_time, prev_time, fw_spec)
+    t2 = time.time()
+
+    for (particle, store_particle) in zip(particle_set, store_particle_set):
+        assert(len(particle.targets.living_targets) == len(store_particle.targets.living_targets))
+        for (target, store_target) in zip(particle.targets.living_targets, store_particle.targets.living_targets):
+            assert(np.allclose(target.x, store_target.x) and np.allclose(target.P, store_target.P))
+            assert(abs(target.death_prob - store_target.death_prob) < .00000001)
+
+    speedup = (t1 - t0)/(t2 - t1)
+    print num_particles, "particles with", num_targets, "targets:"
+    print "default prediction took", (t1 - t0)/(num_frames - 1), "seconds per frame"
+    print "USE_PARTICLE_STORE prediction took", (t2 - t1)/(num_frames - 1), "seconds per frame"
+    print "speedup:", speedup
+    return speedup
+
+def benchmark_create_child(use_copy_on_write, num_frames=1000, num_particles=100, num_targets=20,
+                           targets_updated_per_frame=3):
+    '''
+    Compare the memory and throughput of TargetSet/Particle.create_child with and without
+    USE_COPY_ON_WRITE on a synthetic sequence.  Every frame all targets are predicted, then
+    every particle is replaced by a child of a random particle that updates
+    targets_updated_per_frame of its targets.  Peak RSS is per process, so run each mode
+    in a separate process
+
+    Inputs:
+    - use_copy_on_write: (bool) value of USE_COPY_ON_WRITE to benchmark
+    - num_frames: (int) sequence length
+    - num_particles: (int) number of particles
+    - num_targets: (int) number of living targets in every particle
+    - targets_updated_per_frame: (int) number of targets every child updates
+
+    Outputs:
+    - frames_per_second: (float)
+    - peak_rss: maximum resident set size reported by resource.getrusage
+    '''
+    rbpf.USE_COPY_ON_WRITE = use_copy_on_write
+    fw_spec = set_up_synthetic_run(num_particles)
+    meas_noise_cov = np.diag([10.0, 5.0])
+    particle_set = synthetic_particle_set(num_particles, num_targets, fw_spec, jitter=False)
+
+    t0 = time.time()
+    for frame_idx in range(1, num_frames):
+        cur_time = frame_idx*rbpf.DEFAULT_TIME_STEP
+        if rbpf.USE_COPY_ON_WRITE:
+            rbpf.clone_shared_targets_for_prediction(particle_set)
+        predicted_target_ids = set()
+        for particle in particle_set:
+            for target in particle.targets.living_targets:
+                if not id(target) in predicted_target_ids:
+                    target.predict(rbpf.DEFAULT_TIME_STEP, cur_time)
+                    predicted_target_ids.add(id(target))
+
+        new_particle_set = []
+        for p_idx in range(num_particles):
+            new_particle = particle_set[np.random.randint(num_particles)].create_child()
+            updated_targets = np.random.choice(num_targets, size=targets_updated_per_frame, replace=False)
+            for t_idx in updated_targets:
+                target = new_particle.targets.writable_target(t_idx)
+                target.update(target.x[[0, 2], 0] + np.random.randn(2), 40.0, 30.0, cur_time, meas_noise_cov)
+            new_particle.all_measurement_associations.append(list(updated_targets))
+            new_particle.all_dead_targets.append([])
+            #the benchmark only keeps one generation of ancestors alive
+            new_particle.parent_particle = None
+            new_particle.targets.parent_target_set = None
+            new_particle_set.append(new_particle)
+        particle_set = new_particle_set
+    elapsed = time.time() - t0
+
+    frames_per_second = (num_frames - 1)/elapsed
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print "USE_COPY_ON_WRITE =", use_copy_on_write, ":", frames_per_second, "frames per second, peak RSS:", peak_rss
+    return (frames_per_second, peak_rss)
+
+def test_copy_on_write_isolation(num_targets=5):
+    '''
+    Check that with USE_COPY_ON_WRITE a write through writable_target on either side of
+    create_child (e.g. match_target_ids renaming the parent's targets) leaves the other
+    TargetSet's living_targets unchanged
+    '''
+    rbpf.USE_COPY_ON_WRITE = True
+    fw_spec = set_up_synthetic_run(1)
+    parent = synthetic_particle_set(1, num_targets, fw_spec, jitter=False)[0]
+    child = parent.create_child()
+    child_targets = list(child.targets.living_targets)
+    child_ids = [target.id_ for target in child_targets]
+
+    #parent side write
+    parent.targets.writable_target(0).id_ = 999
+    assert(parent.targets.living_targets[0].id_ == 999)
+    assert(all([target is child_target for (target, child_target) in zip(child.targets.living_targets, child_targets)]))
+    assert([target.id_ for target in child.targets.living_targets] == child_ids), [target.id_ for target in child.targets.living_targets]
+
+    #child side write
+    child.targets.writable_target(1).id_ = 998
+    assert(parent.targets.living_targets[1].id_ == child_ids[1])
+    assert(child.targets.living_targets[0].id_ == child_ids[0])
+    print "copy on write isolation test passed"
+
+def reachable_objects(root, shared):
+    '''
+    Outputs:
+    - objects: dictionary with key: id, value: every object reachable from root through
+        gc.get_referents, except modules, classes, functions and the objects in shared
+    '''
+    skipped_types = (types.ModuleType, type, types.ClassType, types.FunctionType, types.BuiltinFunctionType)
+    shared_ids = set([id(obj) for obj in shared])
+    objects = {}
+    stack = [root]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in objects or id(obj) in shared_ids or isinstance(obj, skipped_types):
+            continue
+        objects[id(obj)] = obj
+        stack.extend(gc.get_referents(obj))
+    return objects
+
+def benchmark_target_memory(num_frames=200, history_window=None):
+    '''
+    Measure the memory of a Target that was predicted and updated for num_frames frames and the
+    memory each copy of it adds (what every particle holding the target pays), with copy.deepcopy
+    (create_child without USE_COPY_ON_WRITE) and Target.clone (USE_COPY_ON_WRITE).  Sizes are
+    sys.getsizeof summed over reachable objects (numpy arrays include their data).
+
+    Measured with 200 frames, before the __slots__ Target with Trajectory history and after:
+    - target: 55.7KB before, 64.9KB after (3.5KB with history_window=5)
+    - per deepcopy: 50.5KB before, 0.8KB after
+    - per clone: 5.9KB before, 0.5KB after
+
+    Inputs:
+    - history_window: value of rbpf.TARGET_HISTORY_WINDOW
+    '''
+    rbpf.TARGET_HISTORY_WINDOW = history_window
+    fw_spec = set_up_synthetic_run(1)
+    rbpf.SPEC['RUN_ONLINE'] = True
+    rbpf.NEXT_TARGET_ID = 0
+    meas_noise_cov = np.diag([10.0, 5.0])
+    target_set = rbpf.TargetSet(fw_spec)
+    target_set.create_new_target(np.array([100.0, 150.0]), 40.0, 30.0, 0.0)
+    target = target_set.living_targets[0]
+    for frame_idx in range(1, num_frames):
+        cur_time = round(frame_idx*rbpf.DEFAULT_TIME_STEP, 2)
+        target.predict(rbpf.DEFAULT_TIME_STEP, cur_time)
+        target.update(target.x[[0, 2], 0] + 1.0, 40.0, 30.0, cur_time, meas_noise_cov)
+
+    #SPEC['P'] and fw_spec are shared by every target of a sequence
+    shared = [rbpf.SPEC, fw_spec]
+    target_objects = reachable_objects(target, shared)
+    def added_bytes(target_copy):
+        return sum([sys.getsizeof(obj) for (obj_id, obj) in reachable_objects(target_copy, shared).items()
+                    if not obj_id in target_objects])
+    target_bytes = sum([sys.getsizeof(obj) for obj in target_objects.values()])
+    print "TARGET_HISTORY_WINDOW =", history_window, ",", num_frames, "frames:"
+    print "target:", target_bytes, "bytes"
+    print "per deepcopy:", added_bytes(copy.deepcopy(target)), "bytes"
+    print "per clone:", added_bytes(target.clone()), "bytes"
+
+
+if __name__ == "__main__":
+    BENCHMARKS = {'particle_store': benchmark_particle_store,
+                  'create_child': lambda: benchmark_create_child(False),
+                  'create_child_copy_on_write': lambda: benchmark_create_child(True),
+                  'copy_on_write_isolation': test_copy_on_write_isolation,
+                  'target_memory': benchmark_target_memory}
+    if len(sys.argv) != 2 or not sys.argv[1] in BENCHMARKS:
+        print "usage: python benchmark_rbpf.py [%s]" % '|'.join(sorted(BENCHMARKS))
+        sys.exit(1)
+    BENCHMARKS[sys.argv[1]]()
@@ -0,0 +1,331 @@
+#Speed tests of rbpf_sampling_manyMeasSrcs.py on random detection groups and targets.  Each speed
+#test checks the optimized code against its reference implementation and prints timings.
+#
+#Each speed test sets the rbpf_sampling_manyMeasSrcs module flags it needs, run them with e.g.
+# $ python benchmark_rbpf_sampling.py construct_log_probs_matrix3
+from __future__ import division
+import sys
+import time
+import random
+import numpy as np
+from numpy.linalg import inv
+from sets import ImmutableSet
+from itertools import combinations
+import rbpf_sampling_manyMeasSrcs as sampling
+from spatial_gating import mahalanobis_sq_2d
+
+
+class SpeedTestTarget:
+    pass
+
+class SpeedTestTargetSet:
+    pass
+
+class SpeedTestParticle:
+    pass
+
+def speed_test_parameters(det_count):
+    '''
+    Outputs:
+    - params: type Parameters with random priors and fixed covariances for det_count detection
+        sources named 'det0', 'det1', ...
+    '''
+    det_names = ['det%d' % det_idx for det_idx in range(det_count)]
+    all_groups = []
+    for group_size in range(det_count + 1):
+        all_groups.extend([ImmutableSet(det_combo) for det_combo in combinations(det_names, group_size)])
+    emission_priors = np.random.rand(len(all_groups))
+    target_groupEmission_priors = dict(zip(all_groups, emission_priors/np.sum(emission_priors)))
+    birth_lambdas_by_group = dict([(group, np.random.rand()) for group in all_groups if len(group) > 0])
+    clutter_lambdas_by_group = dict([(group, np.random.rand()) for group in all_groups if len(group) > 0])
+    posOnly_covariance_blocks = {}
+    clutter_posOnly_covariance_blocks = {}
+    posAndSize_inv_covariance_blocks = {}
+    for det_name1 in det_names:
+        for det_name2 in det_names:
+            if det_name1 == det_name2:
+                posOnly_covariance_blocks[(det_name1, det_name2)] = np.diag([30.0, 10.0])
+                clutter_posOnly_covariance_blocks[(det_name1, det_name2)] = np.diag([60.0, 20.0])
+                posAndSize_inv_covariance_blocks[(det_name1, det_name2)] = inv(np.diag([30.0, 10.0, 20.0, 20.0]))
+            else:
+                posOnly_covariance_blocks[(det_name1, det_name2)] = np.diag([5.0, 2.0])
+                clutter_posOnly_covariance_blocks[(det_name1, det_name2)] = np.diag([5.0, 2.0])
+                posAndSize_inv_covariance_blocks[(det_name1, det_name2)] = .001*np.eye(4)
+    meas_noise_mean = dict([(det_name, np.zeros(4)) for det_name in det_names])
+    H = np.array([[1.0, 0.0, 0.0, 0.0],
+                  [0.0, 0.0, 1.0, 0.0]])
+    params = sampling.Parameters(det_names, target_groupEmission_priors, {}, {}, clutter_lambdas_by_group, {},
+                        birth_lambdas_by_group, posOnly_covariance_blocks, meas_noise_mean, posAndSize_inv_covariance_blocks, None, H, False, False,
+                        None, .5, .5, False, None, False, {'birth_clutter_model': 'poisson', 'birth_clutter_likelihood': 'aprox1'},
+                        None, clutter_posOnly_covariance_blocks, None)
+    return params
+
+def speed_test_particle(T):
+    '''
+    Outputs:
+    - particle: a particle with T random living targets
+    '''
+    particle = SpeedTestParticle()
+    particle.targets = SpeedTestTargetSet()
+    particle.targets.living_targets = []
+    for t_idx in range(T):
+        target = SpeedTestTarget()
+        target.x = np.array([[np.random.rand()*1242], [np.random.randn()], [np.random.rand()*375], [np.random.randn()]])
+        target.P = np.diag([40.0, 10.0, 5.0, 10.0])
+        target.offscreen = (t_idx == 0)
+        target.death_prob = np.random.rand()
+        particle.targets.living_targets.append(target)
+    return particle
+
+def speed_test_meas_groups(M, det_names, group_size=None, targets=None):
+    '''
+    Outputs:
+    - meas_groups: M random detection groups of group_size detections (random sizes if None),
+        centered near a random target in targets if given (anywhere in the image otherwise)
+    '''
+    meas_groups = []
+    for m_idx in range(M):
+        if group_size is None:
+            cur_group_size = np.random.randint(1, len(det_names) + 1)
+        else:
+            cur_group_size = group_size
+        if targets is None:
+            center = np.array([np.random.rand()*1242, np.random.rand()*375])
+        else:
+            target = random.choice(targets)
+            center = np.array([target.x[0][0], target.x[2][0]]) + np.random.randn(2)*10
+        meas_groups.append(dict([(det_name, np.concatenate((center + np.random.randn(2)*5, [40.0, 30.0])))
+                                 for det_name in random.sample(det_names, cur_group_size)]))
+    return meas_groups
+
+def speed_test_construct_log_probs_matrix3(M=30, T=20, det_count=5, iters=20):
+    '''
+    Time construct_log_probs_matrix3 against construct_log_probs_matrix3_loops on random
+    detection groups and targets, and check they give the same values
+    Inputs:
+    - M: number of detection groups
+    - T: number of living targets
+    - det_count: number of detection sources
+    - iters: number of times to construct each matrix
+    '''
+    params = speed_test_parameters(det_count)
+    particle = speed_test_particle(T)
+    meas_groups = speed_test_meas_groups(M, params.det_names)
+    p_target_deaths = [target.death_prob for target in particle.targets.living_targets]
+    #built once per time instance and shared by all particles
+    meas_frame = sampling.MeasurementFrame(meas_groups, params)
+
+    #clear the likelihood cache before every construction to time computing the likelihoods
+    t1 = time.time()
+    for test_iter in range(iters):
+        params.assoc_likelihood_cache.begin_frame()
+        log_probs_loops = sampling.construct_log_probs_matrix3_loops(particle, meas_groups, T, p_target_deaths, params)
+    t2 = time.time()
+    for test_iter in range(iters):
+        params.assoc_likelihood_cache.begin_frame()
+        log_probs = sampling.construct_log_probs_matrix3(particle, meas_groups, T, p_target_deaths, params, meas_frame=meas_frame)
+    t3 = time.time()
+    #every likelihood cached, as for particles sharing their parent's targets
+    for test_iter in range(iters):
+        log_probs_cached = sampling.construct_log_probs_matrix3(particle, meas_groups, T, p_target_deaths, params, meas_frame=meas_frame)
+    t4 = time.time()
+
+    assert(np.allclose(log_probs, log_probs_loops, rtol=1e-9, atol=1e-6)), np.max(np.abs(log_probs - log_probs_loops))
+    assert(np.allclose(log_probs_cached, log_probs_loops, rtol=1e-9, atol=1e-6)), np.max(np.abs(log_probs_cached - log_probs_loops))
+    print "construct_log_probs_matrix3_loops took", (t2-t1)/iters, "seconds per matrix"
+    print "construct_log_probs_matrix3 took", (t3-t2)/iters, "seconds per matrix"
+    print "speedup:", (t2-t1)/(t3-t2)
+    print "construct_log_probs_matrix3 with cached likelihoods took", (t4-t3)/iters, "seconds per matrix"
+    print params.assoc_likelihood_cache.report()
+
+def speed_test_stacked_detection_likelihood(M=30, T=20, det_count=5, iters=20):
+    '''
+    For every detection group size, time stacked_detection_likelihoods against dense_assoc_likelihood
+    on M random detection groups and T random targets and check they give the same values.  The
+    cost per (group, target) pair of stacked_detection_likelihoods should not grow with the group size.
+    '''
+    params = speed_test_parameters(det_count)
+    particle = speed_test_particle(T)
+    living_targets = particle.targets.living_targets
+    for group_size in range(1, det_count + 1):
+        meas_groups = speed_test_meas_groups(M, params.det_names, group_size, living_targets)
+
+        t1 = time.time()
+        dense_likelihoods = np.array([[sampling.dense_assoc_likelihood(target, meas_group, params) for target in living_targets]
+                                      for meas_group in meas_groups])
+        t2 = time.time()
+        single_pair_likelihoods = np.array([[sampling.compute_assoc_likelihood(target, meas_group, params) for target in living_targets]
+                                            for meas_group in meas_groups])
+        t3 = time.time()
+        for test_iter in range(iters):
+            grouped_types = sampling.group_meas_groups_by_size(meas_groups, params)
+            (target_means, target_covs) = sampling.target_meas_space_terms(living_targets, params)
+            likelihoods = sampling.stacked_detection_likelihoods(sampling.detection_group_terms(meas_groups, grouped_types), target_means, target_covs)
+        t4 = time.time()
+
+        assert(np.allclose(likelihoods, dense_likelihoods, rtol=1e-7, atol=1e-300)), np.max(np.abs(likelihoods - dense_likelihoods)/dense_likelihoods)
+        assert(np.allclose(single_pair_likelihoods, dense_likelihoods, rtol=1e-7, atol=1e-300)), np.max(np.abs(single_pair_likelihoods - dense_likelihoods)/dense_likelihoods)
+        print group_size, "detections per group, seconds per pair: dense_assoc_likelihood", (t2-t1)/(M*T),\
+            "compute_assoc_likelihood", (t3-t2)/(M*T), "stacked_detection_likelihoods", (t4-t3)/(iters*M*T)
+
+def speed_test_spatial_gating(M=100, T=60, det_count=3, iters=20):
+    '''
+    Time construct_log_probs_matrix3 and the min cost proposal's cost matrix with and without
+    USE_SPATIAL_GATING on M random detection groups near T random targets, and check that gating
+    keeps exactly the pairs within the gate and does not change their entries
+    '''
+    params = speed_test_parameters(det_count)
+    params.SPEC['targ_meas_assoc_metric'] = 'distance'
+    particle = speed_test_particle(T)
+    living_targets = particle.targets.living_targets
+    meas_groups = speed_test_meas_groups(M, params.det_names, targets=living_targets)
+    p_target_deaths = [target.death_prob for target in living_targets]
+    for target in living_targets:
+        target.width = 40.0
+        target.height = 30.0
+    target_pos4D = [np.array([target.x[0][0], target.x[2][0], target.width, target.height]) for target in living_targets]
+
+    sampling.USE_SPATIAL_GATING = False
+    meas_frame = sampling.MeasurementFrame(meas_groups, params)
+    sampling.USE_SPATIAL_GATING = True
+    gated_meas_frame = sampling.MeasurementFrame(meas_groups, params)
+
+    t1 = time.time()
+    for test_iter in range(iters):
+        params.assoc_likelihood_cache.begin_frame()
+        log_probs = sampling.construct_log_probs_matrix3(particle, meas_groups, T, p_target_deaths, params, meas_frame=meas_frame)
+    t2 = time.time()
+    for test_iter in range(iters):
+        params.assoc_likelihood_cache.begin_frame()
+        gated_log_probs = sampling.construct_log_probs_matrix3(particle, meas_groups, T, p_target_deaths, params, meas_frame=gated_meas_frame)
+    t3 = time.time()
+
+    #gated pairs are exactly the pairs within the gate
+    (meas_indices, target_indices) = gated_meas_frame.spatial_gate.gated_pairs(*sampling.target_meas_space_terms(living_targets, params))
+    all_meas_indices = np.repeat(np.arange(M), T)
+    all_target_indices = np.tile(np.arange(T), M)
+    (target_means, target_covs) = sampling.target_meas_space_terms(living_targets, params)
+    spatial_gate = gated_meas_frame.spatial_gate
+    distances = mahalanobis_sq_2d(spatial_gate.group_means[all_meas_indices] - target_means[all_target_indices],
+                                  spatial_gate.group_covs[all_meas_indices] + target_covs[all_target_indices])
+    assert(set(zip(meas_indices, target_indices)) == set(zip(all_meas_indices[distances <= sampling.SPATIAL_GATE], all_target_indices[distances <= sampling.SPATIAL_GATE])))
+    gated = np.zeros((M, T), dtype=bool)
+    gated[meas_indices, target_indices] = True
+    assert(np.allclose(gated_log_probs[:M, :T][gated], log_probs[:M, :T][gated], rtol=1e-9, atol=1e-6))
+    assert((gated_log_probs[:M, :T][~gated] == -1*sampling.INFEASIBLE_COST).all())
+    assert(np.array_equal(gated_log_probs[M:, :], log_probs[M:, :]) and np.array_equal(gated_log_probs[:, T:], log_probs[:, T:]))
+
+    for (metric, max_assoc_cost) in [('distance', 50.0), ('box_overlap', .5)]:
+        params.SPEC['targ_meas_assoc_metric'] = metric
+        t4 = time.time()
+        for test_iter in range(iters):
+            cost_matrix = [[1e9]*T for m_idx in range(M)]
+            for (m_idx, meas_grp_mean) in enumerate(meas_frame.meas_grp_means4D):
+                for t_idx in range(T):
+                    if metric == 'distance':
+                        c = sampling.l2_dist(meas_grp_mean, target_pos4D[t_idx])
+                    else:
+                        c = 1 - sampling.boxoverlap(meas_grp_mean, target_pos4D[t_idx])
+                    if c <= max_assoc_cost:
+                        cost_matrix[m_idx][t_idx] = c
+        t5 = time.time()
+        for test_iter in range(iters):
+            gated_cost_matrix = sampling.gated_min_cost_matrix(meas_frame.meas_grp_means4D, target_pos4D, params, max_assoc_cost,
+                                                      gated_meas_frame.meas_grid, 1e9)
+        t6 = time.time()
+        assert(gated_cost_matrix == cost_matrix)
+        print metric, "min cost matrix took", (t5-t4)/iters, "seconds with every pair,", (t6-t5)/iters, "seconds with gating"
+
+    print len(meas_indices), "of", M*T, "pairs pass the gate"
+    print "construct_log_probs_matrix3 took", (t2-t1)/iters, "seconds per matrix"
+    print "construct_log_probs_matrix3 with spatial gating took", (t3-t2)/iters, "seconds per matrix"
+
+def speed_test_group_detections(objects=40, det_count=5, iters=20, duplicates=3):
+    '''
+    Time group_detections_by_source against group_detections_munkres on random detections
+    of objects random objects from det_count detection sources and check they form the same groups.
+    Then repeat the check with the first duplicates detections of the first source duplicated, so
+    later detections have equal cost assignments to the duplicated groups, and the first duplicates
+    detections of the last source duplicated, so equal detections compete for the same group: all
+    versions must resolve these ties the same way
+    '''
+    params = speed_test_parameters(det_count)
+    params.SPEC['coord_ascent_params'] = dict([('det_grouping_min_overlap_%s' % det_name, [.5]) for det_name in params.det_names])
+    object_boxes = np.column_stack((np.random.rand(objects)*1242, np.random.rand(objects)*375,
+                                    20 + np.random.rand(objects)*100, 20 + np.random.rand(objects)*100))
+    measurement_lists = []
+    widths = []
+    heights = []
+    for det_name in params.det_names:
+        detected = np.where(np.random.rand(objects) < .8)[0]
+        boxes = object_boxes[detected] + np.random.randn(len(detected), 4)*5
+        measurement_lists.append([box[0:2] for box in boxes])
+        widths.append(list(boxes[:, 2]))
+        heights.append(list(boxes[:, 3]))
+    max_costs = dict([(det_name, sampling.detection_grouping_max_cost(det_name, params)) for det_name in params.det_names])
+
+    def group_contents(cur_meas_groups):
+        return [sorted([(det_name, tuple(detection)) for (det_name, detection) in meas_group.iteritems()])
+                for meas_group in cur_meas_groups]
+
+    def incremental_groups(cur_measurement_lists, cur_widths, cur_heights):
+        incremental_meas_groups = []
+        for det_idx, det_name in enumerate(params.det_names):
+            sampling.group_detections(incremental_meas_groups, det_name, cur_measurement_lists[det_idx], cur_widths[det_idx], cur_heights[det_idx], params)
+        return incremental_meas_groups
+
+    sampling.USE_VECTORIZED_DETECTION_GROUPING = False
+    t1 = time.time()
+    for test_iter in range(iters):
+        munkres_meas_groups = []
+        for det_idx, det_name in enumerate(params.det_names):
+            sampling.group_detections_munkres(munkres_meas_groups, det_name, measurement_lists[det_idx], widths[det_idx], heights[det_idx], params)
+    t2 = time.time()
+    for test_iter in range(iters):
+        meas_groups = sampling.group_detections_by_source(measurement_lists, widths, heights, params.det_names, max_costs).meas_groups()
+    t3 = time.time()
+    sampling.USE_VECTORIZED_DETECTION_GROUPING = True
+    for test_iter in range(iters):
+        incremental_meas_groups = incremental_groups(measurement_lists, widths, heights)
+    t4 = time.time()
+
+    assert(group_contents(meas_groups) == group_contents(munkres_meas_groups))
+    assert(group_contents(incremental_meas_groups) == group_contents(munkres_meas_groups))
+    print len(meas_groups), "detection groups from", sum([len(meas_list) for meas_list in measurement_lists]), "detections"
+    print "group_detections_munkres took", (t2-t1)/iters, "seconds per time instance"
+    print "group_detections_by_source took", (t3-t2)/iters, "seconds per time instance"
+    print "speedup:", (t2-t1)/(t3-t2)
+    print "group_detections took", (t4-t3)/iters, "seconds per time instance"
+
+    #ties
+    for det_idx in [0, len(params.det_names) - 1]:
+        duplicated = min(duplicates, len(measurement_lists[det_idx]))
+        measurement_lists[det_idx] = measurement_lists[det_idx] + measurement_lists[det_idx][0:duplicated]
+        widths[det_idx] = widths[det_idx] + widths[det_idx][0:duplicated]
+        heights[det_idx] = heights[det_idx] + heights[det_idx][0:duplicated]
+    munkres_meas_groups = []
+    for det_idx, det_name in enumerate(params.det_names):
+        sampling.group_detections_munkres(munkres_meas_groups, det_name, measurement_lists[det_idx], widths[det_idx], heights[det_idx], params)
+    meas_groups = sampling.group_detections_by_source(measurement_lists, widths, heights, params.det_names, max_costs).meas_groups()
+    incremental_meas_groups = incremental_groups(measurement_lists, widths, heights)
+    frame_meas_groups = sampling.build_measurement_frame(measurement_lists, widths, heights, params.det_names, params).meas_groups
+    sampling.USE_VECTORIZED_DETECTION_GROUPING = False
+    munkres_frame_meas_groups = sampling.build_measurement_frame(measurement_lists, widths, heights, params.det_names, params).meas_groups
+    sampling.USE_VECTORIZED_DETECTION_GROUPING = True
+
+    assert(group_contents(meas_groups) == group_contents(munkres_meas_groups))
+    assert(group_contents(incremental_meas_groups) == group_contents(munkres_meas_groups))
+    assert(group_contents(frame_meas_groups) == group_contents(munkres_meas_groups))
+    assert(group_contents(munkres_frame_meas_groups) == group_contents(munkres_meas_groups))
+    print "with", duplicates, "duplicated detections in the first and last source all versions form the same groups"
+
+
+if __name__ == "__main__":
+    SPEED_TESTS = {'construct_log_probs_matrix3': speed_test_construct_log_probs_matrix3,
+                   'stacked_detection_likelihood': speed_test_stacked_detection_likelihood,
+                   'spatial_gating': speed_test_spatial_gating,
+                   'group_detections': speed_test_group_detections}
+    if len(sys.argv) != 2 or not sys.argv[1] in SPEED_TESTS:
+        print "usage: python benchmark_rbpf_sampling.py [%s]" % '|'.join(sorted(SPEED_TESTS))
+        sys.exit(1)
+    SPEED_TESTS[sys.argv[1]]()
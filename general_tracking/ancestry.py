@@ -0,0 +1,92 @@
+#Bounded memory particle ancestry.
+#
+#Without pruning, every particle keeps a reference to its parent (Particle.parent_particle) and
+#every TargetSet to its parent TargetSet (so that collect_ancestral_targets can rebuild full
+#trajectories), so every particle that ever existed stays reachable.  Instead, finished (dead)
+#target trajectories are moved into a shared append-only TrackStore when they are killed and each
+#TargetSet records the indices of its lineage's finished tracks in a PersistentHistory (shared
+#with its children in O(1)).  The AncestryManager then only needs to keep one generation of
+#parents (for ID matching when the MAP particle changes) and periodically drops finished tracks
+#that no surviving lineage refers to.
+
+class TrackStore:
+    def __init__(self):
+        #key: track index, value: the finished target (its trajectory is target.trajectory)
+        self.tracks = {}
+        self.next_track_index = 0
+
+    def add(self, target):
+        '''
+        Inputs:
+        - target: a target that has died and will not be modified again
+
+        Outputs:
+        - track_index: (int) index of the stored track
+        '''
+        track_index = self.next_track_index
+        self.tracks[track_index] = target
+        self.next_track_index += 1
+        return track_index
+
+    def get(self, track_index):
+        return self.tracks[track_index]
+
+    def compact(self, live_track_indices):
+        '''
+        Drop every track whose index is not in live_track_indices
+
+        Outputs:
+        - removed_count: (int) number of tracks dropped
+        '''
+        dead_track_indices = [idx for idx in self.tracks if not idx in live_track_indices]
+        for idx in dead_track_indices:
+            del self.tracks[idx]
+        return len(dead_track_indices)
+
+    def __len__(self):
+        return len(self.tracks)
+
+
+class AncestryManager:
+    def __init__(self, track_store, compaction_interval):
+        '''
+        Inputs:
+        - track_store: type TrackStore, shared by all TargetSets
+        - compaction_interval: (int) compact track_store every compaction_interval time instances
+        '''
+        self.track_store = track_store
+        self.compaction_interval = compaction_interval
+
+    def prune(self, particle_set, time_instance_index):
+        '''
+        Call once per time instance after the new particle set has been formed.  Keeps only
+        the parents of the surviving particles (their grandparents and parent TargetSets become
+        unreachable) and periodically compacts the track store.
+
+        Inputs:
+        - particle_set: list of type Particle, the surviving particles
+        - time_instance_index: (int) index of the current time instance
+        '''
+        for particle in particle_set:
+            if particle.parent_particle is not None:
+                particle.parent_particle.parent_particle = None
+            particle.targets.parent_target_set = None
+
+        if time_instance_index % self.compaction_interval == 0:
+            self.compact(particle_set)
+
+    def compact(self, particle_set):
+        '''
+        Drop finished tracks that are not in the lineage of any particle in particle_set
+        '''
+        live_track_indices = set()
+        visited_nodes = set()
+        for particle in particle_set:
+            node = particle.targets.finished_tracks.head
+            #lineages share history nodes, stop once we reach a node we have already visited
+            while node.depth > 0 and not id(node) in visited_nodes:
+                visited_nodes.add(id(node))
+                live_track_indices.update(node.entry.tolist())
+                node = node.parent
+        removed_count = self.track_store.compact(live_track_indices)
+        print "ancestry compaction removed", removed_count, "finished tracks,", len(self.track_store), "remain"
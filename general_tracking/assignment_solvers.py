@@ -0,0 +1,248 @@
+#Registry of linear assignment solvers.
+#
+#Every assignment problem of the tracker (min cost measurement-target association, detection grouping,
+#matching target ids between particles, the KITTI evaluation and the remaining cost matrices of
+#Murty's algorithm) is solved with linear_assignment, which takes a cost matrix of any shape and
+#hands it to a registered solver in a common form: a float numpy array with no more rows than
+#columns (taller matrices are transposed) and entries >= INFEASIBLE_COST for infeasible entries.
+#
+#Call sites pass 'auto' to pick the fastest solver for the problem's size and density of feasible
+#entries from SOLVER_CALIBRATION, except where the result must not depend on how the solver breaks
+#ties (the KITTI evaluation pins munkres).  ASSIGNMENT_SOLVER overrides every call site with the name
+#of a registered solver or with 'auto'.  calibrate_solvers benchmarks the registered solvers on the
+#local machine and produces that table.
+#
+#The time spent in every solver is counted per call site, see print_solver_timings.
+
+import numpy as np
+import time
+from munkres import Munkres
+from scipy.optimize import linear_sum_assignment
+from global_params import INFEASIBLE_COST
+from incremental_assignment import solve_assignment
+from auction_assignment import auction_assignment, dense_edges
+try:
+    from pymatgen.optimization import linear_assignment as pymatgen_linear_assignment
+except ImportError:
+    pymatgen_linear_assignment = None
+
+#None: every call site uses its own solver ('auto' unless pinned)
+#'auto': pick the solver from SOLVER_CALIBRATION
+#or the name of a registered solver to use everywhere, e.g. 'scipy'
+ASSIGNMENT_SOLVER = None
+
+#key: (size, density) benchmarked by calibrate_solvers, value: name of the fastest solver.  A problem
+#uses the entry of the smallest benchmarked size >= max(rows, columns) and the smallest benchmarked
+#density >= its fraction of feasible entries (the largest if there is none).  Produced by
+#calibrate_solvers([5, 10, 25, 50, 100, 200, 400], [.05, .2, 1.0], 3) with numpy 1.16 and scipy 1.2
+#(without pymatgen), rerun it to calibrate other machines
+SOLVER_CALIBRATION = {
+    (5, .05): 'munkres', (5, .2): 'munkres', (5, 1.0): 'munkres',
+    (10, .05): 'incremental', (10, .2): 'incremental', (10, 1.0): 'incremental',
+    (25, .05): 'incremental', (25, .2): 'incremental', (25, 1.0): 'incremental',
+    (50, .05): 'incremental', (50, .2): 'incremental', (50, 1.0): 'incremental',
+    (100, .05): 'incremental', (100, .2): 'incremental', (100, 1.0): 'incremental',
+    (200, .05): 'incremental', (200, .2): 'incremental', (200, 1.0): 'incremental',
+    (400, .05): 'auction', (400, .2): 'incremental', (400, 1.0): 'incremental',
+}
+
+#key: name, value: function(cost_matrix) with cost_matrix a float numpy array with shape (R, C), R <= C,
+#returning a numpy array of ints with shape (R,), the column assigned to every row, or None if every
+#assignment uses an infeasible entry
+SOLVERS = {}
+#names of the solvers that work on the feasible entries only, the other solvers get infeasible entries
+#replaced by a cost larger than any difference between assignments of feasible entries
+SPARSE_SOLVERS = set()
+
+#key: (call site, solver name), value: [number of calls, total seconds]
+SOLVER_TIMINGS = {}
+
+
+def register_solver(name, solve, sparse=False):
+    '''
+    Inputs:
+    - name: string, the solver's name
+    - solve: function(cost_matrix) -> col4row, see SOLVERS
+    - sparse: boolean, True if solve handles infeasible entries itself, see SPARSE_SOLVERS
+    '''
+    SOLVERS[name] = solve
+    if sparse:
+        SPARSE_SOLVERS.add(name)
+    else:
+        SPARSE_SOLVERS.discard(name)
+
+def munkres_solver(cost_matrix):
+    association_list = Munkres().compute(cost_matrix.tolist())
+    return np.array([col for (row, col) in sorted(association_list)], dtype=int)
+
+def scipy_solver(cost_matrix):
+    (row_ind, col_ind) = linear_sum_assignment(cost_matrix)
+    return col_ind[np.argsort(row_ind)]
+
+def pymatgen_solver(cost_matrix):
+    return np.array(pymatgen_linear_assignment.LinearAssignment(cost_matrix).solution, dtype=int)
+
+def incremental_solver(cost_matrix):
+    #shortest augmenting paths need non-negative costs, every row is assigned once so a shift
+    #doesn't change the optimal assignment
+    feasible = cost_matrix < INFEASIBLE_COST
+    if feasible.any() and np.min(cost_matrix[feasible]) < 0:
+        cost_matrix = np.where(feasible, cost_matrix - np.min(cost_matrix[feasible]), cost_matrix)
+    state = solve_assignment(cost_matrix)
+    if state is None:
+        return None
+    return state.col4row[:cost_matrix.shape[0]]
+
+def auction_solver(cost_matrix):
+    (R, C) = cost_matrix.shape
+    (edge_rows, edge_cols, edge_costs) = dense_edges(cost_matrix)
+    (col4row, prices) = auction_assignment(R, C, edge_rows, edge_cols, edge_costs)
+    return col4row
+
+register_solver('munkres', munkres_solver)
+register_solver('scipy', scipy_solver)
+if pymatgen_linear_assignment is not None:
+    register_solver('pymatgen', pymatgen_solver)
+register_solver('incremental', incremental_solver, sparse=True)
+register_solver('auction', auction_solver, sparse=True)
+
+
+def penalized_costs(cost_matrix, feasible):
+    '''
+    Inputs:
+    - cost_matrix: numpy array with shape (R, C), R <= C
+    - feasible: numpy array of bools with shape (R, C), the entries < INFEASIBLE_COST
+
+    Outputs:
+    - penalized_cost_matrix: cost_matrix with infeasible entries replaced by a cost larger than any
+        difference between assignments of feasible entries, so minimum cost assignments use as few
+        infeasible entries as possible without summing INFEASIBLE_COST with small costs
+    '''
+    if feasible.all():
+        return cost_matrix
+    if not feasible.any():
+        return np.zeros(cost_matrix.shape)
+    max_cost = np.max(cost_matrix[feasible])
+    min_cost = np.min(cost_matrix[feasible])
+    penalty = max_cost + cost_matrix.shape[0]*(max_cost - min_cost) + 1.0
+    return np.where(feasible, cost_matrix, penalty)
+
+
+def calibrated_solver(R, C, density):
+    '''
+    Inputs:
+    - R, C: shape of the cost matrix
+    - density: fraction of feasible entries
+
+    Outputs:
+    - solver: name of the solver SOLVER_CALIBRATION picks
+    '''
+    sizes = sorted(set([size for (size, table_density) in SOLVER_CALIBRATION]))
+    densities = sorted(set([table_density for (size, table_density) in SOLVER_CALIBRATION]))
+    size = ([s for s in sizes if s >= max(R, C)] + [sizes[-1]])[0]
+    density = ([d for d in densities if d >= density] + [densities[-1]])[0]
+    return SOLVER_CALIBRATION[(size, density)]
+
+def linear_assignment(cost_matrix, solver='auto', call_site=None):
+    '''
+    Find the minimum cost assignment of a cost matrix
+
+    Inputs:
+    - cost_matrix: numpy array or list of lists with shape (R, C), entries >= INFEASIBLE_COST are infeasible
+    - solver: name of the registered solver the call site uses (or 'auto'), unless ASSIGNMENT_SOLVER
+        overrides it
+    - call_site: string, the key of the call's timing counters (with the solver's name)
+
+    Outputs:
+    - association_list: list of (row, col) pairs sorted by row, the min(R, C) pairs of a minimum cost
+        assignment.  Infeasible entries count as very expensive (like with Munkres) and pairs in them
+        are left out, so fewer pairs are returned when every assignment uses infeasible entries
+    '''
+    cost_matrix = np.array(cost_matrix, dtype=float)
+    if cost_matrix.size == 0:
+        return []
+    assert(cost_matrix.ndim == 2), cost_matrix.shape
+    transposed = cost_matrix.shape[0] > cost_matrix.shape[1]
+    if transposed:
+        cost_matrix = cost_matrix.T
+    (R, C) = cost_matrix.shape
+    feasible = cost_matrix < INFEASIBLE_COST
+
+    if ASSIGNMENT_SOLVER is not None:
+        solver = ASSIGNMENT_SOLVER
+    if solver == 'auto':
+        solver = calibrated_solver(R, C, float(np.count_nonzero(feasible))/cost_matrix.size)
+    assert(solver in SOLVERS), (solver, SOLVERS.keys())
+
+    t0 = time.time()
+    if solver in SPARSE_SOLVERS:
+        col4row = SOLVERS[solver](cost_matrix)
+        if col4row is None:
+            #every assignment uses infeasible entries, use as few as possible
+            col4row = scipy_solver(penalized_costs(cost_matrix, feasible))
+    else:
+        col4row = SOLVERS[solver](penalized_costs(cost_matrix, feasible))
+    timing = SOLVER_TIMINGS.setdefault((call_site, solver), [0, 0.0])
+    timing[0] += 1
+    timing[1] += time.time() - t0
+
+    rows = np.arange(R)
+    assigned = feasible[rows, col4row]
+    if transposed:
+        association_list = sorted(zip(col4row[assigned].tolist(), rows[assigned].tolist()))
+    else:
+        association_list = zip(rows[assigned].tolist(), col4row[assigned].tolist())
+    return association_list
+
+def print_solver_timings():
+    print "assignment solver timings (call site, solver: calls, seconds):"
+    for ((call_site, solver), (calls, seconds)) in sorted(SOLVER_TIMINGS.items()):
+        print "%s, %s: %d, %f" % (call_site, solver, calls, seconds)
+
+def reset_solver_timings():
+    SOLVER_TIMINGS.clear()
+
+
+def calibrate_solvers(sizes, densities, iters, solvers=None):
+    '''
+    Benchmark the registered solvers on random square problems and install the fastest solver for
+    every size and density as SOLVER_CALIBRATION
+
+    Inputs:
+    - sizes: list of ints, numbers of rows and columns
+    - densities: list of floats, probability that an entry is feasible (each row also gets one feasible
+        entry on a random permutation, so every problem is feasible)
+    - iters: number of random problems per size and density
+    - solvers: list of solver names to benchmark, all registered solvers if None.  Munkres is only
+        benchmarked up to size 100
+
+    Outputs:
+    - calibration: dictionary, the new SOLVER_CALIBRATION
+    '''
+    global SOLVER_CALIBRATION
+    if solvers is None:
+        solvers = sorted(SOLVERS.keys())
+    calibration = {}
+    for N in sizes:
+        for density in densities:
+            times = dict([(solver, 0.0) for solver in solvers if solver != 'munkres' or N <= 100])
+            for test_iter in range(iters):
+                cost_matrix = INFEASIBLE_COST*np.ones((N, N))
+                feasible = np.random.rand(N, N) < density
+                feasible[np.arange(N), np.random.permutation(N)] = True
+                cost_matrix[feasible] = np.random.rand(np.sum(feasible))*10
+                for solver in times:
+                    t0 = time.time()
+                    if solver in SPARSE_SOLVERS:
+                        SOLVERS[solver](cost_matrix)
+                    else:
+                        SOLVERS[solver](penalized_costs(cost_matrix, feasible))
+                    times[solver] += time.time() - t0
+            calibration[(N, density)] = min(times.keys(), key=lambda solver: times[solver])
+            print "%d, %.2f:" % (N, density), ", ".join(["%s %f" % (solver, times[solver]/iters) for solver in sorted(times)])
+    SOLVER_CALIBRATION = calibration
+    return calibration
+
+
+if __name__ == "__main__":
+    print calibrate_solvers([5, 10, 25, 50, 100, 200, 400], [.05, .2, 1.0], 3)
@@ -0,0 +1,100 @@
+#Connected components of the birth/clutter/death association problem.
+#
+#Measurements and targets are the nodes of a bipartite graph with an edge for every feasible
+#measurement-target entry.  Measurements and targets in different connected components never
+#compete for each other, so an assignment of the (2*M + 2*T)x(2*M + 2*T) matrix (see
+#sparse_association.py) is a choice of one assignment per component plus filler entries, and its
+#cost is the sum of the components' costs: every component with M_c measurements, T_c targets and
+#k_c associations contributes M_c measurement entries, T_c - k_c lives/dies entries and
+#M_c + T_c + k_c filler entries.  The k best assignments are then found from each component's k
+#best assignments (mht_helpers/k_best_assign_birth_clutter_death_matrix.py), which avoids
+#enumerating every combination of independent clusters with Murty's algorithm on the joint problem.
+
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from global_params import INFEASIBLE_COST
+from sparse_association import SparseAssociationMatrix
+
+
+class AssociationComponent:
+    def __init__(self, meas_indices, target_indices, costs):
+        '''
+        Inputs:
+        - meas_indices: numpy array of ints, the component's measurements in the full problem
+        - target_indices: numpy array of ints, the component's targets in the full problem
+        - costs: type SparseAssociationMatrix, the component's (2*M_c + 2*T_c)x(2*M_c + 2*T_c) costs
+            with measurement m and target t of the component at index meas_indices[m] and
+            target_indices[t] of the full problem
+        '''
+        self.meas_indices = meas_indices
+        self.target_indices = target_indices
+        self.costs = costs
+
+    def to_global_pairs(self, pairs, M, T):
+        '''
+        Inputs:
+        - pairs: list of (row, col) pairs, an assignment of the component's costs
+        - M: number of measurements in the full problem
+        - T: number of targets in the full problem
+
+        Outputs:
+        - global_pairs: list of the (row, col) pairs of the full problem that are association, clutter,
+            birth, lives or dies entries, filler entries are dropped
+        '''
+        M_c = self.costs.M
+        T_c = self.costs.T
+        global_pairs = []
+        for (row, col) in pairs:
+            if row < M_c and col < T_c: #association
+                global_pairs.append((self.meas_indices[row], self.target_indices[col]))
+            elif row < M_c: #clutter or birth
+                assert(col == T_c + 2*row or col == T_c + 1 + 2*row), (row, col, M_c, T_c)
+                m = self.meas_indices[row]
+                global_pairs.append((m, T + 2*m + (col - T_c - 2*row)))
+            elif col < T_c: #lives or dies
+                assert(row == M_c + 2*col or row == M_c + 1 + 2*col), (row, col, M_c, T_c)
+                t = self.target_indices[col]
+                global_pairs.append((M + 2*t + (row - M_c - 2*col), t))
+        return global_pairs
+
+
+def association_components(costs):
+    '''
+    Inputs:
+    - costs: type SparseAssociationMatrix of costs, edges with values >= INFEASIBLE_COST are ignored
+
+    Outputs:
+    - components: list of type AssociationComponent, every measurement and target is in exactly
+        one component.  Measurements and targets without feasible edges are components of their own
+    '''
+    M = costs.M
+    T = costs.T
+    feasible = costs.edge_values < INFEASIBLE_COST
+    edge_meas = costs.edge_meas[feasible]
+    edge_targets = costs.edge_targets[feasible]
+    #nodes 0, ..., M-1 are measurements, nodes M, ..., M+T-1 are targets
+    graph = coo_matrix((np.ones(len(edge_meas)), (edge_meas, M + edge_targets)), shape=(M + T, M + T))
+    (component_count, labels) = connected_components(graph, directed=False)
+    meas_labels = labels[:M]
+    target_labels = labels[M:]
+    edge_labels = meas_labels[edge_meas]
+    edge_values = costs.edge_values[feasible]
+    #index of every measurement and target within its component
+    local_meas = np.zeros(M, dtype=int)
+    local_targets = np.zeros(T, dtype=int)
+
+    components = []
+    for label in range(component_count):
+        meas_indices = np.flatnonzero(meas_labels == label)
+        target_indices = np.flatnonzero(target_labels == label)
+        local_meas[meas_indices] = np.arange(len(meas_indices))
+        local_targets[target_indices] = np.arange(len(target_indices))
+        in_component = edge_labels == label
+        component_costs = SparseAssociationMatrix(len(meas_indices), len(target_indices),
+            local_meas[edge_meas[in_component]], local_targets[edge_targets[in_component]], edge_values[in_component],
+            costs.clutter_values[meas_indices], costs.birth_values[meas_indices],
+            costs.lives_values[target_indices], costs.dies_values[target_indices],
+            filler_value=costs.filler_value, infeasible_value=costs.infeasible_value)
+        components.append(AssociationComponent(meas_indices, target_indices, component_costs))
+    return components
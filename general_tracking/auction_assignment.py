@@ -0,0 +1,233 @@
+#Auction algorithm for sparse assignment problems.
+#
+#Rows (persons) bid for columns (objects) along the feasible entries (edges) of the cost matrix.  An
+#unassigned row bids for its cheapest column at the current prices, raising the column's price by the
+#difference to its second cheapest column plus epsilon, and takes the column from its previous row
+#[D. P. Bertsekas, "The auction algorithm: a distributed relaxation method for the assignment
+#problem", Annals of Operations Research, 1988].  All unassigned rows bid at once (Jacobi auction),
+#so every round is a few NumPy operations over the edges of the unassigned rows.  Epsilon scaling
+#runs the auction with decreasing epsilon, each round starting from the previous round's prices and
+#assignment (minus the rows that are no longer within epsilon of their cheapest column), and the final
+#assignment costs at most (number of rows)*epsilon more than the minimum, with
+#epsilon set relative to the range of edge costs by AUCTION_FINAL_EPSILON.
+#
+#Prices from a similar problem (Murty's parent node, or the previous time instance) warm start the
+#auction, which then starts from a smaller epsilon.  Cost matrices with fewer rows than columns are
+#padded with virtual rows of zeros, as in incremental_assignment.py, so only forward bidding is needed.
+#Rows without a feasible entry on the diagonal get an artificial diagonal entry that costs more than
+#any difference between two feasible assignments, so the auction always terminates with bounded
+#prices and the problem is infeasible exactly when the final assignment uses an artificial entry.
+#
+#Time and memory scale with the number of edges rather than rows*columns, see speed_test for the
+#problem sizes and densities where it beats the dense solvers.  Every bidding round has a fixed NumPy
+#overhead, so small problems and problems with many equal costs (e.g. the constant filler block of the
+#(2*M + 2*T)x(2*M + 2*T) association matrices, where rows displace each other one epsilon at a time)
+#are solved faster by the dense solvers.
+
+import numpy as np
+import time
+from munkres import Munkres
+from scipy.optimize import linear_sum_assignment
+from global_params import INFEASIBLE_COST
+
+#epsilon is divided by this factor between rounds of epsilon scaling
+AUCTION_EPSILON_SCALING = 5.0
+#final epsilon, relative to (range of edge costs)/(number of rows)
+AUCTION_FINAL_EPSILON = 1e-7
+
+
+def dense_edges(cost_matrix, infeasible_cost=INFEASIBLE_COST):
+    '''
+    Inputs:
+    - cost_matrix: numpy array with shape (R, C)
+    - infeasible_cost: entries >= infeasible_cost are infeasible
+
+    Outputs:
+    - edge_rows, edge_cols, edge_costs: numpy arrays of the same length, the feasible entries
+    '''
+    (edge_rows, edge_cols) = np.nonzero(cost_matrix < infeasible_cost)
+    return (edge_rows, edge_cols, cost_matrix[edge_rows, edge_cols].astype(float))
+
+def auction_assignment(R, C, edge_rows, edge_cols, edge_costs, prices=None):
+    '''
+    Inputs:
+    - R: number of rows
+    - C: number of columns, R <= C
+    - edge_rows, edge_cols, edge_costs: numpy arrays of the same length, the feasible entries
+        of the cost matrix (in any order), every other entry is infeasible
+    - prices: (optional) numpy array with shape (C,), column prices to warm start from
+
+    Outputs:
+    - col4row: numpy array of ints with shape (R,), the column assigned to every row, None if no
+        assignment is feasible
+    - prices: numpy array with shape (C,), final column prices (up to a constant), warm start a
+        similar problem with them
+    '''
+    assert(R <= C), (R, C)
+    edge_rows = np.asarray(edge_rows, dtype=int)
+    edge_cols = np.asarray(edge_cols, dtype=int)
+    edge_costs = np.asarray(edge_costs, dtype=float)
+    if prices is None:
+        prices = np.zeros(C)
+        warm_start = False
+    else:
+        assert(len(prices) == C), (len(prices), C)
+        #prices only matter up to a constant
+        prices = np.array(prices, dtype=float) - np.min(prices)
+        warm_start = True
+    if R == 0:
+        return (np.zeros(0, dtype=int), prices)
+    if len(edge_costs) > 0:
+        cost_range = max(np.max(edge_costs) - np.min(edge_costs), 1e-6*max(1.0, np.max(np.abs(edge_costs))))
+        artificial_cost = np.max(edge_costs) + (C + 1)*cost_range
+    else:
+        cost_range = 1.0
+        artificial_cost = 1.0
+    #artificial entries on the diagonal
+    diagonal_edges = np.zeros(R, dtype=bool)
+    diagonal_edges[edge_rows[edge_rows == edge_cols]] = True
+    artificial_rows = np.flatnonzero(~diagonal_edges)
+    edge_rows = np.concatenate((edge_rows, artificial_rows))
+    edge_cols = np.concatenate((edge_cols, artificial_rows))
+    edge_costs = np.concatenate((edge_costs, artificial_cost*np.ones(len(artificial_rows))))
+    if R < C: #virtual rows of zeros
+        virtual_rows = np.repeat(np.arange(R, C), C)
+        virtual_cols = np.tile(np.arange(C), C - R)
+        edge_rows = np.concatenate((edge_rows, virtual_rows))
+        edge_cols = np.concatenate((edge_cols, virtual_cols))
+        edge_costs = np.concatenate((edge_costs, np.zeros(len(virtual_rows))))
+    #edges of row i are offsets[i]:offsets[i+1]
+    order = np.lexsort((edge_cols, edge_rows))
+    edge_rows = edge_rows[order]
+    edge_cols = edge_cols[order]
+    edge_costs = edge_costs[order]
+    offsets = np.searchsorted(edge_rows, np.arange(C + 1))
+
+    #epsilon scaling starts from half the range of all entries (or of the warm start prices), from a
+    #smaller epsilon when warm started.  Epsilon stays well above the resolution of the prices
+    price_range = max(np.max(edge_costs) - np.min(edge_costs), np.max(prices))
+    final_epsilon = max(AUCTION_FINAL_EPSILON*cost_range/C, 1e-10*(np.max(np.abs(edge_costs)) + price_range))
+    epsilon = price_range/2
+    if warm_start:
+        epsilon /= AUCTION_EPSILON_SCALING**2
+    epsilon = max(epsilon, final_epsilon)
+    #a row with a single edge must take it, its bid raises the price by this much
+    single_edge_increment = artificial_cost - min(np.min(edge_costs), 0.0)
+
+    col4row = -1*np.ones(C, dtype=int)
+    row4col = -1*np.ones(C, dtype=int)
+    #edge of every assigned row
+    edge4row = -1*np.ones(C, dtype=int)
+    while True:
+        while True:
+            bidders = np.flatnonzero(col4row == -1)
+            if len(bidders) == 0:
+                break
+            #edges of the bidding rows, in segments of consecutive edges per row
+            starts = offsets[bidders]
+            lengths = offsets[bidders + 1] - starts
+            segment_starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+            edge_indices = np.arange(np.sum(lengths)) + np.repeat(starts - segment_starts, lengths)
+            segments = np.repeat(np.arange(len(bidders)), lengths)
+
+            #bidders minimize cost plus price
+            values = edge_costs[edge_indices] + prices[edge_cols[edge_indices]]
+            best_values = np.minimum.reduceat(values, segment_starts)
+            best_positions = np.minimum.reduceat(np.where(values == best_values[segments],
+                np.arange(len(values)), len(values)), segment_starts)
+            values[best_positions] = np.inf
+            second_values = np.minimum.reduceat(values, segment_starts)
+            second_values = np.where(second_values == np.inf, best_values + single_edge_increment, second_values)
+            bid_edges = edge_indices[best_positions]
+            bid_cols = edge_cols[bid_edges]
+            bids = prices[bid_cols] + second_values - best_values + epsilon
+
+            #every column goes to its highest bidder
+            bid_order = np.lexsort((-bids, bid_cols))
+            highest = np.ones(len(bid_order), dtype=bool)
+            highest[1:] = bid_cols[bid_order[1:]] != bid_cols[bid_order[:-1]]
+            winners = bid_order[highest]
+            won_cols = bid_cols[winners]
+            previous_rows = row4col[won_cols]
+            col4row[previous_rows[previous_rows >= 0]] = -1
+            row4col[won_cols] = bidders[winners]
+            col4row[bidders[winners]] = won_cols
+            edge4row[bidders[winners]] = bid_edges[winners]
+            prices[won_cols] = bids[winners]
+        if epsilon <= final_epsilon:
+            break
+        epsilon = max(epsilon/AUCTION_EPSILON_SCALING, final_epsilon)
+        #rows keep their columns if they are within the smaller epsilon of their cheapest column
+        row_values = edge_costs[edge4row] + prices[col4row]
+        best_values = np.minimum.reduceat(edge_costs + prices[edge_cols], offsets[:-1])
+        unassigned_rows = np.flatnonzero(row_values > best_values + epsilon)
+        row4col[col4row[unassigned_rows]] = -1
+        col4row[unassigned_rows] = -1
+    if (col4row[artificial_rows] == artificial_rows).any(): #no feasible assignment
+        return (None, prices)
+    return (col4row[:R], prices)
+
+def auction_assignment_dense(cost_matrix, prices=None, infeasible_cost=INFEASIBLE_COST):
+    '''
+    Inputs:
+    - cost_matrix: numpy array with shape (R, C), R <= C
+    - prices: (optional) numpy array with shape (C,), column prices to warm start from
+    - infeasible_cost: entries >= infeasible_cost are infeasible
+
+    Outputs:
+    - association_list: list of (row, col) pairs, None if no assignment is feasible
+    - prices: numpy array with shape (C,), final column prices
+    '''
+    (R, C) = cost_matrix.shape
+    (edge_rows, edge_cols, edge_costs) = dense_edges(cost_matrix, infeasible_cost)
+    (col4row, prices) = auction_assignment(R, C, edge_rows, edge_cols, edge_costs, prices)
+    if col4row is None:
+        return (None, prices)
+    return (zip(range(R), col4row.tolist()), prices)
+
+
+def speed_test(sizes, edge_probabilities, iters):
+    '''
+    Crossover benchmark, time single solves of random square problems with the auction and the dense
+    solvers (scipy's linear_sum_assignment and Munkres).  The dense solvers see infeasible entries
+    as INFEASIBLE_COST.
+    Inputs:
+    - sizes: list of ints, numbers of rows and columns
+    - edge_probabilities: list of floats, probability that an entry is feasible (each row also gets
+        one feasible entry on a random permutation, so every problem is feasible)
+    - iters: number of random problems per size and edge probability
+    '''
+    print "size, edge probability: auction, scipy, munkres seconds per solve"
+    for N in sizes:
+        for edge_probability in edge_probabilities:
+            times = {'auction': 0.0, 'scipy': 0.0, 'munkres': 0.0}
+            for test_iter in range(iters):
+                cost_matrix = INFEASIBLE_COST*np.ones((N, N))
+                feasible = np.random.rand(N, N) < edge_probability
+                feasible[np.arange(N), np.random.permutation(N)] = True
+                cost_matrix[feasible] = np.random.rand(np.sum(feasible))*10
+
+                t1 = time.time()
+                (auction_pairs, prices) = auction_assignment_dense(cost_matrix)
+                t2 = time.time()
+                (row_ind, col_ind) = linear_sum_assignment(cost_matrix)
+                t3 = time.time()
+                if N <= 100:
+                    Munkres().compute(cost_matrix.tolist())
+                t4 = time.time()
+                times['auction'] += t2 - t1
+                times['scipy'] += t3 - t2
+                times['munkres'] += t4 - t3
+
+                auction_cost = sum([cost_matrix[row, col] for (row, col) in auction_pairs])
+                scipy_cost = np.sum(cost_matrix[row_ind, col_ind])
+                assert(auction_cost - scipy_cost <= N*AUCTION_FINAL_EPSILON*10 + .000001), (auction_cost, scipy_cost)
+            if N <= 100:
+                munkres_time = "%f" % (times['munkres']/iters)
+            else:
+                munkres_time = "skipped"
+            print "%d, %.2f: %f, %f, %s" % (N, edge_probability, times['auction']/iters, times['scipy']/iters, munkres_time)
+
+
+if __name__ == "__main__":
+    speed_test([10, 50, 100, 200, 400], [.02, .1, .5, 1.0], 3)
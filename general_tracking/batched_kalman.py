@@ -0,0 +1,68 @@
+import numpy as np
+
+#Kalman filter predict and update steps over stacks of targets.  These compute exactly
+#what Target.kf_predict and Target.kf_update compute for a single target, but for K targets
+#(possibly belonging to different particles) in one pass.
+#
+#Shapes:
+# - x: (K,4,1) target states, [x, x_vel, y, y_vel]
+# - P: (K,4,4) target state covariances
+# - z: (K,2,1) measured positions
+# - R: (K,2,2) measurement noise covariances, or a single (2,2) matrix shared by all targets
+
+
+def transition_matrix(dt):
+    '''
+    Constant velocity transition matrix for time step dt
+    '''
+    return np.array([[1.0,  dt, 0.0, 0.0],
+                     [0.0, 1.0, 0.0, 0.0],
+                     [0.0, 0.0, 1.0,  dt],
+                     [0.0, 0.0, 0.0, 1.0]])
+
+def batch_kf_predict(x, P, dt, Q):
+    '''
+    Inputs:
+    - x: (numpy array) shape (K,4,1)
+    - P: (numpy array) shape (K,4,4)
+    - dt: time step to run prediction on
+    - Q: (numpy array) 4x4 process noise covariance
+
+    Outputs:
+    - x_predict: (numpy array) shape (K,4,1)
+    - P_predict: (numpy array) shape (K,4,4)
+    '''
+    F = transition_matrix(dt)
+    x_predict = np.matmul(F, x)
+    P_predict = np.matmul(np.matmul(F, P), F.T) + Q
+    assert((P_predict[:, 0, 0] > 0).all() and
+           (P_predict[:, 1, 1] > 0).all() and
+           (P_predict[:, 2, 2] > 0).all() and
+           (P_predict[:, 3, 3] > 0).all()), (Q, P_predict)
+    return (x_predict, P_predict)
+
+def batch_kf_update(x, P, z, R, H):
+    '''
+    Inputs:
+    - x: (numpy array) shape (K,4,1)
+    - P: (numpy array) shape (K,4,4)
+    - z: (numpy array) shape (K,2,1)
+    - R: (numpy array) shape (K,2,2) or (2,2)
+    - H: (numpy array) 2x4 measurement function matrix
+
+    Outputs:
+    - updated_x: (numpy array) shape (K,4,1)
+    - updated_P: (numpy array) shape (K,4,4)
+    '''
+    PHt = np.matmul(P, H.T) #(K,4,2)
+    S = np.matmul(H, PHt) + R #(K,2,2)
+    K = np.matmul(PHt, np.linalg.inv(S)) #(K,4,2)
+    residual = z - np.matmul(H, x) #(K,2,1)
+    updated_x = x + np.matmul(K, residual)
+    #same (not sure if numerically stable) form as Target.kf_update
+    updated_P = P - np.matmul(np.matmul(K, S), np.transpose(K, (0, 2, 1)))
+    assert((updated_P[:, 0, 0] > 0).all() and
+           (updated_P[:, 1, 1] > 0).all() and
+           (updated_P[:, 2, 2] > 0).all() and
+           (updated_P[:, 3, 3] > 0).all()), (P, R, K, updated_P)
+    return (updated_x, updated_P)
@@ -0,0 +1,155 @@
+#Vectorized bounding box geometry shared by detection grouping, target ID matching, evaluation and
+#parameter learning.
+#
+#Boxes are numpy arrays with shape (N, 4), either in center format [x_center, y_center, width, height]
+#(detections, target states) or in corner format [x1, y1, x2, y2] (KITTI objects).  Overlaps are
+#computed for every pair of boxes from two sets at once with the same arithmetic as the scalar KITTI
+#devkit boxoverlap, so gating on the results gives identical decisions.
+#
+#The border and offscreen tests take the corner coordinates as separate arguments, they work on
+#python floats (a single Target) and on numpy arrays of any shape (ParticleStore) alike.
+
+import numpy as np
+
+#a box is near the border if it is within this many pixels of the left/top or right/bottom edge
+NEAR_BORDER_LEFT_TOP = 10
+NEAR_BORDER_RIGHT_BOTTOM = 15
+
+def centers_to_corners(boxes):
+    '''
+    Inputs:
+    - boxes: numpy array with shape (N, 4), rows are [x_center, y_center, width, height]
+
+    Outputs:
+    - corners: numpy array with shape (N, 4), rows are [x1, y1, x2, y2]
+    '''
+    corners = np.empty(boxes.shape)
+    corners[:, 0] = boxes[:, 0] - boxes[:, 2]/2
+    corners[:, 1] = boxes[:, 1] - boxes[:, 3]/2
+    corners[:, 2] = boxes[:, 0] + boxes[:, 2]/2
+    corners[:, 3] = boxes[:, 1] + boxes[:, 3]/2
+    return corners
+
+def corners_to_centers(corners):
+    '''
+    Inputs:
+    - corners: numpy array with shape (N, 4), rows are [x1, y1, x2, y2]
+
+    Outputs:
+    - boxes: numpy array with shape (N, 4), rows are [x_center, y_center, width, height]
+    '''
+    boxes = np.empty(corners.shape)
+    boxes[:, 0] = (corners[:, 0] + corners[:, 2])/2
+    boxes[:, 1] = (corners[:, 1] + corners[:, 3])/2
+    boxes[:, 2] = corners[:, 2] - corners[:, 0]
+    boxes[:, 3] = corners[:, 3] - corners[:, 1]
+    return boxes
+
+def object_corners(objects):
+    '''
+    Inputs:
+    - objects: list of objects with x1, y1, x2, y2 attributes (e.g. KITTI format objects)
+
+    Outputs:
+    - corners: numpy array with shape (len(objects), 4), rows are [x1, y1, x2, y2]
+    '''
+    corners = np.zeros((len(objects), 4))
+    for (obj_idx, obj) in enumerate(objects):
+        corners[obj_idx] = [obj.x1, obj.y1, obj.x2, obj.y2]
+    return corners
+
+def intersection_areas(corners_a, corners_b):
+    '''
+    Inputs:
+    - corners_a: numpy array with shape (A, 4), rows are [x1, y1, x2, y2]
+    - corners_b: numpy array with shape (B, 4)
+
+    Outputs:
+    - inter: numpy array with shape (A, B), intersection area of every pair of boxes, 0 where
+        the boxes don't overlap
+    - overlapping: numpy array of bools with shape (A, B), True where the boxes overlap
+    '''
+    w = np.minimum(corners_a[:, np.newaxis, 2], corners_b[np.newaxis, :, 2]) - \
+        np.maximum(corners_a[:, np.newaxis, 0], corners_b[np.newaxis, :, 0])
+    h = np.minimum(corners_a[:, np.newaxis, 3], corners_b[np.newaxis, :, 3]) - \
+        np.maximum(corners_a[:, np.newaxis, 1], corners_b[np.newaxis, :, 1])
+    overlapping = (w > 0.) & (h > 0.)
+    inter = np.where(overlapping, w*h, 0.)
+    return (inter, overlapping)
+
+def box_areas(corners):
+    return (corners[:, 2] - corners[:, 0]) * (corners[:, 3] - corners[:, 1])
+
+def iou_matrix(corners_a, corners_b):
+    '''
+    Intersection over union of every pair of boxes (boxoverlap with criterion="union")
+
+    Inputs:
+    - corners_a: numpy array with shape (A, 4), rows are [x1, y1, x2, y2]
+    - corners_b: numpy array with shape (B, 4)
+
+    Outputs:
+    - overlaps: numpy array with shape (A, B)
+    '''
+    (inter, overlapping) = intersection_areas(corners_a, corners_b)
+    union = box_areas(corners_a)[:, np.newaxis] + box_areas(corners_b)[np.newaxis, :] - inter
+    #avoid dividing where boxes don't overlap
+    union[~overlapping] = 1.0
+    return np.where(overlapping, inter / union, 0.)
+
+def overlap_a_matrix(corners_a, corners_b):
+    '''
+    Intersection over the area of the first box of every pair of boxes (boxoverlap with criterion="a",
+    corners_b are usually dontcare areas)
+
+    Inputs:
+    - corners_a: numpy array with shape (A, 4), rows are [x1, y1, x2, y2]
+    - corners_b: numpy array with shape (B, 4)
+
+    Outputs:
+    - overlaps: numpy array with shape (A, B)
+    '''
+    (inter, overlapping) = intersection_areas(corners_a, corners_b)
+    area_a = np.repeat(box_areas(corners_a)[:, np.newaxis], corners_b.shape[0], axis=1)
+    #avoid dividing where boxes don't overlap
+    area_a[~overlapping] = 1.0
+    return np.where(overlapping, inter / area_a, 0.)
+
+def overlap_matrix(corners_a, corners_b, criterion="union"):
+    '''
+    Outputs:
+    - overlaps: iou_matrix if criterion is "union", overlap_a_matrix if criterion is "a"
+    '''
+    if criterion.lower() == "union":
+        return iou_matrix(corners_a, corners_b)
+    elif criterion.lower() == "a":
+        return overlap_a_matrix(corners_a, corners_b)
+    else:
+        raise TypeError("Unkown type for criterion")
+
+def center_iou_matrix(boxes_a, boxes_b):
+    '''
+    iou_matrix for boxes in center format [x_center, y_center, width, height]
+    '''
+    return iou_matrix(centers_to_corners(boxes_a), centers_to_corners(boxes_b))
+
+def offscreen_mask(x1, y1, x2, y2, image_width, image_height):
+    '''
+    Inputs:
+    - x1, y1, x2, y2: box corners, floats or numpy arrays of the same shape
+
+    Outputs:
+    - offscreen: True where the box lies completely outside the image (bool or numpy array of bools)
+    '''
+    return (x2 < 0) | (x1 >= image_width) | (y2 < 0) | (y1 >= image_height)
+
+def near_border_mask(x1, y1, x2, y2, image_width, image_height):
+    '''
+    Inputs:
+    - x1, y1, x2, y2: box corners, floats or numpy arrays of the same shape
+
+    Outputs:
+    - near_border: True where the box is near the image border (bool or numpy array of bools)
+    '''
+    return (x1 < NEAR_BORDER_LEFT_TOP) | (x2 > (image_width - NEAR_BORDER_RIGHT_BOTTOM)) | \
+           (y1 < NEAR_BORDER_LEFT_TOP) | (y2 > (image_height - NEAR_BORDER_RIGHT_BOTTOM))
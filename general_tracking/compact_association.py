@@ -0,0 +1,119 @@
+#Compact M x (T + M) form of the birth/clutter/death association problem.
+#
+#The (2*M + 2*T)x(2*M + 2*T) matrices of construct_log_probs_matrix3 pad the M x T measurement-target
+#association problem with a clutter/birth column pair per measurement, a lives/dies row pair per
+#target and a block of filler entries (see sparse_association.py).  In the compact form row m is
+#measurement m, column t < T is target t and column T+m is "measurement m is unassociated" with the
+#cost of the cheaper of clutter and birth.  Every unassociated target takes the cheaper of lives and
+#dies, so a target's unassociated cost is subtracted from its column (and the filler entry that
+#every association adds to the augmented assignment is added) and collected in a constant base cost:
+#
+#    cost of augmented assignment = base_cost + sum of the compact assignment's entries
+#
+#A compact assignment stands for the cheapest augmented assignment with its measurement-target
+#associations, so ranking compact assignments ranks association hypotheses, with clutter vs. birth
+#and lives vs. dies folded into their best choice.  expand_compact_assignment maps a compact
+#assignment back to the augmented (row, col) pairs used by convert_assignment_pairs_to_associations3.
+
+import numpy as np
+from global_params import INFEASIBLE_COST
+from sparse_association import SparseAssociationMatrix, sparse_association_matrix_from_dense, filler_pairs
+
+
+class CompactAssociationCosts:
+    def __init__(self, costs, M, T, base_cost, unassociated_meas_cells, unassociated_target_cells):
+        '''
+        Inputs:
+        - costs: numpy array with shape (M, T+M), infeasible entries are INFEASIBLE_COST
+        - M: number of measurements
+        - T: number of targets
+        - base_cost: (float) cost of the augmented assignment minus the sum of the compact assignment's entries
+        - unassociated_meas_cells: list of length M, the augmented (row, col) entry (clutter or birth)
+            of measurement m when it is unassociated
+        - unassociated_target_cells: list of length T, the augmented (row, col) entry (lives or dies)
+            of target t when it is unassociated
+        '''
+        assert(costs.shape == (M, T + M)), (costs.shape, M, T)
+        assert(len(unassociated_meas_cells) == M and len(unassociated_target_cells) == T)
+        self.costs = costs
+        self.M = M
+        self.T = T
+        self.base_cost = base_cost
+        self.unassociated_meas_cells = unassociated_meas_cells
+        self.unassociated_target_cells = unassociated_target_cells
+
+
+def compact_association_costs(cost_matrix, M):
+    '''
+    Inputs:
+    - cost_matrix: SparseAssociationMatrix of costs, or numpy array with shape (2*M+2*T)x(2*M+2*T) of
+        costs with a constant lower right block (see sparse_association_matrix_from_dense)
+    - M: number of measurements
+
+    Outputs:
+    - compact_costs: type CompactAssociationCosts, with non-negative entries
+    '''
+    if not isinstance(cost_matrix, SparseAssociationMatrix):
+        cost_matrix = sparse_association_matrix_from_dense(cost_matrix, M)
+    assert(cost_matrix.M == M), (cost_matrix.M, M)
+    T = cost_matrix.T
+    m_indices = np.arange(M)
+    t_indices = np.arange(T)
+
+    #the cheaper of clutter and birth, clutter on ties
+    clutter_cheaper = cost_matrix.clutter_values <= cost_matrix.birth_values
+    unassociated_meas_costs = np.where(clutter_cheaper, cost_matrix.clutter_values, cost_matrix.birth_values)
+    unassociated_meas_cells = zip(m_indices.tolist(), np.where(clutter_cheaper, T + 2*m_indices, T + 1 + 2*m_indices).tolist())
+    #the cheaper of lives and dies, lives on ties
+    lives_cheaper = cost_matrix.lives_values <= cost_matrix.dies_values
+    unassociated_target_costs = np.where(lives_cheaper, cost_matrix.lives_values, cost_matrix.dies_values)
+    unassociated_target_cells = zip(np.where(lives_cheaper, M + 2*t_indices, M + 1 + 2*t_indices).tolist(), t_indices.tolist())
+
+    costs = INFEASIBLE_COST*np.ones((M, T + M))
+    feasible = np.zeros((M, T + M), dtype=bool)
+    edge_costs = cost_matrix.edge_values + cost_matrix.filler_value - unassociated_target_costs[cost_matrix.edge_targets]
+    costs[cost_matrix.edge_meas, cost_matrix.edge_targets] = edge_costs
+    feasible[cost_matrix.edge_meas, cost_matrix.edge_targets] = cost_matrix.edge_values < INFEASIBLE_COST
+    costs[m_indices, T + m_indices] = unassociated_meas_costs
+    feasible[m_indices, T + m_indices] = unassociated_meas_costs < INFEASIBLE_COST
+    base_cost = np.sum(unassociated_target_costs) + cost_matrix.filler_value*(M + T)
+
+    #every row is assigned exactly once, so shifting all feasible entries by the same amount
+    #shifts the cost of every assignment by M times that amount
+    if feasible.any():
+        shift = min(np.min(costs[feasible]), 0.0)
+        costs[feasible] -= shift
+        base_cost += M*shift
+    costs[~feasible] = INFEASIBLE_COST
+    return CompactAssociationCosts(costs, M, T, base_cost, unassociated_meas_cells, unassociated_target_cells)
+
+def expand_compact_assignment(compact_costs, compact_pairs):
+    '''
+    Inputs:
+    - compact_costs: type CompactAssociationCosts
+    - compact_pairs: list of M (row, col) pairs, an assignment of the compact costs
+
+    Outputs:
+    - assignment_pairs: list of 2*M+2*T (row, col) pairs, the corresponding assignment of the
+        (2*M+2*T)x(2*M+2*T) matrix, sorted by row
+    '''
+    M = compact_costs.M
+    T = compact_costs.T
+    assert(len(compact_pairs) == M), (compact_pairs, M)
+    assignment_pairs = []
+    associated_targets = set()
+    for (row, col) in compact_pairs:
+        if col < T:
+            assignment_pairs.append((row, col))
+            associated_targets.add(col)
+        else:
+            assert(col == T + row), (row, col, M, T)
+            assignment_pairs.append(compact_costs.unassociated_meas_cells[row])
+    for t in range(T):
+        if not t in associated_targets:
+            assignment_pairs.append(compact_costs.unassociated_target_cells[t])
+    used_rows = set([row for (row, col) in assignment_pairs])
+    used_cols = set([col for (row, col) in assignment_pairs])
+    assignment_pairs.extend(filler_pairs(M, T, used_rows, used_cols))
+    assignment_pairs.sort()
+    return assignment_pairs
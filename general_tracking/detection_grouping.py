@@ -0,0 +1,175 @@
+#Grouping of detections from multiple detection sources.
+#
+#Detections from different sources that (probably) belong to the same object are grouped.  Sources
+#are processed one at a time in det_names order, as in rbpf_sampling_manyMeasSrcs.group_detections_munkres:
+#the cost of adding a detection to an existing group is the minimum of (1 - intersection over union)
+#with the group's detections, groups whose cost exceeds the source's threshold are gated out, detections
+#are assigned to groups by solving the assignment problem and unassigned detections start new groups.
+#All overlaps between a source and the detections grouped so far are computed as one numpy array
+#(box_geometry.center_iou_matrix) and the assignment problem is solved by the fastest calibrated solver
+#(assignment_solvers.linear_assignment with 'auto').  Ties between equal cost assignments (e.g. duplicated
+#detections) are broken in favor of lower group indices and then lower detection indices by a tiny
+#lexicographic epsilon (tie_broken_grouping_costs), which group_detections_munkres adds to its costs as
+#well, so both form the same groups whichever solver is used.
+#
+#DetectionGroups stores the groups columnarly: one row per detection with its box, source index and
+#group index.  DetectionGroups.meas_groups() converts to the list of dictionaries used by the rest of
+#the tracker.
+
+import numpy as np
+from box_geometry import center_iou_matrix
+from assignment_solvers import linear_assignment
+from global_params import INFEASIBLE_COST
+
+#cost of assigning a detection to a gated out group
+MAX_GROUPING_COST = 1e9
+#the largest tie breaking epsilon added to a grouping cost, far below differences between
+#grouping costs (1 - intersection over union) that are not ties
+TIE_BREAKING_EPSILON = 1e-9
+
+
+class DetectionGroups:
+    def __init__(self):
+        #det_names[i] is the name of the ith detection source added
+        self.det_names = []
+        #one row per detection
+        self.boxes = np.zeros((0, 4))
+        self.source_indices = np.zeros(0, dtype=int)
+        self.group_indices = np.zeros(0, dtype=int)
+        self.group_count = 0
+
+    def add_source(self, det_name, boxes, max_cost):
+        '''
+        Add a detection source's detections to existing groups or new groups
+
+        Inputs:
+        - det_name: name of the detection source
+        - boxes: numpy array with shape (n, 4), rows are [x_center, y_center, width, height]
+        - max_cost: a detection can only join a group if min(1 - overlap) with the group's
+            detections is <= max_cost
+        '''
+        assert(not det_name in self.det_names), (det_name, self.det_names)
+        source_idx = len(self.det_names)
+        n = boxes.shape[0]
+        group_indices = -1*np.ones(n, dtype=int)
+
+        if n > 0 and self.group_count > 0:
+            costs = 1 - center_iou_matrix(boxes, self.boxes)
+            #a group has at most one detection from each source, so the group costs can be
+            #updated one source at a time with fancy indexing
+            group_costs = MAX_GROUPING_COST*np.ones((n, self.group_count))
+            for prev_source_idx in range(source_idx):
+                source_mask = (self.source_indices == prev_source_idx)
+                source_groups = self.group_indices[source_mask]
+                group_costs[:, source_groups] = np.minimum(group_costs[:, source_groups], costs[:, source_mask])
+            #gating
+            group_costs[group_costs > max_cost] = MAX_GROUPING_COST
+
+            association_list = linear_assignment(tie_broken_grouping_costs(group_costs), 'auto', 'DetectionGroups.add_source')
+            for (row, col) in association_list:
+                group_indices[row] = col
+
+        #unassigned detections start new groups, in detection order
+        new_group_detections = np.where(group_indices == -1)[0]
+        group_indices[new_group_detections] = self.group_count + np.arange(len(new_group_detections))
+        self.group_count += len(new_group_detections)
+
+        self.det_names.append(det_name)
+        self.boxes = np.concatenate((self.boxes, boxes))
+        self.source_indices = np.concatenate((self.source_indices, source_idx*np.ones(n, dtype=int)))
+        self.group_indices = np.concatenate((self.group_indices, group_indices))
+
+    def meas_groups(self):
+        '''
+        Outputs:
+        - meas_groups: a list of detection groups, where each detection group is a dictionary of detections
+            in the group, key='det_name', value=detection (numpy array [x_center, y_center, width, height]),
+            meas_groups[i] is group i
+        '''
+        meas_groups = [{} for group_idx in range(self.group_count)]
+        for (box, source_idx, group_idx) in zip(self.boxes, self.source_indices, self.group_indices):
+            meas_groups[group_idx][self.det_names[source_idx]] = box
+        return meas_groups
+
+
+def tie_broken_grouping_costs(group_costs):
+    '''
+    Inputs:
+    - group_costs: numpy array with shape (n, group_count), costs of adding detections to groups, gated
+        out entries are MAX_GROUPING_COST
+
+    Outputs:
+    - solver_costs: group_costs plus an epsilon increasing with (group index, detection index) for the
+        assignment solver, so that ties are broken in favor of lower group indices and then lower
+        detection indices.  Only entries that are not gated out are perturbed (which groups and
+        detections a gated out assignment uses does not matter, but would offset the epsilons of the
+        other assignments), gated out entries become INFEASIBLE_COST: linear_assignment replaces them
+        with a cost small enough for the epsilons to survive rounding and leaves them out of its result
+    '''
+    (n, group_count) = group_costs.shape
+    if n == 0 or group_count == 0:
+        return group_costs
+    tie_breaking = (np.arange(group_count)[np.newaxis, :]*n + np.arange(n)[:, np.newaxis])
+    tie_breaking = tie_breaking*(TIE_BREAKING_EPSILON/(n*group_count))
+    return np.where(group_costs >= MAX_GROUPING_COST, INFEASIBLE_COST, group_costs + tie_breaking)
+
+def detection_boxes(detection_locations, det_widths, det_heights):
+    '''
+    Inputs:
+    - detection_locations: list of detection positions (x, y) from one detection source
+    - det_widths, det_heights: lists of the corresponding bounding box widths/heights
+
+    Outputs:
+    - boxes: numpy array with shape (len(detection_locations), 4), rows are [x_center, y_center, width, height]
+    '''
+    assert(len(detection_locations) == len(det_widths) and len(det_widths) == len(det_heights))
+    boxes = np.zeros((len(detection_locations), 4))
+    for (det_idx, det_loc) in enumerate(detection_locations):
+        boxes[det_idx] = [det_loc[0], det_loc[1], det_widths[det_idx], det_heights[det_idx]]
+    return boxes
+
+def detection_groups_from_meas_groups(meas_groups):
+    '''
+    Inputs:
+    - meas_groups: a list of detection groups, where each detection group is a dictionary of detections
+        in the group, key='det_name', value=detection
+
+    Outputs:
+    - detection_groups: type DetectionGroups, with group i containing the detections of meas_groups[i]
+    '''
+    detection_groups = DetectionGroups()
+    detection_groups.det_names = sorted(set([det_name for meas_group in meas_groups for det_name in meas_group]))
+    boxes = []
+    source_indices = []
+    group_indices = []
+    for (group_idx, meas_group) in enumerate(meas_groups):
+        for (det_name, detection) in meas_group.iteritems():
+            boxes.append(detection)
+            source_indices.append(detection_groups.det_names.index(det_name))
+            group_indices.append(group_idx)
+    if len(boxes) > 0:
+        detection_groups.boxes = np.array(boxes, dtype=float)
+        detection_groups.source_indices = np.array(source_indices, dtype=int)
+        detection_groups.group_indices = np.array(group_indices, dtype=int)
+    detection_groups.group_count = len(meas_groups)
+    return detection_groups
+
+def group_detections_by_source(measurement_lists, widths, heights, det_names, max_costs):
+    '''
+    Inputs:
+    - measurement_lists: a list where measurement_lists[i] is a list of detection positions (x, y)
+        from the ith detection source
+    - widths, heights: lists where widths[i]/heights[i] are lists of bounding box widths/heights for
+        the corresponding detections
+    - det_names: a list of names of detection sources, where det_names[i] corresponds to measurement_lists[i],
+        sources are grouped in this order
+    - max_costs: dictionary, key=det_name, value=max_cost of DetectionGroups.add_source for the source
+
+    Outputs:
+    - detection_groups: type DetectionGroups
+    '''
+    detection_groups = DetectionGroups()
+    for det_idx, det_name in enumerate(det_names):
+        boxes = detection_boxes(measurement_lists[det_idx], widths[det_idx], heights[det_idx])
+        detection_groups.add_source(det_name, boxes, max_costs[det_name])
+    return detection_groups
@@ -0,0 +1,192 @@
+#Warm started shortest augmenting path assignment for Murty's algorithm.
+#
+#A child node in Murty's algorithm differs from its parent by one newly excluded cell (the parent's
+#assignment of some row) and by required cells that are all part of the parent's assignment.  The
+#parent's optimal assignment minus the excluded cell is a partial assignment of the child's problem
+#and the parent's dual variables (u, v) stay feasible for it: excluding cells and removing required
+#rows and columns only removes constraints c_ij - u_i - v_j >= 0.  So the child's optimal assignment
+#is found with a single shortest augmenting path from the row of the excluded cell, and the child's
+#minimum cost is the parent's plus the length of that path [Miller, Stone and Cox, "Optimizing
+#Murty's ranked assignment method", 1997].  Required rows and columns are skipped and excluded cells
+#are masked while scanning a row, so no remaining cost matrix is constructed.
+#
+#Cost matrices with fewer rows than columns (e.g. the M x (T + M) compact costs of
+#compact_association.py) are padded with virtual rows of zeros.  In the square problem every column
+#is assigned, so the dual variables of the column freed by the excluded cell need no correction.
+#
+#solve_assignment can also be warm started across time instances with the column dual variables of
+#a similar problem, e.g. the previous frame's potentials of the targets that survived.  Any column
+#dual variables can be made feasible by setting every row's dual variable to its smallest reduced
+#cost, and each row whose smallest reduced cost is in a column no other row has taken starts out
+#assigned to it.  Only the remaining rows need augmenting paths, typically few when most targets
+#keep the same detections from one frame to the next.
+
+import numpy as np
+from global_params import INFEASIBLE_COST
+
+
+class AssignmentState:
+    def __init__(self, col4row, row4col, u, v):
+        '''
+        Optimal assignment and dual variables of a square (padded) assignment problem
+
+        Inputs:
+        - col4row: numpy array of ints, column assigned to every row, -1 if unassigned
+        - row4col: numpy array of ints, row assigned to every column, -1 if unassigned
+        - u: numpy array of floats, row dual variables
+        - v: numpy array of floats, column dual variables
+        '''
+        self.col4row = col4row
+        self.row4col = row4col
+        self.u = u
+        self.v = v
+
+    def copy(self):
+        return AssignmentState(self.col4row.copy(), self.row4col.copy(), self.u.copy(), self.v.copy())
+
+
+def augment(cost_matrix, state, start_row, available_cols, excluded_cols_by_row):
+    '''
+    Assign start_row with a shortest augmenting path (Dijkstra on reduced costs, following the dense
+    algorithm in scipy.optimize.linear_sum_assignment) and update state in place
+
+    Inputs:
+    - cost_matrix: numpy array with shape (R, C), R <= C, non-negative and INFEASIBLE_COST (or greater)
+        for infeasible entries.  Rows R, ..., C-1 are virtual rows of zeros
+    - state: type AssignmentState with C rows and C columns, start_row is unassigned
+    - start_row: (int) row to assign
+    - available_cols: numpy array of bools with shape (C,), columns that may be used
+        (False for the columns of required cells)
+    - excluded_cols_by_row: dictionary, key=row, value=list of columns excluded in the row
+
+    Outputs:
+    - path_length: (float) increase in the assignment cost, INFEASIBLE_COST if start_row can't
+        be assigned (state is then left unchanged)
+    '''
+    (R, C) = cost_matrix.shape
+    u = state.u
+    v = state.v
+    shortest = np.inf*np.ones(C)
+    path = -1*np.ones(C, dtype=int)
+    remaining = available_cols.copy()
+    scanned_cols = np.zeros(C, dtype=bool)
+    scanned_rows = []
+    min_val = 0.0
+    i = start_row
+    sink = -1
+    while sink == -1:
+        scanned_rows.append(i)
+        if i < R:
+            reduced_costs = min_val + cost_matrix[i] - u[i] - v
+            reduced_costs[cost_matrix[i] >= INFEASIBLE_COST] = np.inf
+        else:
+            reduced_costs = min_val - u[i] - v
+        if i in excluded_cols_by_row:
+            reduced_costs[excluded_cols_by_row[i]] = np.inf
+        improved = remaining & (reduced_costs < shortest)
+        path[improved] = i
+        shortest[improved] = reduced_costs[improved]
+        candidates = np.flatnonzero(remaining)
+        if len(candidates) == 0:
+            return INFEASIBLE_COST
+        j = candidates[np.argmin(shortest[candidates])]
+        min_val = shortest[j]
+        if min_val == np.inf: #no augmenting path
+            return INFEASIBLE_COST
+        remaining[j] = False
+        scanned_cols[j] = True
+        if state.row4col[j] == -1:
+            sink = j
+        else:
+            i = state.row4col[j]
+
+    #update dual variables
+    u[start_row] += min_val
+    for i in scanned_rows[1:]:
+        u[i] += min_val - shortest[state.col4row[i]]
+    v[scanned_cols] -= min_val - shortest[scanned_cols]
+
+    #augment the assignment along the path
+    j = sink
+    while True:
+        i = path[j]
+        state.row4col[j] = i
+        (state.col4row[i], j) = (j, state.col4row[i])
+        if i == start_row:
+            break
+    return min_val
+
+def solve_assignment(cost_matrix, col_potentials=None):
+    '''
+    Inputs:
+    - cost_matrix: numpy array with shape (R, C), R <= C, non-negative and INFEASIBLE_COST (or greater)
+        for infeasible entries
+    - col_potentials: (optional) numpy array with at most C entries, dual variables of the first
+        columns from a similar problem (e.g. AssignmentState.v of the previous time instance) to warm
+        start from, the other columns start at 0
+
+    Outputs:
+    - state: type AssignmentState, minimum cost assignment of every row (and the virtual rows of
+        zeros padding cost_matrix to C x C), None if no assignment is feasible
+    '''
+    (R, C) = cost_matrix.shape
+    assert(R <= C), (R, C)
+    state = AssignmentState(-1*np.ones(C, dtype=int), -1*np.ones(C, dtype=int), np.zeros(C), np.zeros(C))
+    if col_potentials is not None and len(col_potentials) > 0:
+        assert(len(col_potentials) <= C), (len(col_potentials), C)
+        state.v[:len(col_potentials)] = col_potentials
+        #every row's dual variable is its smallest reduced cost, so all reduced costs are non-negative
+        reduced_costs = np.where(cost_matrix < INFEASIBLE_COST, cost_matrix - state.v, np.inf)
+        best_cols = np.argmin(reduced_costs, axis=1).astype(int)
+        state.u[:R] = reduced_costs[np.arange(R), best_cols]
+        if R > 0 and np.max(state.u[:R]) == np.inf: #a row without feasible entries
+            return None
+        #rows keep their tight column unless another row took it first
+        for (row, col) in enumerate(best_cols.tolist()):
+            if state.row4col[col] == -1:
+                state.col4row[row] = col
+                state.row4col[col] = row
+        if R < C:
+            #virtual rows of zeros are tight in every free column with the largest dual variable
+            state.u[R:] = -np.max(state.v)
+            tight_cols = np.flatnonzero((state.v == np.max(state.v)) & (state.row4col == -1))
+            for (row, col) in zip(range(R, C), tight_cols.tolist()):
+                state.col4row[row] = col
+                state.row4col[col] = row
+    available_cols = np.ones(C, dtype=bool)
+    for row in range(C):
+        if state.col4row[row] == -1 and augment(cost_matrix, state, row, available_cols, {}) >= INFEASIBLE_COST:
+            return None
+    return state
+
+def resolve_excluded_cell(cost_matrix, parent_state, excluded_cell, required_cells, excluded_cells):
+    '''
+    Solve a child node in Murty's algorithm from its parent's optimal assignment and dual variables
+
+    Inputs:
+    - cost_matrix: numpy array with shape (R, C), R <= C, the cost matrix solve_assignment was called with
+    - parent_state: type AssignmentState, optimal for the parent node, not modified
+    - excluded_cell: (row, col) pair in the parent's assignment that the child excludes
+    - required_cells: list of (row, col) pairs in the parent's assignment that the child requires
+    - excluded_cells: list of every (row, col) pair the child excludes, including excluded_cell
+
+    Outputs:
+    - state: type AssignmentState, optimal for the child node, None if the child has no feasible assignment
+    - cost_increase: (float) the child's minimum cost minus the parent's
+    '''
+    (row, col) = excluded_cell
+    assert(parent_state.col4row[row] == col), (excluded_cell, parent_state.col4row[row])
+    state = parent_state.copy()
+    state.col4row[row] = -1
+    state.row4col[col] = -1
+    available_cols = np.ones(len(state.v), dtype=bool)
+    for (required_row, required_col) in required_cells:
+        assert(state.col4row[required_row] == required_col), ((required_row, required_col), state.col4row[required_row])
+        available_cols[required_col] = False
+    excluded_cols_by_row = {}
+    for (excluded_row, excluded_col) in excluded_cells:
+        excluded_cols_by_row.setdefault(excluded_row, []).append(excluded_col)
+    cost_increase = augment(cost_matrix, state, row, available_cols, excluded_cols_by_row)
+    if cost_increase >= INFEASIBLE_COST:
+        return (None, INFEASIBLE_COST)
+    return (state, cost_increase)
@@ -0,0 +1,142 @@
+#Frame scoped cache of measurement-target association likelihoods.
+#
+#The likelihood of a detection group given a target only depends on the target's state (x, P) and
+#on the detection group's detection names and positions.  Children of the same parent carry identical
+#targets and every particle groups the same detections each time instance, so the same likelihood is
+#requested by many particles and by several proposal paths (cost matrix construction, get_likelihood,
+#the sequential proposals).  One AssocLikelihoodCache is shared by all of them through the Parameters
+#object and keyed on (target_fingerprint(target), detection_group_key(detection_group)), so keys never
+#depend on a particle or on target/group indices.
+#
+#Target states change every time instance, so entries are dropped by begin_frame.  The cache size is
+#bounded, when full the least recently used entries are evicted (in batches, so a lookup only costs a
+#couple of dictionary operations).
+
+#when the cache grows past max_size, evict least recently used entries until this fraction of
+#max_size remains
+EVICT_TO_FRACTION = .75
+
+def target_fingerprint(target):
+    '''
+    Inputs:
+    - target: type Target (or anything with x and P numpy arrays)
+
+    Outputs:
+    - fingerprint: hashable, equal for targets with identical x and P
+    '''
+    return (target.x.tostring(), target.P.tostring())
+
+def detection_group_key(detection_group):
+    '''
+    Inputs:
+    - detection_group: dictionary of detections, key='det_name', value=detection (x, y, width, height)
+
+    Outputs:
+    - key: hashable, equal for detection groups with the same detection names and positions
+    '''
+    return tuple(sorted([(det_name, float(detection[0]), float(detection[1]))
+                         for (det_name, detection) in detection_group.iteritems()]))
+
+class AssocLikelihoodCache:
+    def __init__(self, max_size=200000):
+        '''
+        Inputs:
+        - max_size: (int) maximum number of cached likelihoods
+        '''
+        assert(max_size > 0)
+        self.max_size = max_size
+        #key: (target fingerprint, detection group key), value: likelihood
+        self.likelihoods = {}
+        #key: same as likelihoods, value: self.tick when the entry was last used
+        self.last_used = {}
+        self.tick = 0
+
+        #counters since the cache was created
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        #counters since the last call to begin_frame
+        self.frame_hits = 0
+        self.frame_misses = 0
+
+    def begin_frame(self):
+        '''
+        Drop all cached likelihoods, call once per time instance after targets are predicted
+        '''
+        self.likelihoods = {}
+        self.last_used = {}
+        self.frame_hits = 0
+        self.frame_misses = 0
+
+    def get(self, key):
+        '''
+        Outputs:
+        - likelihood: the cached likelihood for key, or None if key is not cached (counted as a miss)
+        '''
+        likelihood = self.likelihoods.get(key)
+        if likelihood is None:
+            self.misses += 1
+            self.frame_misses += 1
+        else:
+            self.hits += 1
+            self.frame_hits += 1
+            self.tick += 1
+            self.last_used[key] = self.tick
+        return likelihood
+
+    def get_many(self, keys):
+        '''
+        Outputs:
+        - likelihoods: list with the cached likelihood of every key in keys, None for keys that
+            are not cached, same counters as calling get for every key
+        '''
+        get_likelihood = self.likelihoods.get
+        likelihoods = [get_likelihood(key) for key in keys]
+        self.tick += 1
+        hit_keys = [key for (key, likelihood) in zip(keys, likelihoods) if likelihood is not None]
+        self.last_used.update(dict.fromkeys(hit_keys, self.tick))
+        self.hits += len(hit_keys)
+        self.frame_hits += len(hit_keys)
+        self.misses += len(keys) - len(hit_keys)
+        self.frame_misses += len(keys) - len(hit_keys)
+        return likelihoods
+
+    def put_many(self, keys, likelihoods):
+        self.tick += 1
+        self.likelihoods.update(zip(keys, likelihoods))
+        self.last_used.update(dict.fromkeys(keys, self.tick))
+        if len(self.likelihoods) > self.max_size:
+            self.evict()
+
+    def put(self, key, likelihood):
+        self.tick += 1
+        self.likelihoods[key] = likelihood
+        self.last_used[key] = self.tick
+        if len(self.likelihoods) > self.max_size:
+            self.evict()
+
+    def evict(self):
+        '''
+        Evict least recently used entries until EVICT_TO_FRACTION*max_size entries remain
+        '''
+        keep_count = int(EVICT_TO_FRACTION*self.max_size)
+        entries_by_age = sorted(self.last_used.iteritems(), key=lambda entry: entry[1])
+        for (key, tick) in entries_by_age[:len(entries_by_age) - keep_count]:
+            del self.likelihoods[key]
+            del self.last_used[key]
+            self.evictions += 1
+
+    def __len__(self):
+        return len(self.likelihoods)
+
+    def report(self):
+        '''
+        Outputs:
+        - report: string summarizing the hit/miss counters
+        '''
+        lookups = self.hits + self.misses
+        hit_rate = 0.0
+        if lookups > 0:
+            hit_rate = float(self.hits)/lookups
+        return "association likelihood cache: %d hits, %d misses (hit rate %.3f), %d evictions, this frame: %d hits, %d misses, %d entries" \
+            % (self.hits, self.misses, hit_rate, self.evictions, self.frame_hits, self.frame_misses, len(self.likelihoods))
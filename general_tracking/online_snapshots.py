@@ -0,0 +1,99 @@
+#Per time instance snapshots of living targets for delayed online output (SPEC['ONLINE_DELAY'] > 0).
+#
+#Every TargetSet keeps a queue (living_targets_q) of the last ONLINE_DELAY+1 time instances'
+#living targets.  Rather than deep copying every particle's Target objects (including their full
+#histories) every time instance and deep copying the queue again in create_child, each queue entry
+#is a tuple of TargetSnapshot objects holding only what the delayed output and particle grouping
+#read.  A SnapshotStore creates one snapshot per distinct Target object and one tuple per distinct
+#living target list per time instance, so particles sharing targets (and their children, which
+#shallow copy the queue) share the same entries.  An entry is freed once the last queue referencing
+#it pops it, ONLINE_DELAY time instances later.
+#
+#Snapshots are shared and must not be modified in place, use TargetSet.make_snapshot_queue_private
+#before changing ids.
+
+class TargetSnapshot(object):
+    __slots__ = ('x', 'P', 'width', 'height', 'id_', 'state', 'time_stamp')
+
+    def __init__(self, target):
+        '''
+        Inputs:
+        - target: type Target, snapshot its state at the end of the current time instance
+        '''
+        #Target.x and Target.P are replaced, never modified in place, so sharing them is safe
+        self.x = target.x
+        self.P = target.P
+        self.width = target.width
+        self.height = target.height
+        self.id_ = target.id_
+        #(x, width, height) as recorded in target.trajectory for this time instance
+        self.state = target.trajectory.state(0)
+        self.time_stamp = target.trajectory.time_stamp(0)
+
+    def copy(self):
+        snapshot_copy = TargetSnapshot.__new__(TargetSnapshot)
+        for field in TargetSnapshot.__slots__:
+            setattr(snapshot_copy, field, getattr(self, field))
+        return snapshot_copy
+
+    def __deepcopy__(self, memo):
+        #snapshots are never modified in place, so sharing them is a valid deep copy
+        return self
+
+    def __repr__(self):
+        return "TargetSnapshot(id_=%d, time_stamp=%s)" % (self.id_, self.time_stamp)
+
+
+class SnapshotStore:
+    def __init__(self):
+        self.frame_idx = None
+        #key: id() of a Target, value: its TargetSnapshot for self.frame_idx
+        self.target_snapshots = {}
+        #key: tuple of id()s of a living target list, value: tuple of TargetSnapshots for self.frame_idx
+        self.list_snapshots = {}
+
+    def begin_frame(self, frame_idx):
+        '''
+        Start a new time instance, snapshots from the previous time instance are no longer
+        reused (they stay alive as long as some queue holds them)
+        '''
+        self.frame_idx = frame_idx
+        self.target_snapshots = {}
+        self.list_snapshots = {}
+
+    def snapshot(self, living_targets):
+        '''
+        Inputs:
+        - living_targets: list of type Target
+
+        Outputs:
+        - snapshots: tuple of type TargetSnapshot, shared by every call this time instance
+            with the same Target objects
+        '''
+        list_key = tuple([id(target) for target in living_targets])
+        if list_key in self.list_snapshots:
+            return self.list_snapshots[list_key]
+        snapshots = []
+        for target in living_targets:
+            if not id(target) in self.target_snapshots:
+                self.target_snapshots[id(target)] = TargetSnapshot(target)
+            snapshots.append(self.target_snapshots[id(target)])
+        snapshots = tuple(snapshots)
+        self.list_snapshots[list_key] = snapshots
+        return snapshots
+
+    def push_frame(self, frame_idx, particle_set):
+        '''
+        Pop the oldest entry from every particle's living_targets_q and append a snapshot
+        of its current living targets
+
+        Inputs:
+        - frame_idx: (int) the current time instance index
+        - particle_set: list of type Particle
+        '''
+        self.begin_frame(frame_idx)
+        for particle in particle_set:
+            particle.targets.living_targets_q.popleft()
+            particle.targets.living_targets_q.append((frame_idx, self.snapshot(particle.targets.living_targets)))
+        #memo entries hold references to Target ids that may be reused once targets are freed
+        self.begin_frame(None)
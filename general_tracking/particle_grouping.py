@@ -0,0 +1,69 @@
+#Incremental particle grouping.
+#
+#group_particles groups particles that represent the same state.  Comparing target states
+#directly means building a key from every target's x and P and (for validation) comparing
+#every particle against every group.  Instead, every particle carries a group id per time step:
+#two particles get the same group id on time step k if and only if they had the same group id
+#on time step k-1 and made the same measurement associations and target deaths on time step k.
+#Particles start out in group 0.  Since a child copies its parent's group ids, computing
+#a particle's group id for a new time step is a single dictionary lookup.
+#
+#Equal group ids imply equal states.  Particles that reach the same state through different
+#association histories are put in different groups, the docstring of rbpf.group_particles
+#explains why this should basically never happen; rbpf.VALIDATE_PARTICLE_GROUPING checks it.
+
+class ParticleGroupingEngine:
+    def __init__(self):
+        #group_tables[k][(group id on time step k-1, associations on time step k, dead targets
+        #on time step k)] is the group id on time step k
+        self.group_tables = {}
+        self.next_group_id = 1 #0 is the group of every particle before the first time step
+
+    def update(self, particle):
+        '''
+        Compute particle's group ids for every time step since its group ids were last computed
+
+        Inputs:
+        - particle: type Particle, with attributes group_ids (deque, group ids of the most recent
+            time steps with group_ids[-1] the group id on time step particle.group_ids_step)
+        '''
+        num_time_steps = len(particle.all_measurement_associations)
+        assert(len(particle.all_dead_targets) == num_time_steps)
+        for time_step in range(particle.group_ids_step + 1, num_time_steps + 1):
+            key = (particle.group_ids[-1],
+                   tuple(particle.all_measurement_associations[time_step - 1].tolist()),
+                   tuple(particle.all_dead_targets[time_step - 1].tolist()))
+            if not time_step in self.group_tables:
+                self.group_tables[time_step] = {}
+            group_table = self.group_tables[time_step]
+            if not key in group_table:
+                group_table[key] = self.next_group_id
+                self.next_group_id += 1
+            particle.group_ids.append(group_table[key])
+        particle.group_ids_step = num_time_steps
+
+    def group_id(self, particle, delay):
+        '''
+        Inputs:
+        - particle: type Particle
+        - delay: (int) number of time steps in the past
+
+        Outputs:
+        - group_id: (int) the particle's group id delay time steps in the past.  Particles with the
+            same group id had the same state delay time steps in the past and on every time step before.
+        '''
+        self.update(particle)
+        if delay > particle.group_ids_step:
+            #before the first time step every particle is in group 0
+            return 0
+        assert(delay < len(particle.group_ids)), (delay, len(particle.group_ids))
+        return particle.group_ids[-1 - delay]
+
+    def prune(self, particle_set):
+        '''
+        Drop group tables that no particle in particle_set needs to compute future group ids
+        '''
+        oldest_time_step = min([particle.group_ids_step for particle in particle_set])
+        for time_step in self.group_tables.keys():
+            if time_step <= oldest_time_step:
+                del self.group_tables[time_step]
@@ -0,0 +1,199 @@
+import numpy as np
+from scipy.special import gdtrc
+from global_params import DEFAULT_TIME_STEP
+from batched_kalman import batch_kf_predict
+from box_geometry import offscreen_mask, near_border_mask
+
+#Structure of arrays storage for the living targets of every particle in a particle set.
+#The object model (Particle -> TargetSet -> Target) stays authoritative, the store gathers
+#the per target fields into contiguous arrays once per time instance so that prediction,
+#border/offscreen tests and death probabilities run as whole array operations, and then
+#scatters the results back into the Target objects.
+#
+#Slot (p_idx, t_idx) holds particle_set[p_idx].targets.living_targets[t_idx].  Slots beyond
+#a particle's living target count are marked invalid in self.valid and hold garbage.
+
+class ParticleStore:
+    def __init__(self, n_particles, max_targets=16):
+        '''
+        Inputs:
+        - n_particles: (int) number of particles the store is initially allocated for
+        - max_targets: (int) initial number of target slots per particle, grows as needed
+        '''
+        self.n_particles = 0
+        self.max_targets = 0
+        self.allocate(n_particles, max_targets)
+        #target_refs[p_idx] is the list of Target objects gathered from particle p_idx
+        self.target_refs = []
+
+    def allocate(self, n_particles, max_targets):
+        '''
+        (Re)allocate arrays for n_particles particles with max_targets slots each
+        '''
+        self.n_particles = n_particles
+        self.max_targets = max_targets
+        #target states, [x, x_vel, y, y_vel]
+        self.x = np.zeros((n_particles, max_targets, 4))
+        #target state covariances
+        self.P = np.zeros((n_particles, max_targets, 4, 4))
+        self.widths = np.zeros((n_particles, max_targets))
+        self.heights = np.zeros((n_particles, max_targets))
+        #time of the last measurement association with each target
+        self.last_assoc_times = np.zeros((n_particles, max_targets))
+        self.valid = np.zeros((n_particles, max_targets), dtype=bool)
+        self.target_counts = np.zeros(n_particles, dtype=int)
+
+    def load(self, particle_set):
+        '''
+        Gather the living targets of every particle in particle_set into the store's arrays
+
+        Inputs:
+        - particle_set: list of type Particle
+        '''
+        n_particles = len(particle_set)
+        max_targets = 1
+        for particle in particle_set:
+            max_targets = max(max_targets, len(particle.targets.living_targets))
+        if n_particles != self.n_particles or max_targets > self.max_targets:
+            #grow geometrically so we rarely reallocate as the number of targets changes
+            self.allocate(n_particles, max(max_targets, 2*self.max_targets))
+
+        self.valid[:] = False
+        self.target_refs = []
+        for p_idx, particle in enumerate(particle_set):
+            living_targets = particle.targets.living_targets
+            for t_idx, target in enumerate(living_targets):
+                self.x[p_idx, t_idx] = target.x[:, 0]
+                self.P[p_idx, t_idx] = target.P
+                self.widths[p_idx, t_idx] = target.width
+                self.heights[p_idx, t_idx] = target.height
+                self.last_assoc_times[p_idx, t_idx] = target.last_measurement_association
+            self.valid[p_idx, :len(living_targets)] = True
+            self.target_counts[p_idx] = len(living_targets)
+            self.target_refs.append(list(living_targets))
+
+    def predict(self, dt, Q):
+        '''
+        Run Kalman filter prediction on every valid slot at once
+
+        Inputs:
+        - dt: time step to run prediction on
+        - Q: (numpy array) 4x4 process noise covariance
+        '''
+        #only predict valid slots, garbage in invalid slots could fail batch_kf_predict's checks
+        (x_predict, P_predict) = batch_kf_predict(self.x[self.valid][:, :, np.newaxis], self.P[self.valid], dt, Q)
+        self.x[self.valid] = x_predict[:, :, 0]
+        self.P[self.valid] = P_predict
+
+    def boxes(self):
+        '''
+        Outputs:
+        - boxes: (numpy array) shape (n_particles, max_targets, 4), [x1, y1, x2, y2]
+            bounding box corners of every slot
+        '''
+        boxes = np.empty((self.n_particles, self.max_targets, 4))
+        boxes[:, :, 0] = self.x[:, :, 0] - self.widths/2.0
+        boxes[:, :, 1] = self.x[:, :, 2] - self.heights/2.0
+        boxes[:, :, 2] = self.x[:, :, 0] + self.widths/2.0
+        boxes[:, :, 3] = self.x[:, :, 2] + self.heights/2.0
+        return boxes
+
+    def offscreen_mask(self, image_width, image_height):
+        '''
+        Outputs:
+        - offscreen: (numpy array of bools) shape (n_particles, max_targets), True for valid
+            slots whose bounding box lies completely outside the image (same test as Target.predict)
+        '''
+        boxes = self.boxes()
+        offscreen = offscreen_mask(boxes[:, :, 0], boxes[:, :, 1], boxes[:, :, 2], boxes[:, :, 3],
+                                   image_width, image_height)
+        return offscreen & self.valid
+
+    def near_border_mask(self, image_width, image_height):
+        '''
+        Outputs:
+        - near_border: (numpy array of bools) shape (n_particles, max_targets), True for valid
+            slots whose bounding box is near the image border (same test as Target.near_border)
+        '''
+        boxes = self.boxes()
+        near_border = near_border_mask(boxes[:, :, 0], boxes[:, :, 1], boxes[:, :, 2], boxes[:, :, 3],
+                                       image_width, image_height)
+        return near_border & self.valid
+
+    def death_probabilities(self, cur_time, offscreen, border_death_probs, not_border_death_probs,
+                            image_width, image_height):
+        '''
+        Calculate death probabilities for every valid slot, matching the non-Poisson
+        branch of Target.target_death_prob
+
+        Inputs:
+        - cur_time: the current measurement time (float)
+        - offscreen: (numpy array of bools) shape (n_particles, max_targets)
+        - border_death_probs: list of death probabilities indexed by frames since the last
+            association, for targets near the border
+        - not_border_death_probs: same for targets not near the border
+
+        Outputs:
+        - death_probs: (numpy array) shape (n_particles, max_targets), invalid slots are 0
+        '''
+        frames_since_last_assoc = (cur_time - self.last_assoc_times)/DEFAULT_TIME_STEP
+        rounded_frames = np.rint(frames_since_last_assoc)
+        assert((np.abs(rounded_frames - frames_since_last_assoc)[self.valid] < .00000001).all())
+        rounded_frames = rounded_frames.astype(int)
+        border_death_probs = np.asarray(border_death_probs, dtype=float)
+        not_border_death_probs = np.asarray(not_border_death_probs, dtype=float)
+        border_idx = np.clip(rounded_frames, 0, len(border_death_probs) - 1)
+        not_border_idx = np.clip(rounded_frames, 0, len(not_border_death_probs) - 1)
+
+        death_probs = np.where(self.near_border_mask(image_width, image_height),
+                               border_death_probs[border_idx], not_border_death_probs[not_border_idx])
+        death_probs[offscreen] = 1.0
+        death_probs[~self.valid] = 0.0
+        assert((death_probs >= 0.0).all() and (death_probs <= 1.0).all()), death_probs
+        return death_probs
+
+    def poisson_death_probabilities(self, cur_time, prev_time, theta_death, alpha_death):
+        '''
+        Calculate death probabilities for every valid slot, matching the USE_POISSON_DEATH_MODEL
+        branch of Target.target_death_prob
+
+        Outputs:
+        - death_probs: (numpy array) shape (n_particles, max_targets), invalid slots are 0
+        '''
+        cur_time = cur_time/10.0
+        prev_time = prev_time/10.0
+        last_assoc = self.last_assoc_times/10.0
+        time_step = cur_time - prev_time
+        survival = gdtrc(theta_death, alpha_death, cur_time - last_assoc)
+        death_probs = (survival - gdtrc(theta_death, alpha_death, cur_time - last_assoc + time_step))
+        death_probs[self.valid] /= survival[self.valid]
+        death_probs[~self.valid] = 0.0
+        assert((death_probs >= 0.0).all() and (death_probs <= 1.0).all()), death_probs
+        return death_probs
+
+    def write_predictions(self, cur_time, offscreen):
+        '''
+        Scatter predicted states back into the gathered Target objects
+
+        Inputs:
+        - cur_time: the time the prediction is made for
+        - offscreen: (numpy array of bools) shape (n_particles, max_targets)
+        '''
+        #particles may share Target objects (rbpf.USE_COPY_ON_WRITE), write each one once
+        written_target_ids = set()
+        for p_idx, targets in enumerate(self.target_refs):
+            for t_idx, target in enumerate(targets):
+                if id(target) in written_target_ids:
+                    continue
+                written_target_ids.add(id(target))
+                target.x = self.x[p_idx, t_idx].reshape((4, 1)).copy()
+                target.P = self.P[p_idx, t_idx].copy()
+                target.record_prediction(cur_time, bool(offscreen[p_idx, t_idx]))
+
+    def write_death_probabilities(self, death_probs):
+        '''
+        Scatter death probabilities back into the gathered Target objects
+        '''
+        for p_idx, targets in enumerate(self.target_refs):
+            for t_idx, target in enumerate(targets):
+                target.death_prob = death_probs[p_idx, t_idx]
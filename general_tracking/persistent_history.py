@@ -0,0 +1,133 @@
+import numpy as np
+
+#Persistent (structurally shared) per time step history, used for Particle.all_measurement_associations
+#and Particle.all_dead_targets.  A history is a handle to the newest node of a parent linked list,
+#so a child particle shares its parent's entire history in O(1) and appending a time step is O(1).
+#Each node also stores a jump pointer to an ancestor (Myers' applicative random access stack),
+#giving O(log n) random access to any time step.
+#
+#Entries are stored as compact int32 numpy arrays and are never modified after being appended.
+
+class HistoryNode(object):
+    __slots__ = ('entry', 'parent', 'jump', 'depth')
+
+    def __init__(self, entry, parent):
+        '''
+        Inputs:
+        - entry: (numpy array of int32) the entry for this time step
+        - parent: type HistoryNode, the previous time step (the root sentinel for the first time step)
+        '''
+        self.entry = entry
+        self.parent = parent
+        if parent is None: #root sentinel
+            self.depth = 0
+            self.jump = self
+        else:
+            self.depth = parent.depth + 1
+            jump = parent.jump
+            if parent.depth - jump.depth == jump.depth - jump.jump.depth:
+                self.jump = jump.jump
+            else:
+                self.jump = parent
+
+#every history shares the same root sentinel
+HISTORY_ROOT = HistoryNode(None, None)
+
+class PersistentHistory(object):
+    def __init__(self, head=None):
+        '''
+        Inputs:
+        - head: type HistoryNode, newest node of the history, None for an empty history
+        '''
+        if head is None:
+            head = HISTORY_ROOT
+        self.head = head
+
+    def copy(self):
+        '''
+        O(1), the copy shares all existing entries, later appends to either history
+        are not seen by the other
+        '''
+        return PersistentHistory(self.head)
+
+    def __copy__(self):
+        return self.copy()
+
+    def __deepcopy__(self, memo):
+        #entries are never modified, so sharing them is a valid deep copy
+        return self.copy()
+
+    def append(self, entry):
+        '''
+        Inputs:
+        - entry: list of ints (e.g. measurement associations or dead target indices for a time step)
+        '''
+        self.head = HistoryNode(np.asarray(entry, dtype=np.int32), self.head)
+
+    def __len__(self):
+        return self.head.depth
+
+    def node_at_depth(self, depth):
+        '''
+        Outputs:
+        - node: type HistoryNode, the ancestor of self.head with the specified depth, O(log n)
+        '''
+        assert(depth >= 0 and depth <= self.head.depth), (depth, self.head.depth)
+        node = self.head
+        while node.depth != depth:
+            if node.jump.depth >= depth:
+                node = node.jump
+            else:
+                node = node.parent
+        return node
+
+    def __getitem__(self, idx):
+        '''
+        Inputs:
+        - idx: (int) time step index, negative indices count back from the newest entry
+
+        Outputs:
+        - entry: (numpy array of int32) the entry appended on time step idx
+        '''
+        if idx < 0:
+            idx += len(self)
+        if idx < 0 or idx >= len(self):
+            raise IndexError('history index out of range')
+        return self.node_at_depth(idx + 1).entry
+
+    def __iter__(self):
+        entries = []
+        node = self.head
+        while node.depth > 0:
+            entries.append(node.entry)
+            node = node.parent
+        return reversed(entries)
+
+    def tolist(self):
+        '''
+        Outputs:
+        - history: list of lists of ints, oldest time step first
+        '''
+        return [entry.tolist() for entry in self]
+
+    def shares_prefix_with(self, other, length):
+        '''
+        Outputs:
+        - shared: (bool) True if the first length entries of self and other are the same nodes,
+            i.e. both histories descend from the same ancestor history (O(log n))
+        '''
+        if len(self) < length or len(other) < length:
+            return False
+        return self.node_at_depth(length) is other.node_at_depth(length)
+
+    def __getstate__(self):
+        #store a flat list to avoid deep recursion when pickling long histories
+        return self.tolist()
+
+    def __setstate__(self, state):
+        self.head = HISTORY_ROOT
+        for entry in state:
+            self.append(entry)
+
+    def __repr__(self):
+        return repr(self.tolist())
@@ -0,0 +1,493 @@
+#Sparse birth/clutter/death association matrices.
+#
+#construct_log_probs_matrix3 (rbpf_sampling_manyMeasSrcs.py) builds a (2*M + 2*T)x(2*M + 2*T) matrix where
+#row m < M is measurement m, row M+2t is "target t lives" and row M+1+2t is "target t dies", column t < T
+#is target t, column T+2m is "measurement m is clutter" and column T+1+2m is "measurement m is a birth".
+#Apart from the M*T measurement-target entries, 2*M clutter/birth entries and 2*T lives/dies entries
+#every entry is either infeasible or part of the lower right block of filler entries (rows >= M,
+#columns >= T) that all have the same value.
+#
+#SparseAssociationMatrix stores only the feasible measurement-target entries (edges, in CSR order),
+#the clutter/birth/lives/dies entries and the filler value.  It uses the row and column indices of the
+#dense matrix, so assignments are still lists of (row, col) pairs and convert_assignment_pairs_to_associations3
+#etc. work unchanged.  solve_sparse_association finds the minimum cost assignment subject to the required and
+#excluded cells of a node in Murty's algorithm (mht_helpers/k_best_assign_birth_clutter_death_matrix.py)
+#with a shortest augmenting path algorithm over the edges, the filler entries are filled in afterwards.
+#Memory and solve time scale with the number of edges rather than (2*M + 2*T)^2.
+
+import numpy as np
+import heapq
+from global_params import INFEASIBLE_COST
+
+
+class SparseAssociationMatrix:
+    def __init__(self, M, T, edge_meas, edge_targets, edge_values, clutter_values, birth_values,
+                 lives_values, dies_values, filler_value=0.0, infeasible_value=INFEASIBLE_COST):
+        '''
+        Inputs:
+        - M: number of measurements
+        - T: number of targets
+        - edge_meas, edge_targets, edge_values: numpy arrays of the same length, edge i is the entry
+            (edge_meas[i], edge_targets[i]) with value edge_values[i].  Measurement-target entries
+            that are not edges are infeasible
+        - clutter_values, birth_values: numpy arrays with shape (M,), entries (m, T+2m) and (m, T+1+2m)
+        - lives_values, dies_values: numpy arrays with shape (T,), entries (M+2t, t) and (M+1+2t, t)
+        - filler_value: value of every entry in the lower right block (rows >= M, columns >= T)
+        - infeasible_value: value of every other entry, -1*INFEASIBLE_COST for log probabilities and
+            INFEASIBLE_COST (or larger) for costs
+        '''
+        assert(len(edge_meas) == len(edge_targets) and len(edge_targets) == len(edge_values))
+        assert(len(clutter_values) == M and len(birth_values) == M)
+        assert(len(lives_values) == T and len(dies_values) == T)
+        self.M = M
+        self.T = T
+        edge_meas = np.asarray(edge_meas, dtype=int)
+        edge_targets = np.asarray(edge_targets, dtype=int)
+        #CSR order, edges of measurement m are edge_meas_offsets[m]:edge_meas_offsets[m+1]
+        order = np.lexsort((edge_targets, edge_meas))
+        self.edge_meas = edge_meas[order]
+        self.edge_targets = edge_targets[order]
+        self.edge_meas_offsets = np.searchsorted(self.edge_meas, np.arange(M + 1))
+        self.edge_count = len(order)
+
+        #every value except the filler and infeasible values in one array, so the values can be
+        #transformed and perturbed at once
+        E = self.edge_count
+        self.values = np.concatenate((np.asarray(edge_values, dtype=float)[order], clutter_values, birth_values,
+                                      lives_values, dies_values)).astype(float)
+        self.edge_values = self.values[:E]
+        self.clutter_values = self.values[E:E + M]
+        self.birth_values = self.values[E + M:E + 2*M]
+        self.lives_values = self.values[E + 2*M:E + 2*M + T]
+        self.dies_values = self.values[E + 2*M + T:]
+        self.filler_value = filler_value
+        self.infeasible_value = infeasible_value
+
+        #built on first use by edge_lookup and meas_edge_lists
+        self._edge_indices = None
+        self._meas_edge_lists = None
+
+    def shape(self):
+        return (2*self.M + 2*self.T, 2*self.M + 2*self.T)
+
+    def transformed(self, scale, offset=0.0):
+        '''
+        Outputs:
+        - transformed: type SparseAssociationMatrix, every entry (including the filler and infeasible
+            entries) is scale*entry + offset.  E.g. transformed(-1) converts log probabilities to costs
+        '''
+        E = self.edge_count
+        M = self.M
+        T = self.T
+        values = scale*self.values + offset
+        return SparseAssociationMatrix(M, T, self.edge_meas, self.edge_targets, values[:E],
+            values[E:E + M], values[E + M:E + 2*M], values[E + 2*M:E + 2*M + T], values[E + 2*M + T:],
+            filler_value=scale*self.filler_value + offset, infeasible_value=scale*self.infeasible_value + offset)
+
+    def perturb(self, noise):
+        '''
+        Add noise to the edge, clutter, birth, lives and dies values in place
+
+        Inputs:
+        - noise: numpy array with the same shape as self.values
+        '''
+        assert(noise.shape == self.values.shape)
+        self.values += noise
+        self._meas_edge_lists = None
+
+    def min_value(self):
+        '''
+        Outputs:
+        - min_value: the smallest feasible entry (the smallest entry if infeasible entries are costs)
+        '''
+        if self.M + self.T == 0:
+            return 0.0
+        if len(self.values) == 0:
+            return self.filler_value
+        return min(np.min(self.values), self.filler_value)
+
+    def edge_lookup(self):
+        '''
+        Outputs:
+        - edge_indices: dictionary, key=(measurement index, target index), value=index of the edge
+        '''
+        if self._edge_indices is None:
+            self._edge_indices = dict(zip(zip(self.edge_meas.tolist(), self.edge_targets.tolist()), range(self.edge_count)))
+        return self._edge_indices
+
+    def meas_edge_lists(self):
+        '''
+        Outputs:
+        - meas_edge_lists: list of length M, meas_edge_lists[m] is a list of (target index, value) pairs
+            for the edges of measurement m
+        '''
+        if self._meas_edge_lists is None:
+            targets = self.edge_targets.tolist()
+            values = self.edge_values.tolist()
+            offsets = self.edge_meas_offsets.tolist()
+            self._meas_edge_lists = [zip(targets[offsets[m]:offsets[m+1]], values[offsets[m]:offsets[m+1]])
+                                     for m in range(self.M)]
+        return self._meas_edge_lists
+
+    def is_association_cell(self, row, col):
+        '''
+        Outputs:
+        - True if (row, col) is a measurement-target, clutter, birth, lives or dies entry, False if
+            it is a filler or infeasible entry
+        '''
+        M = self.M
+        T = self.T
+        if row < M:
+            return col < T or col == T + 2*row or col == T + 1 + 2*row
+        elif row < M + 2*T:
+            return col == (row - M)//2
+        return False
+
+    def entry(self, row, col):
+        '''
+        Outputs:
+        - value: the entry at (row, col) of the dense matrix
+        '''
+        M = self.M
+        T = self.T
+        if row < M and col < T:
+            edge_idx = self.edge_lookup().get((row, col))
+            if edge_idx is None:
+                return self.infeasible_value
+            return self.edge_values[edge_idx]
+        elif row < M:
+            if col == T + 2*row:
+                return self.clutter_values[row]
+            elif col == T + 1 + 2*row:
+                return self.birth_values[row]
+            return self.infeasible_value
+        elif col < T:
+            if row == M + 2*col:
+                return self.lives_values[col]
+            elif row == M + 1 + 2*col:
+                return self.dies_values[col]
+            return self.infeasible_value
+        return self.filler_value
+
+    def assignment_value(self, assignment):
+        '''
+        Inputs:
+        - assignment: list of (row, col) pairs
+
+        Outputs:
+        - value: sum of the entries in assignment, equal to np.trace(np.dot(self.to_dense(), A.T)) where A
+            is the assignment matrix of assignment
+        '''
+        value = 0.0
+        for (row, col) in assignment:
+            value += self.entry(row, col)
+        return value
+
+    def permutation_value(self, col4row):
+        '''
+        Inputs:
+        - col4row: numpy array of ints with shape (2*M+2*T,), col4row[row] is the column assigned to row
+
+        Outputs:
+        - value: sum of the entries selected by col4row, as assignment_value
+        '''
+        M = self.M
+        T = self.T
+        col4row = np.asarray(col4row, dtype=int)
+        assert(len(col4row) == 2*M + 2*T), (len(col4row), M, T)
+        #filler entries, the remaining entries are set below or stay infeasible
+        entries = np.where(col4row >= T, self.filler_value, self.infeasible_value).astype(float)
+        m_indices = np.arange(M)
+        meas_cols = col4row[:M]
+        entries[:M] = self.infeasible_value
+        clutter = (meas_cols == T + 2*m_indices)
+        entries[m_indices[clutter]] = self.clutter_values[clutter]
+        birth = (meas_cols == T + 1 + 2*m_indices)
+        entries[m_indices[birth]] = self.birth_values[birth]
+        associated = np.flatnonzero(meas_cols < T)
+        if len(associated) > 0 and self.edge_count > 0:
+            #edges are in CSR order, so their (measurement, target) keys are sorted
+            edge_keys = self.edge_meas*T + self.edge_targets
+            keys = associated*T + meas_cols[associated]
+            edge_indices = np.minimum(np.searchsorted(edge_keys, keys), self.edge_count - 1)
+            found = (edge_keys[edge_indices] == keys)
+            entries[associated[found]] = self.edge_values[edge_indices[found]]
+        t_indices = np.arange(T)
+        lives = (col4row[M + 2*t_indices] == t_indices)
+        entries[M + 2*t_indices[lives]] = self.lives_values[lives]
+        dies = (col4row[M + 1 + 2*t_indices] == t_indices)
+        entries[M + 1 + 2*t_indices[dies]] = self.dies_values[dies]
+        return np.sum(entries)
+
+    def to_dense(self):
+        '''
+        Outputs:
+        - matrix: numpy array with shape (2*M+2*T)x(2*M+2*T)
+        '''
+        M = self.M
+        T = self.T
+        matrix = np.empty((2*M + 2*T, 2*T + 2*M))
+        matrix.fill(self.infeasible_value)
+        matrix[self.edge_meas, self.edge_targets] = self.edge_values
+        t_indices = np.arange(T)
+        matrix[M + 2*t_indices, t_indices] = self.lives_values
+        matrix[M + 1 + 2*t_indices, t_indices] = self.dies_values
+        m_indices = np.arange(M)
+        matrix[m_indices, T + 2*m_indices] = self.clutter_values
+        matrix[m_indices, T + 1 + 2*m_indices] = self.birth_values
+        matrix[M:, T:] = self.filler_value
+        return matrix
+
+
+def sparse_association_matrix_from_dense(cost_matrix, M):
+    '''
+    Inputs:
+    - cost_matrix: numpy array with shape (2*M+2*T)x(2*M+2*T) of costs, entries >= INFEASIBLE_COST are
+        infeasible.  The lower right block (rows >= M, columns >= T) must be constant
+    - M: number of measurements
+
+    Outputs:
+    - sparse_costs: type SparseAssociationMatrix
+    '''
+    T = cost_matrix.shape[0]//2 - M
+    assert(cost_matrix.shape == (2*M + 2*T, 2*M + 2*T)), (cost_matrix.shape, M, T)
+    (edge_meas, edge_targets) = np.nonzero(cost_matrix[:M, :T] < INFEASIBLE_COST)
+    m_indices = np.arange(M)
+    t_indices = np.arange(T)
+    if M + T > 0:
+        filler_value = cost_matrix[M, T]
+        assert((cost_matrix[M:, T:] == filler_value).all())
+    else:
+        filler_value = 0.0
+    return SparseAssociationMatrix(M, T, edge_meas, edge_targets, cost_matrix[edge_meas, edge_targets],
+        cost_matrix[m_indices, T + 2*m_indices], cost_matrix[m_indices, T + 1 + 2*m_indices],
+        cost_matrix[M + 2*t_indices, t_indices], cost_matrix[M + 1 + 2*t_indices, t_indices],
+        filler_value=filler_value, infeasible_value=INFEASIBLE_COST)
+
+
+def cheapest_allowed(options):
+    '''
+    Inputs:
+    - options: list of (cost, cell, allowed) triplets
+
+    Outputs:
+    - (cost, cell) of the cheapest allowed option with cost < INFEASIBLE_COST, None if there is none.
+        Ties go to the earlier option
+    '''
+    best = None
+    for (cost, cell, allowed) in options:
+        if allowed and cost < INFEASIBLE_COST and (best is None or cost < best[0]):
+            best = (cost, cell)
+    return best
+
+def filler_pairs(M, T, used_rows, used_cols):
+    '''
+    Inputs:
+    - M: number of measurements
+    - T: number of targets
+    - used_rows, used_cols: sets of the rows and columns that are assigned association, clutter,
+        birth, lives or dies entries
+
+    Outputs:
+    - filler_pairs: list of (row, col) pairs, the filler entries that complete the assignment
+    '''
+    filler_rows = [row for row in range(M, 2*M + 2*T) if not row in used_rows]
+    filler_cols = [col for col in range(T, 2*M + 2*T) if not col in used_cols]
+    assert(len(filler_rows) == len(filler_cols)), (filler_rows, filler_cols)
+    return zip(filler_rows, filler_cols)
+
+def solve_sparse_association(costs, required_cells=[], excluded_cells=[]):
+    '''
+    Find the minimum cost assignment of a sparse birth/clutter/death cost matrix that contains
+    required_cells and does not contain excluded_cells.  Measurements are assigned one at a time with
+    shortest augmenting paths (Dijkstra with row and column potentials) over the edges, the columns
+    are the targets plus a private "unassociated" column per measurement with the cost of the
+    cheaper of clutter and birth.  A target's cost of being unassociated (the cheaper of lives and
+    dies) is subtracted from its edges and the filler value, since every association adds one
+    filler entry to the assignment, is added.  Targets that can neither live nor die must be associated,
+    their edges are made cheaper than any assignment that leaves them unassociated.
+
+    Inputs:
+    - costs: type SparseAssociationMatrix of costs
+    - required_cells: list of (row, col) pairs that must be in the assignment, each one a
+        measurement-target, clutter, birth, lives or dies entry
+    - excluded_cells: list of (row, col) pairs that must not be in the assignment, each one a
+        measurement-target, clutter, birth, lives or dies entry
+
+    Outputs:
+    - cost: (float) cost of the assignment of the rows and columns that aren't in required_cells,
+        INFEASIBLE_COST if no assignment satisfies the constraints
+    - association_list: list of (row, col) pairs assigning every row and column that isn't in
+        required_cells, sorted by row.  Empty if no assignment satisfies the constraints
+    - exclusion_bounds: dictionary, key=measurement-target, clutter, birth, lives or dies cell in
+        association_list, value=lower bound on how much the minimum cost increases when the cell is
+        also excluded.  Computed from the final dual variables: with reduced costs
+        c - u - v >= 0 the cost of any assignment is at least the minimum cost plus the sum of its
+        reduced costs, and the assignment must use another entry in the cell's row (or, for lives
+        and dies, another entry in the target's column or the target's other unassociated entry)
+    '''
+    M = costs.M
+    T = costs.T
+    excluded = set(excluded_cells)
+    required_rows = set()
+    required_cols = set()
+    for (row, col) in required_cells:
+        assert(costs.is_association_cell(row, col)), (row, col, M, T)
+        required_rows.add(row)
+        required_cols.add(col)
+    for (row, col) in excluded_cells:
+        assert(costs.is_association_cell(row, col)), (row, col, M, T)
+
+    free_meas = [m for m in range(M) if not m in required_rows]
+    free_target = [not t in required_cols for t in range(T)]
+
+    #cheapest way for each free target to be unassociated, None if it must be associated
+    unassociated_targets = [None for t in range(T)]
+    for t in range(T):
+        if free_target[t]:
+            unassociated_targets[t] = cheapest_allowed([
+                (costs.lives_values[t], (M + 2*t, t), not (M + 2*t, t) in excluded),
+                (costs.dies_values[t], (M + 1 + 2*t, t), not (M + 1 + 2*t, t) in excluded)])
+
+    #edges of the shortest augmenting path problem, row r is measurement free_meas[r], column t < T is
+    #target t and column T + r is row r's unassociated column
+    must_associate_cost = 1.0 + np.sum(np.abs(costs.values[costs.values < INFEASIBLE_COST])) + \
+        abs(costs.filler_value)*(M + T)
+    meas_edge_lists = costs.meas_edge_lists()
+    row_edges = []
+    unassociated_meas = []
+    assoc_costs = {} #key: (measurement index, target index), value: cost of the edge
+    for (r, m) in enumerate(free_meas):
+        cur_edges = []
+        for (t, cost) in meas_edge_lists[m]:
+            if free_target[t] and cost < INFEASIBLE_COST and not (m, t) in excluded:
+                assoc_costs[(m, t)] = cost
+                #every association adds a filler entry to the assignment
+                if unassociated_targets[t] is None:
+                    cur_edges.append((t, cost + costs.filler_value - must_associate_cost))
+                else:
+                    cur_edges.append((t, cost + costs.filler_value - unassociated_targets[t][0]))
+        unassociated = cheapest_allowed([
+            (costs.clutter_values[m], (m, T + 2*m), not (m, T + 2*m) in excluded),
+            (costs.birth_values[m], (m, T + 1 + 2*m), not (m, T + 1 + 2*m) in excluded)])
+        if unassociated is not None:
+            cur_edges.append((T + r, unassociated[0]))
+        row_edges.append(cur_edges)
+        unassociated_meas.append(unassociated)
+
+    #shortest augmenting path, following the dense algorithm in scipy.optimize.linear_sum_assignment
+    u = [0.0 for r in range(len(free_meas))]
+    v = {}
+    col4row = [-1 for r in range(len(free_meas))]
+    row4col = {}
+    for cur_row in range(len(free_meas)):
+        shortest = {}
+        path = {}
+        scanned_rows = []
+        scanned_cols = set()
+        heap = []
+        min_val = 0.0
+        i = cur_row
+        sink = -1
+        while sink == -1:
+            scanned_rows.append(i)
+            for (j, cost) in row_edges[i]:
+                if j in scanned_cols:
+                    continue
+                reduced_cost = min_val + cost - u[i] - v.get(j, 0.0)
+                if not j in shortest or reduced_cost < shortest[j]:
+                    shortest[j] = reduced_cost
+                    path[j] = i
+                    heapq.heappush(heap, (reduced_cost, j))
+            while len(heap) > 0 and (heap[0][1] in scanned_cols or heap[0][0] > shortest[heap[0][1]]):
+                heapq.heappop(heap)
+            if len(heap) == 0: #no augmenting path, measurement can't be assigned
+                return (INFEASIBLE_COST, [], {})
+            (min_val, j) = heapq.heappop(heap)
+            scanned_cols.add(j)
+            if not j in row4col:
+                sink = j
+            else:
+                i = row4col[j]
+
+        #update dual variables
+        u[cur_row] += min_val
+        for i in scanned_rows[1:]:
+            u[i] += min_val - shortest[col4row[i]]
+        for j in scanned_cols:
+            v[j] = v.get(j, 0.0) - (min_val - shortest[j])
+
+        #augment the assignment along the path
+        j = sink
+        while True:
+            i = path[j]
+            row4col[j] = i
+            (col4row[i], j) = (j, col4row[i])
+            if i == cur_row:
+                break
+
+    #assignment of the association rows and columns
+    association_list = []
+    cost = 0.0
+    for (r, m) in enumerate(free_meas):
+        if col4row[r] < T:
+            association_list.append((m, col4row[r]))
+            cost += assoc_costs[(m, col4row[r])]
+        else:
+            association_list.append(unassociated_meas[r][1])
+            cost += unassociated_meas[r][0]
+    for t in range(T):
+        if free_target[t] and not t in row4col:
+            if unassociated_targets[t] is None: #target can't be unassociated
+                return (INFEASIBLE_COST, [], {})
+            association_list.append(unassociated_targets[t][1])
+            cost += unassociated_targets[t][0]
+
+    #remaining rows and columns are assigned filler entries
+    used_rows = required_rows.union([row for (row, col) in association_list])
+    used_cols = required_cols.union([col for (row, col) in association_list])
+    cur_filler_pairs = filler_pairs(M, T, used_rows, used_cols)
+    association_list.extend(cur_filler_pairs)
+    cost += costs.filler_value*len(cur_filler_pairs)
+
+    association_list.sort()
+
+    #lower bounds for Murty's children, see exclusion_bounds above
+    exclusion_bounds = {}
+    target_min_reduced_costs = {}
+    for (r, m) in enumerate(free_meas):
+        min_target_reduced_cost = np.inf #smallest reduced cost of the row's other target columns
+        for (j, edge_cost) in row_edges[r]:
+            if j < T and j != col4row[r]:
+                reduced_cost = max(edge_cost - u[r] - v.get(j, 0.0), 0.0)
+                min_target_reduced_cost = min(min_target_reduced_cost, reduced_cost)
+                target_min_reduced_costs[j] = min(target_min_reduced_costs.get(j, np.inf), reduced_cost)
+        if col4row[r] < T:
+            #the row must use its unassociated column or another target
+            if unassociated_meas[r] is not None:
+                dummy_reduced_cost = max(unassociated_meas[r][0] - u[r] - v.get(T + r, 0.0), 0.0)
+            else:
+                dummy_reduced_cost = np.inf
+            exclusion_bounds[(m, col4row[r])] = min(min_target_reduced_cost, dummy_reduced_cost)
+        else:
+            #the row must use a target, or its other unassociated entry at a higher cost
+            (chosen_cost, chosen_cell) = unassociated_meas[r]
+            other_cell = (m, T + 2*m) if chosen_cell[1] == T + 1 + 2*m else (m, T + 1 + 2*m)
+            other_cost = costs.entry(other_cell[0], other_cell[1])
+            if other_cell in excluded or other_cost >= INFEASIBLE_COST:
+                other_increase = np.inf
+            else:
+                other_increase = other_cost - chosen_cost
+            exclusion_bounds[chosen_cell] = min(min_target_reduced_cost, other_increase)
+    for t in range(T):
+        if free_target[t] and not t in row4col:
+            #the target must be associated, or use its other unassociated entry at a higher cost
+            (chosen_cost, chosen_cell) = unassociated_targets[t]
+            other_cell = (M + 1 + 2*t, t) if chosen_cell[0] == M + 2*t else (M + 2*t, t)
+            other_cost = costs.entry(other_cell[0], other_cell[1])
+            if other_cell in excluded or other_cost >= INFEASIBLE_COST:
+                other_increase = np.inf
+            else:
+                other_increase = other_cost - chosen_cost
+            exclusion_bounds[chosen_cell] = min(target_min_reduced_costs.get(t, np.inf), other_increase)
+    return (cost, association_list, exclusion_bounds)
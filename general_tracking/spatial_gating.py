@@ -0,0 +1,140 @@
+#Spatial gating of detection group-target associations.
+#
+#In a KITTI frame most (detection group, target) pairs are hundreds of pixels apart and have a
+#negligible association likelihood.  A uniform grid over the detection groups' image positions is
+#built once per time instance (MeasurementGrid), each target then only looks at the detection groups
+#in nearby grid cells and keeps those that pass a gate (SpatialGate), so the cost of association
+#scales with the number of gated pairs instead of (number of detection groups) x (number of targets).
+#
+#The likelihood of a detection group with stacked positions z given a target with mean mu and
+#covariance S (both in measurement space) factors into a term that does not depend on the target and
+#N(mu_m; mu, G^-1 + S), where G = U^T D^-1 U and mu_m = G^-1 U^T D^-1 z are the group's combined
+#position and its covariance (see stacked_detection_likelihoods in rbpf_sampling_manyMeasSrcs.py).
+#SpatialGate gates on the squared Mahalanobis distance of this term, so it is exact for every group
+#size.  Pairs further apart than sqrt(gate*(largest eigenvalue of G^-1 + S)) cannot pass the gate,
+#which bounds the grid search radius.
+
+import numpy as np
+import math
+from collections import defaultdict
+
+def max_eigenvalues_2x2(covs):
+    '''
+    Inputs:
+    - covs: numpy array with shape (N, 2, 2) of symmetric matrices
+
+    Outputs:
+    - max_eigenvalues: numpy array with shape (N,)
+    '''
+    half_trace = (covs[:, 0, 0] + covs[:, 1, 1])/2
+    det = covs[:, 0, 0]*covs[:, 1, 1] - covs[:, 0, 1]*covs[:, 1, 0]
+    return half_trace + np.sqrt(np.maximum(half_trace**2 - det, 0.0))
+
+def mahalanobis_sq_2d(residuals, covs):
+    '''
+    Inputs:
+    - residuals: numpy array with shape (N, 2)
+    - covs: numpy array with shape (N, 2, 2)
+
+    Outputs:
+    - distances: numpy array with shape (N,), residuals[i]^T covs[i]^-1 residuals[i]
+    '''
+    det = covs[:, 0, 0]*covs[:, 1, 1] - covs[:, 0, 1]*covs[:, 1, 0]
+    return (covs[:, 1, 1]*residuals[:, 0]**2 - (covs[:, 0, 1] + covs[:, 1, 0])*residuals[:, 0]*residuals[:, 1] \
+            + covs[:, 0, 0]*residuals[:, 1]**2)/det
+
+
+class MeasurementGrid:
+    def __init__(self, positions, cell_size):
+        '''
+        Uniform grid over measurement positions in image coordinates
+
+        Inputs:
+        - positions: numpy array with shape (M, 2), (x, y) position of every measurement
+        - cell_size: (float) side length of a grid cell in pixels
+        '''
+        assert(cell_size > 0)
+        self.positions = positions
+        self.cell_size = float(cell_size)
+        #key: (column, row) of a cell, value: numpy array of indices of the measurements in the cell
+        cells = defaultdict(list)
+        for (meas_idx, cell) in enumerate(np.floor(positions/self.cell_size).astype(int).tolist()):
+            cells[tuple(cell)].append(meas_idx)
+        self.cells = dict([(cell, np.array(meas_indices, dtype=int)) for (cell, meas_indices) in cells.iteritems()])
+
+    def query(self, center, radius):
+        '''
+        Inputs:
+        - center: (x, y)
+        - radius: (float)
+
+        Outputs:
+        - candidates: numpy array of the indices of every measurement in a grid cell that intersects the
+            square of half side length radius around center.  A superset of the measurements within
+            distance radius of center, callers apply their exact gate to the candidates.
+        '''
+        (col_min, row_min) = [int(math.floor((center[i] - radius)/self.cell_size)) for i in range(2)]
+        (col_max, row_max) = [int(math.floor((center[i] + radius)/self.cell_size)) for i in range(2)]
+        candidates = []
+        if (col_max - col_min + 1)*(row_max - row_min + 1) < len(self.cells):
+            for col in range(col_min, col_max + 1):
+                for row in range(row_min, row_max + 1):
+                    if (col, row) in self.cells:
+                        candidates.append(self.cells[(col, row)])
+        else:
+            #the square covers more cells than are occupied, check the occupied cells instead
+            for ((col, row), meas_indices) in self.cells.iteritems():
+                if col_min <= col <= col_max and row_min <= row <= row_max:
+                    candidates.append(meas_indices)
+        if len(candidates) == 0:
+            return np.zeros(0, dtype=int)
+        return np.concatenate(candidates)
+
+
+class SpatialGate:
+    def __init__(self, group_means, group_covs, gate, cell_size):
+        '''
+        Inputs:
+        - group_means: numpy array with shape (M, 2), combined position of every detection group
+        - group_covs: numpy array with shape (M, 2, 2), covariance of every detection group's combined position
+        - gate: (float) pairs with squared Mahalanobis distance larger than gate are gated out
+        - cell_size: (float) side length of the grid cells in pixels
+        '''
+        self.group_means = group_means
+        self.group_covs = group_covs
+        self.gate = gate
+        self.grid = MeasurementGrid(group_means, cell_size)
+        if len(group_means) > 0:
+            self.max_group_eigenvalue = np.max(max_eigenvalues_2x2(group_covs))
+        else:
+            self.max_group_eigenvalue = 0.0
+
+    def gated_pairs(self, target_means, target_covs):
+        '''
+        Inputs:
+        - target_means: numpy array with shape (T, 2), target means in measurement space
+        - target_covs: numpy array with shape (T, 2, 2), target covariances in measurement space
+
+        Outputs:
+        - meas_indices, target_indices: numpy arrays of the same length, the gated (detection group, target)
+            pairs sorted by detection group then target
+        '''
+        if len(self.group_means) == 0 or len(target_means) == 0:
+            return (np.zeros(0, dtype=int), np.zeros(0, dtype=int))
+        radii = np.sqrt(self.gate*(self.max_group_eigenvalue + max_eigenvalues_2x2(target_covs)))
+        candidate_meas = []
+        candidate_targets = []
+        for target_idx in range(len(target_means)):
+            candidates = self.grid.query(target_means[target_idx], radii[target_idx])
+            candidate_meas.append(candidates)
+            candidate_targets.append(target_idx*np.ones(len(candidates), dtype=int))
+        meas_indices = np.concatenate(candidate_meas)
+        target_indices = np.concatenate(candidate_targets)
+
+        distances = mahalanobis_sq_2d(self.group_means[meas_indices] - target_means[target_indices],
+                                      self.group_covs[meas_indices] + target_covs[target_indices])
+        passed = distances <= self.gate
+        meas_indices = meas_indices[passed]
+        target_indices = target_indices[passed]
+        order = np.lexsort((target_indices, meas_indices))
+        return (meas_indices[order], target_indices[order])
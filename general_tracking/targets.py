@@ -2,6 +2,7 @@ import os
 from collections import defaultdict
 from collections import deque
 from global_params import *
+from box_geometry import near_border_mask
 
 class TargetState:
     #everything that uniquely defines a target at a single instance in time
@@ -45,14 +46,11 @@ NOT NOW            *'Q'
         #set to false when death is sampled during data generation
         self.alive = True
     def near_border(self):
-        near_border = False
         x1 = self.x[0][0] - self.width/2.0 #left edge of bounding box
         x2 = self.x[0][0] + self.width/2.0 #right edge of bounding box
         y1 = self.x[2][0] - self.height/2.0 #top of bounding box, (I think, assuming images are 0 at top)
         y2 = self.x[2][0] + self.height/2.0 #bottom of bounding box, (I think, assuming images are 0 at top)
-        if(x1 < 10 or x2 > (CAMERA_PIXEL_WIDTH - 15) or y1 < 10 or y2 > (CAMERA_PIXEL_HEIGHT - 15)):
-            near_border = True
-        return near_border
+        return bool(near_border_mask(x1, y1, x2, y2, CAMERA_PIXEL_WIDTH, CAMERA_PIXEL_HEIGHT))
 
     def is_offscreen(self):
         is_offscreen = False
@@ -0,0 +1,152 @@
+#Persistent (structurally shared) target trajectories, used for rbpf.Target's state history.
+#
+#A trajectory is a handle to the newest node of a parent linked list of (state, time stamp)
+#nodes.  Copying a trajectory (Target.clone, copy.deepcopy of a Target) is O(1) and the copies
+#share all existing nodes; appending, replacing or removing the newest state only creates or
+#drops nodes reachable from one handle, so nodes are never modified after creation.
+#
+#If a window is given, at most 2*window nodes are kept reachable: when a trajectory grows past
+#that, its newest window nodes are copied into a fresh chain and older nodes are released
+#(amortized O(1) per append).  len() still reports the total number of states.
+
+class TrajectoryNode(object):
+    __slots__ = ('state', 'time_stamp', 'parent')
+
+    def __init__(self, state, time_stamp, parent):
+        '''
+        Inputs:
+        - state: tuple (x, width, height), x is a numpy array with shape (4,1)
+        - time_stamp: (float) time of the state, rounded to 2 decimals
+        - parent: type TrajectoryNode, the previous state (None for the oldest retained state)
+        '''
+        self.state = state
+        self.time_stamp = time_stamp
+        self.parent = parent
+
+
+class Trajectory(object):
+    __slots__ = ('head', 'length', 'retained')
+
+    def __init__(self, head=None, length=0, retained=0):
+        '''
+        Inputs:
+        - head: type TrajectoryNode, newest state (None for an empty trajectory)
+        - length: (int) total number of states in the trajectory
+        - retained: (int) number of states reachable from head
+        '''
+        self.head = head
+        self.length = length
+        self.retained = retained
+
+    def copy(self):
+        return Trajectory(self.head, self.length, self.retained)
+
+    def __copy__(self):
+        return self.copy()
+
+    def __deepcopy__(self, memo):
+        #nodes are never modified, so sharing them is a valid deep copy
+        return self.copy()
+
+    def __len__(self):
+        return self.length
+
+    def append(self, state, time_stamp, window=None):
+        '''
+        Inputs:
+        - state: tuple (x, width, height)
+        - time_stamp: (float)
+        - window: (int) if not None, only the newest window states are guaranteed to be retained
+        '''
+        self.head = TrajectoryNode(state, time_stamp, self.head)
+        self.length += 1
+        self.retained += 1
+        if window is not None and self.retained > 2*window:
+            self.truncate(window)
+
+    def truncate(self, window):
+        '''
+        Release all but the newest window states
+        '''
+        newest_nodes = []
+        node = self.head
+        while len(newest_nodes) < window:
+            newest_nodes.append(node)
+            node = node.parent
+        head = None
+        for node in reversed(newest_nodes):
+            head = TrajectoryNode(node.state, node.time_stamp, head)
+        self.head = head
+        self.retained = window
+
+    def pop(self):
+        '''
+        Remove the newest state
+        '''
+        assert(self.retained > 0)
+        self.head = self.head.parent
+        self.length -= 1
+        self.retained -= 1
+
+    def replace_last(self, state):
+        '''
+        Replace the newest state, keeping its time stamp
+        '''
+        assert(self.retained > 0)
+        self.head = TrajectoryNode(state, self.head.time_stamp, self.head.parent)
+
+    def node(self, steps_back):
+        '''
+        Outputs:
+        - node: type TrajectoryNode, the state steps_back time steps before the newest state, O(steps_back)
+        '''
+        assert(steps_back < self.retained), (steps_back, self.retained)
+        node = self.head
+        for i in range(steps_back):
+            node = node.parent
+        return node
+
+    def state(self, steps_back=0):
+        return self.node(steps_back).state
+
+    def time_stamp(self, steps_back=0):
+        return self.node(steps_back).time_stamp
+
+    def states(self):
+        '''
+        Outputs:
+        - states: list of every retained state, oldest first
+        '''
+        states = []
+        node = self.head
+        while node is not None:
+            states.append(node.state)
+            node = node.parent
+        states.reverse()
+        return states
+
+    def time_stamps(self):
+        '''
+        Outputs:
+        - time_stamps: list of every retained time stamp, oldest first
+        '''
+        time_stamps = []
+        node = self.head
+        while node is not None:
+            time_stamps.append(node.time_stamp)
+            node = node.parent
+        time_stamps.reverse()
+        return time_stamps
+
+    def __getstate__(self):
+        #store flat lists to avoid deep recursion when pickling long trajectories
+        return (self.states(), self.time_stamps(), self.length)
+
+    def __setstate__(self, pickled_state):
+        (states, time_stamps, length) = pickled_state
+        self.head = None
+        self.length = 0
+        self.retained = 0
+        for (state, time_stamp) in zip(states, time_stamps):
+            self.append(state, time_stamp)
+        self.length = length
@@ -2,15 +2,8 @@ import numpy as np
 import sys
 import cProfile
 import sys
-from munkres import Munkres, print_matrix
-from scipy.optimize import linear_sum_assignment
-#use edited version of scipy
-sys.path.insert(0, "/Users/jkuck/tracking_research/scipy/scipy/optimize")
-#from _hungarian import linear_sum_assignment
-
-from pymatgen.optimization import linear_assignment
-
 import itertools
+import heapq
 import math
 import random
 import time
@@ -23,6 +16,12 @@ from cluster_config import RBPF_HOME_DIRECTORY
 sys.path.insert(0, "%sgeneral_tracking" % RBPF_HOME_DIRECTORY)
 #Entries in the cost matrix that cannot be chosen as associations are set to this value or greater
 from global_params import INFEASIBLE_COST
+from sparse_association import SparseAssociationMatrix, solve_sparse_association, sparse_association_matrix_from_dense, filler_pairs
+from compact_association import CompactAssociationCosts, compact_association_costs, expand_compact_assignment
+from incremental_assignment import solve_assignment, resolve_excluded_cell
+from association_components import association_components
+from auction_assignment import auction_assignment_dense
+from assignment_solvers import linear_assignment
 
 
 np.random.seed(1)
@@ -31,17 +30,45 @@ random.seed(1)
 #to the same associations and deaths, due to filler entries in matrix
 CHECK_NO_DUPLICATES = True
 
-#if true use Munkres from munkres to solve the assignment problem
-#if false use linear_sum_assignment from scipy to solve the assignment problem (generally faster)
-
-#'pymatgen' should be fastest, significantly
-#pick from ['munkres', 'scipy', 'pymatgen'], 
-ASSIGNMENT_SOLVER = 'pymatgen'
+#pick from ['munkres', 'scipy', 'pymatgen', 'auto', 'incremental', 'auction'], 
+#'munkres', 'scipy', 'pymatgen' and 'auto' solve the remaining cost matrix with linear_assignment
+#(see assignment_solvers.py), 'auto' picks the solver from the calibration table.  'pymatgen' is
+#only registered if pymatgen is installed, rerun assignment_solvers.calibrate_solvers with it
+#installed for 'auto' to consider it
+#'incremental' solves a node's children from the node's assignment and dual variables with a single
+#augmenting path each (see incremental_assignment.py), no remaining cost matrix is constructed
+#'auction' solves the remaining cost matrix over its feasible entries only with the auction algorithm
+#(see auction_assignment.py), warm started from the parent node's column prices.  It is faster than
+#the dense solvers on large sparse cost matrices, run auction_assignment.speed_test for the crossover
+#cost matrices of type SparseAssociationMatrix are always solved with solve_sparse_association
+ASSIGNMENT_SOLVER = 'auto'
 DEBUG = False
 DEBUG1 = False
 DEBUG2 = False
 PROFILE = False
 
+#if 'augmented', Murty's algorithm runs on the (2*M + 2*T)x(2*M + 2*T) cost matrices
+#if 'compact', the cost matrices are converted to the M x (T + M) form of compact_association.py
+#(cost matrices must then have a constant lower right block, as SparseAssociationMatrix's do) and
+#Murty's algorithm ranks association hypotheses, each with the cheaper of clutter/birth for every
+#unassociated measurement and the cheaper of lives/dies for every unassociated target
+ASSIGNMENT_FORMULATION = 'augmented'
+
+#if True, k_best_assign_mult_cost_matrices keeps Murty's partition in a heap and solves nodes lazily
+#(see lazy_k_best_assignments), if False it solves every node when it is created and scans the
+#partition for the minimum cost node each iteration
+USE_LAZY_MURTY = False
+
+#if True, k_best_assign_mult_cost_matrices splits every cost matrix into the connected components of
+#its feasible measurement-target entries (see association_components.py), finds the k best
+#assignments of each component (generated lazily) and merges them best first (see component_k_best_assignments).
+#Dense cost matrices whose lower right block isn't constant (e.g. with gumbel noise added to every
+#entry) are solved jointly
+DECOMPOSE_ASSOCIATION_COMPONENTS = False
+
+#mass_adaptive_k_best_assignments caps the exponents of its bounds on relative probability mass at this
+MAX_LOG_MASS_BOUND = 700.0
+
 #if 'delete', delete required rows, WORKS :)
 #if 'fixed', keep the same size but set cost of required entry to .00000001, 
 #other entries in row/col to INFEASIBLE_COST, THIS DOESN"T WORK CURRENTLY
@@ -66,7 +93,7 @@ REMAINING_COST_MATRIX_CONSTRUNCTION = 'delete'
 
 
 #BRUTE FORCE TEST ME WITH RANDOM MATRICES
-def k_best_assign_mult_cost_matrices(k, cost_matrices, matrix_costs, M):
+def k_best_assign_mult_cost_matrices(k, cost_matrices, matrix_costs, M, target_potentials=None):
     '''
     Find the k lowest cost assignments for any of the cost matrices.  That is, the lowest cost will
     be the lowest cost assignment with costs specified by ANY of the cost matrices.  This is 
@@ -79,10 +106,16 @@ def k_best_assign_mult_cost_matrices(k, cost_matrices, matrix_costs, M):
     cost for the matrix given in matrix_costs
     Inputs:
     - k: (integer), find top k best assignments   
-    - cost_matrices: (list of numpy arrays)  
+    - cost_matrices: (list of numpy arrays or SparseAssociationMatrix's of costs)
     - matrix_costs: (list of floats) same length as cost_matrices.  add this to every assignment cost for the corresponding matrix
         in cost_matrices
     - M: number of measurements 
+    - target_potentials: (optional) list with the same length as cost_matrices, entries are None or
+        numpy arrays with shape (T,) of the dual variables of the target columns, e.g. from the
+        previous time instance, that warm start the root solves when ASSIGNMENT_SOLVER == 'incremental'
+        (see solve_assignment).  Entries are replaced by the dual variables of the target columns of
+        every root node that is solved with ASSIGNMENT_SOLVER == 'incremental', to warm start the next
+        time instance.  Not used with DECOMPOSE_ASSOCIATION_COMPONENTS
 
     cost_matrices have dimensions (2*M + 2*T)x(2*M + 2*T), where T = number of targets and may differ
     between cost_matrices
@@ -95,18 +128,189 @@ def k_best_assign_mult_cost_matrices(k, cost_matrices, matrix_costs, M):
         best_assignments[i][2] is the index in the input cost_matrices of the cost matrix used
         for the ith best assignment
     '''
+    check_cost_matrices(cost_matrices, M)
+    if DECOMPOSE_ASSOCIATION_COMPONENTS:
+        best_assignments = component_k_best_assignments(k, cost_matrices, matrix_costs, M)
+    else:
+        best_assignments = murty_k_best_assignments(k, cost_matrices, matrix_costs, M, target_potentials)
+
+    if CHECK_NO_DUPLICATES:
+        check_for_duplicates(best_assignments, M, cost_matrices[0])
+
+    return best_assignments
+
+def check_cost_matrices(cost_matrices, M):
     for cur_cost_matrix in cost_matrices:
-#        assert(cur_cost_matrix.shape == (2*M + 2*T, 2*M + 2*T)), (cur_cost_matrix.shape, M, T)
-        assert(cur_cost_matrix.shape[0] == cur_cost_matrix.shape[1]), (cur_cost_matrix.shape, M)
-        for i in range(cur_cost_matrix.shape[0]):
-            for j in range(cur_cost_matrix.shape[1]):
-                assert(sys.maxint > cur_cost_matrix[i][j])
+        if isinstance(cur_cost_matrix, SparseAssociationMatrix):
+            assert(cur_cost_matrix.M == M), (cur_cost_matrix.M, M)
+            assert((cur_cost_matrix.values >= 0).all() and cur_cost_matrix.filler_value >= 0)
+        else:
+#            assert(cur_cost_matrix.shape == (2*M + 2*T, 2*M + 2*T)), (cur_cost_matrix.shape, M, T)
+            assert(cur_cost_matrix.shape[0] == cur_cost_matrix.shape[1]), (cur_cost_matrix.shape, M)
+            assert((cur_cost_matrix < sys.maxint).all())
+
+def mass_adaptive_k_best_assignments(min_k, max_k, mass_fraction, cost_matrices, matrix_costs, M, target_potentials=None):
+    '''
+    Find the lowest cost assignments for any of the cost matrices, as k_best_assign_mult_cost_matrices,
+    until they carry at least mass_fraction of the probability mass of all assignments, where the
+    probability of an assignment is proportional to exp(-cost) (costs are negative log probabilities,
+    as in modified_SIS_MHT_gumbel_step without gumbel noise).
+
+    After n assignments with mass P_n, the mass of the assignments that haven't been found is at most
+    the smaller of
+    - the upper bound on the mass of all assignments (see log_mass_upper_bound) minus P_n
+    - (number of assignments that haven't been found)*exp(-L), where L is the cost of the next best
+        assignment, the smallest cost of any unexplored node in Murty's partition
+    so P_n/(P_n + the smaller bound) is a lower bound on the fraction of the mass that was found.
+    Assignments are ranked lazily (lazy_ranked_assignments, or component_ranked_assignments with
+    DECOMPOSE_ASSOCIATION_COMPONENTS) whatever USE_LAZY_MURTY, one assignment beyond the last one
+    returned is ranked to find L.
+
+    Inputs:
+    - min_k: (integer) find at least min_k assignments (if there are that many), e.g. the number of
+        hypotheses sampled without replacement
+    - max_k: (integer) find at most max_k assignments
+    - mass_fraction: (float) stop once the assignments carry at least this fraction of the mass
+    - cost_matrices, matrix_costs, M, target_potentials: as in k_best_assign_mult_cost_matrices
+
+    Outputs:
+    - best_assignments: as in k_best_assign_mult_cost_matrices, at most max_k assignments
+    - captured_mass: (float) lower bound on the fraction of the probability mass of all assignments
+        carried by best_assignments
+    '''
+    assert(min_k <= max_k and mass_fraction >= 0 and mass_fraction <= 1), (min_k, max_k, mass_fraction)
+    check_cost_matrices(cost_matrices, M)
+    log_total_mass = np.logaddexp.reduce([log_mass_upper_bound(cur_cost_matrix, matrix_costs[idx], M)
+                                          for (idx, cur_cost_matrix) in enumerate(cost_matrices)])
+    log_total_count = np.logaddexp.reduce([log_assignment_count(M, cost_matrix_target_count(cur_cost_matrix, M))
+                                           for cur_cost_matrix in cost_matrices])
+
+    ranked = ranked_assignments(cost_matrices, matrix_costs, M, target_potentials)
+    best_assignments = []
+    #masses relative to the mass of the best assignment
+    captured_mass = 0.0
+    remaining_mass = 0.0
+    cur_assignment = next(ranked, None)
+    while cur_assignment is not None:
+        best_assignments.append(cur_assignment)
+        best_cost = best_assignments[0][0]
+        captured_mass += np.exp(best_cost - cur_assignment[0])
+        cur_assignment = next(ranked, None)
+        if cur_assignment is None: #found every assignment
+            remaining_mass = 0.0
+        else:
+            #exponents are capped, larger bounds don't matter compared to at most max_k relative masses
+            total_bound = np.exp(min(log_total_mass + best_cost, MAX_LOG_MASS_BOUND)) - captured_mass
+            count_bound = np.exp(min(log_total_count + best_cost - cur_assignment[0], MAX_LOG_MASS_BOUND)) - \
+                len(best_assignments)*np.exp(best_cost - cur_assignment[0])
+            remaining_mass = max(min(total_bound, count_bound), 0.0)
+        if len(best_assignments) == max_k:
+            break
+        if len(best_assignments) >= min_k and captured_mass >= mass_fraction*(captured_mass + remaining_mass):
+            break
+
+    if CHECK_NO_DUPLICATES and len(best_assignments) > 0:
+        check_for_duplicates(best_assignments, M, cost_matrices[0])
+
+    if len(best_assignments) == 0:
+        return (best_assignments, 1.0)
+    return (best_assignments, captured_mass/(captured_mass + remaining_mass))
+
+def ranked_assignments(cost_matrices, matrix_costs, M, target_potentials=None):
+    '''
+    Generator of the assignments of k_best_assign_mult_cost_matrices in order of increasing cost, the
+    lazy version of murty_k_best_assignments or component_k_best_assignments
+
+    Inputs are the same as k_best_assign_mult_cost_matrices, generates the entries of best_assignments
+    '''
+    if DECOMPOSE_ASSOCIATION_COMPONENTS:
+        return component_ranked_assignments(cost_matrices, matrix_costs, M)
+    if ASSIGNMENT_FORMULATION == 'compact':
+        cost_matrices = [compact_association_costs(cur_cost_matrix, M) for cur_cost_matrix in cost_matrices]
+    else:
+        assert(ASSIGNMENT_FORMULATION == 'augmented'), ASSIGNMENT_FORMULATION
+    return lazy_ranked_assignments(cost_matrices, matrix_costs, M, target_potentials)
+
+def log_mass_upper_bound(cost_matrix, matrix_cost, M):
+    '''
+    Upper bound on the log of the probability mass (sum of exp(-cost)) of the assignments of a cost
+    matrix, as ranked with ASSIGNMENT_FORMULATION, where cost includes matrix_cost.
+
+    An assignment associates some measurements with targets, every other measurement is clutter or a
+    birth and every other target lives or dies, and it pays the filler entry once per measurement,
+    target and association (see compact_association.py).  Dividing every association's term by its
+    target's unassociated term u_t = exp(-lives) + exp(-dies):
+
+        mass = exp(-matrix_cost - filler*(M + T)) * prod_t u_t * sum over assignments of prod_m w_m
+
+    where w_m is exp(-clutter) + exp(-birth) if measurement m is unassociated and
+    exp(-association - filler)/u_t if it is associated with target t.  Dropping the constraint that no
+    two measurements are associated with the same target bounds the sum by the product over
+    measurements of the sum of their w_m's.  The bound is close when every measurement has one
+    dominant choice.  The compact formulation only ranks the cheaper of clutter and birth and of lives
+    and dies, so maxima replace their sums.
+
+    Inputs:
+    - cost_matrix: SparseAssociationMatrix or numpy array of costs, as in k_best_assign_mult_cost_matrices
+    - matrix_cost: (float) added to every assignment's cost
+    - M: number of measurements
+
+    Outputs:
+    - log_mass: (float) np.inf if a dense cost_matrix's lower right block isn't constant (e.g. with
+        gumbel noise added to every entry) or a target can neither live nor die
+    '''
+    if not isinstance(cost_matrix, SparseAssociationMatrix):
+        T = cost_matrix_target_count(cost_matrix, M)
+        if M + T > 0 and not (cost_matrix[M:, T:] == cost_matrix[M, T]).all():
+            return np.inf
+        cost_matrix = sparse_association_matrix_from_dense(cost_matrix, M)
+    if ASSIGNMENT_FORMULATION == 'compact':
+        fold = np.maximum
+    else:
+        fold = np.logaddexp
+    if ((cost_matrix.lives_values >= INFEASIBLE_COST) & (cost_matrix.dies_values >= INFEASIBLE_COST)).any():
+        return np.inf
+    log_target_terms = fold(-cost_matrix.lives_values, -cost_matrix.dies_values)
+    log_meas_terms = fold(-cost_matrix.clutter_values, -cost_matrix.birth_values)
+    np.logaddexp.at(log_meas_terms, cost_matrix.edge_meas, -cost_matrix.edge_values - cost_matrix.filler_value -
+                    log_target_terms[cost_matrix.edge_targets])
+    return -matrix_cost - cost_matrix.filler_value*(M + cost_matrix.T) + np.sum(log_target_terms) + np.sum(log_meas_terms)
+
+def log_assignment_count(M, T):
+    '''
+    Outputs:
+    - log_count: (float) log of an upper bound on the number of assignments ranked with
+        ASSIGNMENT_FORMULATION of a cost matrix with M measurements and T targets.  a measurements
+        are associated with a targets in (M choose a)*(T choose a)*a! ways and every other measurement
+        and target has two options, one with the compact formulation
+    '''
+    if ASSIGNMENT_FORMULATION == 'compact':
+        log_options = 0.0
+    else:
+        log_options = math.log(2)
+    return np.logaddexp.reduce([math.lgamma(M + 1) - math.lgamma(a + 1) - math.lgamma(M - a + 1) +
+                                math.lgamma(T + 1) - math.lgamma(T - a + 1) + (M + T - 2*a)*log_options
+                                for a in range(min(M, T) + 1)])
+
+def murty_k_best_assignments(k, cost_matrices, matrix_costs, M, target_potentials=None):
+    '''
+    Murty's algorithm on the joint problem of every cost matrix, inputs and outputs are the same
+    as k_best_assign_mult_cost_matrices
+    '''
+    if ASSIGNMENT_FORMULATION == 'compact':
+        cost_matrices = [compact_association_costs(cur_cost_matrix, M) for cur_cost_matrix in cost_matrices]
+    else:
+        assert(ASSIGNMENT_FORMULATION == 'augmented'), ASSIGNMENT_FORMULATION
+    if USE_LAZY_MURTY:
+        return lazy_k_best_assignments(k, cost_matrices, matrix_costs, M, target_potentials)
+
     best_assignments = []
     cur_partition = []
     for (idx, cur_cost_matrix) in enumerate(cost_matrices):
-        T = cur_cost_matrix.shape[0]/2 - M
-        assert(cur_cost_matrix.shape == (2*M + 2*T, 2*M + 2*T)), (cur_cost_matrix.shape, M, T)        
-        cur_partition.append(Node(cur_cost_matrix, [], [], idx, M, T, matrix_costs[idx]))
+        T = cost_matrix_target_count(cur_cost_matrix, M)
+        cur_partition.append(Node(cur_cost_matrix, [], [], idx, M, T, matrix_costs[idx],
+                                  root_target_potentials=get_target_potentials(target_potentials, idx)))
+        store_target_potentials(cur_partition[-1], target_potentials)
 
     for itr in range(0, k):
         if DEBUG2:
@@ -185,11 +389,247 @@ def k_best_assign_mult_cost_matrices(k, cost_matrices, matrix_costs, M):
         else: #out of assignments early
             break
 
-    if CHECK_NO_DUPLICATES:
-        check_for_duplicates(best_assignments, M, cost_matrices[0])
+    return best_assignments
+
+def cost_matrix_target_count(cost_matrix, M):
+    '''
+    Outputs:
+    - T: number of targets of cost_matrix (numpy array, SparseAssociationMatrix or CompactAssociationCosts)
+    '''
+    if isinstance(cost_matrix, SparseAssociationMatrix) or isinstance(cost_matrix, CompactAssociationCosts):
+        return cost_matrix.T
+    T = cost_matrix.shape[0]/2 - M
+    assert(cost_matrix.shape == (2*M + 2*T, 2*M + 2*T)), (cost_matrix.shape, M, T)        
+    return T
+
+def lazy_k_best_assignments(k, cost_matrices, matrix_costs, M, target_potentials=None):
+    '''
+    Murty's algorithm with a priority queue and lazy evaluation.  Nodes are kept in a heap keyed by
+    their minimum cost, or by a lower bound on it if they haven't been solved.  A node is solved when
+    it reaches the top of the heap and is pushed back with its minimum cost.  When a solved node
+    reaches the top of the heap its assignment is the next best assignment and its children are
+    pushed unsolved, with the node's minimum cost (plus a dual based bound for sparse costs, see
+    Node.partition) as their lower bound.  Root nodes are pushed with
+    a lower bound of their matrix cost (plus the base cost of compact costs), since cost matrix
+    entries are non-negative.  The search stops once k assignments are found.
+
+    Inputs and outputs are the same as k_best_assign_mult_cost_matrices, after cost_matrices have
+    been converted to ASSIGNMENT_FORMULATION.
+    '''
+    best_assignments = []
+    for assignment in lazy_ranked_assignments(cost_matrices, matrix_costs, M, target_potentials):
+        best_assignments.append(assignment)
+        if len(best_assignments) == k:
+            break
+    return best_assignments
+
+def lazy_ranked_assignments(cost_matrices, matrix_costs, M, target_potentials=None):
+    '''
+    Generator of the assignments of lazy_k_best_assignments in order of increasing cost, a node's
+    children are only created when the next assignment is requested
+
+    Inputs are the same as lazy_k_best_assignments, generates the entries of best_assignments
+    '''
+    #heap entries are (cost or lower bound, push count, node), the push count breaks ties in
+    #the order nodes were pushed so nodes are never compared
+    heap = []
+    push_count = 0
+    for (idx, cur_cost_matrix) in enumerate(cost_matrices):
+        T = cost_matrix_target_count(cur_cost_matrix, M)
+        lower_bound = matrix_costs[idx]
+        if isinstance(cur_cost_matrix, CompactAssociationCosts):
+            lower_bound += cur_cost_matrix.base_cost
+        heapq.heappush(heap, (lower_bound, push_count, Node(cur_cost_matrix, [], [], idx, M, T, matrix_costs[idx], lower_bound,
+                                                            root_target_potentials=get_target_potentials(target_potentials, idx))))
+        push_count += 1
+
+    while len(heap) > 0:
+        (cur_cost, cur_push_count, cur_node) = heapq.heappop(heap)
+        if not cur_node.solved:
+            cur_node.solve()
+            store_target_potentials(cur_node, target_potentials)
+            if cur_node.minimum_cost < INFEASIBLE_COST:
+                heapq.heappush(heap, (cur_node.minimum_cost, push_count, cur_node))
+                push_count += 1
+            continue
+
+        #children are created when the generator is resumed, not if the caller has enough assignments
+        yield cur_node.get_min_cost_assignment()
+        for child_node in cur_node.partition(lazy=True):
+            heapq.heappush(heap, (child_node.minimum_cost, push_count, child_node))
+            push_count += 1
+
+def get_target_potentials(target_potentials, idx):
+    '''
+    Outputs:
+    - potentials: target_potentials[idx], None if target_potentials is None
+    '''
+    if target_potentials is None:
+        return None
+    return target_potentials[idx]
 
+def store_target_potentials(node, target_potentials):
+    '''
+    Replace target_potentials[node.orig_cost_matrix_index] with the dual variables of the target
+    columns if node is a root node solved with ASSIGNMENT_SOLVER == 'incremental'
+    '''
+    if target_potentials is not None and node.assignment_state is not None and \
+        len(node.required_cells) == 0 and len(node.excluded_cells) == 0:
+        target_potentials[node.orig_cost_matrix_index] = node.assignment_state.v[:node.T].copy()
+
+def component_k_best_assignments(k, cost_matrices, matrix_costs, M):
+    '''
+    Find the k best assignments from the ranked assignments of every connected component of every
+    cost matrix.  An assignment of a cost matrix picks one ranked assignment from each of its
+    components and costs the matrix cost plus the sum of the picked assignments' costs.  The
+    combinations are merged best first with a heap: a combination is represented by the rank
+    picked in every component and the children of a combination add one to the rank of its pivot
+    component or of a later one, so every combination is pushed exactly once and never before
+    a combination that costs less.  A component's assignments are generated with lazy Murty
+    (lazy_ranked_assignments) only when a combination first uses their rank, instead of
+    enumerating combinations of independent clusters with Murty's algorithm on the joint problem.
+
+    Inputs and outputs are the same as k_best_assign_mult_cost_matrices.
+    '''
+    best_assignments = []
+    for assignment in component_ranked_assignments(cost_matrices, matrix_costs, M):
+        best_assignments.append(assignment)
+        if len(best_assignments) == k: #don't generate component assignments we won't use
+            break
     return best_assignments
 
+def component_ranked_assignments(cost_matrices, matrix_costs, M):
+    '''
+    Generator of the assignments of component_k_best_assignments in order of increasing cost, the
+    children of a combination are only pushed when the next assignment is requested
+
+    Inputs are the same as component_k_best_assignments, generates the entries of best_assignments
+    '''
+    #ranked_components[idx] is a list with a RankedAssignmentList for every component of cost_matrices[idx]
+    ranked_components = []
+    heap = []
+    for (idx, cur_cost_matrix) in enumerate(cost_matrices):
+        cur_ranked_components = ranked_component_assignments(cur_cost_matrix, M)
+        ranked_components.append(cur_ranked_components)
+        best_component_assignments = [ranked_assignments.get(0) for ranked_assignments in cur_ranked_components]
+        if not None in best_component_assignments:
+            cur_cost = matrix_costs[idx] + sum([cur_cost for (cur_cost, pairs) in best_component_assignments])
+            heapq.heappush(heap, (cur_cost, idx, (0,)*len(cur_ranked_components), 0))
+
+    while len(heap) > 0:
+        (cur_cost, idx, ranks, pivot) = heapq.heappop(heap)
+        if cur_cost >= INFEASIBLE_COST:
+            break
+        cur_ranked_components = ranked_components[idx]
+        T = cost_matrix_target_count(cost_matrices[idx], M)
+        assignment_pairs = []
+        for (component_idx, rank) in enumerate(ranks):
+            assignment_pairs.extend(cur_ranked_components[component_idx].get(rank)[1])
+        used_rows = set([row for (row, col) in assignment_pairs])
+        used_cols = set([col for (row, col) in assignment_pairs])
+        assignment_pairs.extend(filler_pairs(M, T, used_rows, used_cols))
+        assignment_pairs.sort()
+        yield (cur_cost, assignment_pairs, idx)
+
+        for component_idx in range(pivot, len(ranks)):
+            ranked_assignments = cur_ranked_components[component_idx]
+            rank = ranks[component_idx]
+            next_assignment = ranked_assignments.get(rank + 1)
+            if next_assignment is not None:
+                child_cost = cur_cost - ranked_assignments.get(rank)[0] + next_assignment[0]
+                child_ranks = ranks[:component_idx] + (rank + 1,) + ranks[component_idx + 1:]
+                heapq.heappush(heap, (child_cost, idx, child_ranks, component_idx))
+
+class RankedAssignmentList:
+    def __init__(self, ranked_assignments):
+        '''
+        Assignments from a generator in order of increasing cost, generated when they are first accessed
+
+        Inputs:
+        - ranked_assignments: iterator of (cost, pairs) in order of increasing cost
+        '''
+        self.ranked_assignments = ranked_assignments
+        self.assignments = []
+
+    def get(self, rank):
+        '''
+        Outputs:
+        - assignment: the (cost, pairs) with index rank, None if there are no more assignments
+        '''
+        while len(self.assignments) <= rank and self.ranked_assignments is not None:
+            try:
+                self.assignments.append(next(self.ranked_assignments))
+            except StopIteration:
+                self.ranked_assignments = None
+        if rank < len(self.assignments):
+            return self.assignments[rank]
+        else:
+            return None
+
+def ranked_component_assignments(cost_matrix, M):
+    '''
+    Inputs:
+    - cost_matrix: SparseAssociationMatrix or numpy array of costs, as in k_best_assign_mult_cost_matrices
+    - M: number of measurements
+
+    Outputs:
+    - ranked_components: list of type RankedAssignmentList with an entry for every connected component
+        of cost_matrix, ranking (cost, pairs) of the component's assignments.  pairs are the (row, col)
+        pairs of cost_matrix without filler entries.  A dense cost_matrix with a lower right block
+        that isn't constant is a single component whose pairs include filler entries
+    '''
+    sparse = isinstance(cost_matrix, SparseAssociationMatrix)
+    if not sparse:
+        T = cost_matrix_target_count(cost_matrix, M)
+        if M + T > 0 and not (cost_matrix[M:, T:] == cost_matrix[M, T]).all():
+            if ASSIGNMENT_FORMULATION == 'compact':
+                cost_matrix = compact_association_costs(cost_matrix, M)
+            return [RankedAssignmentList((cur_cost, pairs) for (cur_cost, pairs, idx) in
+                                         lazy_ranked_assignments([cost_matrix], [0.0], M))]
+        cost_matrix = sparse_association_matrix_from_dense(cost_matrix, M)
+    T = cost_matrix.T
+
+    ranked_components = []
+    for component in association_components(cost_matrix):
+        costs = component.costs
+        if costs.M + costs.T == 1:
+            #a lone measurement is clutter or a birth, a lone target lives or dies
+            if costs.M == 1:
+                options = [(costs.clutter_values[0], (0, 0)), (costs.birth_values[0], (0, 1))]
+            else:
+                options = [(costs.lives_values[0], (0, 0)), (costs.dies_values[0], (1, 0))]
+            options = [(cur_cost + costs.filler_value, component.to_global_pairs([cell], M, T))
+                       for (cur_cost, cell) in options if cur_cost < INFEASIBLE_COST]
+            options.sort(key=lambda option: option[0])
+            if ASSIGNMENT_FORMULATION == 'compact':
+                #only the cheaper option, as in compact_association_costs
+                options = options[:1]
+            ranked_components.append(RankedAssignmentList(iter(options)))
+        else:
+            if ASSIGNMENT_FORMULATION == 'compact':
+                component_cost_matrix = compact_association_costs(costs, costs.M)
+            elif sparse:
+                component_cost_matrix = costs
+            else:
+                component_cost_matrix = costs.to_dense()
+            ranked_components.append(RankedAssignmentList(
+                ranked_global_component_assignments(component, component_cost_matrix, M, T)))
+    return ranked_components
+
+def ranked_global_component_assignments(component, component_cost_matrix, M, T):
+    '''
+    Generator of (cost, pairs) of the component's assignments in order of increasing cost, with pairs
+    of the full (2*M+2*T)x(2*M+2*T) problem (see AssociationComponent.to_global_pairs)
+
+    Inputs:
+    - component: type AssociationComponent
+    - component_cost_matrix: the component's costs in ASSIGNMENT_FORMULATION
+    - M: number of measurements in the full problem
+    - T: number of targets in the full problem
+    '''
+    for (cur_cost, pairs, idx) in lazy_ranked_assignments([component_cost_matrix], [0.0], component.costs.M):
+        yield (cur_cost, component.to_global_pairs(pairs, M, T))
+
 def check_for_duplicates(best_assignments, M, cost_matrix_example):
     '''
     Check the assignments differ in entries that are meaningful
@@ -220,14 +660,18 @@ def check_for_duplicates(best_assignments, M, cost_matrix_example):
 #    for ()
 
 class Node:
-    def __init__(self, orig_cost_matrix, required_cells, excluded_cells, orig_cost_matrix_index, M, T, matrix_cost):
+    def __init__(self, orig_cost_matrix, required_cells, excluded_cells, orig_cost_matrix_index, M, T, matrix_cost, lower_bound=None,
+                 parent_assignment_state=None, root_target_potentials=None, parent_prices=None):
         '''
         Following the terminology used by [1], a node is defined to be a nonempty subset of possible
         assignments to a cost matrix.  Every assignment in node N is required to contain
         required_cells and exclude excluded_cells.
 
         Inputs:
-        - orig_cost_matrix: (2d numpy array) the original cost matrix
+        - orig_cost_matrix: (2d numpy array, SparseAssociationMatrix or CompactAssociationCosts) the original
+            cost matrix, a SparseAssociationMatrix or CompactAssociationCosts is shared with the node's
+            children rather than copied.  With CompactAssociationCosts required_cells and excluded_cells
+            are cells of the M x (T + M) compact cost matrix
         - required_cells: (list of pairs) where each pair represents a (zero indexed) location
             in the assignment matrix that must be a 1
         - excluded_cells: list of pairs) where each pair represents a (zero indexed) location
@@ -238,10 +682,29 @@ class Node:
         - M: number of measurements 
         - T: number of targets 
         - matrix_cost: cost of this matrix, must be added to every assignment cost we compute
+        - lower_bound: if None the node's assignment problem is solved immediately, otherwise it is
+            solved when solve() is called and minimum_cost is set to lower_bound until then
+        - parent_assignment_state: type AssignmentState, the parent node's optimal assignment and
+            dual variables when ASSIGNMENT_SOLVER == 'incremental', None for a root node.  The node
+            must exclude the last cell of excluded_cells in addition to the parent's constraints
+        - root_target_potentials: numpy array with shape (T,), dual variables of the target columns
+            that warm start a root node's solve when ASSIGNMENT_SOLVER == 'incremental', or None
+        - parent_prices: numpy array with one price per column of the cost matrix, the parent node's
+            column prices that warm start the auction when ASSIGNMENT_SOLVER == 'auction', or None
         orig_cost_matrix has dimensions (2*M + 2*T)x(2*M + 2*T) 
 
         '''
-        self.orig_cost_matrix = np.array(orig_cost_matrix, copy=True)
+        self.sparse = isinstance(orig_cost_matrix, SparseAssociationMatrix)
+        self.compact = isinstance(orig_cost_matrix, CompactAssociationCosts)
+        if self.sparse:
+            self.orig_cost_matrix = orig_cost_matrix
+        elif self.compact:
+            #the compact cost matrix is solved like a dense cost matrix
+            self.compact_costs = orig_cost_matrix
+            self.orig_cost_matrix = orig_cost_matrix.costs
+            orig_cost_matrix = orig_cost_matrix.costs
+        else:
+            self.orig_cost_matrix = np.array(orig_cost_matrix, copy=True)
         self.required_cells = required_cells[:]
         self.excluded_cells = excluded_cells[:]
         self.orig_cost_matrix_index = orig_cost_matrix_index
@@ -253,9 +716,63 @@ class Node:
             print "self.excluded_cells:", self.excluded_cells 
 
         self.matrix_cost = matrix_cost
-        self.minimum_cost = matrix_cost
+        self.parent_assignment_state = parent_assignment_state
+        self.root_target_potentials = root_target_potentials
+        self.assignment_state = None
+        self.parent_prices = parent_prices
+        self.prices = None
+        self.solved = False
+        if lower_bound is None:
+            self.solve()
+        else:
+            self.minimum_cost = lower_bound
+
+    def solve(self):
+        '''
+        Solve the node's assignment problem, setting minimum_cost and min_cost_associations
+        '''
+        orig_cost_matrix = self.orig_cost_matrix
+        self.minimum_cost = self.matrix_cost
+        #key: cell of the minimum cost assignment, value: lower bound on the increase in minimum cost
+        #of the child that excludes the cell (only available for sparse costs)
+        self.exclusion_bounds = {}
+        if self.compact:
+            self.minimum_cost += self.compact_costs.base_cost
+
+        if self.sparse:
+            #solve the assignment problem for the rows and columns that aren't required directly
+            #on the sparse costs, no remaining cost matrix is constructed
+            (remaining_cost, self.min_cost_associations, self.exclusion_bounds) = solve_sparse_association(orig_cost_matrix,
+                self.required_cells, self.excluded_cells)
+            if remaining_cost >= INFEASIBLE_COST:
+                self.minimum_cost += INFEASIBLE_COST
+            else:
+                self.minimum_cost += remaining_cost
+                for (row, col) in self.required_cells:
+                    self.minimum_cost += orig_cost_matrix.entry(row, col)
 
-        if orig_cost_matrix.size > 0:
+        elif ASSIGNMENT_SOLVER == 'incremental' and orig_cost_matrix.size > 0:
+            if self.parent_assignment_state is None:
+                assert(len(self.required_cells) == 0 and len(self.excluded_cells) == 0)
+                self.assignment_state = solve_assignment(orig_cost_matrix, self.root_target_potentials)
+            else:
+                (self.assignment_state, cost_increase) = resolve_excluded_cell(orig_cost_matrix,
+                    self.parent_assignment_state, self.excluded_cells[-1], self.required_cells, self.excluded_cells)
+                self.parent_assignment_state = None
+            if self.assignment_state is None:
+                #not added to minimum_cost, the base cost of compact costs may be negative
+                self.minimum_cost = INFEASIBLE_COST
+                self.min_cost_associations = []
+            else:
+                #rows beyond the cost matrix's are the virtual rows padding it to a square
+                rows = np.arange(orig_cost_matrix.shape[0])
+                cols = self.assignment_state.col4row[:orig_cost_matrix.shape[0]]
+                self.minimum_cost += float(np.sum(orig_cost_matrix[rows, cols]))
+                required_cells = set(self.required_cells)
+                self.min_cost_associations = [(row, col) for (row, col) in zip(rows.tolist(), cols.tolist())
+                                              if not (row, col) in required_cells]
+
+        elif orig_cost_matrix.size > 0:
             #we will transform the cost matrix into the "remaining cost matrix" as described in [1]
             if REMAINING_COST_MATRIX_CONSTRUNCTION == 'fixed':
                 self.remaining_cost_matrix = self.construct_fixed_size_remaining_cost_matrix()
@@ -266,20 +783,27 @@ class Node:
 
             assert((self.remaining_cost_matrix >= 0).all()), self.remaining_cost_matrix
             #solve the assignment problem for the remaining cost matrix
-            if ASSIGNMENT_SOLVER == 'munkres':
-                hm = Munkres()
-                # we get a list of (row, col) associations, or 1's in the minimum assignment matrix
-                association_list = hm.compute(self.remaining_cost_matrix.tolist())
-            elif ASSIGNMENT_SOLVER == 'scipy':
-                row_ind, col_ind = linear_sum_assignment(self.remaining_cost_matrix)
-                assert(len(row_ind) == len(col_ind))
-                association_list = zip(row_ind, col_ind)
+            if ASSIGNMENT_SOLVER == 'auction':
+                #excluded cells (sys.maxint) and infeasible entries are not edges of the auction
+                if REMAINING_COST_MATRIX_CONSTRUNCTION == 'fixed':
+                    remaining_cols = np.arange(orig_cost_matrix.shape[1])
+                else:
+                    remaining_cols = np.delete(np.arange(orig_cost_matrix.shape[1]), [col for (row, col) in self.required_cells])
+                if self.parent_prices is None:
+                    self.prices = np.zeros(orig_cost_matrix.shape[1])
+                    (association_list, remaining_prices) = auction_assignment_dense(self.remaining_cost_matrix)
+                else:
+                    self.prices = self.parent_prices.copy()
+                    (association_list, remaining_prices) = auction_assignment_dense(self.remaining_cost_matrix,
+                        self.parent_prices[remaining_cols])
+                    self.parent_prices = None
+                self.prices[remaining_cols] = remaining_prices
             else:
-                assert(ASSIGNMENT_SOLVER == 'pymatgen')
-                lin_assign = linear_assignment.LinearAssignment(self.remaining_cost_matrix)
-                solution = lin_assign.solution
-                association_list = zip([i for i in range(len(solution))], solution)
-#                association_list = [(i, i) for i in range(orig_cost_matrix.shape[0])]
+                # we get a list of (row, col) associations, or 1's in the minimum assignment matrix
+                association_list = linear_assignment(self.remaining_cost_matrix, ASSIGNMENT_SOLVER, 'murty')
+                if len(association_list) < self.remaining_cost_matrix.shape[0]:
+                    #pairs in excluded or infeasible entries are left out
+                    association_list = None
 
             if DEBUG:
                 print "remaining cost matrix:"
@@ -287,7 +811,10 @@ class Node:
                 print "association_list"
                 print association_list
 
-            if REMAINING_COST_MATRIX_CONSTRUNCTION == 'fixed':
+            if association_list is None:
+                #no feasible assignment, not added to minimum_cost as the base cost of compact costs may be negative
+                self.minimum_cost = INFEASIBLE_COST
+            elif REMAINING_COST_MATRIX_CONSTRUNCTION == 'fixed':
                 for (row,col) in association_list:
                     self.minimum_cost += np.asscalar(self.orig_cost_matrix[row][col])
             elif REMAINING_COST_MATRIX_CONSTRUNCTION == 'delete':
@@ -305,13 +832,16 @@ class Node:
             else:
                 implement_me = False
             #store the minimum cost associations with indices consistent with the original cost matrix
-            if REMAINING_COST_MATRIX_CONSTRUNCTION == 'fixed':
+            if association_list is None:
+                self.min_cost_associations = []
+            elif REMAINING_COST_MATRIX_CONSTRUNCTION == 'fixed':
                 self.min_cost_associations = association_list
             else:
                 self.min_cost_associations = self.get_orig_indices(association_list)
 
         else:
             self.min_cost_associations = []
+        self.solved = True
         if DEBUG:
             print "New Node:"
             print "self.required_cells:", self.required_cells 
@@ -320,24 +850,35 @@ class Node:
             print
 
     def get_min_cost_assignment(self):
+        assert(self.solved)
         if REMAINING_COST_MATRIX_CONSTRUNCTION == 'fixed':
             min_cost_assignment = self.min_cost_associations
         else:
             min_cost_assignment = self.required_cells[:]
             min_cost_assignment.extend(self.min_cost_associations)
+        if self.compact:
+            #map back to the (2*M + 2*T)x(2*M + 2*T) cost matrix
+            min_cost_assignment = expand_compact_assignment(self.compact_costs, min_cost_assignment)
         if DEBUG:
             return (self.minimum_cost, min_cost_assignment, self.excluded_cells, self.required_cells[:], self.min_cost_associations)
         else:
             return (self.minimum_cost, min_cost_assignment, self.orig_cost_matrix_index)
 
-    def partition(self):
+    def partition(self, lazy=False):
         '''
         Partition this node by its minimum assignment, as described in [1]
 
+        Inputs:
+        - lazy: if True, the children aren't solved, their lower bound is this node's minimum cost
+            (every assignment of a child is an assignment of this node) plus the exclusion bound of
+            the child's newly excluded cell when the node has sparse costs.  Children whose bound is
+            infinite have no feasible assignment and are left out.
+
         Output:
         - partition: a list of mutually disjoint Nodes, whose union with the minimum assignment
             of this node forms the set of possible assignments represented by this node (that are different in our assignment context)
         '''
+        assert(self.solved)
         partition = []
         cur_required_cells = self.required_cells[:]
 
@@ -355,8 +896,9 @@ class Node:
             cur_assoc = self.min_cost_associations[idx]
             row_idx = cur_assoc[0]
             col_idx = cur_assoc[1]
-            #only partition by cells that will result in a different assignment
-            if((row_idx < self.M+2*self.T and col_idx < self.T) or (row_idx < self.M and col_idx < self.T+2*self.M)):
+            #only partition by cells that will result in a different assignment, every cell
+            #of a compact assignment does
+            if(self.compact or (row_idx < self.M+2*self.T and col_idx < self.T) or (row_idx < self.M and col_idx < self.T+2*self.M)):
                 cur_excluded_cells = self.excluded_cells[:]
                 cur_excluded_cells.append(cur_assoc)
                 if DEBUG:
@@ -373,8 +915,18 @@ class Node:
                             assert(cur_required_cells[i][0] != cur_required_cells[j][0] and
                                    cur_required_cells[i][1] != cur_required_cells[j][1])
                                     
-                partition.append(Node(self.orig_cost_matrix, cur_required_cells, cur_excluded_cells,
-                                      self.orig_cost_matrix_index, self.M, self.T, self.matrix_cost))
+                if self.compact:
+                    child_cost_matrix = self.compact_costs
+                else:
+                    child_cost_matrix = self.orig_cost_matrix
+                if lazy:
+                    child_lower_bound = self.minimum_cost + self.exclusion_bounds.get(cur_assoc, 0.0)
+                else:
+                    child_lower_bound = None
+                if child_lower_bound is None or child_lower_bound < np.inf:
+                    partition.append(Node(child_cost_matrix, cur_required_cells, cur_excluded_cells,
+                                          self.orig_cost_matrix_index, self.M, self.T, self.matrix_cost, child_lower_bound,
+                                          self.assignment_state, parent_prices=self.prices))
                 cur_required_cells.append(cur_assoc)
 
             elif DEBUG2:
@@ -581,11 +1133,14 @@ def gen_permutation_matrices(n):
     return all_permutation_matrices
 
 
-def construct_random_costs_matrix(M, T):
+def construct_random_costs_matrix(M, T, edge_probability=1.0, cluster_count=1):
     '''
     Inputs:
     - M: (int), #measurements
     - T: (int), #targets
+    - edge_probability: (float) probability that a measurement-target entry is feasible
+    - cluster_count: (int) measurement m and target t can only be associated if
+        m % cluster_count == t % cluster_count
 
     Outputs:
     - cost_matrix: numpy matrix with dimensions (2*M+2*T)x(2*M+2*T) of costs
@@ -598,7 +1153,8 @@ def construct_random_costs_matrix(M, T):
     for t_idx in range(T):
         for m_idx in range(M):
         #generate random costs for measurement-target association entries in the cost matrix
-            cost_matrix[m_idx][t_idx] = np.random.rand(1)[0]*10
+            if np.random.rand(1)[0] < edge_probability and m_idx % cluster_count == t_idx % cluster_count:
+                cost_matrix[m_idx][t_idx] = np.random.rand(1)[0]*10
 
         #generate random costs for target doesn't emit and lives/dies entries in the cost matrix
         lives_row_idx = M + 2*t_idx
@@ -624,7 +1180,7 @@ def construct_random_costs_matrix(M, T):
 
     return cost_matrix
 
-def test_against_brute_force(M,k,num_cost_matrices,iters):
+def test_against_brute_force(M,k,num_cost_matrices,iters,sparse=False,edge_probability=1.0):
     '''
     Test our implementation to find the k best assignments for a set of cost
     matrices, each with an associated cost, against a brute force approach.
@@ -634,6 +1190,8 @@ def test_against_brute_force(M,k,num_cost_matrices,iters):
     - k: find k best solutions
     - iters: number of random problems to solve and check
     - num_cost_matrices: integer, the number of cost matrices to generate
+    - sparse: if True, pass the cost matrices to k_best_assign_mult_cost_matrices as SparseAssociationMatrix's
+    - edge_probability: (float) probability that a measurement-target entry is feasible
     '''
     for test_iter in range(iters):
         #create cost matrices and associated costs
@@ -641,12 +1199,16 @@ def test_against_brute_force(M,k,num_cost_matrices,iters):
         matrix_costs = []
         for m_idx in range(num_cost_matrices):
             T = random.randrange(M+1) + 1
-            cost_matrix = construct_random_costs_matrix(M, T)
+            cost_matrix = construct_random_costs_matrix(M, T, edge_probability)
             matrix_cost = np.random.rand(1)[0]*1000
             cost_matrices.append(cost_matrix)
             matrix_costs.append(matrix_cost)
 
-        best_assignments = k_best_assign_mult_cost_matrices(k, cost_matrices, matrix_costs, M)
+        if sparse:
+            sparse_cost_matrices = [sparse_association_matrix_from_dense(cost_matrix, M) for cost_matrix in cost_matrices]
+            best_assignments = k_best_assign_mult_cost_matrices(k, sparse_cost_matrices, matrix_costs, M)
+        else:
+            best_assignments = k_best_assign_mult_cost_matrices(k, cost_matrices, matrix_costs, M)
         print "calculated with Hungarian"        
         if DEBUG:
             for (idx, assignment) in enumerate(best_assignments):
@@ -663,25 +1225,30 @@ def test_against_brute_force(M,k,num_cost_matrices,iters):
         print "match!"
 
 
-def speed_test(M,k,num_cost_matrices,iters):
+def speed_test(M,k,num_cost_matrices,iters,edge_probability=1.0):
     '''
     Time our implementation to find the k best assignments for a set of cost
-    matrices, each with an associated cost
+    matrices, each with an associated cost, with dense cost matrices solved by
+    ASSIGNMENT_SOLVER, dense cost matrices solved incrementally and by the auction
+    algorithm and the same costs as SparseAssociationMatrix's
     Inputs:
     - M: use a random cost matrix of size (2*M + 2*T)x(2*M + 2*T) with this M and random 
         T in range 0, M+1
     - k: find k best solutions
     - iters: number of random problems to solve and check
     - num_cost_matrices: integer, the number of cost matrices to generate
+    - edge_probability: (float) probability that a measurement-target entry is feasible
     '''
+    global ASSIGNMENT_SOLVER
     cost_matrices = []
     matrix_costs = []
     for m_idx in range(num_cost_matrices):
         T = M
-        cost_matrix = construct_random_costs_matrix(M, T)
+        cost_matrix = construct_random_costs_matrix(M, T, edge_probability)
         matrix_cost = np.random.rand(1)[0]*1000
         cost_matrices.append(cost_matrix)
         matrix_costs.append(matrix_cost)
+    sparse_cost_matrices = [sparse_association_matrix_from_dense(cost_matrix, M) for cost_matrix in cost_matrices]
 
     t1 = time.time()
 
@@ -692,7 +1259,75 @@ def speed_test(M,k,num_cost_matrices,iters):
 
     t2 = time.time()
 
-    print "calculation took", t2-t1, "seconds"
+    for test_iter in range(iters):
+        sparse_best_assignments = k_best_assign_mult_cost_matrices(k, sparse_cost_matrices, matrix_costs, M)
+
+    t3 = time.time()
+
+    dense_assignment_solver = ASSIGNMENT_SOLVER
+    ASSIGNMENT_SOLVER = 'incremental'
+    for test_iter in range(iters):
+        incremental_best_assignments = k_best_assign_mult_cost_matrices(k, cost_matrices, matrix_costs, M)
+    ASSIGNMENT_SOLVER = dense_assignment_solver
+
+    t4 = time.time()
+
+    ASSIGNMENT_SOLVER = 'auction'
+    for test_iter in range(iters):
+        auction_best_assignments = k_best_assign_mult_cost_matrices(k, cost_matrices, matrix_costs, M)
+    ASSIGNMENT_SOLVER = dense_assignment_solver
+
+    t5 = time.time()
+
+    print "dense calculation with", dense_assignment_solver, "took", t2-t1, "seconds"
+    print "sparse calculation took", t3-t2, "seconds"
+    print "dense calculation with incremental took", t4-t3, "seconds"
+    print "dense calculation with auction took", t5-t4, "seconds"
+    assert(len(best_assignments) == len(sparse_best_assignments))
+    assert(len(best_assignments) == len(incremental_best_assignments))
+    assert(len(best_assignments) == len(auction_best_assignments))
+    for (dense_assignment, sparse_assignment, incremental_assignment, auction_assignment) in \
+        zip(best_assignments, sparse_best_assignments, incremental_best_assignments, auction_best_assignments):
+        assert(np.abs(dense_assignment[0] - sparse_assignment[0]) < .00001), (dense_assignment[0], sparse_assignment[0])
+        assert(np.abs(dense_assignment[0] - incremental_assignment[0]) < .00001), (dense_assignment[0], incremental_assignment[0])
+        assert(np.abs(dense_assignment[0] - auction_assignment[0]) < .00001), (dense_assignment[0], auction_assignment[0])
+
+def speed_test_components(M,k,num_cost_matrices,iters,cluster_count):
+    '''
+    Time finding the k best assignments for a set of cost matrices with cluster_count independent
+    clusters of measurements and targets, with Murty's algorithm on the joint problem and
+    with DECOMPOSE_ASSOCIATION_COMPONENTS
+    Inputs:
+    - M: use a random cost matrix of size (4*M)x(4*M), with M measurements and M targets
+    - k: find k best solutions
+    - num_cost_matrices: integer, the number of cost matrices to generate
+    - iters: number of times to solve the problem
+    - cluster_count: (int) number of clusters, see construct_random_costs_matrix
+    '''
+    global DECOMPOSE_ASSOCIATION_COMPONENTS
+    cost_matrices = []
+    matrix_costs = []
+    for m_idx in range(num_cost_matrices):
+        cost_matrices.append(construct_random_costs_matrix(M, M, cluster_count=cluster_count))
+        matrix_costs.append(np.random.rand(1)[0]*10)
+    decompose = DECOMPOSE_ASSOCIATION_COMPONENTS
+
+    DECOMPOSE_ASSOCIATION_COMPONENTS = False
+    t1 = time.time()
+    for test_iter in range(iters):
+        best_assignments = k_best_assign_mult_cost_matrices(k, cost_matrices, matrix_costs, M)
+    t2 = time.time()
+    DECOMPOSE_ASSOCIATION_COMPONENTS = True
+    for test_iter in range(iters):
+        component_best_assignments = k_best_assign_mult_cost_matrices(k, cost_matrices, matrix_costs, M)
+    t3 = time.time()
+    DECOMPOSE_ASSOCIATION_COMPONENTS = decompose
+
+    print "joint calculation took", t2-t1, "seconds"
+    print "component calculation took", t3-t2, "seconds"
+    assert(len(best_assignments) == len(component_best_assignments))
+    for (joint_assignment, component_assignment) in zip(best_assignments, component_best_assignments):
+        assert(np.abs(joint_assignment[0] - component_assignment[0]) < .00001), (joint_assignment[0], component_assignment[0])
 
 
 if __name__ == "__main__":
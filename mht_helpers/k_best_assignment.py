@@ -1,12 +1,20 @@
 import numpy as np
-from munkres import Munkres, print_matrix
 import sys
 import itertools
 import math
 from operator import itemgetter
+sys.path.insert(0, "../")
+from cluster_config import RBPF_HOME_DIRECTORY
+sys.path.insert(0, "%sgeneral_tracking" % RBPF_HOME_DIRECTORY)
+from auction_assignment import auction_assignment_dense
+from assignment_solvers import linear_assignment
 
 DEBUG = False
 DEBUG1 = False
+#pick from ['munkres', 'auction'] or any other solver of assignment_solvers.py, e.g. 'scipy' or 'auto'
+#'auction' solves every node's remaining cost matrix with the auction algorithm (see
+#auction_assignment.py), warm started from the parent node's column prices
+ASSIGNMENT_SOLVER = 'auto'
 #
 #
 #References:
@@ -196,7 +204,7 @@ def k_best_assign_mult_cost_matrices(k, cost_matrices):
 
 
 class Node:
-    def __init__(self, orig_cost_matrix, required_cells, excluded_cells, orig_cost_matrix_index):
+    def __init__(self, orig_cost_matrix, required_cells, excluded_cells, orig_cost_matrix_index, parent_prices=None):
         '''
         Following the terminology used by [1], a node is defined to be a nonempty subset of possible
         assignments to a cost matrix.  Every assignment in node N is required to contain
@@ -211,6 +219,8 @@ class Node:
         - orig_cost_matrix_index: index of the cost matrix this Node is descended from, used when
             when finding the k lowest cost assignments among a group of assignment matrices
             (k_best_assign_mult_cost_matrices)
+        - parent_prices: numpy array with one price per column of orig_cost_matrix, the parent node's
+            column prices that warm start the auction when ASSIGNMENT_SOLVER == 'auction', or None
         '''
         self.orig_cost_matrix = np.array(orig_cost_matrix, copy=True)
         self.required_cells = required_cells[:]
@@ -225,9 +235,25 @@ class Node:
         self.remaining_cost_matrix = self.construct_remaining_cost_matrix()
         assert((self.remaining_cost_matrix > 0).all()), self.remaining_cost_matrix
         #solve the assignment problem for the remaining cost matrix
-        hm = Munkres()
-        # we get a list of (row, col) associations, or 1's in the minimum assignment matrix
-        association_list = hm.compute(self.remaining_cost_matrix.tolist())
+        if ASSIGNMENT_SOLVER == 'auction':
+            #excluded cells (sys.maxint) are not edges of the auction
+            remaining_cols = np.delete(np.arange(self.orig_cost_matrix.shape[1]), [col for (row, col) in self.required_cells])
+            if parent_prices is None:
+                self.prices = np.zeros(self.orig_cost_matrix.shape[1])
+                (association_list, remaining_prices) = auction_assignment_dense(self.remaining_cost_matrix,
+                    None, infeasible_cost=sys.maxint)
+            else:
+                self.prices = parent_prices.copy()
+                (association_list, remaining_prices) = auction_assignment_dense(self.remaining_cost_matrix,
+                    parent_prices[remaining_cols], infeasible_cost=sys.maxint)
+            self.prices[remaining_cols] = remaining_prices
+        else:
+            self.prices = None
+            # we get a list of (row, col) associations, or 1's in the minimum assignment matrix
+            association_list = linear_assignment(self.remaining_cost_matrix, ASSIGNMENT_SOLVER, 'murty')
+            if len(association_list) < self.remaining_cost_matrix.shape[0]:
+                #pairs in excluded cells are left out
+                association_list = None
         if DEBUG:
             print "remaining cost matrix:"
             print self.remaining_cost_matrix
@@ -235,20 +261,25 @@ class Node:
             print association_list
 
 
-        #compute the minimum cost assignment for the node
-        self.minimum_cost = 0
-        for (row,col) in association_list:
-#            print 'a', self.minimum_cost, type(self.minimum_cost)
-#            print 'b', self.remaining_cost_matrix[row][col], type(self.remaining_cost_matrix[row][col])
-#            print 'c', self.minimum_cost +self.remaining_cost_matrix[row][col], type(self.minimum_cost +self.remaining_cost_matrix[row][col])
-            #np.asscalar important for avoiding overflow problems
-            self.minimum_cost += np.asscalar(self.remaining_cost_matrix[row][col])
-        for (row, col) in self.required_cells:
-            #np.asscalar important for avoiding overflow problems
-            self.minimum_cost += np.asscalar(orig_cost_matrix[row][col])
-
-        #store the minimum cost associations with indices consistent with the original cost matrix
-        self.min_cost_associations = self.get_orig_indices(association_list)
+        if association_list is None:
+            #every remaining assignment uses an excluded cell, the node is never picked
+            self.minimum_cost = sys.maxint
+            self.min_cost_associations = []
+        else:
+            #compute the minimum cost assignment for the node
+            self.minimum_cost = 0
+            for (row,col) in association_list:
+#                print 'a', self.minimum_cost, type(self.minimum_cost)
+#                print 'b', self.remaining_cost_matrix[row][col], type(self.remaining_cost_matrix[row][col])
+#                print 'c', self.minimum_cost +self.remaining_cost_matrix[row][col], type(self.minimum_cost +self.remaining_cost_matrix[row][col])
+                #np.asscalar important for avoiding overflow problems
+                self.minimum_cost += np.asscalar(self.remaining_cost_matrix[row][col])
+            for (row, col) in self.required_cells:
+                #np.asscalar important for avoiding overflow problems
+                self.minimum_cost += np.asscalar(orig_cost_matrix[row][col])
+
+            #store the minimum cost associations with indices consistent with the original cost matrix
+            self.min_cost_associations = self.get_orig_indices(association_list)
 
         if DEBUG:
             print "New Node:"
@@ -299,7 +330,7 @@ class Node:
                                cur_required_cells[i][1] != cur_required_cells[j][1])
                                  
             partition.append(Node(self.orig_cost_matrix, cur_required_cells, cur_excluded_cells,
-                                  self.orig_cost_matrix_index))
+                                  self.orig_cost_matrix_index, self.prices))
             cur_required_cells.append(cur_assoc)
 
 
@@ -26,7 +26,6 @@ import pickle
 import sys
 import resource
 import errno
-from munkres import Munkres
 from collections import deque
 from collections import defaultdict
 from sets import ImmutableSet
@@ -57,11 +56,21 @@ sys.path.insert(0, "%sgeneral_tracking" % RBPF_HOME_DIRECTORY)
 from global_params import DEFAULT_TIME_STEP
 #Entries in the cost matrix that cannot be chosen as associations are set to this value or greater
 from global_params import INFEASIBLE_COST
+from particle_store import ParticleStore
+from batched_kalman import batch_kf_update
+from persistent_history import PersistentHistory
+from ancestry import TrackStore
+from ancestry import AncestryManager
+from online_snapshots import SnapshotStore
+from particle_grouping import ParticleGroupingEngine
+from trajectory import Trajectory
+from box_geometry import iou_matrix, object_corners, offscreen_mask, near_border_mask
+from assignment_solvers import linear_assignment
 
 from rbpf_sampling_manyMeasSrcs import group_detections
+from rbpf_sampling_manyMeasSrcs import build_measurement_frame
 from rbpf_sampling_manyMeasSrcs import solve_perturbed_max_gumbel
 from rbpf_sampling_manyMeasSrcs import solve_perturbed_max_gumbel_exact
-from rbpf_sampling_manyMeasSrcs import combine_arbitrary_number_measurements_4d as combine_4d_detections
 from rbpf_sampling_manyMeasSrcs import sample_target_deaths
 from rbpf_sampling_manyMeasSrcs import get_likelihood
 from rbpf_sampling_manyMeasSrcs import get_assoc_prior
@@ -71,11 +80,13 @@ from rbpf_sampling_manyMeasSrcs import get_immutable_set_meas_names
 from rbpf_sampling_manyMeasSrcs import conditional_birth_clutter_distribution
 from rbpf_sampling_manyMeasSrcs import nCr
 from rbpf_sampling_manyMeasSrcs import construct_log_probs_matrix3
-from rbpf_sampling_manyMeasSrcs import convert_assignment_matrix3
-from rbpf_sampling_manyMeasSrcs import convert_assignment_pairs_to_matrix3
+from rbpf_sampling_manyMeasSrcs import construct_sparse_log_probs3
+from rbpf_sampling_manyMeasSrcs import convert_assignment_pairs_to_permutation3
+from rbpf_sampling_manyMeasSrcs import permutation_log_prob3
+from rbpf_sampling_manyMeasSrcs import convert_permutation_to_associations3
 
 sys.path.insert(0, "%smht_helpers" % RBPF_HOME_DIRECTORY)
-from k_best_assign_birth_clutter_death_matrix import k_best_assign_mult_cost_matrices
+from k_best_assign_birth_clutter_death_matrix import k_best_assign_mult_cost_matrices, mass_adaptive_k_best_assignments
 #from k_best_assignment import k_best_assign_mult_cost_matrices
 #from run_experiment import DIRECTORY_OF_ALL_RESULTS
 #from run_experiment import CUR_EXPERIMENT_BATCH_NAME
@@ -101,6 +112,10 @@ assert([KF_MOTION, LSTM_MOTION, KNN_MOTION].count(True)==1)
 assert([KF_MOTION, LSTM_MOTION, KNN_MOTION].count(False)==2)
 LSTM_WINDOW = 3 #number of frames used to make LSTM prediction
 KNN_WINDOW = 5 #number of frames used to make KNN prediction
+#if not None, targets only keep (at least) their last TARGET_HISTORY_WINDOW states in memory
+#rather than their full trajectories.  Full trajectories are only needed for offline results
+#(write_targets_to_KITTI_format), so this requires SPEC['RUN_ONLINE']
+TARGET_HISTORY_WINDOW = None
 #MIN_LSTM_X_VAR = 40.0/2.0 #if the LSTM predicts x variance less than this value, set to this value
 #MIN_LSTM_Y_VAR = 5.0/2.0 #if the LSTM predicts y variance less than this value, set to this value
 #MIN_LSTM_X_VAR = .01 #if the LSTM predicts x variance less than this value, set to this value
@@ -120,6 +135,51 @@ PLOT_TARGET_LOCATIONS = False
 
 USE_POISSON_DEATH_MODEL = False
 USE_CREATE_CHILD = True #speed up copying during resampling
+#if True, gather all particles' living targets into a structure of arrays ParticleStore
+#and run prediction, offscreen tests and death probabilities as whole array operations
+#(KF_MOTION only).  About 2x faster per frame with 100 particles of 20 targets, including
+#gathering from and scattering back into the Target objects (see benchmark_rbpf.py)
+USE_PARTICLE_STORE = False
+#if True, the modified_SIS_* proposals collect every target update a frame assigns and run
+#them as one batched Kalman filter update (KF_MOTION only)
+USE_BATCHED_KALMAN = False
+#if True (and USE_CREATE_CHILD), children share their parent's Target objects instead of
+#deep copying them (association histories are always shared, see PersistentHistory).  A Target is cloned the first time a TargetSet writes to
+#a Target it does not own (see TargetSet.writable_target), prediction clones each distinct
+#shared Target once per time instance.
+USE_COPY_ON_WRITE = False
+#each TargetSet gets a unique id, Target.owner_id records which TargetSet may write to a Target
+NEXT_TARGET_SET_ID = 0
+#if True, killed targets' trajectories are moved into TRACK_STORE and an AncestryManager prunes
+#Particle.parent_particle and TargetSet.parent_target_set chains so memory does not grow with
+#sequence length (requires USE_CREATE_CHILD)
+USE_ANCESTRY_MANAGER = False
+#compact TRACK_STORE every this many time instances
+ANCESTRY_COMPACTION_INTERVAL = 10
+#finished target trajectories shared by all TargetSets, used with USE_ANCESTRY_MANAGER
+TRACK_STORE = TrackStore()
+#if True, group_particles groups particles by incrementally computed group ids (see
+#particle_grouping.py) rather than by keys built from every target's state
+USE_HASHED_PARTICLE_GROUPING = False
+#if True, group_particles also checks its groups against pairwise comparisons of particle
+#states (cur_particle_states_match), O(N_PARTICLES x number of groups), for debugging
+VALIDATE_PARTICLE_GROUPING = False
+PARTICLE_GROUPING = ParticleGroupingEngine()
+#if True, modified_SIS_MHT_gumbel_step passes each particle group's costs to k_best_assign_mult_cost_matrices
+#as a SparseAssociationMatrix (see sparse_association.py) instead of a dense (2*M+2*T)x(2*M+2*T)
+#matrix, with USE_SPATIAL_GATING only gated measurement-target pairs are stored.  Gumbel noise
+#is only added to the association, clutter, birth, lives and dies entries, not to filler entries
+USE_SPARSE_ASSOCIATION_COSTS = False
+#if True, modified_SIS_MHT_gumbel_step warm starts each particle group's root assignment solve with
+#the dual variables of its targets' columns from the previous time instance (carried by particles,
+#see Particle.assignment_warm_start), only used with dense costs and ASSIGNMENT_SOLVER = 'incremental'
+#in k_best_assign_birth_clutter_death_matrix.py.  The min cost proposals have their own flag,
+#USE_WARM_START_ASSIGNMENT in rbpf_sampling_manyMeasSrcs.py
+USE_WARM_START_ASSIGNMENT = False
+#if not None, the proposals of modified_SIS_MHT_gumbel_step that sample from the top hypotheses stop
+#enumerating hypotheses once they carry at least this fraction of the probability mass of all
+#hypotheses (see mass_adaptive_k_best_assignments), SPEC['num_top_hypotheses_to_sample_from'] becomes a cap
+HYPOTHESIS_MASS_FRACTION = None
 #Write results of the particle with the largest importance
 #weight times current likelihood, double check doing this correctly
 FIND_MAX_IMPRT_TIMES_LIKELIHOOD = False 
@@ -143,6 +203,8 @@ SAVE_EXTRA_INFO = False
 USE_PYTHON_GAUSSIAN = False 
 
 #For testing why score interval for R are slow
+#(with rbpf_sampling_manyMeasSrcs, set from params.assoc_likelihood_cache's hit/miss counters
+#at the end of run_rbpf_on_targetset)
 CACHED_LIKELIHOODS = 0
 NOT_CACHED_LIKELIHOODS = 0
 
@@ -205,7 +267,12 @@ def get_cmap(N):
 
 
 
-class Target:
+class Target(object):
+    __slots__ = ('x', 'P', 'width', 'height', 'birth_time', 'last_measurement_association', 'id_',
+                 'death_prob', 'trajectory', 'measurements', 'measurement_time_stamps', 'offscreen',
+                 'updated_this_time_instance', 'associated_measurements', 'owner_id', 'image_width',
+                 'image_height')
+
     def __init__(self, fw_spec, cur_time, id_, measurement = None, width=-1, height=-1):
 #       if measurement is None: #for data generation
 #           position = np.random.uniform(min_pos,max_pos)
@@ -214,7 +281,9 @@ class Target:
 #           self.P = P_default
 #       else:
         assert(measurement.all() != None)
-        self.x = np.array([[measurement[0]], [0], [measurement[1]], [0]])
+        self.image_width = fw_spec['image_widths'][fw_spec['seq_idx']]
+        self.image_height = fw_spec['image_heights'][fw_spec['seq_idx']]
+        self.x = np.array([[measurement[0]], [0], [measurement[1]], [0]], dtype=np.float64)
         self.P = SPEC['P']
 
         self.width = width
@@ -227,8 +296,9 @@ class Target:
         self.id_ = id_ #named id_ to avoid clash with built in id
         self.death_prob = -1 #calculate at every time instance
 
-        self.all_states = [(self.x, self.width, self.height)]
-        self.all_time_stamps = [round(cur_time, 2)]
+        #states (x, width, height) and their time stamps, shared with clones
+        self.trajectory = Trajectory()
+        self.trajectory.append((self.x, self.width, self.height), round(cur_time, 2), TARGET_HISTORY_WINDOW)
 
         self.measurements = []
         self.measurement_time_stamps = []
@@ -241,21 +311,48 @@ class Target:
         #used when SPEC['UPDATE_MULT_MEAS_SIMUL'] = True
         self.associated_measurements = []
 
-        self.image_width = fw_spec['image_widths'][fw_spec['seq_idx']]
-        self.image_height = fw_spec['image_heights'][fw_spec['seq_idx']]
+        #cow_id of the TargetSet allowed to modify this target in place (USE_COPY_ON_WRITE)
+        self.owner_id = -1
+
+    @property
+    def all_states(self):
+        '''
+        list of every retained state (x, width, height), oldest first.  Builds a new list,
+        use self.trajectory to read recent states
+        '''
+        return self.trajectory.states()
+
+    @property
+    def all_time_stamps(self):
+        '''
+        list of every retained time stamp, oldest first
+        '''
+        return self.trajectory.time_stamps()
+
+    def clone(self):
+        '''
+        Copy this target for copy on write, numpy arrays and the trajectory's nodes are shared
+        (they are replaced, never modified in place), lists that may be modified are copied
+        '''
+        new_target = Target.__new__(Target)
+        for field in Target.__slots__:
+            setattr(new_target, field, getattr(self, field))
+        new_target.trajectory = self.trajectory.copy()
+        new_target.measurements = list(self.measurements)
+        new_target.measurement_time_stamps = list(self.measurement_time_stamps)
+        new_target.associated_measurements = list(self.associated_measurements)
+        new_target.owner_id = -1
+        return new_target
 
         
         
 
     def near_border(self):
-        near_border = False
         x1 = self.x[0][0] - self.width/2.0
         x2 = self.x[0][0] + self.width/2.0
         y1 = self.x[2][0] - self.height/2.0
         y2 = self.x[2][0] + self.height/2.0
-        if(x1 < 10 or x2 > (self.image_width - 15) or y1 < 10 or y2 > (self.image_height - 15)):
-            near_border = True
-        return near_border
+        return bool(near_border_mask(x1, y1, x2, y2, self.image_width, self.image_height))
 
 
     def kf_update(self, measurement, meas_noise_cov):
@@ -341,10 +438,10 @@ class Target:
         self.width = self.associated_measurements[0]['width']
         self.height = self.associated_measurements[0]['height']
         cur_time = self.associated_measurements[0]['cur_time']
-        assert(self.all_time_stamps[-1] == round(cur_time, 2) and self.all_time_stamps[-2] != round(cur_time, 2))
+        assert(self.trajectory.time_stamp(0) == round(cur_time, 2) and self.trajectory.time_stamp(1) != round(cur_time, 2))
         assert(self.x.shape == (4, 1)), (self.x.shape, np.dot(K, residual).shape)
 
-        self.all_states[-1] = (self.x, self.width, self.height)
+        self.trajectory.replace_last((self.x, self.width, self.height))
         self.updated_this_time_instance = True
         self.last_measurement_association = cur_time        
 
@@ -364,7 +461,7 @@ class Target:
         if KF_MOTION:
             (self.x, self.P) = self.kf_update(reformat_meas, meas_noise_cov)
         elif LSTM_MOTION:
-            if(len(self.all_states) <= LSTM_WINDOW):
+            if(len(self.trajectory) <= LSTM_WINDOW):
                 (self.x, self.P) = self.kf_update(reformat_meas, meas_noise_cov)
             else:
                 self.x = np.array([[measurement[0]],
@@ -377,7 +474,7 @@ class Target:
                                    [-99, -99, -99, -99]])
         else:
             assert(KNN_MOTION)
-            if(len(self.all_states) <= KNN_WINDOW):
+            if(len(self.trajectory) <= KNN_WINDOW):
                 (self.x, self.P) = self.kf_update(reformat_meas, meas_noise_cov)
             else:
                 self.x = np.array([[measurement[0]],
@@ -389,15 +486,22 @@ class Target:
                                    [-99, -99, -99, -99],
                                    [-99, -99, -99, -99]])
 
+        self.record_update(width, height, cur_time)
+
+    def record_update(self, width, height, cur_time):
+        """
+        Bookkeeping after self.x and self.P have been set to their updated values
+        (used by update and the batched Kalman update in apply_batched_kf_updates)
+        """
         assert(self.x.shape == (4, 1))
         assert(self.P.shape == (4, 4))
 
         self.width = width
         self.height = height
-        assert(self.all_time_stamps[-1] == round(cur_time, 2) and self.all_time_stamps[-2] != round(cur_time, 2))
+        assert(self.trajectory.time_stamp(0) == round(cur_time, 2) and self.trajectory.time_stamp(1) != round(cur_time, 2))
         assert(self.x.shape == (4, 1)), (self.x.shape, np.dot(K, residual).shape)
 
-        self.all_states[-1] = (self.x, self.width, self.height)
+        self.trajectory.replace_last((self.x, self.width, self.height))
         self.updated_this_time_instance = True
         self.last_measurement_association = cur_time        
 
@@ -442,9 +546,9 @@ class Target:
         # [x_t-windowsize+1, y_t-windowsize+1]]
         past_locations = np.zeros(LSTM_WINDOW*2)
         for i in range(LSTM_WINDOW):
-            pos = -1 - LSTM_WINDOW +1 
-            past_locations[2*i] = self.all_states[pos+i][0][0,0]
-            past_locations[2*i+1] = self.all_states[pos+i][0][2,0]
+            past_state = self.trajectory.state(LSTM_WINDOW - 1 - i)
+            past_locations[2*i] = past_state[0][0,0]
+            past_locations[2*i+1] = past_state[0][2,0]
 
         ##########DAN Begin
         cat = np.concatenate((past_locations, past_locations[:2]))
@@ -505,8 +609,8 @@ class Target:
         # [x_t-windowsize+1, y_t-windowsize+1]]
         past_locations = np.zeros((LSTM_WINDOW,2))
         for i in range(LSTM_WINDOW):
-            past_locations[i, 0] = self.all_states[-1-i][0][0,0]
-            past_locations[i, 1] = self.all_states[-1-i][0][2,0]
+            past_locations[i, 0] = self.trajectory.state(i)[0][0,0]
+            past_locations[i, 1] = self.trajectory.state(i)[0][2,0]
 
         ##########Philip Begin
 
@@ -537,36 +641,45 @@ class Target:
             -dt: time step to run prediction on
             -cur_time: the time the prediction is made for
         """
-        assert(self.all_time_stamps[-1] == round((cur_time - dt), 2))
+        assert(self.trajectory.time_stamp(0) == round((cur_time - dt), 2))
 
         if KF_MOTION:
             (self.x, self.P) = self.kf_predict(dt)
         elif LSTM_MOTION:
-            if(len(self.all_states) < LSTM_WINDOW):
+            if(len(self.trajectory) < LSTM_WINDOW):
                 (self.x, self.P) = self.kf_predict(dt)
             else:
                 (self.x, self.P) = self.lstm_predict()
         else:
             assert(KNN_MOTION)
-            if(len(self.all_states) < KNN_WINDOW):
+            if(len(self.trajectory) < KNN_WINDOW):
                 (self.x, self.P) = self.kf_predict(dt)
             else:
                 (self.x, self.P) = self.knn_predict()
 
+        self.record_prediction(cur_time)
+
+    def record_prediction(self, cur_time, offscreen=None):
+        """
+        Bookkeeping after self.x and self.P have been set to their predicted values
+        Inputs:
+            -cur_time: the time the prediction is made for
+            -offscreen: (bool) whether the predicted bounding box is offscreen, if None
+                compute it here (the ParticleStore computes it for all targets at once)
+        """
         assert(self.x.shape == (4, 1))
         assert(self.P.shape == (4, 4))
 
-        self.all_states.append((self.x, self.width, self.height))
-        self.all_time_stamps.append(round(cur_time, 2))
+        self.trajectory.append((self.x, self.width, self.height), round(cur_time, 2), TARGET_HISTORY_WINDOW)
 
+        if offscreen is None:
+            x1 = self.x[0][0] - self.width/2.0
+            x2 = self.x[0][0] + self.width/2.0
+            y1 = self.x[2][0] - self.height/2.0
+            y2 = self.x[2][0] + self.height/2.0
+            offscreen = offscreen_mask(x1, y1, x2, y2, self.image_width, self.image_height)
 
-        x1 = self.x[0][0] - self.width/2.0
-        x2 = self.x[0][0] + self.width/2.0
-        y1 = self.x[2][0] - self.height/2.0
-        y2 = self.x[2][0] + self.height/2.0
-
-        if(x2<0 or x1>=self.image_width or \
-           y2<0 or y1>=self.image_height):
+        if offscreen:
 #           print '!'*40, "TARGET IS OFFSCREEN", '!'*40
             self.offscreen = True
             if USE_GENERATED_DATA:
@@ -696,22 +809,72 @@ class TargetSet:
         self.measurements = [] #generated measurements for a generative TargetSet 
 
         self.parent_target_set = None 
+        #indices in TRACK_STORE of targets killed in this TargetSet's lineage (USE_ANCESTRY_MANAGER)
+        self.finished_tracks = PersistentHistory()
 
+        #entries are (time instance index, tuple of TargetSnapshot) for the last ONLINE_DELAY+1
+        #time instances, shared with other TargetSets (see online_snapshots.py)
         self.living_targets_q = deque([-1 for i in range(SPEC['ONLINE_DELAY']+1)])
 
         self.fw_spec = fw_spec
 
+        global NEXT_TARGET_SET_ID
+        self.cow_id = NEXT_TARGET_SET_ID
+        NEXT_TARGET_SET_ID += 1
+
     def create_child(self):
+        global NEXT_TARGET_SET_ID
         child_target_set = TargetSet(self.fw_spec)
         child_target_set.parent_target_set = self
         child_target_set.total_count = self.total_count
         child_target_set.living_count = self.living_count
-        child_target_set.all_targets = copy.deepcopy(self.living_targets)
+        if USE_COPY_ON_WRITE:
+            #share targets, they are cloned by writable_target when the child first modifies them.
+            #The parent gets a new cow_id so it no longer owns the shared targets and clones them
+            #on its first write too (e.g. when match_target_ids renames its targets)
+            child_target_set.all_targets = list(self.living_targets)
+            self.cow_id = NEXT_TARGET_SET_ID
+            NEXT_TARGET_SET_ID += 1
+        else:
+            child_target_set.all_targets = copy.deepcopy(self.living_targets)
         for target in child_target_set.all_targets:
             child_target_set.living_targets.append(target)
-        child_target_set.living_targets_q = copy.deepcopy(self.living_targets_q)
+        #queue entries are shared read only snapshots, a shallow copy is enough
+        child_target_set.living_targets_q = copy.copy(self.living_targets_q)
+        child_target_set.finished_tracks = self.finished_tracks.copy()
         return child_target_set
 
+    def make_snapshot_queue_private(self):
+        '''
+        Replace the snapshots in self.living_targets_q with copies owned by this TargetSet so
+        they can be modified (e.g. target ids rewritten) without affecting other TargetSets
+        '''
+        for q_idx in range(len(self.living_targets_q)):
+            if self.living_targets_q[q_idx] != -1:
+                (frame_idx, snapshots) = self.living_targets_q[q_idx]
+                self.living_targets_q[q_idx] = (frame_idx, tuple([snapshot.copy() for snapshot in snapshots]))
+
+    def writable_target(self, living_target_index):
+        '''
+        Get self.living_targets[living_target_index] for modification.  With USE_COPY_ON_WRITE,
+        if this TargetSet does not own the target it is cloned and the clone replaces it in
+        living_targets and all_targets.
+
+        Outputs:
+        - target: type Target, safe to modify in place
+        '''
+        target = self.living_targets[living_target_index]
+        if USE_COPY_ON_WRITE and target.owner_id != self.cow_id:
+            new_target = target.clone()
+            new_target.owner_id = self.cow_id
+            self.living_targets[living_target_index] = new_target
+            for all_idx in reversed(range(len(self.all_targets))):
+                if self.all_targets[all_idx] is target:
+                    self.all_targets[all_idx] = new_target
+                    break
+            target = new_target
+        return target
+
     def create_new_target(self, measurement, width, height, cur_time):
         if SPEC['RUN_ONLINE']:
             global NEXT_TARGET_ID
@@ -719,6 +882,7 @@ class TargetSet:
             NEXT_TARGET_ID += 1
         else:
             new_target = Target(self.fw_spec, cur_time, self.total_count, np.squeeze(measurement), width, height)
+        new_target.owner_id = self.cow_id
         self.living_targets.append(new_target)
         self.all_targets.append(new_target)
         self.living_count += 1
@@ -734,8 +898,12 @@ class TargetSet:
         """
 
         #kf predict was run for this time instance, but the target actually died, so remove the predicted state
-        del self.living_targets[living_target_index].all_states[-1]
-        del self.living_targets[living_target_index].all_time_stamps[-1]
+        dying_target = self.writable_target(living_target_index)
+        dying_target.trajectory.pop()
+
+        if USE_ANCESTRY_MANAGER:
+            #the trajectory is finished, move it to the shared track store
+            self.finished_tracks.append([TRACK_STORE.add(dying_target)])
 
         del self.living_targets[living_target_index]
 
@@ -758,8 +926,10 @@ class TargetSet:
         fig = plt.figure()
         ax = fig.add_subplot(1, 1, 1)
         for i in range(self.total_count):
-            life = len(self.all_targets[i].all_states) #length of current targets life 
-            locations_1D =  [self.all_targets[i].all_states[j][0] for j in range(life)]
+            #all_states builds a new list, read it once per target
+            states = self.all_targets[i].all_states
+            life = len(states) #length of current targets life 
+            locations_1D =  [states[j][0] for j in range(life)]
             ax.plot(self.all_targets[i].all_time_stamps, locations_1D,
                     '-o', label='Target %d' % i)
 
@@ -788,6 +958,19 @@ class TargetSet:
         #every target in any of this TargetSet's ancestors' all_targets lists that does not
         #appear in the all_targets list of a descendant
         """
+        if USE_ANCESTRY_MANAGER:
+            #ancestors have been pruned, every target of this lineage is either alive or
+            #a finished track in TRACK_STORE
+            every_target = []
+            found_target_ids = list(descendant_target_ids)
+            finished_targets = [TRACK_STORE.get(track_idx) for entry in reversed(list(self.finished_tracks))
+                                                           for track_idx in entry]
+            for target in self.living_targets + finished_targets:
+                if(not target.id_ in found_target_ids):
+                    every_target.append(target)
+                    found_target_ids.append(target.id_)
+            return every_target
+
         every_target = []
         found_target_ids = descendant_target_ids
         for target in self.all_targets:
@@ -820,11 +1003,11 @@ class TargetSet:
             print "fw_spec['obj_class']:", fw_spec['obj_class']
 
             for target in self.living_targets:
-                assert(target.all_time_stamps[-1] == round(frame_idx*DEFAULT_TIME_STEP, 2)), (target.all_time_stamps[-1], round(frame_idx*DEFAULT_TIME_STEP, 2))
-                x_pos = target.all_states[-1][0][0][0]
-                y_pos = target.all_states[-1][0][2][0]
-                width = target.all_states[-1][1]
-                height = target.all_states[-1][2]
+                assert(target.trajectory.time_stamp(0) == round(frame_idx*DEFAULT_TIME_STEP, 2)), (target.trajectory.time_stamp(0), round(frame_idx*DEFAULT_TIME_STEP, 2))
+                x_pos = target.trajectory.state(0)[0][0][0]
+                y_pos = target.trajectory.state(0)[0][2][0]
+                width = target.trajectory.state(0)[1]
+                height = target.trajectory.state(0)[2]
 
                 left = x_pos - width/2.0
                 top = y_pos - height/2.0
@@ -845,11 +1028,11 @@ class TargetSet:
             print delayed_liv_targets
             assert(delayed_frame_idx == frame_idx - SPEC['ONLINE_DELAY']), (delayed_frame_idx, frame_idx, SPEC['ONLINE_DELAY'])
             for target in delayed_liv_targets:
-                assert(target.all_time_stamps[-1] == round((frame_idx - SPEC['ONLINE_DELAY'])*DEFAULT_TIME_STEP, 2)), (target.all_time_stamps[-1], frame_idx, SPEC['ONLINE_DELAY'], round((frame_idx - SPEC['ONLINE_DELAY'])*DEFAULT_TIME_STEP, 2))
-                x_pos = target.all_states[-1][0][0][0]
-                y_pos = target.all_states[-1][0][2][0]
-                width = target.all_states[-1][1]
-                height = target.all_states[-1][2]
+                assert(target.time_stamp == round((frame_idx - SPEC['ONLINE_DELAY'])*DEFAULT_TIME_STEP, 2)), (target.time_stamp, frame_idx, SPEC['ONLINE_DELAY'], round((frame_idx - SPEC['ONLINE_DELAY'])*DEFAULT_TIME_STEP, 2))
+                x_pos = target.state[0][0][0]
+                y_pos = target.state[0][2][0]
+                width = target.state[1]
+                height = target.state[2]
 
                 left = x_pos - width/2.0
                 top = y_pos - height/2.0
@@ -876,11 +1059,11 @@ class TargetSet:
                     q_idx+=1
                     assert(delayed_frame_idx == cur_frame_idx), (delayed_frame_idx, cur_frame_idx, SPEC['ONLINE_DELAY'])
                     for target in delayed_liv_targets:
-                        assert(target.all_time_stamps[-1] == round((cur_frame_idx)*DEFAULT_TIME_STEP, 2))
-                        x_pos = target.all_states[-1][0][0][0]
-                        y_pos = target.all_states[-1][0][2][0]
-                        width = target.all_states[-1][1]
-                        height = target.all_states[-1][2]
+                        assert(target.time_stamp == round((cur_frame_idx)*DEFAULT_TIME_STEP, 2))
+                        x_pos = target.state[0][0][0]
+                        y_pos = target.state[0][2][0]
+                        width = target.state[1]
+                        height = target.state[2]
 
                         left = x_pos - width/2.0
                         top = y_pos - height/2.0
@@ -899,11 +1082,11 @@ class TargetSet:
 
                 print "&&&&&&&&&"
                 for target in self.living_targets:
-                    assert(target.all_time_stamps[-1] == round(frame_idx*DEFAULT_TIME_STEP, 2))
-                    x_pos = target.all_states[-1][0][0][0]
-                    y_pos = target.all_states[-1][0][2][0]
-                    width = target.all_states[-1][1]
-                    height = target.all_states[-1][2]
+                    assert(target.trajectory.time_stamp(0) == round(frame_idx*DEFAULT_TIME_STEP, 2))
+                    x_pos = target.trajectory.state(0)[0][0][0]
+                    y_pos = target.trajectory.state(0)[0][2][0]
+                    width = target.trajectory.state(0)[1]
+                    height = target.trajectory.state(0)[2]
 
                     left = x_pos - width/2.0
                     top = y_pos - height/2.0
@@ -929,16 +1112,17 @@ class TargetSet:
             num_frames = NUM_GEN_FRAMES
         if USE_CREATE_CHILD:
             every_target = self.collect_ancestral_targets()
+            every_target_states = [(target, get_states_by_time(target)) for target in every_target]
             f = open(results_filename, "w")
             for frame_idx in range(num_frames):
                 timestamp = round(frame_idx*DEFAULT_TIME_STEP, 2)
 
-                for target in every_target:
-                    if timestamp in target.all_time_stamps:
-                        x_pos = target.all_states[target.all_time_stamps.index(timestamp)][0][0][0]
-                        y_pos = target.all_states[target.all_time_stamps.index(timestamp)][0][2][0]
-                        width = target.all_states[target.all_time_stamps.index(timestamp)][1]
-                        height = target.all_states[target.all_time_stamps.index(timestamp)][2]
+                for (target, states_by_time) in every_target_states:
+                    if timestamp in states_by_time:
+                        x_pos = states_by_time[timestamp][0][0][0]
+                        y_pos = states_by_time[timestamp][0][2][0]
+                        width = states_by_time[timestamp][1]
+                        height = states_by_time[timestamp][2]
 
                         left = x_pos - width/2.0
                         top = y_pos - height/2.0
@@ -953,15 +1137,16 @@ class TargetSet:
             f.close()
 
         else:
+            all_target_states = [(target, get_states_by_time(target)) for target in self.all_targets]
             f = open(results_filename, "w")
             for frame_idx in range(num_frames):
                 timestamp = round(frame_idx*DEFAULT_TIME_STEP, 2)
-                for target in self.all_targets:
-                    if timestamp in target.all_time_stamps:
-                        x_pos = target.all_states[target.all_time_stamps.index(timestamp)][0][0][0]
-                        y_pos = target.all_states[target.all_time_stamps.index(timestamp)][0][2][0]
-                        width = target.all_states[target.all_time_stamps.index(timestamp)][1]
-                        height = target.all_states[target.all_time_stamps.index(timestamp)][2]
+                for (target, states_by_time) in all_target_states:
+                    if timestamp in states_by_time:
+                        x_pos = states_by_time[timestamp][0][0][0]
+                        y_pos = states_by_time[timestamp][0][2][0]
+                        width = states_by_time[timestamp][1]
+                        height = states_by_time[timestamp][2]
 
                         left = x_pos - width/2.0
                         top = y_pos - height/2.0
@@ -1007,8 +1192,9 @@ class Particle:
         #these two lists uniquely identifies the state of this particle and are used for determining whether
         #two separate particles represent the same state
         #NOTE, only implemented when SPEC['use_general_num_dets'] == True
-        self.all_measurement_associations = []
-        self.all_dead_targets = []
+        #These are PersistentHistory objects, children share their parent's history in O(1)
+        self.all_measurement_associations = PersistentHistory()
+        self.all_dead_targets = PersistentHistory()
 
         self.importance_weight = 1.0/N_PARTICLES
 
@@ -1018,13 +1204,24 @@ class Particle:
         #end for debugging
 
         self.likelihood_DOUBLE_CHECK_ME = -1
-        #cache for memoizing association likelihood computation
+        #cache for memoizing association likelihood computation, used by rbpf_sampling
+        #(rbpf_sampling_manyMeasSrcs shares params.assoc_likelihood_cache between all particles)
         self.assoc_likelihood_cache = {}
 
         self.id_ = id_ 
 
         self.parent_particle = None
 
+        #group ids (see particle_grouping.py) of the last ONLINE_DELAY+1 time steps, group_ids[-1]
+        #is the group id on time step group_ids_step
+        self.group_ids = deque([0], maxlen=SPEC['ONLINE_DELAY']+1)
+        self.group_ids_step = 0
+
+        #dual variables of target columns from this particle's last assignment solves, used to warm start
+        #the next time instance's solves.  key: name of the solve, value: dictionary with key=target id_,
+        #value=dual variable.  Replaced rather than modified, children share their parent's dictionary
+        self.assignment_warm_starts = {}
+
         #for debugging
         self.c_debug = -1
         self.imprt_re_weight_debug = -1
@@ -1042,10 +1239,38 @@ class Particle:
         child_particle.parent_particle = self #this might hurt memory with real data
         child_particle.importance_weight = self.importance_weight
         child_particle.targets = self.targets.create_child()
-        child_particle.all_measurement_associations = copy.deepcopy(self.all_measurement_associations)
-        child_particle.all_dead_targets = copy.deepcopy(self.all_dead_targets)
+        #persistent histories, the child shares the parent's entries and appends its own
+        child_particle.all_measurement_associations = self.all_measurement_associations.copy()
+        child_particle.all_dead_targets = self.all_dead_targets.copy()
+        child_particle.group_ids = copy.copy(self.group_ids)
+        child_particle.group_ids_step = self.group_ids_step
+        child_particle.assignment_warm_starts = self.assignment_warm_starts
         return child_particle
 
+    def assignment_warm_start(self, key):
+        '''
+        Inputs:
+        - key: name of the assignment solve
+
+        Outputs:
+        - target_potentials: numpy array with shape (number of living targets,), the dual variables
+            stored for every living target by store_assignment_warm_start, 0 for targets without one
+        '''
+        potentials = self.assignment_warm_starts.get(key, {})
+        return np.array([potentials.get(target.id_, 0.0) for target in self.targets.living_targets], dtype=float)
+
+    def store_assignment_warm_start(self, key, target_potentials):
+        '''
+        Inputs:
+        - key: name of the assignment solve
+        - target_potentials: numpy array with shape (number of living targets,), dual variables of the
+            living targets' columns
+        '''
+        assert(len(target_potentials) == len(self.targets.living_targets))
+        self.assignment_warm_starts = dict(self.assignment_warm_starts)
+        self.assignment_warm_starts[key] = dict(zip([target.id_ for target in self.targets.living_targets],
+                                                    np.asarray(target_potentials).tolist()))
+
     def create_new_target(self, measurement, width, height, cur_time):
         self.targets.create_new_target(measurement, width, height, cur_time)
 
@@ -1061,19 +1286,26 @@ class Particle:
         print "sampled association c = ", self.c_debug, "importance reweighting factor = ", self.imprt_re_weight_debug
         self.plot_all_target_locations()
 
-    def process_meas_grp_assoc(self, birth_value, measurement_association, meas_grp_mean, meas_grp_cov, cur_time):
+    def process_meas_grp_assoc(self, birth_value, measurement_association, meas_grp_mean, meas_grp_cov, cur_time,
+                               pending_kf_updates=None):
         """
         - meas_source_index: the index of the measurement source being processed (i.e. in SCORE_INTERVALS)
+        - pending_kf_updates: if not None, a list that target updates are appended to instead of being
+            performed now, run them all at once later with apply_batched_kf_updates
 
         """
         #create new target
         if(measurement_association == birth_value):
             self.create_new_target(meas_grp_mean[0:2], meas_grp_mean[2], meas_grp_mean[3], cur_time)
-            new_target = True 
+            new_target = True
         #update the target corresponding to the association we have sampled
         elif((measurement_association >= 0) and (measurement_association < birth_value)):
-            self.targets.living_targets[measurement_association].update(meas_grp_mean[0:2], meas_grp_mean[2], \
-                            meas_grp_mean[3], cur_time, meas_grp_cov[0:2, 0:2])
+            if pending_kf_updates is not None:
+                pending_kf_updates.append((self.targets.writable_target(measurement_association), meas_grp_mean[0:2],
+                                           meas_grp_mean[2], meas_grp_mean[3], cur_time, meas_grp_cov[0:2, 0:2]))
+            else:
+                self.targets.writable_target(measurement_association).update(meas_grp_mean[0:2], meas_grp_mean[2], \
+                                meas_grp_mean[3], cur_time, meas_grp_cov[0:2, 0:2])
         else:
             #otherwise the measurement was associated with clutter
             assert(measurement_association == -1), ("measurement_association = ", measurement_association)
@@ -1100,12 +1332,12 @@ class Particle:
                     cur_meas = {'meas_loc': measurements[meas_index], 'width': widths[meas_index], \
                                 'height': heights[meas_index], 'cur_time': cur_time,
                                 'meas_noise_cov': MEAS_NOISE_COVS[meas_source_index][score_index]}
-                    self.targets.living_targets[meas_assoc].associated_measurements.append(cur_meas)
+                    self.targets.writable_target(meas_assoc).associated_measurements.append(cur_meas)
                 #update the target corresponding to the association we have sampled right now, unless already updated
                 #and we only allow a max of 1 update
                 elif not (SPEC['MAX_1_MEAS_UPDATE'] and self.targets.living_targets[meas_assoc].updated_this_time_instance):
                     score_index = get_score_index(SCORE_INTERVALS[meas_source_index], measurement_scores[meas_index])
-                    self.targets.living_targets[meas_assoc].update(measurements[meas_index], widths[meas_index], \
+                    self.targets.writable_target(meas_assoc).update(measurements[meas_index], widths[meas_index], \
                                     heights[meas_index], cur_time, MEAS_NOISE_COVS[meas_source_index][score_index])
             else:
                 #otherwise the measurement was associated with clutter
@@ -1128,7 +1360,7 @@ class Particle:
 
 
     #@profile
-    def update_particle_with_measurement(self, cur_time, measurement_lists, widths, heights, measurement_scores, params):
+    def update_particle_with_measurement(self, cur_time, measurement_lists, widths, heights, measurement_scores, params, meas_frame=None):
         """
         Input:
         - measurement_lists: a list where measurement_lists[i] is a list of all measurements from the current
@@ -1139,6 +1371,8 @@ class Particle:
         
         -widths: a list where widths[i] is a list of bounding box widths for the corresponding measurements
         -heights: a list where heights[i] is a list of bounding box heights for the corresponding measurements
+        -meas_frame: (optional) type MeasurementFrame of this time instance's measurements, shared by all
+            particles (only used when SPEC['use_general_num_dets'] == True)
 
         Debugging output:
         - new_target: True if a new target was created
@@ -1151,7 +1385,7 @@ class Particle:
         if SPEC['use_general_num_dets'] == True:
             (meas_grp_associations, meas_grp_means, meas_grp_covs, dead_target_indices, imprt_re_weight, exact_probability, proposal_probability) = \
             sample_and_reweight(self, measurement_lists,  widths, heights, SPEC['det_names'], \
-                cur_time, measurement_scores, params)
+                cur_time, measurement_scores, params, meas_frame)
             #debug
 #            self.exact_probability = exact_probability
 #            self.proposal_probability = proposal_probability
@@ -1226,8 +1460,10 @@ class Particle:
         fig = plt.figure()
         ax = fig.add_subplot(1, 1, 1)
         for i in range(self.targets.total_count):
-            life = len(self.targets.all_targets[i].all_states) #length of current targets life 
-            locations_1D =  [self.targets.all_targets[i].all_states[j][0] for j in range(life)]
+            #all_states builds a new list, read it once per target
+            states = self.targets.all_targets[i].all_states
+            life = len(states) #length of current targets life 
+            locations_1D =  [states[j][0] for j in range(life)]
             ax.plot(self.targets.all_targets[i].all_time_stamps, locations_1D,
                     '-o', label='Target %d' % i)
 
@@ -1339,6 +1575,95 @@ def get_eff_num_particles(particle_set):
     assert(abs(weight_sum - 1.0) < .000001), (weight_sum, n_eff)
     return 1.0/n_eff
 
+def predict_with_particle_store(particle_store, particle_set, cur_time, prev_time, fw_spec):
+    '''
+    Equivalent to calling target.predict for every living target, particle.update_target_death_probabilities
+    and particle.targets.kill_offscreen_targets for every particle, but with prediction and death
+    probabilities computed as whole array operations over particle_store
+
+    Inputs:
+    - particle_store: type ParticleStore
+    - particle_set: list of type Particle
+    - cur_time: the current measurement time (float)
+    - prev_time: the previous time step when a measurement was received (float)
+    '''
+    assert(KF_MOTION)
+    dt = cur_time - prev_time
+    assert(abs(dt - DEFAULT_TIME_STEP) < .00000001), (dt, DEFAULT_TIME_STEP, cur_time, prev_time)
+    image_width = fw_spec['image_widths'][fw_spec['seq_idx']]
+    image_height = fw_spec['image_heights'][fw_spec['seq_idx']]
+
+    particle_store.load(particle_set)
+    particle_store.predict(dt, SPEC['Q'])
+    offscreen = particle_store.offscreen_mask(image_width, image_height)
+    if USE_GENERATED_DATA:
+        offscreen[:] = False
+    particle_store.write_predictions(cur_time, offscreen)
+
+    if USE_POISSON_DEATH_MODEL:
+        death_probs = particle_store.poisson_death_probabilities(cur_time, prev_time, theta_death, alpha_death)
+    else:
+        death_probs = particle_store.death_probabilities(cur_time, offscreen, BORDER_DEATH_PROBABILITIES,
+            NOT_BORDER_DEATH_PROBABILITIES, image_width, image_height)
+    particle_store.write_death_probabilities(death_probs)
+
+    for particle in particle_set:
+        particle.assoc_likelihood_cache = {} #clear likelihood cache
+        particle.targets.kill_offscreen_targets()
+
+def clone_shared_targets_for_prediction(particle_set):
+    '''
+    Used with USE_COPY_ON_WRITE before prediction.  Prediction modifies targets, so replace every
+    living target with a clone, making one clone per distinct Target object that is shared by every
+    particle holding that object.  Targets of previous particles (parents) are left unchanged.
+    A clone held by a single TargetSet is owned by it and may be modified in place.
+
+    Inputs:
+    - particle_set: list of type Particle
+    '''
+    #key: id of a Target before prediction, value: (clone, list of TargetSets holding the clone)
+    clones = {}
+    for particle in particle_set:
+        target_set = particle.targets
+        all_target_indices = dict((id(target), all_idx) for (all_idx, target) in enumerate(target_set.all_targets))
+        for (idx, target) in enumerate(target_set.living_targets):
+            if not id(target) in clones:
+                clones[id(target)] = (target.clone(), [])
+            (new_target, holders) = clones[id(target)]
+            holders.append(target_set)
+            target_set.living_targets[idx] = new_target
+            target_set.all_targets[all_target_indices[id(target)]] = new_target
+
+    for (new_target, holders) in clones.itervalues():
+        if len(holders) == 1:
+            new_target.owner_id = holders[0].cow_id
+
+def apply_batched_kf_updates(pending_kf_updates):
+    '''
+    Run the Kalman filter update for every (target, measurement group) pair a frame assigned
+    as one batched operation, equivalent to calling target.update for each pair
+
+    Inputs:
+    - pending_kf_updates: list of (target, meas_pos, width, height, cur_time, meas_noise_cov) tuples,
+        as appended by Particle.process_meas_grp_assoc
+    '''
+    assert(KF_MOTION)
+    if len(pending_kf_updates) == 0:
+        return
+    x = np.array([target.x for (target, meas_pos, width, height, cur_time, meas_noise_cov) in pending_kf_updates])
+    P = np.array([target.P for (target, meas_pos, width, height, cur_time, meas_noise_cov) in pending_kf_updates])
+    z = np.array([np.reshape(meas_pos, (2, 1)) for (target, meas_pos, width, height, cur_time, meas_noise_cov) in pending_kf_updates])
+    if SPEC['USE_CONSTANT_R']:
+        R = SPEC['R']
+    else:
+        R = np.array([meas_noise_cov for (target, meas_pos, width, height, cur_time, meas_noise_cov) in pending_kf_updates])
+
+    (updated_x, updated_P) = batch_kf_update(x, P, z, R, H)
+    for idx, (target, meas_pos, width, height, cur_time, meas_noise_cov) in enumerate(pending_kf_updates):
+        target.x = updated_x[idx]
+        target.P = updated_P[idx]
+        target.record_update(width, height, cur_time)
+
 def cur_particle_states_match(particleA, particleB, min_delay, max_delay):
     '''
     Inputs:
@@ -1424,6 +1749,47 @@ def cur_particle_states_match(particleA, particleB, min_delay, max_delay):
     return (match, 'match!')
 
 def group_particles(particle_set, min_delay, max_delay): 
+    '''
+    Group particles with the same state [min_delay,max_delay] time instances in the past, see
+    group_particles_by_state for inputs and outputs.  With USE_HASHED_PARTICLE_GROUPING keys are
+    group ids from PARTICLE_GROUPING, computing them only costs a dictionary lookup per particle
+    and new time step.
+    '''
+    if not USE_HASHED_PARTICLE_GROUPING:
+        return group_particles_by_state(particle_set, min_delay, max_delay)
+
+    assert(SPEC['RUN_ONLINE'])
+    assert(min_delay <= SPEC['ONLINE_DELAY'] and max_delay <= SPEC['ONLINE_DELAY'] and min_delay<=max_delay)
+    particle_group_probs = {}
+    particle_groups = {}
+    for particle in particle_set:
+        #the same group id min_delay time instances in the past implies the same state on every
+        #earlier time instance, so one group id is the whole key
+        particle_group_key = PARTICLE_GROUPING.group_id(particle, min_delay)
+        if particle_group_key in particle_group_probs:
+            particle_group_probs[particle_group_key] += particle.importance_weight
+        else:
+            particle_group_probs[particle_group_key] = particle.importance_weight
+            particle_groups[particle_group_key] = particle
+    PARTICLE_GROUPING.prune(particle_set)
+
+    if VALIDATE_PARTICLE_GROUPING:
+        (state_group_probs, state_groups) = group_particles_by_state(particle_set, min_delay, max_delay)
+        for particle in particle_set:
+            (match_bool, match_str) = cur_particle_states_match(particle_groups[PARTICLE_GROUPING.group_id(particle, min_delay)],
+                                                                particle, min_delay, max_delay)
+            assert(match_bool), (match_str, particle.all_measurement_associations, particle.all_dead_targets)
+        if len(state_group_probs) != len(particle_group_probs):
+            print "particles with the same state but different association histories:", \
+                len(particle_group_probs), "groups by id,", len(state_group_probs), "groups by state"
+
+    total_prob = 0.0
+    for key, prob in particle_group_probs.iteritems():
+        total_prob += prob
+    assert(np.isclose(total_prob, 1, rtol=1e-04, atol=1e-04)), total_prob
+    return(particle_group_probs, particle_groups)
+
+def group_particles_by_state(particle_set, min_delay, max_delay): 
     '''
     ###CONSIDER ROUNDING PARTICLE POSITIONS TO SOME DEGREE, I don't THINK not rounding causes a bug###
     ###We assume the same targets are always in the same list position, I THINK this is ok###
@@ -1479,14 +1845,15 @@ def group_particles(particle_set, min_delay, max_delay):
             particle_groups[particle_state_key] = particle
 
         ############testing############
-        for cur_key, cur_particle in particle_groups.iteritems():
-            if(cur_key != particle_state_key):
-                (match_bool, match_str) = cur_particle_states_match(cur_particle, particle, min_delay, max_delay)
-                assert(not match_bool), (match_str, particle_state_key, cur_key, len(particle.all_measurement_associations), 
-                    particle.importance_weight, particle_groups[particle_state_key].importance_weight, 
-                    particle.all_measurement_associations, particle_groups[particle_state_key].all_measurement_associations,
-                    cur_particle.all_measurement_associations,
-                    particle.all_dead_targets, particle_groups[particle_state_key].all_dead_targets)
+        if VALIDATE_PARTICLE_GROUPING:
+            for cur_key, cur_particle in particle_groups.iteritems():
+                if(cur_key != particle_state_key):
+                    (match_bool, match_str) = cur_particle_states_match(cur_particle, particle, min_delay, max_delay)
+                    assert(not match_bool), (match_str, particle_state_key, cur_key, len(particle.all_measurement_associations), 
+                        particle.importance_weight, particle_groups[particle_state_key].importance_weight, 
+                        particle.all_measurement_associations, particle_groups[particle_state_key].all_measurement_associations,
+                        cur_particle.all_measurement_associations,
+                        particle.all_dead_targets, particle_groups[particle_state_key].all_dead_targets)
         ############done testing############
 
     ############testing############
@@ -1497,16 +1864,17 @@ def group_particles(particle_set, min_delay, max_delay):
     ############done testing############
     return(particle_group_probs, particle_groups)
 
-def modified_SIS_gumbel_step(particle_set, measurement_lists, widths, heights, cur_time, params):
+def modified_SIS_gumbel_step(particle_set, measurement_lists, widths, heights, cur_time, params, meas_frame=None):
     (particle_group_probs, particle_groups) = group_particles(particle_set, 0, SPEC['ONLINE_DELAY'])
-    #housekeeping, should make this nicer somehow
-    meas_groups = []
-    for det_idx, det_name in enumerate(SPEC['det_names']):
-        group_detections(meas_groups, det_name, measurement_lists[det_idx], widths[det_idx], heights[det_idx], params)
+    if meas_frame is None:
+        meas_frame = build_measurement_frame(measurement_lists, widths, heights, SPEC['det_names'], params)
+    meas_groups = meas_frame.meas_groups
 
 
     #now that we have estimates of p(x_1:k-1|y_1:k-1), perform modified SIS step
     new_particle_set = []
+    #target updates are collected here and run together if USE_BATCHED_KALMAN
+    pending_kf_updates = [] if USE_BATCHED_KALMAN else None
     particle_group_log_probs = {}
     for idx in range(N_PARTICLES):
         #1. solve perturbed max(log(p(x_k, y_k | x_1:k-1, y_1:k-1))) problem for each particle group
@@ -1520,7 +1888,7 @@ def modified_SIS_gumbel_step(particle_set, measurement_lists, widths, heights, c
             assert(len(particle.targets.living_targets) == particle.targets.living_count)
             (meas_associations, dead_target_indices, max_log_prob) = \
                 solve_perturbed_max_gumbel(particle, meas_groups, len(particle.targets.living_targets), 
-                p_target_deaths, params)
+                p_target_deaths, params, meas_frame)
 #                solve_perturbed_max_gumbel_exact(particle, meas_groups, len(particle.targets.living_targets), 
 #                p_target_deaths, params)
 
@@ -1552,20 +1920,9 @@ def modified_SIS_gumbel_step(particle_set, measurement_lists, widths, heights, c
         birth_value = new_particle.targets.living_count
 
 
-    ############ MESSY ############
-        #list of detection group centers, meas_grp_means[i] is a 2-d numpy array
-        #of the position of meas_groups[i]
-        meas_grp_covs = []   
-        meas_grp_means2D = []
-        meas_grp_means = []
-        for (index, detection_group) in enumerate(meas_groups):
-            (combined_meas_mean, combined_covariance) = combine_4d_detections(params.posAndSize_inv_covariance_blocks, 
-                                params.meas_noise_mean, detection_group)
-            combined_meas_pos = combined_meas_mean[0:2]
-            meas_grp_means2D.append(combined_meas_pos)
-            meas_grp_means.append(combined_meas_mean)
-            meas_grp_covs.append(combined_covariance)
-    ############ END MESSY ############
+        #combined detection group means and covariances, computed once per time instance
+        meas_grp_means = meas_frame.meas_grp_means4D
+        meas_grp_covs = meas_frame.meas_grp_covs
 
         meas_grp_associations = particle_group_log_probs[maximum_log_prob_p_key]['meas_associations']
         dead_target_indices = particle_group_log_probs[maximum_log_prob_p_key]['dead_target_indices']
@@ -1575,7 +1932,7 @@ def modified_SIS_gumbel_step(particle_set, measurement_lists, widths, heights, c
         new_particle.all_dead_targets.append(dead_target_indices)  
         assert(len(meas_grp_associations) == len(meas_grp_means) and len(meas_grp_means) == len(meas_grp_covs))
         for meas_grp_idx, meas_grp_assoc in enumerate(meas_grp_associations):
-            new_particle.process_meas_grp_assoc(birth_value, meas_grp_assoc, meas_grp_means[meas_grp_idx], meas_grp_covs[meas_grp_idx], cur_time)
+            new_particle.process_meas_grp_assoc(birth_value, meas_grp_assoc, meas_grp_means[meas_grp_idx], meas_grp_covs[meas_grp_idx], cur_time, pending_kf_updates)
 
         #process target deaths
         #double check dead_target_indices is sorted
@@ -1594,12 +1951,29 @@ def modified_SIS_gumbel_step(particle_set, measurement_lists, widths, heights, c
         new_particle_set.append(new_particle)
         assert(new_particle.parent_particle != None)
 
+    if pending_kf_updates is not None:
+        apply_batched_kf_updates(pending_kf_updates)
+
     return new_particle_set
 
 
 
 
-def modified_SIS_MHT_gumbel_step(particle_set, measurement_lists, widths, heights, cur_time, params):
+def convert_best_assignments_to_permutations(best_assignments, M, ordered_particle_groups):
+    '''
+    Inputs:
+    - best_assignments: list of (cost, assignment pairs, particle group index) from k_best_assign_mult_cost_matrices
+    - M: number of measurement groups
+    - ordered_particle_groups: list of particle groups, in the order of the cost matrices
+
+    Outputs:
+    - best_assignments: list of (cost, col4row, particle group index), col4row is the permutation of
+        the assignment pairs (see convert_assignment_pairs_to_permutation3)
+    '''
+    return [(cur_cost, convert_assignment_pairs_to_permutation3(cur_assignment, M, ordered_particle_groups[cur_particle_idx].targets.living_count), cur_particle_idx)
+            for (cur_cost, cur_assignment, cur_particle_idx) in best_assignments]
+
+def modified_SIS_MHT_gumbel_step(particle_set, measurement_lists, widths, heights, cur_time, params, meas_frame=None):
     '''
     Very similar to modified_SIS_gumbel_step, but we sample new particles w/o replacement.  Also
     params.SPEC['gumbel_scale'] should exist.  When params.SPEC['gumbel_scale'] = 0, we get MHT back.
@@ -1622,16 +1996,18 @@ def modified_SIS_MHT_gumbel_step(particle_set, measurement_lists, widths, height
         -sample 'num_particles' unique hypotheses from 'num_top_hypotheses_to_sample_from' with replacement,
         that is, keep sampling until we have 'num_particles' different hypotheses
 
+    meas_frame: (optional) type MeasurementFrame of this time instance's measurements (built here if None)
     '''
     (particle_group_probs, particle_groups) = group_particles(particle_set, 0, SPEC['ONLINE_DELAY'])
-    #housekeeping, should make this nicer somehow
-    meas_groups = []
-    for det_idx, det_name in enumerate(SPEC['det_names']):
-        group_detections(meas_groups, det_name, measurement_lists[det_idx], widths[det_idx], heights[det_idx], params)
+    if meas_frame is None:
+        meas_frame = build_measurement_frame(measurement_lists, widths, heights, SPEC['det_names'], params)
+    meas_groups = meas_frame.meas_groups
 
     M = len(meas_groups) #number of measurement groups
     #now that we have estimates of p(x_1:k-1|y_1:k-1), perform modified SIS step
     new_particle_set = []
+    #target updates are collected here and run together if USE_BATCHED_KALMAN
+    pending_kf_updates = [] if USE_BATCHED_KALMAN else None
     particle_group_log_probs = {}
 #    for idx in range(N_PARTICLES): 
 
@@ -1658,23 +2034,36 @@ def modified_SIS_MHT_gumbel_step(particle_set, measurement_lists, widths, height
 
 
         #1. construct log probs matrix for  particle GROUP
-        cur_log_probs = construct_log_probs_matrix3(particle, meas_groups, T, p_target_deaths, params)
-        log_prob_matrices.append(cur_log_probs) #store to calculate probabilities later
-        assert((cur_log_probs <= .000001).all()), (cur_log_probs)
+        if USE_SPARSE_ASSOCIATION_COSTS:
+            cur_log_probs = construct_sparse_log_probs3(particle, meas_groups, T, p_target_deaths, params, meas_frame=meas_frame)
+            log_prob_matrices.append(cur_log_probs) #store to calculate probabilities later
+            assert((cur_log_probs.values <= .000001).all()), (cur_log_probs.values)
+        else:
+            cur_log_probs = construct_log_probs_matrix3(particle, meas_groups, T, p_target_deaths, params, meas_frame=meas_frame)
+            log_prob_matrices.append(cur_log_probs) #store to calculate probabilities later
+            assert((cur_log_probs <= .000001).all()), (cur_log_probs)
 
         if params.SPEC['proposal_distr'] == 'modified_SIS_gumbel':
             #3. add gumbel matrix to log probs matrix, scaled by params.SPEC['gumbel_scale']/(number of assignments)
-            G = np.random.gumbel(loc=0.0, scale=1.0, size=(cur_log_probs.shape[0], cur_log_probs.shape[1]))
             number_of_assignments = 2*(M + T)
-            G = G*params.SPEC['gumbel_scale']/number_of_assignments
-            cur_log_probs += G
-
-        cur_cost_matrix = -1*cur_log_probs #k_best_assign_mult_cost_matrices is set up to find minimum cost, not max log prob
-        
-        if cur_cost_matrix.size > 0:
-            cur_min_cost = np.min(cur_cost_matrix)
+            if USE_SPARSE_ASSOCIATION_COSTS:
+                G = np.random.gumbel(loc=0.0, scale=1.0, size=cur_log_probs.values.shape)
+                cur_log_probs.perturb(G*params.SPEC['gumbel_scale']/number_of_assignments)
+            else:
+                G = np.random.gumbel(loc=0.0, scale=1.0, size=(cur_log_probs.shape[0], cur_log_probs.shape[1]))
+                G = G*params.SPEC['gumbel_scale']/number_of_assignments
+                cur_log_probs += G
+
+        #k_best_assign_mult_cost_matrices is set up to find minimum cost, not max log prob
+        if USE_SPARSE_ASSOCIATION_COSTS:
+            cur_cost_matrix = cur_log_probs.transformed(-1)
+            cur_min_cost = cur_cost_matrix.min_value()
         else:
-            cur_min_cost = 0.0
+            cur_cost_matrix = -1*cur_log_probs
+            if cur_cost_matrix.size > 0:
+                cur_min_cost = np.min(cur_cost_matrix)
+            else:
+                cur_min_cost = 0.0
 
         if cur_min_cost < min_cost:
             min_cost = cur_min_cost
@@ -1688,8 +2077,12 @@ def modified_SIS_MHT_gumbel_step(particle_set, measurement_lists, widths, height
 
     #make all entries of all cost matrices non-negative
     for idx in range(len(perturbed_cost_matrices)):
-        perturbed_cost_matrices[idx] = perturbed_cost_matrices[idx] - min_cost
-        assert((perturbed_cost_matrices[idx] >= 0.0).all()), (perturbed_cost_matrices[idx])
+        if USE_SPARSE_ASSOCIATION_COSTS:
+            perturbed_cost_matrices[idx] = perturbed_cost_matrices[idx].transformed(1, -1*min_cost)
+            assert((perturbed_cost_matrices[idx].values >= 0.0).all()), (perturbed_cost_matrices[idx].values)
+        else:
+            perturbed_cost_matrices[idx] = perturbed_cost_matrices[idx] - min_cost
+            assert((perturbed_cost_matrices[idx] >= 0.0).all()), (perturbed_cost_matrices[idx])
 
     #4. find N_PARTICLES most likely assignments among all assignments in log probs matrices of ALL particle GROUPS
 
@@ -1701,20 +2094,41 @@ def modified_SIS_MHT_gumbel_step(particle_set, measurement_lists, widths, height
 
     print 'M =', M
 
+    if USE_WARM_START_ASSIGNMENT:
+        target_potentials = [particle.assignment_warm_start('MHT') for particle in ordered_particle_groups]
+    else:
+        target_potentials = None
+
     if params.SPEC['proposal_distr'] == 'modified_SIS_gumbel':
-        best_assignments = k_best_assign_mult_cost_matrices(N_PARTICLES, perturbed_cost_matrices, particle_costs, M)
+        best_assignments = k_best_assign_mult_cost_matrices(N_PARTICLES, perturbed_cost_matrices, particle_costs, M, target_potentials)
 #    best_assignments = k_best_assign_mult_cost_matrices(N_PARTICLES, perturbed_cost_matrices)
+        best_assignments = convert_best_assignments_to_permutations(best_assignments, M, ordered_particle_groups)
 
     else: 
         #now we sample without replacemenent from the most likely assignments
-        best_assignments = k_best_assign_mult_cost_matrices(params.SPEC['num_top_hypotheses_to_sample_from'], perturbed_cost_matrices, particle_costs, M)        
+        if HYPOTHESIS_MASS_FRACTION is None:
+            best_assignments = k_best_assign_mult_cost_matrices(params.SPEC['num_top_hypotheses_to_sample_from'], perturbed_cost_matrices, particle_costs, M, target_potentials)        
+        else:
+            #sampling without replacement or until 'num_particles' unique hypotheses needs that many hypotheses
+            if params.SPEC['proposal_distr'] == 'modified_SIS_w_replacement':
+                min_hypotheses = 1
+            else:
+                min_hypotheses = min(len(particle_set), params.SPEC['num_top_hypotheses_to_sample_from'])
+            (best_assignments, captured_mass) = mass_adaptive_k_best_assignments(min_hypotheses,
+                params.SPEC['num_top_hypotheses_to_sample_from'], HYPOTHESIS_MASS_FRACTION, perturbed_cost_matrices,
+                particle_costs, M, target_potentials)
+            if DEBUG:
+                print "top", len(best_assignments), "hypotheses carry >=", captured_mass, "of the probability mass"
+            params.captured_hypothesis_mass.append((cur_time, len(best_assignments), captured_mass))
+        #assignments are scored and decoded as permutations, without (2*M+2*T)x(2*M+2*T) assignment matrices
+        best_assignments = convert_best_assignments_to_permutations(best_assignments, M, ordered_particle_groups)
         
         assignment_proposal_distr = []
         for (cur_cost, cur_assignment, cur_particle_idx) in best_assignments:
-            T = len(ordered_particle_groups[cur_particle_idx].targets.living_targets)            
-            cur_assignment_matrix = convert_assignment_pairs_to_matrix3(cur_assignment, M, T)
-
-            assignment_log_prob = np.trace(np.dot(log_prob_matrices[cur_particle_idx], cur_assignment_matrix.T))
+            if USE_SPARSE_ASSOCIATION_COSTS:
+                assignment_log_prob = log_prob_matrices[cur_particle_idx].permutation_value(cur_assignment)
+            else:
+                assignment_log_prob = permutation_log_prob3(log_prob_matrices[cur_particle_idx], cur_assignment)
             assignment_prob = np.exp(assignment_log_prob - particle_neg_log_probs[cur_particle_idx])
             assignment_proposal_distr.append(assignment_prob)
 
@@ -1795,6 +2209,11 @@ def modified_SIS_MHT_gumbel_step(particle_set, measurement_lists, widths, height
 ############        for sampled_idx in sampled_assignment_indices:
 ############            sampled_assignments.append(best_assignments[sampled_idx])
 ############        best_assignments = sampled_assignments
+    if USE_WARM_START_ASSIGNMENT:
+        #stored before the new particles are created, so they inherit them
+        for (particle, cur_target_potentials) in zip(ordered_particle_groups, target_potentials):
+            particle.store_assignment_warm_start('MHT', cur_target_potentials)
+
     #5. For each of the most likely assignments, create a new particle that is a copy of its particle GROUP, 
     # and associate measurements / kill targets according to assignment.
 
@@ -1811,10 +2230,12 @@ def modified_SIS_MHT_gumbel_step(particle_set, measurement_lists, widths, height
         T = len(new_particle.targets.living_targets)
         assert(T == new_particle.targets.living_count)
 
-        cur_assignment_matrix = convert_assignment_pairs_to_matrix3(cur_assignment, M, T)
         assert(SPEC['normalize_log_importance_weights'] == True)
         #set to log of importance weight
-        assignment_log_prob = np.trace(np.dot(log_prob_matrices[cur_particle_idx], cur_assignment_matrix.T))
+        if USE_SPARSE_ASSOCIATION_COSTS:
+            assignment_log_prob = log_prob_matrices[cur_particle_idx].permutation_value(cur_assignment)
+        else:
+            assignment_log_prob = permutation_log_prob3(log_prob_matrices[cur_particle_idx], cur_assignment)
         if params.SPEC['proposal_distr'] == 'modified_SIS_gumbel':
             new_particle.importance_weight = assignment_log_prob - particle_neg_log_probs[cur_particle_idx] #log prob
 
@@ -1841,7 +2262,7 @@ def modified_SIS_MHT_gumbel_step(particle_set, measurement_lists, widths, height
 ############            proposal_log_prob = np.log(calc_prop_prob(assignment_proposal_distr, sampled_assignment_indices[idx], len(particle_set)))
 ############            new_particle.importance_weight = exact_prob - proposal_log_prob #log prob
        
-        (meas_grp_associations, dead_target_indices) = convert_assignment_matrix3(cur_assignment_matrix, M, T)
+        (meas_grp_associations, dead_target_indices) = convert_permutation_to_associations3(cur_assignment, M, T)
 
 
         if PRINT_INFO:
@@ -1855,27 +2276,16 @@ def modified_SIS_MHT_gumbel_step(particle_set, measurement_lists, widths, height
             print 'parent_particle idx:', cur_particle_idx
             print 'meas_grp_associations: ', meas_grp_associations
             print 'dead_target_indices: ', dead_target_indices
-    ############ MESSY ############
-        #list of detection group centers, meas_grp_means[i] is a 2-d numpy array
-        #of the position of meas_groups[i]
-        meas_grp_covs = []   
-        meas_grp_means2D = []
-        meas_grp_means = []
-        for (index, detection_group) in enumerate(meas_groups):
-            (combined_meas_mean, combined_covariance) = combine_4d_detections(params.posAndSize_inv_covariance_blocks, 
-                                params.meas_noise_mean, detection_group)
-            combined_meas_pos = combined_meas_mean[0:2]
-            meas_grp_means2D.append(combined_meas_pos)
-            meas_grp_means.append(combined_meas_mean)
-            meas_grp_covs.append(combined_covariance)
-    ############ END MESSY ############
+        #combined detection group means and covariances, computed once per time instance
+        meas_grp_means = meas_frame.meas_grp_means4D
+        meas_grp_covs = meas_frame.meas_grp_covs
 
 
         new_particle.all_measurement_associations.append(meas_grp_associations)
         new_particle.all_dead_targets.append(dead_target_indices)  
         assert(len(meas_grp_associations) == len(meas_grp_means) and len(meas_grp_means) == len(meas_grp_covs))
         for meas_grp_idx, meas_grp_assoc in enumerate(meas_grp_associations):
-            new_particle.process_meas_grp_assoc(birth_value, meas_grp_assoc, meas_grp_means[meas_grp_idx], meas_grp_covs[meas_grp_idx], cur_time)
+            new_particle.process_meas_grp_assoc(birth_value, meas_grp_assoc, meas_grp_means[meas_grp_idx], meas_grp_covs[meas_grp_idx], cur_time, pending_kf_updates)
 
         #process target deaths
         #double check dead_target_indices is sorted
@@ -1894,15 +2304,17 @@ def modified_SIS_MHT_gumbel_step(particle_set, measurement_lists, widths, height
         new_particle_set.append(new_particle)
         assert(new_particle.parent_particle != None)
 
+    if pending_kf_updates is not None:
+        apply_batched_kf_updates(pending_kf_updates)
+
     return (new_particle_set, invalid_low_prob_sample_count)
 
 
-def modified_SIS_min_cost_proposal_step(particle_set, measurement_lists, widths, heights, cur_time, params):
+def modified_SIS_min_cost_proposal_step(particle_set, measurement_lists, widths, heights, cur_time, params, meas_frame=None):
     (particle_group_probs, particle_groups) = group_particles(particle_set, 0, SPEC['ONLINE_DELAY'])
-    #housekeeping, should make this nicer somehow
-    meas_groups = []
-    for det_idx, det_name in enumerate(SPEC['det_names']):
-        group_detections(meas_groups, det_name, measurement_lists[det_idx], widths[det_idx], heights[det_idx], params)
+    if meas_frame is None:
+        meas_frame = build_measurement_frame(measurement_lists, widths, heights, SPEC['det_names'], params)
+    meas_groups = meas_frame.meas_groups
 
 
     #construct distribution over particles and measurement target associations
@@ -1910,7 +2322,7 @@ def modified_SIS_min_cost_proposal_step(particle_set, measurement_lists, widths,
     marginal_proposal_info = []
     for p_key, particle in particle_groups.iteritems():
         (meas_grp_means4D, meas_grp_covs, marginal_meas_target_proposal_distr, proposal_measurement_target_associations) = \
-        unnormalized_marginal_meas_target_assoc(particle, meas_groups, len(particle.targets.living_targets), params)
+        unnormalized_marginal_meas_target_assoc(particle, meas_groups, len(particle.targets.living_targets), params, meas_frame)
         for m_t_prop_idx, associations in enumerate(proposal_measurement_target_associations):
             proposal_distr.append(particle_group_probs[p_key]*marginal_meas_target_proposal_distr[m_t_prop_idx])
             marginal_proposal_info.append({'particle_key': p_key,
@@ -1921,6 +2333,8 @@ def modified_SIS_min_cost_proposal_step(particle_set, measurement_lists, widths,
     proposal_distr /= float(np.sum(proposal_distr))    
 
     new_particle_set = []
+    #target updates are collected here and run together if USE_BATCHED_KALMAN
+    pending_kf_updates = [] if USE_BATCHED_KALMAN else None
     particle_group_log_probs = {}
     for idx in range(N_PARTICLES):
 
@@ -2016,9 +2430,7 @@ def modified_SIS_min_cost_proposal_step(particle_set, measurement_lists, widths,
         # a list containing the number of measurements detected by each source
         # used in prior calculation to count the number of ordered vectors given
         # an unordered association set
-        meas_counts_by_source = [] 
-        for meas_list in measurement_lists:
-            meas_counts_by_source.append(len(meas_list))
+        meas_counts_by_source = meas_frame.meas_counts_by_source
 
         likelihood = get_likelihood(particle_groups[sampled_particle_key], meas_groups, particle_groups[sampled_particle_key].targets.living_count,
                                        sampled_assoc, params, log=False)
@@ -2029,20 +2441,9 @@ def modified_SIS_min_cost_proposal_step(particle_set, measurement_lists, widths,
         birth_value = new_particle.targets.living_count
 
 
-    ############ MESSY ############
-        #list of detection group centers, meas_grp_means[i] is a 2-d numpy array
-        #of the position of meas_groups[i]
-        meas_grp_covs = []   
-        meas_grp_means2D = []
-        meas_grp_means = []
-        for (index, detection_group) in enumerate(meas_groups):
-            (combined_meas_mean, combined_covariance) = combine_4d_detections(params.posAndSize_inv_covariance_blocks, 
-                                params.meas_noise_mean, detection_group)
-            combined_meas_pos = combined_meas_mean[0:2]
-            meas_grp_means2D.append(combined_meas_pos)
-            meas_grp_means.append(combined_meas_mean)
-            meas_grp_covs.append(combined_covariance)
-    ############ END MESSY ############
+        #combined detection group means and covariances, computed once per time instance
+        meas_grp_means = meas_frame.meas_grp_means4D
+        meas_grp_covs = meas_frame.meas_grp_covs
 
         sampled_assoc = sampled_assoc
         dead_target_indices = targets_to_kill
@@ -2052,7 +2453,7 @@ def modified_SIS_min_cost_proposal_step(particle_set, measurement_lists, widths,
         new_particle.all_dead_targets.append(dead_target_indices)  
         assert(len(sampled_assoc) == len(meas_grp_means) and len(meas_grp_means) == len(meas_grp_covs))
         for meas_grp_idx, meas_grp_assoc in enumerate(sampled_assoc):
-            new_particle.process_meas_grp_assoc(birth_value, meas_grp_assoc, meas_grp_means[meas_grp_idx], meas_grp_covs[meas_grp_idx], cur_time)
+            new_particle.process_meas_grp_assoc(birth_value, meas_grp_assoc, meas_grp_means[meas_grp_idx], meas_grp_covs[meas_grp_idx], cur_time, pending_kf_updates)
 
         #process target deaths
         #double check dead_target_indices is sorted
@@ -2072,6 +2473,9 @@ def modified_SIS_min_cost_proposal_step(particle_set, measurement_lists, widths,
         assert(new_particle.parent_particle != None)
 
 
+    if pending_kf_updates is not None:
+        apply_batched_kf_updates(pending_kf_updates)
+
     return new_particle_set
 
 
@@ -2090,12 +2494,31 @@ def run_rbpf_on_targetset(target_sets, online_results_filename, params, fw_spec)
     """
     particle_set = []
     global NEXT_PARTICLE_ID
+    global TRACK_STORE
+    global PARTICLE_GROUPING
+    global CACHED_LIKELIHOODS
+    global NOT_CACHED_LIKELIHOODS
+    PARTICLE_GROUPING = ParticleGroupingEngine()
+    if TARGET_HISTORY_WINDOW is not None:
+        #offline results need full trajectories, the motion models need their windows
+        assert(SPEC['RUN_ONLINE'] and TARGET_HISTORY_WINDOW >= max(2, LSTM_WINDOW, KNN_WINDOW))
     #Create the particle set
     for i in range(0, N_PARTICLES):
         particle_set.append(Particle(NEXT_PARTICLE_ID, fw_spec))
         NEXT_PARTICLE_ID += 1
     prev_time_stamp = -1
 
+    if USE_PARTICLE_STORE:
+        particle_store = ParticleStore(N_PARTICLES)
+
+    if SPEC['RUN_ONLINE']:
+        snapshot_store = SnapshotStore()
+
+    if USE_ANCESTRY_MANAGER:
+        assert(USE_CREATE_CHILD)
+        TRACK_STORE = TrackStore()
+        ancestry_manager = AncestryManager(TRACK_STORE, ANCESTRY_COMPACTION_INTERVAL)
+
 
     #for displaying results
     time_stamps = []
@@ -2164,16 +2587,26 @@ def run_rbpf_on_targetset(target_sets, online_results_filename, params, fw_spec)
         particle_set[0].targets.living_count
         print "number of measurements from source 0:", len(measurement_lists[0])
 
+        if USE_COPY_ON_WRITE and prev_time_stamp != -1:
+            clone_shared_targets_for_prediction(particle_set)
+
+        if USE_PARTICLE_STORE and prev_time_stamp != -1:
+            predict_with_particle_store(particle_store, particle_set, time_stamp, prev_time_stamp, fw_spec)
+
+        #with USE_COPY_ON_WRITE particles share Target objects, predict each distinct Target once
+        predicted_target_ids = set()
         for particle in particle_set:
             #update particle death probabilities
-            if(prev_time_stamp != -1):
+            if(prev_time_stamp != -1 and not USE_PARTICLE_STORE):
                 particle.assoc_likelihood_cache = {} #clear likelihood cache
                 #Run Kalman filter prediction for all living targets
                 for target in particle.targets.living_targets:
                     dt = time_stamp - prev_time_stamp
                     ###############if params.SPEC['train_test'] != 'generated_data': #we might not generate data for a particular time step
                     assert(abs(dt - DEFAULT_TIME_STEP) < .00000001), (dt, DEFAULT_TIME_STEP, time_stamp, prev_time_stamp)
-                    target.predict(dt, time_stamp)
+                    if not id(target) in predicted_target_ids:
+                        target.predict(dt, time_stamp)
+                        predicted_target_ids.add(id(target))
                 #update particle death probabilities AFTER predict so that targets that moved
                 #off screen this time instance will be killed
                 particle.update_target_death_probabilities(time_stamp, prev_time_stamp)
@@ -2184,20 +2617,27 @@ def run_rbpf_on_targetset(target_sets, online_results_filename, params, fw_spec)
 
 
 
+        meas_frame = None
+        if SPEC['use_general_num_dets']:
+            #targets have been predicted, likelihoods cached on the previous time instance won't be requested again
+            params.assoc_likelihood_cache.begin_frame()
+            #group detections and precompute everything that doesn't depend on a particle once
+            meas_frame = build_measurement_frame(measurement_lists, widths, heights, SPEC['det_names'], params)
+
         new_target_list = [] #for debugging, list of booleans whether each particle created a new target
         pIdxDebugInfo = 0
 
         if params.SPEC['proposal_distr'] in ['modified_SIS_gumbel', 'modified_SIS_wo_replacement_approx', 'modified_SIS_w_replacement', 'modified_SIS_w_replacement_unique']:
-            (particle_set, cur_invalid_low_prob_sample_count) = modified_SIS_MHT_gumbel_step(particle_set, measurement_lists, widths, heights, time_stamp, params)
+            (particle_set, cur_invalid_low_prob_sample_count) = modified_SIS_MHT_gumbel_step(particle_set, measurement_lists, widths, heights, time_stamp, params, meas_frame)
             invalid_low_prob_sample_count += cur_invalid_low_prob_sample_count
 #            particle_set = modified_SIS_gumbel_step(particle_set, measurement_lists, widths, heights, time_stamp, params)
         elif params.SPEC['proposal_distr'] == 'modified_SIS_min_cost':
-            particle_set = modified_SIS_min_cost_proposal_step(particle_set, measurement_lists, widths, heights, time_stamp, params)
+            particle_set = modified_SIS_min_cost_proposal_step(particle_set, measurement_lists, widths, heights, time_stamp, params, meas_frame)
         else:
             for particle in particle_set:
                 #this is where 
                 assert(len(particle.all_measurement_associations) == time_instance_index), (particle.all_measurement_associations, len(particle.all_measurement_associations), time_instance_index)
-                new_target = particle.update_particle_with_measurement(time_stamp, measurement_lists, widths, heights, measurement_scores, params)
+                new_target = particle.update_particle_with_measurement(time_stamp, measurement_lists, widths, heights, measurement_scores, params, meas_frame)
                 assert(len(particle.all_measurement_associations) == time_instance_index + 1), (particle.all_measurement_associations, len(particle.all_measurement_associations), time_instance_index)            
                 new_target_list.append(new_target)
                 pIdxDebugInfo += 1
@@ -2277,19 +2717,23 @@ def run_rbpf_on_targetset(target_sets, online_results_filename, params, fw_spec)
                 if time_instance_index>0 and cur_max_weight_particle.parent_particle != prv_max_weight_particle:
                     (target_associations, duplicate_ids) = \
                     match_target_ids(cur_max_weight_particle.parent_particle.targets.living_targets,\
-                                     prv_max_weight_particle.targets.living_targets)
+                                     prv_max_weight_particle.targets.living_targets,
+                                     cur_max_weight_particle.parent_particle.targets)
                     #replace associated target IDs with the IDs from the previous maximum importance weight
                     #particle for ID conistency in the online results we output
 #                    for cur_target in cur_max_weight_target_set.living_targets:
 #                        if cur_target.id_ in target_associations:
 #                            cur_target.id_ = target_associations[cur_target.id_]                   
+                    cur_max_weight_target_set.make_snapshot_queue_private()
                     for q_idx in range(SPEC['ONLINE_DELAY'] + 1):
                         for cur_target in cur_max_weight_target_set.living_targets_q[q_idx][1]:
                             if cur_target.id_ in duplicate_ids:
                                 cur_target.id_ = duplicate_ids[cur_target.id_]
                             if cur_target.id_ in target_associations:
                                 cur_target.id_ = target_associations[cur_target.id_]
-                    for cur_target in cur_max_weight_target_set.living_targets:
+                    for (t_idx, cur_target) in enumerate(cur_max_weight_target_set.living_targets):
+                        if cur_target.id_ in duplicate_ids or cur_target.id_ in target_associations:
+                            cur_target = cur_max_weight_target_set.writable_target(t_idx)
                         if cur_target.id_ in duplicate_ids:
                             cur_target.id_ = duplicate_ids[cur_target.id_]                      
                         if cur_target.id_ in target_associations:
@@ -2315,6 +2759,8 @@ def run_rbpf_on_targetset(target_sets, online_results_filename, params, fw_spec)
 ##########                            if cur_target.id_ in target_associations:
 ##########                                cur_target.id_ = target_associations[cur_target.id_]
 ###########                    elif time_instance_index >= SPEC['ONLINE_DELAY']:
+                    #match_target_ids and the loop below rewrite ids of the snapshots in the queue
+                    cur_max_weight_target_set.make_snapshot_queue_private()
                     (target_associations, duplicate_ids) = match_target_ids(cur_max_weight_target_set.living_targets_q[0][1],\
                                                            prv_max_weight_particle.targets.living_targets_q[0][1])
                     #replace associated target IDs with the IDs from the previous maximum importance weight
@@ -2325,7 +2771,9 @@ def run_rbpf_on_targetset(target_sets, online_results_filename, params, fw_spec)
                                 cur_target.id_ = duplicate_ids[cur_target.id_]
                             if cur_target.id_ in target_associations:
                                 cur_target.id_ = target_associations[cur_target.id_]
-                    for cur_target in cur_max_weight_target_set.living_targets:
+                    for (t_idx, cur_target) in enumerate(cur_max_weight_target_set.living_targets):
+                        if cur_target.id_ in duplicate_ids or cur_target.id_ in target_associations:
+                            cur_target = cur_max_weight_target_set.writable_target(t_idx)
                         if cur_target.id_ in duplicate_ids:
                             cur_target.id_ = duplicate_ids[cur_target.id_]                      
                         if cur_target.id_ in target_associations:
@@ -2348,11 +2796,7 @@ def run_rbpf_on_targetset(target_sets, online_results_filename, params, fw_spec)
 
 
             print "popped on time_instance_index", time_instance_index
-            for particle in particle_set:
-                particle.targets.living_targets_q.popleft()
-
-            for particle in particle_set:
-                particle.targets.living_targets_q.append((time_instance_index, copy.deepcopy(particle.targets.living_targets)))
+            snapshot_store.push_frame(time_instance_index, particle_set)
         
         #Using modified_SIS_MHT_gumbel, sampling with replacement, importance weights may vary but DON'T resample because sampling
         #was done without replacement
@@ -2362,6 +2806,10 @@ def run_rbpf_on_targetset(target_sets, online_results_filename, params, fw_spec)
             perform_resampling(particle_set)
             print "resampled on iter: ", iter
             number_resamplings += 1
+
+        if USE_ANCESTRY_MANAGER:
+            ancestry_manager.prune(particle_set, time_instance_index)
+
         prev_time_stamp = time_stamp
 
         iter+=1
@@ -2398,11 +2846,29 @@ def run_rbpf_on_targetset(target_sets, online_results_filename, params, fw_spec)
     print "Using the max_weight importance weight we would have made mistakes on", incorrect_max_weight_particle_count,\
         "out of", number_time_instances, "time instances"
 
+    if SPEC['use_general_num_dets']:
+        CACHED_LIKELIHOODS = params.assoc_likelihood_cache.hits
+        NOT_CACHED_LIKELIHOODS = params.assoc_likelihood_cache.misses
+        print params.assoc_likelihood_cache.report()
+
+    if HYPOTHESIS_MASS_FRACTION is not None and len(params.captured_hypothesis_mass) > 0:
+        print "mean number of hypotheses:", np.mean([hypothesis_count for (time_stamp, hypothesis_count, captured_mass) in params.captured_hypothesis_mass]),\
+            "smallest captured probability mass:", min([captured_mass for (time_stamp, hypothesis_count, captured_mass) in params.captured_hypothesis_mass])
+
 
     return (max_weight_target_set, run_info, number_resamplings, incorrect_max_weight_particle_count, number_time_instances, invalid_low_prob_sample_count)
 
 
 
+def get_states_by_time(target):
+    '''
+    Outputs:
+    - states_by_time: dictionary with key: time stamp, value: the target's state (x, width, height)
+        at that time, built once per target instead of searching target.all_time_stamps every frame
+    '''
+    #reversed so the first state with a given time stamp is kept, like list.index
+    return dict(zip(reversed(target.all_time_stamps), reversed(target.all_states)))
+
 def convert_to_clearmetrics_dictionary(target_set, all_time_stamps):
     """
     Convert the locations of a TargetSet to clearmetrics dictionary format
@@ -2415,15 +2881,16 @@ def convert_to_clearmetrics_dictionary(target_set, all_time_stamps):
     """
     target_dict = {}
     for target in target_set.all_targets:
+        states_by_time = get_states_by_time(target)
         for t in all_time_stamps:
             if target == target_set.all_targets[0]: #this is the first target
-                if t in target.all_time_stamps: #target exists at this time
-                    target_dict[t] = [target.all_states[target.all_time_stamps.index(t)]]
+                if t in states_by_time: #target exists at this time
+                    target_dict[t] = [states_by_time[t]]
                 else: #target doesn't exit at this time
                     target_dict[t] = [None]
             else: #this isn't the first target
-                if t in target.all_time_stamps: #target exists at this time
-                    target_dict[t].append(target.all_states[target.all_time_stamps.index(t)])
+                if t in states_by_time: #target exists at this time
+                    target_dict[t].append(states_by_time[t])
                 else: #target doesn't exit at this time
                     target_dict[t].append(None)
     return target_dict
@@ -2485,25 +2952,9 @@ def boxoverlap(a,b):
         Copied from  KITTI devkit_tracking/python/evaluate_tracking.py
 
         boxoverlap computes intersection over union for bbox a and b in KITTI format.
-        If the criterion is 'union', overlap = (a inter b) / a union b).
-        If the criterion is 'a', overlap = (a inter b) / a, where b should be a dontcare area.
+        Single pair version of box_geometry.iou_matrix, use it directly for many pairs
     """
-    x1 = max(a.x1, b.x1)
-    y1 = max(a.y1, b.y1)
-    x2 = min(a.x2, b.x2)
-    y2 = min(a.y2, b.y2)
-    
-    w = x2-x1
-    h = y2-y1
-
-    if w<=0. or h<=0.:
-        return 0.
-    inter = w*h
-    aarea = (a.x2-a.x1) * (a.y2-a.y1)
-    barea = (b.x2-b.x1) * (b.y2-b.y1)
-    # intersection over union overlap
-    o = inter / float(aarea+barea-inter)
-    return o
+    return iou_matrix(object_corners([a]), object_corners([b]))[0, 0]
 
 def convert_targets(input_targets):
     kitti_format_targets = []
@@ -2521,13 +2972,15 @@ def convert_targets(input_targets):
         kitti_format_targets.append(KittiTarget(left, right, top, bottom))
     return kitti_format_targets
 
-def match_target_ids(particle1_targets, particle2_targets):
+def match_target_ids(particle1_targets, particle2_targets, particle1_target_set=None):
     """
     Use the same association as in  KITTI devkit_tracking/python/evaluate_tracking.py
 
     Inputs:
     - particle1_targets: a list of targets from particle1
     - particle2_targets: a list of targets from particle2
+    - particle1_target_set: the TargetSet whose living_targets are particle1_targets, if given
+        duplicate ids are replaced through TargetSet.writable_target (needed with USE_COPY_ON_WRITE)
 
     Output:
     - associations: a dictionary of associations between targets in particle1 and particle2.  
@@ -2544,20 +2997,22 @@ def match_target_ids(particle1_targets, particle2_targets):
     p2_target_ids = []
     for cur_t2 in particle2_targets:
         p2_target_ids.append(cur_t2.id_)
-    for cur_t1 in particle1_targets:
+    for (t1_idx, cur_t1) in enumerate(particle1_targets):
         if cur_t1.id_ in p2_target_ids:
+            if particle1_target_set is not None:
+                cur_t1 = particle1_target_set.writable_target(t1_idx)
             duplicate_ids[cur_t1.id_] = NEXT_TARGET_ID
             cur_t1.id_ = NEXT_TARGET_ID
             NEXT_TARGET_ID += 1
 
-    hm = Munkres()
     max_cost = 1e9
     cost_matrix = []
-    for cur_t1 in kitti_targets1:
+    overlaps = iou_matrix(object_corners(kitti_targets1), object_corners(kitti_targets2))
+    for t1_idx in range(len(kitti_targets1)):
         cost_row = []
-        for cur_t2 in kitti_targets2:
+        for t2_idx in range(len(kitti_targets2)):
             # overlap == 1 is cost ==0
-            c = 1-boxoverlap(cur_t1,cur_t2)
+            c = 1-overlaps[t1_idx, t2_idx]
             # gating for boxoverlap
             if c<=.5:
                 cost_row.append(c)
@@ -2569,7 +3024,7 @@ def match_target_ids(particle1_targets, particle2_targets):
         cost_matrix=[[]]
 
     # associate
-    association_matrix = hm.compute(cost_matrix)
+    association_matrix = linear_assignment(cost_matrix, 'auto', 'match_target_ids')
     associations = {}
     for row,col in association_matrix:
         c = cost_matrix[row][col]
@@ -6,7 +6,6 @@ from numpy.linalg import inv
 import numpy.linalg
 import random
 from sets import ImmutableSet
-from munkres import Munkres
 from collections import defaultdict
 from itertools import combinations
 from itertools import permutations
@@ -18,11 +17,36 @@ import math
 from cluster_config import RBPF_HOME_DIRECTORY
 sys.path.insert(0, "%sgeneral_tracking" % RBPF_HOME_DIRECTORY)
 from global_params import INFEASIBLE_COST
+from likelihood_cache import AssocLikelihoodCache, target_fingerprint, detection_group_key
+from box_geometry import overlap_matrix, center_iou_matrix, centers_to_corners
+from detection_grouping import detection_boxes, detection_groups_from_meas_groups, group_detections_by_source, tie_broken_grouping_costs
+from spatial_gating import SpatialGate, MeasurementGrid
+from sparse_association import SparseAssociationMatrix, sparse_association_matrix_from_dense
+from incremental_assignment import solve_assignment
+from assignment_solvers import linear_assignment
 
 
 #if we have prior of 0, return PRIOR_EPSILON
 PRIOR_EPSILON = .000000001
 
+#If True, only (detection group, target) pairs that pass a Mahalanobis gate are evaluated by
+#construct_log_probs_matrix3, associate_measurements_sequentially and the min cost proposal
+#(see spatial_gating.py), every other pair is treated as having association likelihood 0
+USE_SPATIAL_GATING = False
+#gate on the squared Mahalanobis distance between a detection group's combined position and a
+#target's position, P(chi-squared with 2 degrees of freedom > 25) is about 3.7e-6
+SPATIAL_GATE = 25.0
+#side length in pixels of the grid cells indexing detection group positions
+SPATIAL_GRID_CELL_SIZE = 100.0
+#If True, the min cost proposals solve min_cost_measGrp_target_assoc with solve_assignment (see
+#incremental_assignment.py) warm started from the dual variables of the particle's targets on the
+#previous time instance (see Particle.assignment_warm_start in rbpf.py) instead of with Munkres
+USE_WARM_START_ASSIGNMENT = False
+#If True, group_detections and build_measurement_frame group detections with the vectorized
+#DetectionGroups (see detection_grouping.py) instead of group_detections_munkres.  Both break ties
+#between equal cost assignments with tie_broken_grouping_costs, so they form the same groups
+USE_VECTORIZED_DETECTION_GROUPING = True
+
 class Parameters:
     def __init__(self, det_names, target_groupEmission_priors, clutter_grpCountByFrame_priors,\
                  clutter_group_priors, clutter_lambdas_by_group, birth_count_priors, birth_lambdas_by_group, posOnly_covariance_blocks, \
@@ -98,6 +122,16 @@ class Parameters:
 
         self.SPEC = SPEC
 
+        #per detection group type constants, computed on first use by get_group_type_constants
+        self.group_type_constants = {}
+
+        #association likelihoods shared by every particle and proposal, cleared every time instance
+        self.assoc_likelihood_cache = AssocLikelihoodCache()
+
+        #(time stamp, number of hypotheses, lower bound on the fraction of probability mass they carry) of
+        #every time instance enumerated with rbpf.HYPOTHESIS_MASS_FRACTION
+        self.captured_hypothesis_mass = []
+
         #training_counts model means we count the number of frames we observe i births (or clutters)
         #and divide by the total number of frames to get the probability of i births.
         #poisson means we fit (MLE) this data to a poisson distribution
@@ -197,46 +231,60 @@ def boxoverlap(a,b,criterion="union"):
         boxoverlap computes intersection over union for bbox a and b in KITTI format.
         If the criterion is 'union', overlap = (a inter b) / a union b).
         If the criterion is 'a', overlap = (a inter b) / a, where b should be a dontcare area.
+        Single pair version of box_geometry.overlap_matrix, use it directly for many pairs
         Inputs:
         - a: numpy array, [x_center, y_center, width, height] for detection a
         - b: numpy array, [x_center, y_center, width, height] for detection b
     """
-    a_x1 = a[0]-a[2]/2
-    a_x2 = a[0]+a[2]/2
-    a_y1 = a[1]-a[3]/2
-    a_y2 = a[1]+a[3]/2
-
-    b_x1 = b[0]-b[2]/2
-    b_x2 = b[0]+b[2]/2
-    b_y1 = b[1]-b[3]/2
-    b_y2 = b[1]+b[3]/2
-
-    x1 = max(a_x1, b_x1)
-    y1 = max(a_y1, b_y1)
-    x2 = min(a_x2, b_x2)
-    y2 = min(a_y2, b_y2)
-    
-    w = x2-x1
-    h = y2-y1
-
-    if w<=0. or h<=0.:
-        return 0.
-    inter = w*h
-    aarea = (a_x2-a_x1) * (a_y2-a_y1)
-    barea = (b_x2-b_x1) * (b_y2-b_y1)
-    # intersection over union overlap
-    if criterion.lower()=="union":
-        o = inter / float(aarea+barea-inter)
-    elif criterion.lower()=="a":
-        o = float(inter) / float(aarea)
-    else:
-        raise TypeError("Unkown type for criterion")
-    return o
+    corners = centers_to_corners(np.array([a, b], dtype=float))
+    return overlap_matrix(corners[0:1], corners[1:2], criterion)[0, 0]
+
 
+def detection_grouping_max_cost(det_name, params):
+    '''
+    Outputs:
+    - max_cost: a detection from det_name can only join a detection group if min(1 - boxoverlap) with
+        the group's detections is <= max_cost
+    '''
+    return params.SPEC['coord_ascent_params']['det_grouping_min_overlap_%s' % det_name][0]
 
 def group_detections(meas_groups, det_name, detection_locations, det_widths, det_heights, params):
     """
-    Take a list of detections and try to associate them with detection groups from other measurement sources
+    Take a list of detections and try to associate them with detection groups from other measurement sources,
+    with group_detections_munkres or with its vectorized version (see detection_grouping.py) if
+    USE_VECTORIZED_DETECTION_GROUPING
+    Inputs:
+    - meas_groups: a list of detection groups, where each detection group is a dictionary of detections 
+        in the group, key='det_name', value=detection
+    - det_name: name of the detection source we are currently associating with current detection groups
+    - detection_locations: a list of detection positions (x, y) from det_name
+    - det_widths, det_heights: lists of the corresponding bounding box widths/heights
+
+    Outputs:
+    None, but meas_groups will be modified, with the new detections added (passed by reference)
+    """
+    if not USE_VECTORIZED_DETECTION_GROUPING:
+        group_detections_munkres(meas_groups, det_name, detection_locations, det_widths, det_heights, params)
+        return
+
+    detection_groups = detection_groups_from_meas_groups(meas_groups)
+    boxes = detection_boxes(detection_locations, det_widths, det_heights)
+    detection_groups.add_source(det_name, boxes, detection_grouping_max_cost(det_name, params))
+
+    new_group_indices = detection_groups.group_indices[len(detection_groups.group_indices) - len(boxes):]
+    for (box, group_idx) in zip(boxes, new_group_indices):
+        if group_idx < len(meas_groups):
+            meas_groups[group_idx][det_name] = box
+        else:
+            #new groups are numbered in detection order
+            assert(group_idx == len(meas_groups))
+            meas_groups.append({det_name: box})
+
+def group_detections_munkres(meas_groups, det_name, detection_locations, det_widths, det_heights, params):
+    """
+    Take a list of detections and try to associate them with detection groups from other measurement sources,
+    reference implementation of group_detections that loops over every detection and group (it used to
+    be solved with munkres, the name is kept)
     Inputs:
     - meas_groups: a list of detection groups, where each detection group is a dictionary of detections 
         in the group, key='det_name', value=detection
@@ -249,7 +297,6 @@ def group_detections(meas_groups, det_name, detection_locations, det_widths, det
     None, but meas_groups will be modified, with the new detections added (passed by reference)
     """
 
-    hm = Munkres()
     max_cost = 1e9
 
     # use hungarian method to associate, using boxoverlap 0..1 as cost
@@ -282,8 +329,8 @@ def group_detections(meas_groups, det_name, detection_locations, det_widths, det
     
     if len(detections) is 0:
         cost_matrix=[[]]
-    # associate
-    association_matrix = hm.compute(cost_matrix)
+    # associate, breaking ties like DetectionGroups.add_source
+    association_matrix = linear_assignment(tie_broken_grouping_costs(np.array(cost_matrix, dtype=float)), 'auto', 'group_detections_munkres')
 
     associated_detection_indices = []
     check_det_count = 0
@@ -318,7 +365,7 @@ def group_detections(meas_groups, det_name, detection_locations, det_widths, det
 
 
 def sample_and_reweight(particle, measurement_lists, widths, heights, det_names, \
-    cur_time, measurement_scores, params):
+    cur_time, measurement_scores, params, meas_frame=None):
     """
     Input:
     - particle: type Particle, we will perform sampling and importance reweighting on this particle
@@ -329,6 +376,8 @@ def sample_and_reweight(particle, measurement_lists, widths, heights, det_names,
     - measurement_scores: a list where measurement_scores[i] is a list containing scores for every measurement in
         measurement_list[i]
     - params: type Parameters, gives prior probabilities and other parameters we are using
+    - meas_frame: (optional) type MeasurementFrame, the output of build_measurement_frame for this time
+        instance's measurements, shared by all particles (built here if None)
 
     Output:
     - measurement_associations: A list where measurement_associations[i] is a list of association values
@@ -352,20 +401,18 @@ def sample_and_reweight(particle, measurement_lists, widths, heights, det_names,
         p_target_deaths.append(target.death_prob)
         assert(p_target_deaths[len(p_target_deaths) - 1] >= 0 and p_target_deaths[len(p_target_deaths) - 1] <= 1)
 
+    if meas_frame is None:
+        meas_frame = build_measurement_frame(measurement_lists, widths, heights, det_names, params)
     # a list containing the number of measurements detected by each source
     # used in prior calculation to count the number of ordered vectors given
     # an unordered association set
-    meas_counts_by_source = [] 
-    for meas_list in measurement_lists:
-        meas_counts_by_source.append(len(meas_list))
-
-    meas_groups = []
-    for det_idx, det_name in enumerate(det_names):
-        group_detections(meas_groups, det_name, measurement_lists[det_idx], widths[det_idx], heights[det_idx], params)
+    meas_counts_by_source = meas_frame.meas_counts_by_source
+    meas_groups = meas_frame.meas_groups
 
     (targets_to_kill, meas_grp_associations, meas_grp_means, meas_grp_covs, proposal_probability, 
         unassociated_target_death_probs) =  sample_grouped_meas_assoc_and_death(particle, 
-        meas_groups, particle.targets.living_count, p_target_deaths, cur_time, measurement_scores, params, meas_counts_by_source)
+        meas_groups, particle.targets.living_count, p_target_deaths, cur_time, measurement_scores, params, meas_counts_by_source,
+        meas_frame)
 
 
 
@@ -425,7 +472,7 @@ def sample_and_reweight(particle, measurement_lists, widths, heights, det_names,
     return (meas_grp_associations, meas_grp_means, meas_grp_covs, targets_to_kill, imprt_re_weight, log_exact_probability, proposal_probability)
 
 def sample_grouped_meas_assoc_and_death(particle, meas_groups, total_target_count, 
-    p_target_deaths, cur_time, measurement_scores, params, meas_counts_by_source=None):
+    p_target_deaths, cur_time, measurement_scores, params, meas_counts_by_source=None, meas_frame=None):
     """
     Try sampling associations with each measurement sequentially
     Input:
@@ -439,6 +486,7 @@ def sample_grouped_meas_assoc_and_death(particle, meas_groups, total_target_coun
         p_target_deaths[i] = the probability that target i has died between the last
         time instance and the current time instance
     - params: type Parameters, gives prior probabilities and other parameters we are using
+    - meas_frame: (optional) type MeasurementFrame of meas_groups
 
     Output:
     - targets_to_kill: a list of targets that have been sampled to die (not killed yet)
@@ -469,7 +517,7 @@ def sample_grouped_meas_assoc_and_death(particle, meas_groups, total_target_coun
     if params.SPEC['proposal_distr'] == 'traditional_SIR_gumbel':
         (meas_grp_associations, meas_grp_means, meas_grp_covs, proposal_probability, targets_to_kill) = \
             associate_meas_gumbel_exact(particle, meas_groups, total_target_count, p_target_deaths, params,\
-            meas_counts_by_source)
+            meas_counts_by_source, meas_frame)
 #            associate_meas_gumbel_exact(particle, meas_groups, total_target_count, p_target_deaths, params)        
 
         unassociated_target_death_probs = []
@@ -489,23 +537,23 @@ def sample_grouped_meas_assoc_and_death(particle, meas_groups, total_target_coun
         if params.SPEC['proposal_distr'] == 'sequential':
             (meas_grp_associations, meas_grp_means, meas_grp_covs, proposal_probability) = \
             associate_measurements_sequentially(particle, meas_groups, total_target_count, \
-            p_target_deaths, params)
+            p_target_deaths, params, meas_frame)
 
         elif params.SPEC['proposal_distr'] == 'min_cost':
             (meas_grp_associations, meas_grp_means, meas_grp_covs, proposal_probability) = \
             associate_meas_min_cost(particle, meas_groups, total_target_count, \
-            p_target_deaths, params)
+            p_target_deaths, params, meas_frame)
 
         elif params.SPEC['proposal_distr'] == 'min_cost_corrected':
             (meas_grp_associations, meas_grp_means, meas_grp_covs, proposal_probability) = \
             associate_meas_min_cost_corrected(particle, meas_groups, total_target_count, \
-            p_target_deaths, params)        
+            p_target_deaths, params, meas_frame)
 
         else: 
             assert(params.SPEC['proposal_distr'] == 'optimal')
             (meas_grp_associations, meas_grp_means, meas_grp_covs, proposal_probability) = \
             associate_meas_optimal(particle, meas_groups, total_target_count, \
-            p_target_deaths, params, meas_counts_by_source)
+            p_target_deaths, params, meas_counts_by_source, meas_frame)
 
 
     ############################################################################################################
@@ -543,12 +591,59 @@ def sample_grouped_meas_assoc_and_death(particle, meas_groups, total_target_coun
 
 
 
-def min_cost_measGrp_target_assoc(meas_grp_means4D, target_pos4D, params, max_assoc_cost):
+def gated_min_cost_matrix(meas_grp_means4D, target_pos4D, params, max_assoc_cost, meas_grid, max_cost):
+    """
+    The cost matrix of min_cost_measGrp_target_assoc, only evaluating the costs of (measurement group, target)
+    pairs that meas_grid finds near each other.  With the distance metric pairs further apart than
+    max_assoc_cost are gated out, with the box overlap metric (max_assoc_cost < 1) pairs whose boxes
+    can't overlap are gated out.
+    Inputs:
+    - meas_grid: type MeasurementGrid over the (x, y) positions of meas_grp_means4D
+    - max_cost: cost of gated out pairs
+
+    Outputs:
+    - cost_matrix: list of lists, same values as the cost matrix built by min_cost_measGrp_target_assoc
+    """
+    metric = params.SPEC['targ_meas_assoc_metric']
+    assert(metric == 'distance' or (metric == 'box_overlap' and max_assoc_cost < 1))
+    cost_matrix = [[max_cost]*len(target_pos4D) for det_idx in range(len(meas_grp_means4D))]
+    if len(meas_grp_means4D) == 0:
+        return cost_matrix
+    meas_boxes = np.array(meas_grp_means4D, dtype=float).reshape((-1, 4))
+    max_width = np.max(meas_boxes[:, 2])
+    max_height = np.max(meas_boxes[:, 3])
+    for (target_idx, cur_target) in enumerate(target_pos4D):
+        if metric == 'distance':
+            radius = max_assoc_cost
+        else:
+            #boxes can only overlap if their centers are closer than half the sum of their widths in x
+            #and half the sum of their heights in y
+            radius = math.sqrt(((max_width + cur_target[2])/2)**2 + ((max_height + cur_target[3])/2)**2)
+        candidates = meas_grid.query(cur_target[0:2], radius)
+        if metric == 'box_overlap' and len(candidates) > 0:
+            candidate_costs = 1 - center_iou_matrix(meas_boxes[candidates], np.array([cur_target], dtype=float).reshape((1, 4)))[:, 0]
+        for (candidate_idx, det_idx) in enumerate(candidates):
+            if metric == 'box_overlap':
+                c = candidate_costs[candidate_idx]
+            else:
+                c = l2_dist(meas_grp_means4D[det_idx], cur_target)
+            # gating
+            if c<=max_assoc_cost:
+                cost_matrix[det_idx][target_idx] = c
+    return cost_matrix
+
+def min_cost_measGrp_target_assoc(meas_grp_means4D, target_pos4D, params, max_assoc_cost, meas_grid=None, target_potentials=None):
     """
     Take a list of detections and try to associate them with detection groups from other measurement sources
     Inputs:
     - meas_grp_means4D: list of numpy arrays of combined measurment group x,y,width,height
     - target_pos4D: list of numpy arrays of target positions x,y,width,height
+    - meas_grid: (optional) type MeasurementGrid over the (x, y) positions of meas_grp_means4D,
+        if given only costs of nearby pairs are evaluated (gated_min_cost_matrix)
+    - target_potentials: (optional) numpy array with shape (len(target_pos4D),), if given the
+        association is solved with solve_assignment warm started from these dual variables of the
+        target columns (e.g. from the previous time instance) instead of with Munkres, and they are
+        overwritten with the dual variables of this solve
 
     Outputs:
     - measurement_assoc: list of length=len(meas_grp_means4D).  measurement_assoc[i] = j means
@@ -556,7 +651,6 @@ def min_cost_measGrp_target_assoc(meas_grp_means4D, target_pos4D, params, max_as
         measurement is not associated with any living target.
     """
 
-    hm = Munkres()
     max_cost = 1e9
 
     # use hungarian method to associate, using boxoverlap 0..1 as cost
@@ -564,25 +658,36 @@ def min_cost_measGrp_target_assoc(meas_grp_means4D, target_pos4D, params, max_as
     cost_matrix = []
     this_ids = [[],[]]
 
-    for cur_detection in meas_grp_means4D:
-        cost_row = []
-        for cur_target in target_pos4D:
-            if params.SPEC['targ_meas_assoc_metric'] == 'box_overlap':
-                c = 1-boxoverlap(cur_detection, cur_target)
-            else:
-                assert(params.SPEC['targ_meas_assoc_metric'] == 'distance')
-                c = l2_dist(cur_detection, cur_target)
-            # gating for boxoverlap
-            if c<=max_assoc_cost:
-                cost_row.append(c)
-            else:
-                cost_row.append(max_cost)
-        cost_matrix.append(cost_row)
+    if meas_grid is not None and len(meas_grp_means4D) > 0 and len(target_pos4D) > 0 and \
+        (params.SPEC['targ_meas_assoc_metric'] == 'distance' or max_assoc_cost < 1):
+        cost_matrix = gated_min_cost_matrix(meas_grp_means4D, target_pos4D, params, max_assoc_cost, meas_grid, max_cost)
+    else:
+        if params.SPEC['targ_meas_assoc_metric'] == 'box_overlap' and len(meas_grp_means4D) > 0 and len(target_pos4D) > 0:
+            box_overlap_costs = 1 - center_iou_matrix(np.array(meas_grp_means4D, dtype=float).reshape((-1, 4)),
+                                                      np.array(target_pos4D, dtype=float).reshape((-1, 4)))
+        for (det_idx, cur_detection) in enumerate(meas_grp_means4D):
+            cost_row = []
+            for (target_idx, cur_target) in enumerate(target_pos4D):
+                if params.SPEC['targ_meas_assoc_metric'] == 'box_overlap':
+                    c = box_overlap_costs[det_idx, target_idx]
+                else:
+                    assert(params.SPEC['targ_meas_assoc_metric'] == 'distance')
+                    c = l2_dist(cur_detection, cur_target)
+                # gating for boxoverlap
+                if c<=max_assoc_cost:
+                    cost_row.append(c)
+                else:
+                    cost_row.append(max_cost)
+            cost_matrix.append(cost_row)
     
     if len(meas_grp_means4D) is 0:
         cost_matrix=[[]]
     # associate
-    association_matrix = hm.compute(cost_matrix)
+    if target_potentials is not None:
+        association_matrix = warm_start_min_cost_assoc(cost_matrix, len(meas_grp_means4D), len(target_pos4D),
+                                                       max_cost, target_potentials)
+    else:
+        association_matrix = linear_assignment(cost_matrix, 'auto', 'min_cost_measGrp_target_assoc')
 
     measurement_assoc = [-1 for i in range(len(meas_grp_means4D))]
     for row,col in association_matrix:
@@ -601,7 +706,33 @@ def min_cost_measGrp_target_assoc(meas_grp_means4D, target_pos4D, params, max_as
 
     return measurement_assoc
 
-def associate_meas_optimal(particle, meas_groups, total_target_count, p_target_deaths, params, meas_counts_by_source):
+def warm_start_min_cost_assoc(cost_matrix, M, T, max_cost, target_potentials):
+    '''
+    Solve the min cost association of min_cost_measGrp_target_assoc with solve_assignment.  Every
+    measurement also gets a column of cost max_cost, the cost of gated out pairs, so rows can stay
+    unassociated: like Munkres on the M x T matrix this maximizes the number of pairs that pass the gate
+    and then minimizes their cost.
+
+    Inputs:
+    - cost_matrix: list of lists or numpy array with shape (M, T) of costs
+    - M: number of measurement groups
+    - T: number of targets
+    - max_cost: cost of gated out pairs
+    - target_potentials: numpy array with shape (T,), dual variables of the target columns to warm
+        start from, overwritten with the dual variables of this solve
+
+    Outputs:
+    - association_list: list of (measurement group, target) pairs
+    '''
+    if M == 0 or T == 0:
+        return []
+    costs = max_cost*np.ones((M, T + M))
+    costs[:, :T] = np.asarray(cost_matrix, dtype=float).reshape((M, T))
+    state = solve_assignment(costs, target_potentials)
+    target_potentials[:] = state.v[:T]
+    return [(row, col) for (row, col) in enumerate(state.col4row[:M].tolist()) if col < T]
+
+def associate_meas_optimal(particle, meas_groups, total_target_count, p_target_deaths, params, meas_counts_by_source, meas_frame=None):
     '''
     Sample measurement associations from the optimal proposal distribution p(c_k | e_{1-k-1}, c_{1:k-1}, y_{1:k}).
     Generally computationally intractable.
@@ -685,18 +816,9 @@ def associate_meas_optimal(particle, meas_groups, total_target_count, p_target_d
                                             p=proposal_distribution)
 
 ############ THIS DOESN"T REALLY BELONG HERE, BUT FOLLOWING RETURN VALUES FOR OTHER PROPOSAL DISTRIBUTIONS ############
-    #list of detection group centers, meas_grp_means[i] is a 2-d numpy array
+    #list of detection group centers, meas_grp_means2D[i] is a 2-d numpy array
     #of the position of meas_groups[i]
-    meas_grp_covs = []   
-    meas_grp_means2D = []
-    meas_grp_means4D = []
-    for (index, detection_group) in enumerate(meas_groups):
-        (combined_meas_mean, combined_covariance) = combine_arbitrary_number_measurements_4d(params.posAndSize_inv_covariance_blocks, 
-                            params.meas_noise_mean, detection_group)
-        combined_meas_pos = combined_meas_mean[0:2]
-        meas_grp_means2D.append(combined_meas_pos)
-        meas_grp_means4D.append(combined_meas_mean)
-        meas_grp_covs.append(combined_covariance)
+    (meas_grp_means2D, meas_grp_means4D, meas_grp_covs) = combine_meas_groups(meas_groups, params, meas_frame)
 ############ END THIS DOESN"T REALLY BELONG HERE, BUT FOLLOWING RETURN VALUES FOR OTHER PROPOSAL DISTRIBUTIONS ############
 
 #UNCOMMENT ME WHEN DONE DEBUGGING GUMBEL TO WORK WITH OTHER STUFF
@@ -769,7 +891,7 @@ def solve_gumbel_perturbed_assignment(log_probs, ubc_count):
     return(assignment, max_log_prob)
 
 
-def associate_meas_gumbel(particle, meas_groups, total_target_count, p_target_deaths, params):
+def associate_meas_gumbel(particle, meas_groups, total_target_count, p_target_deaths, params, meas_frame=None):
     '''
     Sample measurement associations from close to the optimal proposal distribution p(c_k | e_{1-k-1}, c_{1:k-1}, y_{1:k})
     using an approximation to the Gumbel max trick
@@ -823,18 +945,9 @@ def associate_meas_gumbel(particle, meas_groups, total_target_count, p_target_de
 
     proposal_probability = unnormalized_proposal_probability/partition_estimate
 ############ THIS DOESN"T REALLY BELONG HERE, BUT FOLLOWING RETURN VALUES FOR OTHER PROPOSAL DISTRIBUTIONS ############
-    #list of detection group centers, meas_grp_means[i] is a 2-d numpy array
+    #list of detection group centers, meas_grp_means2D[i] is a 2-d numpy array
     #of the position of meas_groups[i]
-    meas_grp_covs = []   
-    meas_grp_means2D = []
-    meas_grp_means4D = []
-    for (index, detection_group) in enumerate(meas_groups):
-        (combined_meas_mean, combined_covariance) = combine_arbitrary_number_measurements_4d(params.posAndSize_inv_covariance_blocks, 
-                            params.meas_noise_mean, detection_group)
-        combined_meas_pos = combined_meas_mean[0:2]
-        meas_grp_means2D.append(combined_meas_pos)
-        meas_grp_means4D.append(combined_meas_mean)
-        meas_grp_covs.append(combined_covariance)
+    (meas_grp_means2D, meas_grp_means4D, meas_grp_covs) = combine_meas_groups(meas_groups, params, meas_frame)
 ############ END THIS DOESN"T REALLY BELONG HERE, BUT FOLLOWING RETURN VALUES FOR OTHER PROPOSAL DISTRIBUTIONS ############
 
 
@@ -1157,11 +1270,590 @@ def solve_gumbel_perturbed_assignment2(log_probs, M, T):
 
 
 
-def construct_log_probs_matrix3(particle, meas_groups, total_target_count, p_target_deaths, params):
+def get_group_type_constants(params, dets_present):
+    '''
+    Inputs:
+    - params: type Parameters
+    - dets_present: sorted tuple of detection names in a detection group (tuples hash much
+        faster than ImmutableSets, so they are used as the cache key)
+
+    Outputs:
+    - constants: dictionary of quantities that only depend on the detection sources in a group,
+        cached in params.group_type_constants:
+        - 'dets_present': dets_present
+        - 'emission_prior': params.target_groupEmission_priors of the group
+        - 'birth_lambda', 'clutter_lambda': params.birth_lambdas_by_group/clutter_lambdas_by_group
+            of the group, 0 if we never saw the group in our training data
+        - 'det_covariance': (2n x 2n) block covariance D between the detection sources
+        - 'det_covariance_inv', 'det_covariance_det': inverse and determinant of D
+        - 'U_Dinv_U': (2 x 2) U^T D^-1 U with U = [I; I; ...; I], the sum of the 2x2 blocks of D^-1
+        - 'birth', 'clutter': (cov_invs, inv_sum_cInv, normalization) terms of birth_clutter_likelihood,
+            None for groups with a single detection
+    '''
+    if dets_present in params.group_type_constants:
+        return params.group_type_constants[dets_present]
+
+    meas_group_type = ImmutableSet(dets_present)
+    n = len(dets_present)
+    det_covariance = np.zeros((2*n, 2*n))
+    for idx1, det_name1 in enumerate(dets_present):
+        for idx2, det_name2 in enumerate(dets_present):
+            det_covariance[idx1*2:(idx1+1)*2,idx2*2:(idx2+1)*2] = params.posOnly_covariance_blocks[(det_name1, det_name2)]
+    constants = {'dets_present': dets_present,
+                 'emission_prior': params.target_groupEmission_priors[meas_group_type],
+                 'birth_lambda': params.birth_lambdas_by_group.get(meas_group_type, 0),
+                 'clutter_lambda': params.clutter_lambdas_by_group.get(meas_group_type, 0),
+                 'det_covariance': det_covariance}
+    #terms of stacked_detection_likelihoods
+    det_covariance_inv = inv(det_covariance)
+    constants['det_covariance_inv'] = det_covariance_inv
+    constants['det_covariance_det'] = numpy.linalg.det(det_covariance)
+    constants['U_Dinv_U'] = det_covariance_inv.reshape((n, 2, n, 2)).sum(axis=(0, 2))
+
+    #number of dimensions in measurement space
+    d = params.posOnly_covariance_blocks[params.posOnly_covariance_blocks.keys()[0]].shape[0]
+    for likelihood_type in ['birth', 'clutter']:
+        if n == 1:
+            constants[likelihood_type] = None
+            continue
+        if likelihood_type == 'birth':
+            covariance_blocks = params.posOnly_covariance_blocks
+        else:
+            covariance_blocks = params.clutter_posOnly_covariance_blocks
+        #inverse measurement noise covariance of every detection source, shape (n,d,d)
+        cov_invs = np.array([inv(covariance_blocks[(det_name, det_name)]) for det_name in dets_present])
+        prod_of_determinants = np.prod(np.linalg.det(cov_invs))
+        sum_cInv = np.sum(cov_invs, axis=0)
+        determinant_of_sum = numpy.linalg.det(sum_cInv)
+        normalization = (2*math.pi)**(-.5*(n-1)*d)*math.sqrt(prod_of_determinants/determinant_of_sum)
+        constants[likelihood_type] = (cov_invs, inv(sum_cInv), normalization)
+
+    params.group_type_constants[dets_present] = constants
+    return constants
+
+def group_meas_groups_by_size(meas_groups, params):
+    '''
+    Inputs:
+    - meas_groups: a list of detection groups, where each detection group is a dictionary of detections 
+        in the group, key='det_name', value=detection
+    - params: type Parameters
+
+    Outputs:
+    - group_constants: list of length len(meas_groups), group_constants[i] is
+        get_group_type_constants for meas_groups[i]
+    - indices_by_size: dictionary with key: number of detections in a group, value: list of indices
+        of the detection groups with this many detections
+    '''
+    group_constants = [get_group_type_constants(params, tuple(sorted(meas_group.keys()))) for meas_group in meas_groups]
+    indices_by_size = defaultdict(list)
+    for (m_idx, meas_group) in enumerate(meas_groups):
+        indices_by_size[len(meas_group)].append(m_idx)
+    return (group_constants, indices_by_size)
+
+def stacked_detection_positions(meas_groups, m_indices, group_constants):
+    '''
+    Outputs:
+    - det_pos: numpy array with shape (len(m_indices), n, 2), positions of the detections in
+        meas_groups[m_indices], which must all contain n detections, in the order of
+        group_constants[m_idx]['dets_present']
+    '''
+    return np.array([[meas_groups[m_idx][det_name][0:2] for det_name in group_constants[m_idx]['dets_present']]
+                     for m_idx in m_indices])
+
+def target_meas_space_terms(targets, params):
+    '''
+    Inputs:
+    - targets: list of type Target
+    - params: type Parameters
+
+    Outputs:
+    - target_means: numpy array with shape (len(targets), 2), H*x of every target
+    - target_covs: numpy array with shape (len(targets), 2, 2), H*P*H^T of every target
+    '''
+    target_x = np.array([target.x for target in targets])
+    target_P = np.array([target.P for target in targets])
+    target_means = np.matmul(params.H, target_x)[:, :, 0]
+    target_covs = np.matmul(np.matmul(params.H, target_P), params.H.T)
+    return (target_means, target_covs)
+
+def detection_group_terms(meas_groups, grouped_types):
+    '''
+    Per detection group terms of stacked_detection_likelihoods.  A group with n detections has stacked
+    detection positions z (length 2n) and detection covariance D (2n x 2n, see get_group_type_constants).
+
+    Inputs:
+    - meas_groups: a list of detection groups
+    - grouped_types: output of group_meas_groups_by_size(meas_groups, params)
+
+    Outputs:
+    - group_terms: tuple of numpy arrays indexed by detection group (q, g, G, det_D, n) where
+        q[m] = z^T D^-1 z, g[m] = U^T D^-1 z (shape (M,2)), G[m] = U^T D^-1 U (shape (M,2,2)),
+        det_D[m] = det(D) and n[m] = number of detections, with U = [I; I; ...; I]
+    '''
+    (group_constants, indices_by_size) = grouped_types
+    M = len(meas_groups)
+    q = np.empty(M)
+    g = np.empty((M, 2))
+    G = np.empty((M, 2, 2))
+    det_D = np.empty(M)
+    n_dets = np.empty(M)
+    for (n, m_indices) in indices_by_size.iteritems():
+        z = stacked_detection_positions(meas_groups, m_indices, group_constants).reshape((len(m_indices), 2*n))
+        D_inv = np.array([group_constants[m_idx]['det_covariance_inv'] for m_idx in m_indices])
+        D_inv_z = np.einsum('mij,mj->mi', D_inv, z)
+        q[m_indices] = np.einsum('mi,mi->m', z, D_inv_z)
+        g[m_indices] = D_inv_z.reshape((len(m_indices), n, 2)).sum(axis=1)
+        G[m_indices] = [group_constants[m_idx]['U_Dinv_U'] for m_idx in m_indices]
+        det_D[m_indices] = [group_constants[m_idx]['det_covariance_det'] for m_idx in m_indices]
+        n_dets[m_indices] = n
+    return (q, g, G, det_D, n_dets)
+
+def stacked_detection_likelihoods(group_terms, target_means, target_covs):
+    '''
+    Likelihood of every detection group given every target.  The covariance of a group's stacked
+    detections given a target is C = D + U*S*U^T (every 2x2 block of D plus the target's covariance in
+    measurement space S, U = [I; I; ...; I]), so by the Woodbury identity and the matrix determinant lemma
+    with K = S^-1 + U^T D^-1 U (2 x 2):
+        (z - U*mu)^T C^-1 (z - U*mu) = (z - U*mu)^T D^-1 (z - U*mu) - v^T K^-1 v, v = U^T D^-1 (z - U*mu)
+        det(C) = det(D)*det(S)*det(K)
+    With D^-1 and det(D) precomputed per detection group type (get_group_type_constants) and z terms
+    per detection group (detection_group_terms), every (group, target) pair only needs closed form 2x2
+    algebra, whatever the number of detections in the group.
+
+    Inputs:
+    - group_terms: output of detection_group_terms
+    - target_means: numpy array with shape (T, 2), target means in measurement space
+    - target_covs: numpy array with shape (T, 2, 2), target covariances in measurement space
+
+    Outputs:
+    - likelihoods: numpy array with shape (M, T)
+    '''
+    (q, g, G, det_D, n_dets) = group_terms
+    return closed_form_detection_likelihoods(q[:, np.newaxis], g[:, np.newaxis, :], G[:, np.newaxis, :, :],
+        det_D[:, np.newaxis], n_dets[:, np.newaxis], target_means[np.newaxis, :, :], target_covs[np.newaxis, :, :])
+
+def paired_detection_likelihoods(group_terms, target_means, target_covs, meas_indices, target_indices):
+    '''
+    stacked_detection_likelihoods for the (detection group, target) pairs
+    (meas_indices[i], target_indices[i]) only
+
+    Outputs:
+    - likelihoods: numpy array with shape (len(meas_indices),)
+    '''
+    (q, g, G, det_D, n_dets) = group_terms
+    return closed_form_detection_likelihoods(q[meas_indices], g[meas_indices], G[meas_indices], det_D[meas_indices],
+        n_dets[meas_indices], target_means[target_indices], target_covs[target_indices])
+
+def closed_form_detection_likelihoods(q, g, G, det_D, n_dets, mu, S):
+    '''
+    The closed form likelihood of stacked_detection_likelihoods, all inputs broadcast against each other
+
+    Inputs:
+    - q, det_D, n_dets: numpy arrays with shape (...), detection group terms
+    - g: numpy array with shape (..., 2), detection group terms
+    - G: numpy array with shape (..., 2, 2), detection group terms
+    - mu: numpy array with shape (..., 2), target means in measurement space
+    - S: numpy array with shape (..., 2, 2), target covariances in measurement space
+
+    Outputs:
+    - likelihoods: numpy array with the broadcast shape (...)
+    '''
+    (S_det, complete_cov_det, exponent) = closed_form_likelihood_terms(q, g[..., 0], g[..., 1],
+        G[..., 0, 0], G[..., 0, 1], G[..., 1, 0], G[..., 1, 1], det_D, mu[..., 0], mu[..., 1],
+        S[..., 0, 0], S[..., 0, 1], S[..., 1, 0], S[..., 1, 1])
+    assert((S_det > 0).all()), S_det
+    assert((complete_cov_det > 0).all()), complete_cov_det
+    LIKELIHOOD_DISTR_NORM = 1.0/(np.sqrt(complete_cov_det)*(2*math.pi)**n_dets)
+    return LIKELIHOOD_DISTR_NORM*np.exp(-.5*exponent)
+
+def closed_form_likelihood_terms(q, g_0, g_1, G_00, G_01, G_10, G_11, det_D, mu_0, mu_1, S_00, S_01, S_10, S_11):
+    '''
+    The 2x2 algebra of stacked_detection_likelihoods written out per matrix entry, shared by
+    closed_form_detection_likelihoods (numpy arrays) and compute_assoc_likelihood (floats, a single
+    pair does not pay for numpy operations on tiny arrays)
+
+    Inputs: the entries of the inputs of closed_form_detection_likelihoods, e.g. G_01 = G[..., 0, 1]
+
+    Outputs:
+    - S_det: det(S)
+    - complete_cov_det: det(C) = det(D)*det(S)*det(K)
+    - exponent: (z - U*mu)^T C^-1 (z - U*mu)
+    '''
+    S_det = S_00*S_11 - S_01*S_10
+    #K = S^-1 + G
+    K_00 = S_11/S_det + G_00
+    K_01 = -S_01/S_det + G_01
+    K_10 = -S_10/S_det + G_10
+    K_11 = S_00/S_det + G_11
+    K_det = K_00*K_11 - K_01*K_10
+    G_mu_0 = G_00*mu_0 + G_01*mu_1
+    G_mu_1 = G_10*mu_0 + G_11*mu_1
+    v_0 = g_0 - G_mu_0
+    v_1 = g_1 - G_mu_1
+    #(z - U*mu)^T D^-1 (z - U*mu)
+    r_Dinv_r = q - 2*(g_0*mu_0 + g_1*mu_1) + mu_0*G_mu_0 + mu_1*G_mu_1
+    v_Kinv_v = (K_11*v_0**2 - (K_01 + K_10)*v_0*v_1 + K_00*v_1**2)/K_det
+    return (S_det, det_D*S_det*K_det, r_Dinv_r - v_Kinv_v)
+
+def detection_group_positions(group_terms):
+    '''
+    Inputs:
+    - group_terms: output of detection_group_terms
+
+    Outputs:
+    - group_means: numpy array with shape (M, 2), G^-1 g, the combined position of every detection group
+    - group_covs: numpy array with shape (M, 2, 2), G^-1, the covariance of the combined position
+    '''
+    (q, g, G, det_D, n_dets) = group_terms
+    G_det = G[:, 0, 0]*G[:, 1, 1] - G[:, 0, 1]*G[:, 1, 0]
+    group_covs = np.empty(G.shape)
+    group_covs[:, 0, 0] = G[:, 1, 1]/G_det
+    group_covs[:, 0, 1] = -G[:, 0, 1]/G_det
+    group_covs[:, 1, 0] = -G[:, 1, 0]/G_det
+    group_covs[:, 1, 1] = G[:, 0, 0]/G_det
+    group_means = np.einsum('mij,mj->mi', group_covs, g)
+    return (group_means, group_covs)
+
+def assoc_likelihood_matrix(particle, meas_groups, params, meas_frame=None):
+    '''
+    Compute memoized_assoc_likelihood for every detection group and living target at once.
+    Likelihoods found in params.assoc_likelihood_cache are reused, the rest are computed by
+    stacked_detection_likelihoods and added to the cache.
+    (Always uses the closed form Gaussian density, i.e. params.USE_PYTHON_GAUSSIAN == False)
+
+    Inputs:
+    - particle: type Particle
+    - meas_groups: a list of detection groups
+    - params: type Parameters
+    - meas_frame: (optional) type MeasurementFrame of meas_groups
+
+    Outputs:
+    - likelihoods: numpy array with shape (len(meas_groups), number of living targets),
+        likelihoods[m_idx, t_idx] == memoized_assoc_likelihood(particle, meas_groups[m_idx], t_idx, params)
+    '''
+    living_targets = particle.targets.living_targets
+    M = len(meas_groups)
+    T = len(living_targets)
+    if M == 0 or T == 0:
+        return np.zeros((M, T))
+    if meas_frame is None:
+        meas_frame = MeasurementFrame(meas_groups, params)
+
+    #look up cached likelihoods, only detection groups with a missing likelihood are computed below
+    cache = params.assoc_likelihood_cache
+    target_keys = [target_fingerprint(target) for target in living_targets]
+    group_keys = meas_frame.group_keys
+    #keys in row major order
+    cell_keys = [(target_key, group_key) for group_key in group_keys for target_key in target_keys]
+    cached_likelihoods = cache.get_many(cell_keys)
+    uncached_cells = [cell_idx for (cell_idx, likelihood) in enumerate(cached_likelihoods) if likelihood is None]
+    if len(uncached_cells) == 0:
+        return np.array(cached_likelihoods).reshape((M, T))
+    for cell_idx in uncached_cells:
+        cached_likelihoods[cell_idx] = 0.0
+    likelihoods = np.array(cached_likelihoods).reshape((M, T))
+    uncached_rows = sorted(set([cell_idx//T for cell_idx in uncached_cells]))
+
+    (target_means, target_covs) = target_meas_space_terms(living_targets, params)
+    group_terms = tuple([group_term[uncached_rows] for group_term in meas_frame.group_terms])
+    likelihoods[uncached_rows, :] = stacked_detection_likelihoods(group_terms, target_means, target_covs)
+
+    cache.put_many([cell_keys[cell_idx] for cell_idx in uncached_cells], likelihoods.ravel()[uncached_cells].tolist())
+    return likelihoods
+
+def gated_assoc_likelihoods(particle, params, meas_frame):
+    '''
+    Compute memoized_assoc_likelihood for the (detection group, living target) pairs that pass
+    meas_frame.spatial_gate, the likelihood of every other pair is treated as 0.  Cached likelihoods
+    are reused as in assoc_likelihood_matrix.
+
+    Inputs:
+    - particle: type Particle
+    - params: type Parameters
+    - meas_frame: type MeasurementFrame, built with USE_SPATIAL_GATING
+
+    Outputs:
+    - meas_indices, target_indices: numpy arrays of the gated pairs, sorted by detection group then target
+    - likelihoods: numpy array, likelihoods[i] is the likelihood of meas_groups[meas_indices[i]] given
+        living target target_indices[i]
+    '''
+    assert(meas_frame.spatial_gate is not None)
+    living_targets = particle.targets.living_targets
+    if len(meas_frame.meas_groups) == 0 or len(living_targets) == 0:
+        return (np.zeros(0, dtype=int), np.zeros(0, dtype=int), np.zeros(0))
+    (target_means, target_covs) = target_meas_space_terms(living_targets, params)
+    (meas_indices, target_indices) = meas_frame.spatial_gate.gated_pairs(target_means, target_covs)
+
+    cache = params.assoc_likelihood_cache
+    target_keys = [target_fingerprint(target) for target in living_targets]
+    group_keys = meas_frame.group_keys
+    pair_keys = [(target_keys[t_idx], group_keys[m_idx]) for (m_idx, t_idx) in zip(meas_indices.tolist(), target_indices.tolist())]
+    cached_likelihoods = cache.get_many(pair_keys)
+    uncached_pairs = [pair_idx for (pair_idx, likelihood) in enumerate(cached_likelihoods) if likelihood is None]
+    for pair_idx in uncached_pairs:
+        cached_likelihoods[pair_idx] = 0.0
+    likelihoods = np.array(cached_likelihoods, dtype=float)
+    if len(uncached_pairs) > 0:
+        likelihoods[uncached_pairs] = paired_detection_likelihoods(meas_frame.group_terms, target_means, target_covs,
+                                                                   meas_indices[uncached_pairs], target_indices[uncached_pairs])
+        cache.put_many([pair_keys[pair_idx] for pair_idx in uncached_pairs], likelihoods[uncached_pairs].tolist())
+    return (meas_indices, target_indices, likelihoods)
+
+def birth_clutter_likelihoods(meas_groups, params, likelihood_type, grouped_types=None):
+    '''
+    Compute birth_clutter_likelihood for every detection group at once
+
+    Inputs:
+    - meas_groups: a list of detection groups
+    - params: type Parameters
+    - likelihood_type: string, 'clutter' or 'birth'
+    - grouped_types: (optional) output of group_meas_groups_by_size(meas_groups, params)
+
+    Outputs:
+    - likelihoods: numpy array with shape (len(meas_groups),),
+        likelihoods[m_idx] == birth_clutter_likelihood(meas_groups[m_idx], params, likelihood_type)
+    '''
+    assert(likelihood_type in ['clutter', 'birth'])
+    if grouped_types is None:
+        grouped_types = group_meas_groups_by_size(meas_groups, params)
+    (group_constants, indices_by_size) = grouped_types
+
+    likelihoods = np.ones(len(meas_groups))
+    for (n, m_indices) in indices_by_size.iteritems():
+        if n == 1:
+            continue
+        type_constants = [group_constants[m_idx][likelihood_type] for m_idx in m_indices]
+        #shapes (len(m_indices),n,d,d), (len(m_indices),d,d), (len(m_indices),)
+        cov_invs = np.array([constants[0] for constants in type_constants])
+        inv_sum_cInv = np.array([constants[1] for constants in type_constants])
+        normalization = np.array([constants[2] for constants in type_constants])
+
+        #detection positions, shape (len(m_indices),n,d)
+        det_pos = stacked_detection_positions(meas_groups, m_indices, group_constants)
+        cInv_pos = np.einsum('mnij,mnj->mni', cov_invs, det_pos)
+        A = np.einsum('mni,mni->m', det_pos, cInv_pos)
+        sum_cInv_pos = np.sum(cInv_pos, axis=1)
+        B = np.einsum('mi,mij,mj->m', sum_cInv_pos, inv_sum_cInv, sum_cInv_pos)
+        likelihoods[m_indices] = normalization*np.exp(-.5*(A - B))
+    return likelihoods
+
+class MeasurementFrame:
+    def __init__(self, meas_groups, params, meas_counts_by_source=None, detection_groups=None):
+        '''
+        Everything about a time instance's detection groups that does not depend on a particle,
+        computed once per time instance and shared by every particle's proposal and update.
+
+        Inputs:
+        - meas_groups: a list of detection groups, where each detection group is a dictionary of detections 
+            in the group, key='det_name', value=detection
+        - params: type Parameters
+        - meas_counts_by_source: (optional) list, the number of measurements detected by each source
+        - detection_groups: (optional) type DetectionGroups, columnar version of meas_groups
+        '''
+        self.meas_groups = meas_groups
+        self.meas_counts_by_source = meas_counts_by_source
+        self.detection_groups = detection_groups
+
+        #combined measurement of every detection group, meas_grp_means4D[i] is the combined
+        #(x, y, width, height), meas_grp_means2D[i] its position and meas_grp_covs[i] its covariance
+        (self.meas_grp_means2D, self.meas_grp_means4D, self.meas_grp_covs) = combine_meas_groups(meas_groups, params)
+
+        #grouped_types[0][i] is get_group_type_constants for meas_groups[i], group_type_ids[i] its sorted
+        #tuple of detection names
+        self.grouped_types = group_meas_groups_by_size(meas_groups, params)
+        self.group_type_ids = [constants['dets_present'] for constants in self.grouped_types[0]]
+        #keys of params.assoc_likelihood_cache
+        self.group_keys = [detection_group_key(meas_group) for meas_group in meas_groups]
+        #terms of stacked_detection_likelihoods
+        self.group_terms = detection_group_terms(meas_groups, self.grouped_types)
+
+        self.birth_likelihoods = birth_clutter_likelihoods(meas_groups, params, 'birth', self.grouped_types)
+        self.clutter_likelihoods = birth_clutter_likelihoods(meas_groups, params, 'clutter', self.grouped_types)
+
+        #spatial indices, only built with USE_SPATIAL_GATING
+        self.spatial_gate = None
+        self.meas_grid = None
+        if USE_SPATIAL_GATING:
+            (group_means, group_covs) = detection_group_positions(self.group_terms)
+            self.spatial_gate = SpatialGate(group_means, group_covs, SPATIAL_GATE, SPATIAL_GRID_CELL_SIZE)
+            #grid over the combined (x, y) of meas_grp_means4D, used by the min cost proposal
+            self.meas_grid = MeasurementGrid(np.array([mean[0:2] for mean in self.meas_grp_means4D], dtype=float).reshape((-1, 2)),
+                                             SPATIAL_GRID_CELL_SIZE)
+
+def build_measurement_frame(measurement_lists, widths, heights, det_names, params):
+    '''
+    Group the current time instance's detections (group_detections, or group_detections_by_source if
+    USE_VECTORIZED_DETECTION_GROUPING) and precompute a MeasurementFrame
+
+    Inputs:
+    - measurement_lists: a list where measurement_lists[i] is a list of all measurements from the current
+        time instance from the ith measurement source
+    - widths, heights: lists where widths[i]/heights[i] are lists of bounding box widths/heights for
+        the corresponding measurements
+    - det_names: a list of names of measurement sources, where det_names[i] corresponds to measurement_lists[i]
+    - params: type Parameters
+
+    Outputs:
+    - meas_frame: type MeasurementFrame
+    '''
+    meas_counts_by_source = [len(meas_list) for meas_list in measurement_lists]
+    if not USE_VECTORIZED_DETECTION_GROUPING:
+        meas_groups = []
+        for det_idx, det_name in enumerate(det_names):
+            group_detections(meas_groups, det_name, measurement_lists[det_idx], widths[det_idx], heights[det_idx], params)
+        return MeasurementFrame(meas_groups, params, meas_counts_by_source, detection_groups_from_meas_groups(meas_groups))
+
+    max_costs = dict([(det_name, detection_grouping_max_cost(det_name, params)) for det_name in det_names])
+    detection_groups = group_detections_by_source(measurement_lists, widths, heights, det_names, max_costs)
+    return MeasurementFrame(detection_groups.meas_groups(), params, meas_counts_by_source, detection_groups)
+
+def combine_meas_groups(meas_groups, params, meas_frame=None):
+    '''
+    Inputs:
+    - meas_groups: a list of detection groups
+    - params: type Parameters
+    - meas_frame: (optional) type MeasurementFrame of meas_groups, return its precomputed values if given
+
+    Outputs:
+    - meas_grp_means2D: list, meas_grp_means2D[i] is a 2-d numpy array of the position of meas_groups[i]
+    - meas_grp_means4D: list, each element is the combined measurement mean (x, y, width, height)
+    - meas_grp_covs: list, each element is the combined measurement covariance (np array)
+    '''
+    if meas_frame is not None:
+        return (meas_frame.meas_grp_means2D, meas_frame.meas_grp_means4D, meas_frame.meas_grp_covs)
+    meas_grp_covs = []   
+    meas_grp_means2D = []
+    meas_grp_means4D = []
+    for (index, detection_group) in enumerate(meas_groups):
+        (combined_meas_mean, combined_covariance) = combine_arbitrary_number_measurements_4d(params.posAndSize_inv_covariance_blocks, 
+                            params.meas_noise_mean, detection_group)
+        combined_meas_pos = combined_meas_mean[0:2]
+        meas_grp_means2D.append(combined_meas_pos)
+        meas_grp_means4D.append(combined_meas_mean)
+        meas_grp_covs.append(combined_covariance)
+    return (meas_grp_means2D, meas_grp_means4D, meas_grp_covs)
+
+def construct_log_probs_matrix3(particle, meas_groups, total_target_count, p_target_deaths, params, meas_frame=None):
     '''
     M = #measurements
     T = #targets
 
+    Inputs:
+    - particle: type Particle, we will perform sampling and importance reweighting on this particle         
+    - meas_groups: a list of detection groups, where each detection group is a dictionary of detections 
+        in the group, key='det_name', value=detection
+    - total_target_count: the number of living targets on the previous time instace
+    - p_target_deaths: a list of length len(total_target_count) where 
+        p_target_deaths[i] = the probability that target i has died between the last
+        time instance and the current time instance
+    - params: type Parameters, gives prior probabilities and other parameters we are using
+    - meas_frame: (optional) type MeasurementFrame of meas_groups
+
+    Outputs:
+    - log_probs: numpy matrix with dimensions (2*M+2*T)x(2*M+2*T) of log probabilities.
+        np.trace(np.dot(log_probs,A.T) will be the log probability of an assignment A, given our
+        Inputs.  (Where an assignment defines measurement associations to targets, and is marginalized
+
+    Same values as construct_log_probs_matrix3_loops, computed with array operations.  With USE_SPATIAL_GATING
+    measurement-target entries of pairs outside the gate are left infeasible (-1*INFEASIBLE_COST).
+    '''
+    if params.USE_PYTHON_GAUSSIAN:
+        #the vectorized likelihoods only implement the closed form density
+        return construct_log_probs_matrix3_loops(particle, meas_groups, total_target_count, p_target_deaths, params)
+
+    sparse_log_probs = construct_sparse_log_probs3(particle, meas_groups, total_target_count, p_target_deaths, params, meas_frame)
+    return sparse_log_probs.to_dense()
+
+def construct_sparse_log_probs3(particle, meas_groups, total_target_count, p_target_deaths, params, meas_frame=None):
+    '''
+    Sparse version of construct_log_probs_matrix3, the entries of the (2*M+2*T)x(2*M+2*T) matrix are not
+    allocated.  Without USE_SPATIAL_GATING every measurement-target entry is stored, with it only the
+    gated pairs are, so memory scales with the number of gated pairs.
+
+    Inputs: the same as construct_log_probs_matrix3
+
+    Outputs:
+    - log_probs: type SparseAssociationMatrix of log probabilities, log_probs.to_dense() is the matrix
+        returned by construct_log_probs_matrix3
+    '''
+    M = len(meas_groups)
+    T = total_target_count
+    if params.USE_PYTHON_GAUSSIAN:
+        #the vectorized likelihoods only implement the closed form density
+        log_probs = construct_log_probs_matrix3_loops(particle, meas_groups, total_target_count, p_target_deaths, params)
+        return sparse_association_matrix_from_dense(-1*log_probs, M).transformed(-1)
+
+    if meas_frame is None:
+        meas_frame = MeasurementFrame(meas_groups, params)
+    group_constants = meas_frame.grouped_types[0]
+
+    #measurement-target association entries
+    if M > 0 and T > 0 and meas_frame.spatial_gate is not None:
+        #pairs outside the gate are infeasible
+        (meas_indices, target_indices, likelihoods) = gated_assoc_likelihoods(particle, params, meas_frame)
+        assert((likelihoods >= 0.0).all()), likelihoods
+        assoc_log_probs = np.where(likelihoods > 0.0, np.log(np.where(likelihoods > 0.0, likelihoods, 1.0)), -999)
+        log_emission_priors = np.log([constants['emission_prior'] for constants in group_constants])
+        edge_log_probs = assoc_log_probs + log_emission_priors[meas_indices]
+    elif M > 0 and T > 0:
+        likelihoods = assoc_likelihood_matrix(particle, meas_groups, params, meas_frame)
+        assert((likelihoods >= 0.0).all()), likelihoods
+        #(np.exp(-999) == 0) evaluates to True
+        assoc_log_probs = np.where(likelihoods > 0.0, np.log(np.where(likelihoods > 0.0, likelihoods, 1.0)), -999)
+        log_emission_priors = np.log([constants['emission_prior'] for constants in group_constants])
+        meas_indices = np.repeat(np.arange(M), T)
+        target_indices = np.tile(np.arange(T), M)
+        edge_log_probs = (assoc_log_probs + log_emission_priors[:, np.newaxis]).ravel()
+    else:
+        meas_indices = np.zeros(0, dtype=int)
+        target_indices = np.zeros(0, dtype=int)
+        edge_log_probs = np.zeros(0)
+
+    #target doesn't emit and lives/dies entries
+    if T > 0:
+        p_target_does_not_emit = params.target_groupEmission_priors[ImmutableSet([])]
+        living_targets = particle.targets.living_targets[:T]
+        #would probably be better to kill offscreen targets before association
+        death_probs = np.array([.999999999999 if target.offscreen == True else target.death_prob
+                                for target in living_targets], dtype=float)
+        death_probs[death_probs == 1.0] = .99999999999 #still getting an error with domain error, trying this
+        death_probs[death_probs == 0] = 10**-100
+        assert(p_target_does_not_emit > 0 and (death_probs > 0).all() and (death_probs < 1.0).all()), (p_target_does_not_emit, death_probs)
+        lives_log_probs = math.log(p_target_does_not_emit) + np.log(1.0 - death_probs)
+        dies_log_probs = math.log(p_target_does_not_emit) + np.log(death_probs)
+    else:
+        lives_log_probs = np.zeros(0)
+        dies_log_probs = np.zeros(0)
+
+    #birth/clutter measurement association entries
+    assert(params.SPEC['birth_clutter_likelihood'] == 'aprox1')
+    if M > 0:
+        min_birth_lambda = min(params.birth_lambdas_by_group.itervalues())/100
+        min_clutter_lambda = min(params.clutter_lambdas_by_group.itervalues())/100
+        #use a small value if we never saw one of these groups in our training data            
+        birth_lambdas = np.array([constants['birth_lambda'] for constants in group_constants], dtype=float)
+        birth_lambdas[birth_lambdas == 0] = min_birth_lambda
+        clutter_lambdas = np.array([constants['clutter_lambda'] for constants in group_constants], dtype=float)
+        clutter_lambdas[clutter_lambdas == 0] = min_clutter_lambda
+
+        clutter_log_probs = np.log(clutter_lambdas) + np.log(meas_frame.clutter_likelihoods*params.p_clutter_likelihood)
+        birth_log_probs = np.log(birth_lambdas) + np.log(meas_frame.birth_likelihoods*params.p_birth_likelihood)
+    else:
+        clutter_log_probs = np.zeros(0)
+        birth_log_probs = np.zeros(0)
+
+    #bottom right quadrant is 0's
+    return SparseAssociationMatrix(M, T, meas_indices, target_indices, edge_log_probs, clutter_log_probs,
+        birth_log_probs, lives_log_probs, dies_log_probs, filler_value=0.0, infeasible_value=-1*INFEASIBLE_COST)
+
+def construct_log_probs_matrix3_loops(particle, meas_groups, total_target_count, p_target_deaths, params):
+    '''
+    Cell by cell reference implementation of construct_log_probs_matrix3, kept for testing
+    and speed comparisons (see benchmark_rbpf_sampling.py)
+
+    M = #measurements
+    T = #targets
+
     Inputs:
     - particle: type Particle, we will perform sampling and importance reweighting on this particle         
     - meas_groups: a list of detection groups, where each detection group is a dictionary of detections 
@@ -1399,6 +2091,66 @@ def convert_assignment_pairs_to_matrix3(assignment_pairs, M, T):
     return assignment_matrix
 
 
+def convert_assignment_pairs_to_permutation3(assignment_pairs, M, T):
+    '''
+    Inputs:
+    - assignment_pairs: list of pairs where each pair represents an association in the assignment (1's in assignment matrix)
+    - M: #measurements (int)
+    - T: #targets (int)
+
+    Outputs:
+    - col4row: numpy array of ints with shape (2*M+2*T,), col4row[i] is the column assigned to row i,
+        the permutation represented by the (2*M+2*T)x(2*M+2*T) assignment matrix
+    '''
+    assert(len(assignment_pairs) == (2*M+2*T)), (assignment_pairs, M, T)
+    col4row = -1*np.ones(2*M+2*T, dtype=int)
+    if len(assignment_pairs) > 0:
+        pairs = np.array(assignment_pairs, dtype=int)
+        col4row[pairs[:, 0]] = pairs[:, 1]
+    assert((np.sort(col4row) == np.arange(2*M+2*T)).all()), (assignment_pairs, M, T)
+    return col4row
+
+
+def permutation_log_prob3(log_probs, col4row):
+    '''
+    Inputs:
+    - log_probs: numpy array with dimensions (2*M+2*T)x(2*M+2*T), from construct_log_probs_matrix3
+    - col4row: numpy array of ints, permutation from convert_assignment_pairs_to_permutation3
+
+    Outputs:
+    - log_prob: sum of the entries of log_probs selected by col4row, equal to
+        np.trace(np.dot(log_probs, A.T)) where A is the assignment matrix of col4row
+    '''
+    return np.sum(log_probs[np.arange(len(col4row)), col4row])
+
+
+def convert_permutation_to_associations3(col4row, M, T):
+    '''  
+    Same functionality as convert_assignment_matrix3, but takes in a permutation from
+    convert_assignment_pairs_to_permutation3
+
+    Inputs:
+    - col4row: numpy array of ints with shape (2*M+2*T,), col4row[i] is the column assigned to row i
+    - M: #measurements (int)
+    - T: #targets (int)
+
+    Outputs:
+    - meas_associations: list of integers, the measurement associations represented by col4row,
+        -1 for clutter, [0,target_count-1] for a target association and target_count for a birth
+    - dead_target_indices: sorted list of integers, the targets that died
+    '''
+    assert(len(col4row) == 2*M+2*T), (col4row, M, T)
+    m_indices = np.arange(M)
+    t_indices = np.arange(T)
+    meas_cols = col4row[:M]
+    clutter = (meas_cols == T + 2*m_indices)
+    assert(((meas_cols < T) | clutter | (meas_cols == T + 1 + 2*m_indices)).all()), (col4row, M, T)
+    meas_associations = np.where(meas_cols < T, meas_cols, np.where(clutter, -1, T))
+    #an unassociated target's column is taken by its lives or dies row
+    dead_target_indices = np.flatnonzero(col4row[M + 1 + 2*t_indices] == t_indices)
+    return (meas_associations.tolist(), dead_target_indices.tolist())
+
+
 def solve_gumbel_perturbed_assignment3(log_probs, M, T):
     '''
     use along with construct_log_probs_matrix3()
@@ -1466,7 +2218,7 @@ def solve_gumbel_perturbed_assignment3(log_probs, M, T):
 
 
 
-def associate_meas_gumbel_exact(particle, meas_groups, total_target_count, p_target_deaths, params, meas_counts_by_source):
+def associate_meas_gumbel_exact(particle, meas_groups, total_target_count, p_target_deaths, params, meas_counts_by_source, meas_frame=None):
     '''
     Sample measurement associations from the optimal proposal distribution 
     p(c_k | e_{1-k-1}, c_{1:k-1}, y_{1:k})
@@ -1538,7 +2290,7 @@ def associate_meas_gumbel_exact(particle, meas_groups, total_target_count, p_tar
                     all_norm_probs[idx]
 
         (a, b, c, d, check_partition_val, check_proposal_distribution, check_proposal_distr_dict) = associate_meas_optimal(particle, meas_groups, \
-            total_target_count, p_target_deaths, params, meas_counts_by_source)
+            total_target_count, p_target_deaths, params, meas_counts_by_source, meas_frame)
         
         for assoc, check_prob in check_proposal_distr_dict.iteritems():
             assert(assoc in matrix_proposal_excluding_deaths)
@@ -1564,18 +2316,9 @@ def associate_meas_gumbel_exact(particle, meas_groups, total_target_count, p_tar
 
 
 ############ THIS DOESN"T REALLY BELONG HERE, BUT FOLLOWING RETURN VALUES FOR OTHER PROPOSAL DISTRIBUTIONS ############
-    #list of detection group centers, meas_grp_means[i] is a 2-d numpy array
+    #list of detection group centers, meas_grp_means2D[i] is a 2-d numpy array
     #of the position of meas_groups[i]
-    meas_grp_covs = []   
-    meas_grp_means2D = []
-    meas_grp_means4D = []
-    for (index, detection_group) in enumerate(meas_groups):
-        (combined_meas_mean, combined_covariance) = combine_arbitrary_number_measurements_4d(params.posAndSize_inv_covariance_blocks, 
-                            params.meas_noise_mean, detection_group)
-        combined_meas_pos = combined_meas_mean[0:2]
-        meas_grp_means2D.append(combined_meas_pos)
-        meas_grp_means4D.append(combined_meas_mean)
-        meas_grp_covs.append(combined_covariance)
+    (meas_grp_means2D, meas_grp_means4D, meas_grp_covs) = combine_meas_groups(meas_groups, params, meas_frame)
 ############ END THIS DOESN"T REALLY BELONG HERE, BUT FOLLOWING RETURN VALUES FOR OTHER PROPOSAL DISTRIBUTIONS ############
 
 
@@ -1583,7 +2326,7 @@ def associate_meas_gumbel_exact(particle, meas_groups, total_target_count, p_tar
 
 
 
-def solve_perturbed_max_gumbel(particle, meas_groups, total_target_count, p_target_deaths, params):
+def solve_perturbed_max_gumbel(particle, meas_groups, total_target_count, p_target_deaths, params, meas_frame=None):
     '''
     Solve gumbel perturbed linear program to approximately sample
     from p(x_k| x_1:k-1, y_1:k).
@@ -1593,7 +2336,7 @@ def solve_perturbed_max_gumbel(particle, meas_groups, total_target_count, p_targ
     USE_LOG_PROBS_3 = False
 
     if USE_LOG_PROBS_3:
-        log_probs = construct_log_probs_matrix3(particle, meas_groups, total_target_count, p_target_deaths, params)
+        log_probs = construct_log_probs_matrix3(particle, meas_groups, total_target_count, p_target_deaths, params, meas_frame=meas_frame)
 
         #solve a perturbed assignment problem 
         (assignment, max_log_prob) = solve_gumbel_perturbed_assignment3(log_probs, len(meas_groups), total_target_count)
@@ -1835,7 +2578,7 @@ def get_immutable_set_meas_names(meas_group):
     return meas_names_set        
 
 
-def unnormalized_marginal_meas_target_assoc(particle, meas_groups, total_target_count, params):
+def unnormalized_marginal_meas_target_assoc(particle, meas_groups, total_target_count, params, meas_frame=None):
 
     """
     Sample measurement target associations marginalized over birth association, clutter associations, and
@@ -1860,18 +2603,9 @@ def unnormalized_marginal_meas_target_assoc(particle, meas_groups, total_target_
     """
     marginal_meas_target_proposal_distr = []
     proposal_measurement_target_associations = []
-    #list of detection group centers, meas_grp_means[i] is a 2-d numpy array
+    #list of detection group centers, meas_grp_means2D[i] is a 2-d numpy array
     #of the position of meas_groups[i]
-    meas_grp_covs = []   
-    meas_grp_means2D = []
-    meas_grp_means4D = []
-    for (index, detection_group) in enumerate(meas_groups):
-        (combined_meas_mean, combined_covariance) = combine_arbitrary_number_measurements_4d(params.posAndSize_inv_covariance_blocks, 
-                            params.meas_noise_mean, detection_group)
-        combined_meas_pos = combined_meas_mean[0:2]
-        meas_grp_means2D.append(combined_meas_pos)
-        meas_grp_means4D.append(combined_meas_mean)
-        meas_grp_covs.append(combined_covariance)
+    (meas_grp_means2D, meas_grp_means4D, meas_grp_covs) = combine_meas_groups(meas_groups, params, meas_frame)
 
 
     #get list of target bounding boxes  
@@ -1880,6 +2614,9 @@ def unnormalized_marginal_meas_target_assoc(particle, meas_groups, total_target_
         target = particle.targets.living_targets[target_index]            
         target_location = np.squeeze(np.dot(params.H, target.x)) 
         target_pos4D.append(np.array([target_location[0], target_location[1], target.width, target.height]))
+    meas_grid = None
+    if meas_frame is not None:
+        meas_grid = meas_frame.meas_grid
 
     meas_target_association_possibilities = []
     marginal_association_probs = []
@@ -1893,7 +2630,14 @@ def unnormalized_marginal_meas_target_assoc(particle, meas_groups, total_target_
         max_costs = params.SPEC['target_detection_max_overlaps']
 
     for max_assoc_cost in max_costs:
-        list_of_measurement_associations = min_cost_measGrp_target_assoc(meas_grp_means4D, target_pos4D, params, max_assoc_cost)
+        if USE_WARM_START_ASSIGNMENT:
+            target_potentials = particle.assignment_warm_start(('min_cost', max_assoc_cost))
+        else:
+            target_potentials = None
+        list_of_measurement_associations = min_cost_measGrp_target_assoc(meas_grp_means4D, target_pos4D, params, max_assoc_cost,
+                                                                         meas_grid, target_potentials)
+        if USE_WARM_START_ASSIGNMENT:
+            particle.store_assignment_warm_start(('min_cost', max_assoc_cost), target_potentials)
 
         proposal_probability = 1.0
         observed_target_count = 0
@@ -2014,7 +2758,7 @@ def conditional_birth_clutter_partition(remaining_meas_count_by_groups, params):
         partition_val *= cur_sum
     return partition_val
 
-def associate_meas_min_cost_corrected(particle, meas_groups, total_target_count, p_target_deaths, params):
+def associate_meas_min_cost_corrected(particle, meas_groups, total_target_count, p_target_deaths, params, meas_frame=None):
 
     """
     First sample measurement associations from a small set of min cost matchings, with different max costs,
@@ -2037,7 +2781,7 @@ def associate_meas_min_cost_corrected(particle, meas_groups, total_target_count,
     """
     # 1. sample measurment target associations marginalized over birth/clutter/unassociated death
     (meas_grp_means4D, meas_grp_covs, marginal_meas_target_proposal_distr, proposal_measurement_target_associations) = \
-    unnormalized_marginal_meas_target_assoc(particle, meas_groups, total_target_count, params)
+    unnormalized_marginal_meas_target_assoc(particle, meas_groups, total_target_count, params, meas_frame)
 
     marginal_meas_target_proposal_distr /= float(np.sum(marginal_meas_target_proposal_distr))
 
@@ -2086,7 +2830,7 @@ def associate_meas_min_cost_corrected(particle, meas_groups, total_target_count,
     return(meas_targ_assoc, meas_grp_means4D, meas_grp_covs, proposal_probability)
 
 
-def associate_meas_min_cost(particle, meas_groups, total_target_count, p_target_deaths, params):
+def associate_meas_min_cost(particle, meas_groups, total_target_count, p_target_deaths, params, meas_frame=None):
 
     """
     Input:
@@ -2109,18 +2853,9 @@ def associate_meas_min_cost(particle, meas_groups, total_target_count, p_target_
     birth_count = 0
     clutter_count = 0
 
-    #list of detection group centers, meas_grp_means[i] is a 2-d numpy array
+    #list of detection group centers, meas_grp_means2D[i] is a 2-d numpy array
     #of the position of meas_groups[i]
-    meas_grp_covs = []   
-    meas_grp_means2D = []
-    meas_grp_means4D = []
-    for (index, detection_group) in enumerate(meas_groups):
-        (combined_meas_mean, combined_covariance) = combine_arbitrary_number_measurements_4d(params.posAndSize_inv_covariance_blocks, 
-                            params.meas_noise_mean, detection_group)
-        combined_meas_pos = combined_meas_mean[0:2]
-        meas_grp_means2D.append(combined_meas_pos)
-        meas_grp_means4D.append(combined_meas_mean)
-        meas_grp_covs.append(combined_covariance)
+    (meas_grp_means2D, meas_grp_means4D, meas_grp_covs) = combine_meas_groups(meas_groups, params, meas_frame)
 
 
     #get list of target bounding boxes  
@@ -2129,6 +2864,9 @@ def associate_meas_min_cost(particle, meas_groups, total_target_count, p_target_
         target = particle.targets.living_targets[target_index]            
         target_location = np.squeeze(np.dot(params.H, target.x)) 
         target_pos4D.append(np.array([target_location[0], target_location[1], target.width, target.height]))
+    meas_grid = None
+    if meas_frame is not None:
+        meas_grid = meas_frame.meas_grid
 
 
     complete_association_possibilities = []
@@ -2141,7 +2879,14 @@ def associate_meas_min_cost(particle, meas_groups, total_target_count, p_target_
         max_costs = params.SPEC['target_detection_max_overlaps']
 
     for max_assoc_cost in max_costs:
-        list_of_measurement_associations = min_cost_measGrp_target_assoc(meas_grp_means4D, target_pos4D, params, max_assoc_cost)
+        if USE_WARM_START_ASSIGNMENT:
+            target_potentials = particle.assignment_warm_start(('min_cost', max_assoc_cost))
+        else:
+            target_potentials = None
+        list_of_measurement_associations = min_cost_measGrp_target_assoc(meas_grp_means4D, target_pos4D, params, max_assoc_cost,
+                                                                         meas_grid, target_potentials)
+        if USE_WARM_START_ASSIGNMENT:
+            particle.store_assignment_warm_start(('min_cost', max_assoc_cost), target_potentials)
         proposal_probability = 1.0
 
         remaining_meas_count = list_of_measurement_associations.count(-1)
@@ -2260,7 +3005,7 @@ def associate_meas_min_cost(particle, meas_groups, total_target_count, p_target_
 
 
 
-def associate_measurements_sequentially(particle, meas_groups, total_target_count, p_target_deaths, params):
+def associate_measurements_sequentially(particle, meas_groups, total_target_count, p_target_deaths, params, meas_frame=None):
 
     """
     Try sampling associations with each measurement sequentially
@@ -2287,18 +3032,9 @@ def associate_measurements_sequentially(particle, meas_groups, total_target_coun
     clutter_count = 0
     remaining_meas_count = len(meas_groups)
 
-    #list of detection group centers, meas_grp_means[i] is a 2-d numpy array
+    #list of detection group centers, meas_grp_means2D[i] is a 2-d numpy array
     #of the position of meas_groups[i]
-    meas_grp_covs = []   
-    meas_grp_means2D = []
-    meas_grp_means4D = []
-    for (index, detection_group) in enumerate(meas_groups):
-        (combined_meas_mean, combined_covariance) = combine_arbitrary_number_measurements_4d(params.posAndSize_inv_covariance_blocks, 
-                            params.meas_noise_mean, detection_group)
-        combined_meas_pos = combined_meas_mean[0:2]
-        meas_grp_means2D.append(combined_meas_pos)
-        meas_grp_means4D.append(combined_meas_mean)
-        meas_grp_covs.append(combined_covariance)
+    (meas_grp_means2D, meas_grp_means4D, meas_grp_covs) = combine_meas_groups(meas_groups, params, meas_frame)
 
 
     def get_k_nearest_targets(measurement, k):
@@ -2328,6 +3064,25 @@ def associate_measurements_sequentially(particle, meas_groups, total_target_coun
 
         return k_nearest_target_indices
 
+    gated_targets_by_meas = None
+    if meas_frame is not None and meas_frame.spatial_gate is not None:
+        #only targets that pass the gate with a detection group are proposed for it, the likelihood
+        #of every other pair is treated as 0
+        (gated_meas_indices, gated_target_indices, gated_likelihoods) = gated_assoc_likelihoods(particle, params, meas_frame)
+        in_target_count = gated_target_indices < total_target_count
+        gated_meas_indices = gated_meas_indices[in_target_count]
+        gated_target_indices = gated_target_indices[in_target_count]
+        gated_likelihoods = gated_likelihoods[in_target_count]
+        gated_targets_by_meas = defaultdict(list)
+        gated_likelihoods_by_pair = {}
+        for (m_idx, t_idx, likelihood) in zip(gated_meas_indices.tolist(), gated_target_indices.tolist(), gated_likelihoods.tolist()):
+            gated_targets_by_meas[m_idx].append(t_idx)
+            gated_likelihoods_by_pair[(m_idx, t_idx)] = likelihood
+        #targ_likelihoods_summed_over_meas for every target
+        gated_likelihood_sums = np.bincount(gated_target_indices, weights=gated_likelihoods, minlength=total_target_count)
+        if total_target_count > 0:
+            (target_means, target_covs) = target_meas_space_terms(particle.targets.living_targets[:total_target_count], params)
+
 
     for (index, detection_group) in enumerate(meas_groups):
         #create proposal distribution for the current measurement
@@ -2340,20 +3095,29 @@ def associate_measurements_sequentially(particle, meas_groups, total_target_coun
             group_det_names.append(det_name)
         det_names_set = ImmutableSet(group_det_names)
 
-        if params.CHECK_K_NEAREST_TARGETS:
+        if gated_targets_by_meas is not None:
+            targets_to_check = gated_targets_by_meas[index]
+            if params.CHECK_K_NEAREST_TARGETS and len(targets_to_check) > params.K_NEAREST_TARGETS:
+                distances = np.sum((target_means[targets_to_check] - meas_grp_means2D[index][0:2])**2, axis=1)
+                targets_to_check = [targets_to_check[i] for i in np.argsort(distances, kind='mergesort')[:params.K_NEAREST_TARGETS]]
+        elif params.CHECK_K_NEAREST_TARGETS:
             targets_to_check = get_k_nearest_targets(meas_grp_means2D[index], params.K_NEAREST_TARGETS)
         else:
             targets_to_check = [i for i in range(total_target_count)]
 
 #        for target_index in range(total_target_count):
         for target_index in targets_to_check:
-            cur_target_likelihood = memoized_assoc_likelihood(particle, detection_group, target_index, params)
-            targ_likelihoods_summed_over_meas = 0.0
+            if gated_targets_by_meas is not None:
+                cur_target_likelihood = gated_likelihoods_by_pair[(index, target_index)]
+                targ_likelihoods_summed_over_meas = gated_likelihood_sums[target_index]
+            else:
+                cur_target_likelihood = memoized_assoc_likelihood(particle, detection_group, target_index, params)
+                targ_likelihoods_summed_over_meas = 0.0
 
-            debug_idx = 0
-            for meas_index2, detection_group2 in enumerate(meas_groups):
-                targ_likelihoods_summed_over_meas += memoized_assoc_likelihood(particle, detection_group2, target_index, params)
-                debug_idx += 1
+                debug_idx = 0
+                for meas_index2, detection_group2 in enumerate(meas_groups):
+                    targ_likelihoods_summed_over_meas += memoized_assoc_likelihood(particle, detection_group2, target_index, params)
+                    debug_idx += 1
 
             if((targ_likelihoods_summed_over_meas != 0.0) and (not target_index in list_of_measurement_associations)\
                 and p_target_deaths[target_index] < 1.0):
@@ -2432,7 +3196,9 @@ def associate_measurements_sequentially(particle, meas_groups, total_target_coun
         proposal_distribution = np.asarray(proposal_distribution_list)
         assert(np.sum(proposal_distribution) != 0.0), (index, remaining_meas_count, len(proposal_distribution), proposal_distribution, birth_count, clutter_count, len(measurement_list), total_target_count)
         proposal_distribution /= float(np.sum(proposal_distribution))
-        if params.CHECK_K_NEAREST_TARGETS:
+        if gated_targets_by_meas is not None:
+            assert(len(proposal_distribution) == len(targets_to_check)+2), (len(targets_to_check), len(proposal_distribution))
+        elif params.CHECK_K_NEAREST_TARGETS:
             proposal_length = min(params.K_NEAREST_TARGETS+2, total_target_count+2)
             assert(len(proposal_distribution) == proposal_length), (proposal_length, len(proposal_distribution))
 
@@ -2445,8 +3211,8 @@ def associate_measurements_sequentially(particle, meas_groups, total_target_coun
         sampled_assoc_idx = np.random.choice(len(proposal_distribution),
                                                 p=proposal_distribution)
 
-        if params.CHECK_K_NEAREST_TARGETS:
-            possible_target_assoc_count = min(params.K_NEAREST_TARGETS, total_target_count)
+        if params.CHECK_K_NEAREST_TARGETS or gated_targets_by_meas is not None:
+            possible_target_assoc_count = len(targets_to_check)
             if(sampled_assoc_idx <= possible_target_assoc_count): #target or birth association
                 if(sampled_assoc_idx == possible_target_assoc_count): #birth
                     birth_count += 1
@@ -3060,108 +3826,148 @@ def get_likelihood(particle, meas_groups, total_target_count,
 
 def memoized_assoc_likelihood(particle, detection_group, target_index, params):
     """
-        LSVM and regionlets produced two measurements with the same locations (centers), so using the 
-        meas_source_index as part of the key is (sort of) necessary.  Currently also using the score_index, 
-        could possibly be removed (not sure if this would improve speed).
-
-        Currently saving more in the value than necessary (from debugging), can eliminate to improve
-        performance (possibly noticable)
+    Likelihood of detection_group given particle.targets.living_targets[target_index], looked up in
+    params.assoc_likelihood_cache (shared by all particles, keyed on the target's state and the
+    detection group's detection names and positions) and computed on a miss.
 
     Inputs:
     - params: type Parameters, gives prior probabilities and other parameters we are using
 
     """
+    target = particle.targets.living_targets[target_index]
+    key = (target_fingerprint(target), detection_group_key(detection_group))
+    assoc_likelihood = params.assoc_likelihood_cache.get(key)
+    if assoc_likelihood is None: #likelihood not cached
+        assoc_likelihood = compute_assoc_likelihood(target, detection_group, params)
+        params.assoc_likelihood_cache.put(key, assoc_likelihood)
+    return assoc_likelihood
+
+def compute_assoc_likelihood(target, detection_group, params):
+    """
+    Inputs:
+    - target: type Target
+    - detection_group: dictionary of detections, key='det_name', value=detection
+    - params: type Parameters, gives prior probabilities and other parameters we are using
 
-#    if((str(detection_group), target_index) in particle.assoc_likelihood_cache):
-#        (assoc_likelihood) = particle.assoc_likelihood_cache[(str(detection_group), target_index)]
-#        return assoc_likelihood
-#    else: #likelihood not cached
-    if True:
-        target = particle.targets.living_targets[target_index]
-        target_cov = np.dot(np.dot(params.H, target.P), params.H.T)
-        assert(target.x.shape == (4, 1))
-
-        state_mean_meas_space = np.dot(params.H, target.x)
-        state_mean_meas_space = np.squeeze(state_mean_meas_space)
-
-
+    Outputs:
+    - assoc_likelihood: (float) likelihood of the detection group's positions given the target
+    """
+    if params.USE_PYTHON_GAUSSIAN:
+        return dense_assoc_likelihood(target, detection_group, params)
+
+    #single pair version of stacked_detection_likelihoods
+    constants = get_group_type_constants(params, tuple(sorted(detection_group.keys())))
+    n = len(constants['dets_present'])
+    z = np.concatenate([detection_group[det_name][0:2] for det_name in constants['dets_present']])
+    D_inv_z = np.dot(constants['det_covariance_inv'], z)
+    q = np.dot(z, D_inv_z)
+    g = D_inv_z.reshape((n, 2)).sum(axis=0)
+    ((G_00, G_01), (G_10, G_11)) = constants['U_Dinv_U'].tolist()
+    (mu_0, mu_1) = np.dot(params.H, target.x)[:, 0].tolist()
+    ((S_00, S_01), (S_10, S_11)) = np.dot(np.dot(params.H, target.P), params.H.T).tolist()
+    (S_det, complete_cov_det, exponent) = closed_form_likelihood_terms(float(q), float(g[0]), float(g[1]),
+        G_00, G_01, G_10, G_11, float(constants['det_covariance_det']), mu_0, mu_1, S_00, S_01, S_10, S_11)
+    assert(S_det > 0), S_det
+    assert(complete_cov_det > 0), complete_cov_det
+    LIKELIHOOD_DISTR_NORM = 1.0/(math.sqrt(complete_cov_det)*(2*math.pi)**n)
+    return LIKELIHOOD_DISTR_NORM*math.exp(-.5*exponent)
+
+def dense_assoc_likelihood(target, detection_group, params):
+    """
+    compute_assoc_likelihood using the complete (2*#detections x 2*#detections) covariance
+    matrix, used when params.USE_PYTHON_GAUSSIAN and for checking stacked_detection_likelihoods
 
-        #get list of detection names present in our detection group
-        dets_present = []
-        for det_name, detection in detection_group.iteritems():
-            dets_present.append(det_name)
-        # create array of all detection positions in the group
-        all_det_loc = np.zeros(2*len(detection_group))
-        # repeat the target location to map it to the #detections * 2 dimension space
-        target_loc_repeated = np.zeros(2*len(detection_group))
-        for idx, det_name in enumerate(dets_present):
-            all_det_loc[idx*2] = detection_group[det_name][0]
-            all_det_loc[idx*2+1] = detection_group[det_name][1]
+    Inputs:
+    - target: type Target
+    - detection_group: dictionary of detections, key='det_name', value=detection
+    - params: type Parameters, gives prior probabilities and other parameters we are using
 
-            target_loc_repeated[idx*2] = state_mean_meas_space[0]
-            target_loc_repeated[idx*2+1] = state_mean_meas_space[1]
+    Outputs:
+    - assoc_likelihood: (float) likelihood of the detection group's positions given the target
+    """
+    target_cov = np.dot(np.dot(params.H, target.P), params.H.T)
+    assert(target.x.shape == (4, 1))
 
+    state_mean_meas_space = np.dot(params.H, target.x)
+    state_mean_meas_space = np.squeeze(state_mean_meas_space)
 
-        complete_covariance = np.zeros((2*len(detection_group), 2*len(detection_group)))
-        for idx1, det_name1 in enumerate(dets_present):
-            for idx2, det_name2 in enumerate(dets_present):
-                complete_covariance[idx1*2:(idx1+1)*2,idx2*2:(idx2+1)*2] = params.posOnly_covariance_blocks[(det_name1, det_name2)] + target_cov
 
 
-        if params.USE_PYTHON_GAUSSIAN:        
-            distribution = multivariate_normal(mean=target_loc_repeated, cov=complete_covariance)
-            assoc_likelihood = distribution.pdf(all_det_loc)
-        else:
-            S_det = numpy.linalg.det(complete_covariance)
-            S_inv = inv(complete_covariance)
-            assert(S_det > 0), S_det
-            LIKELIHOOD_DISTR_NORM = 1.0/(math.sqrt(S_det)*(2*math.pi)**(len(target_loc_repeated)/2))
-
-            assert(LIKELIHOOD_DISTR_NORM!=0.0), (S_det, complete_covariance, len(target_loc_repeated))
-
-            offset = all_det_loc - target_loc_repeated
-            a = -.5*np.dot(np.dot(offset, S_inv), offset)
-            assoc_likelihood = LIKELIHOOD_DISTR_NORM*math.exp(a)
-
-#            if assoc_likelihood == 0.0:
-#                print "about to crash, assoc_likelihood = 0"
-#                print "the target at position ", state_mean_meas_space
-#                print "With width: ", target.width, " and height:", target.height
-#                print "was associated with this measurement group:"
-#                print detection_group
-#            assert(assoc_likelihood != 0.0), (a, offset, S_inv)
-
-#        distribution = multivariate_normal(mean=target_loc_repeated, cov=complete_covariance)
-#        assoc_likelihood_compare = distribution.pdf(all_det_loc)
+    #get list of detection names present in our detection group
+    dets_present = []
+    for det_name, detection in detection_group.iteritems():
+        dets_present.append(det_name)
+    # create array of all detection positions in the group
+    all_det_loc = np.zeros(2*len(detection_group))
+    # repeat the target location to map it to the #detections * 2 dimension space
+    target_loc_repeated = np.zeros(2*len(detection_group))
+    for idx, det_name in enumerate(dets_present):
+        all_det_loc[idx*2] = detection_group[det_name][0]
+        all_det_loc[idx*2+1] = detection_group[det_name][1]
+
+        target_loc_repeated[idx*2] = state_mean_meas_space[0]
+        target_loc_repeated[idx*2+1] = state_mean_meas_space[1]
+
+
+    complete_covariance = np.zeros((2*len(detection_group), 2*len(detection_group)))
+    for idx1, det_name1 in enumerate(dets_present):
+        for idx2, det_name2 in enumerate(dets_present):
+            complete_covariance[idx1*2:(idx1+1)*2,idx2*2:(idx2+1)*2] = params.posOnly_covariance_blocks[(det_name1, det_name2)] + target_cov
+
+
+    if params.USE_PYTHON_GAUSSIAN:        
+        distribution = multivariate_normal(mean=target_loc_repeated, cov=complete_covariance)
+        assoc_likelihood = distribution.pdf(all_det_loc)
+    else:
+        S_det = numpy.linalg.det(complete_covariance)
+        S_inv = inv(complete_covariance)
+        assert(S_det > 0), S_det
+        LIKELIHOOD_DISTR_NORM = 1.0/(math.sqrt(S_det)*(2*math.pi)**(len(target_loc_repeated)/2))
+
+        assert(LIKELIHOOD_DISTR_NORM!=0.0), (S_det, complete_covariance, len(target_loc_repeated))
+
+        offset = all_det_loc - target_loc_repeated
+        a = -.5*np.dot(np.dot(offset, S_inv), offset)
+        assoc_likelihood = LIKELIHOOD_DISTR_NORM*math.exp(a)
+
+#        if assoc_likelihood == 0.0:
+#            print "about to crash, assoc_likelihood = 0"
+#            print "the target at position ", state_mean_meas_space
+#            print "With width: ", target.width, " and height:", target.height
+#            print "was associated with this measurement group:"
+#            print detection_group
+#        assert(assoc_likelihood != 0.0), (a, offset, S_inv)
+
+#    distribution = multivariate_normal(mean=target_loc_repeated, cov=complete_covariance)
+#    assoc_likelihood_compare = distribution.pdf(all_det_loc)
 #
-#        S_det = numpy.linalg.det(complete_covariance)
-#        S_inv = inv(complete_covariance)
-#        assert(S_det > 0), S_det
-#        LIKELIHOOD_DISTR_NORM = 1.0/(math.sqrt(S_det)*(2*math.pi)**(len(target_loc_repeated)/2))
-#        offset = all_det_loc - target_loc_repeated
-#        a = -.5*np.dot(np.dot(offset, S_inv), offset)
-#        assoc_likelihood = LIKELIHOOD_DISTR_NORM*math.exp(a)
+#    S_det = numpy.linalg.det(complete_covariance)
+#    S_inv = inv(complete_covariance)
+#    assert(S_det > 0), S_det
+#    LIKELIHOOD_DISTR_NORM = 1.0/(math.sqrt(S_det)*(2*math.pi)**(len(target_loc_repeated)/2))
+#    offset = all_det_loc - target_loc_repeated
+#    a = -.5*np.dot(np.dot(offset, S_inv), offset)
+#    assoc_likelihood = LIKELIHOOD_DISTR_NORM*math.exp(a)
 #
-#        assert(abs(assoc_likelihood_compare - assoc_likelihood) < .0000001), (assoc_likelihood, assoc_likelihood_compare)
+#    assert(abs(assoc_likelihood_compare - assoc_likelihood) < .0000001), (assoc_likelihood, assoc_likelihood_compare)
 
 
-#        if params.USE_PYTHON_GAUSSIAN:
-#            distribution = multivariate_normal(mean=state_mean_meas_space, cov=S)
-#            assoc_likelihood = distribution.pdf(measurement)
-#        else:
-#            S_det = S[0][0]*S[1][1] - S[0][1]*S[1][0] # a little faster
-#            S_inv = inv(S)
-#            assert(S_det > 0), S_det
-#            LIKELIHOOD_DISTR_NORM = 1.0/math.sqrt((2*math.pi)**2*S_det)
+#    if params.USE_PYTHON_GAUSSIAN:
+#        distribution = multivariate_normal(mean=state_mean_meas_space, cov=S)
+#        assoc_likelihood = distribution.pdf(measurement)
+#    else:
+#        S_det = S[0][0]*S[1][1] - S[0][1]*S[1][0] # a little faster
+#        S_inv = inv(S)
+#        assert(S_det > 0), S_det
+#        LIKELIHOOD_DISTR_NORM = 1.0/math.sqrt((2*math.pi)**2*S_det)
 #
-#            offset = measurement - state_mean_meas_space
-#            a = -.5*np.dot(np.dot(offset, S_inv), offset)
-#            assoc_likelihood = LIKELIHOOD_DISTR_NORM*math.exp(a)
+#        offset = measurement - state_mean_meas_space
+#        a = -.5*np.dot(np.dot(offset, S_inv), offset)
+#        assoc_likelihood = LIKELIHOOD_DISTR_NORM*math.exp(a)
 #
 
 
 
-#        particle.assoc_likelihood_cache[(str(detection_group), target_index)] = (assoc_likelihood)
-        return assoc_likelihood
+    return assoc_likelihood
 
 